@@ -5,13 +5,7 @@ Authentication helpers for secure API endpoints
 import os
 import functools
 from flask import request, jsonify
-from contextlib import contextmanager
-
-def get_db_connection():
-    """Import and return database connection context"""
-    # Import here to avoid circular imports
-    from main import get_db_connection as get_conn
-    return get_conn()
+from db_pool import get_db_connection
 
 def verify_admin_token(token: str) -> bool:
     """Verify admin token against environment variable"""
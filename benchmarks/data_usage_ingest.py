@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Data Usage Ingestion
+Compares events/sec of DataUsageMonitor.log_usage_event (one event per call)
+against log_usage_events (COPY batches) on the database at DATABASE_URL
+
+Usage: python benchmarks/data_usage_ingest.py [--events 2000] [--batch-size 500] [--users 10]
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import get_db_connection
+from data_usage_monitor import DataUsageMonitor
+
+
+def make_events(count, uids):
+    return [{
+        'firebase_uid': random.choice(uids),
+        'network_type': random.choice(['4G', '5G']),
+        'connection_type': random.choice(['Mobile', 'Home', 'WiFi']),
+        'speed_mbps': round(random.uniform(10, 500), 2),
+        'data_used_mb': round(random.uniform(0.01, 5), 4),
+        'provider': 'OXIO',
+        'session_id': str(uuid.uuid4()),
+        'device_id': 'bench_probe'
+    } for _ in range(count)]
+
+
+def cleanup(uids):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM data_usage_metrics WHERE firebase_uid = ANY(%s)", (uids,))
+            cur.execute("DELETE FROM data_usage_realtime WHERE firebase_uid = ANY(%s)", (uids,))
+            cur.execute("DELETE FROM data_usage_rollups WHERE firebase_uid = ANY(%s)", (uids,))
+            cur.execute("DELETE FROM data_usage_billing_events WHERE firebase_uid = ANY(%s)", (uids,))
+            conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--users', type=int, default=10)
+    args = parser.parse_args()
+
+    monitor = DataUsageMonitor(get_db_connection)
+    uids = [f'bench_{uuid.uuid4().hex[:12]}' for _ in range(args.users)]
+    events = make_events(args.events, uids)
+
+    try:
+        start = time.perf_counter()
+        for event in events:
+            monitor.log_usage_event(**event)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, len(events), args.batch_size):
+            result = monitor.log_usage_events(events[i:i + args.batch_size])
+            if not result.get('success'):
+                raise SystemExit(f"Batch failed: {result.get('error')}")
+        batch = time.perf_counter() - start
+    finally:
+        cleanup(uids)
+
+    print(f"Events: {args.events}, users: {args.users}, batch size: {args.batch_size}")
+    print(f"  single-event path: {args.events / single:10.1f} events/sec ({single:.2f}s)")
+    print(f"  batch COPY path:   {args.events / batch:10.1f} events/sec ({batch:.2f}s)")
+    print(f"  speedup:           {single / batch:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark: OXIO Activation Flow
+Runs the OXIO side of an eSIM activation (create user, 6805 fallback to lookup,
+activate line, read lines back) through OXIOService against the local OXIO
+simulator, reporting activations/sec and latency percentiles for a healthy
+run and a run with injected errors (failure-path latency, breaker behaviour)
+
+Usage: python benchmarks/oxio_activation.py [--activations 300] [--concurrency 16]
+           [--latency-ms 50] [--error-rate 0.2] [--duplicate-rate 0.1]
+"""
+
+import io
+import os
+import sys
+import time
+import uuid
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OXIO_API_KEY', 'bench_key')
+os.environ.setdefault('OXIO_AUTH_TOKEN', 'bench_token')
+
+from oxio_service import OXIOService
+from oxio_simulator import OXIOSimulator, USER_EXISTS_CODE
+
+
+def activate(service, email):
+    """Returns (ok, step reached) for one activation"""
+    created = service.create_oxio_user('Bench', 'User', email)
+    if created.get('success'):
+        oxio_user_id = created['oxio_user_id']
+    elif created.get('status_code') == 400 and (created.get('data') or {}).get('code') == USER_EXISTS_CODE:
+        found = service.find_user_by_email(email)
+        if not found.get('success'):
+            return False, 'find_user'
+        oxio_user_id = found['oxio_user_id']
+    else:
+        return False, 'create_user'
+
+    if not service.activate_line({'lineType': 'LINE_TYPE_MOBILITY', 'endUserId': oxio_user_id}).get('success'):
+        return False, 'activate_line'
+    if not service.get_user_lines(oxio_user_id).get('success'):
+        return False, 'get_user_lines'
+    return True, 'done'
+
+
+def run(service, emails, concurrency):
+    def timed(email):
+        started = time.perf_counter()
+        ok, step = activate(service, email)
+        return ok, step, (time.perf_counter() - started) * 1000
+
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(timed, emails))
+        elapsed = time.perf_counter() - started
+    return results, elapsed
+
+
+def report(name, results, elapsed):
+    def pick(samples, p):
+        return samples[min(int(round(p / 100 * (len(samples) - 1))), len(samples) - 1)] if samples else 0
+
+    ok = sorted(ms for success, _, ms in results if success)
+    failed = sorted(ms for success, _, ms in results if not success)
+    steps = {}
+    for success, step, _ in results:
+        if not success:
+            steps[step] = steps.get(step, 0) + 1
+    print(f"  {name:<16} {len(ok) / elapsed:7.1f} activations/sec  "
+          f"ok p50 {pick(ok, 50):7.1f}ms p99 {pick(ok, 99):7.1f}ms  "
+          f"failed {len(failed)} (p50 {pick(failed, 50):7.1f}ms) {steps or ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--activations', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=50, help='simulated OXIO response time')
+    parser.add_argument('--error-rate', type=float, default=0.2, help='share of 503s in the failure run')
+    parser.add_argument('--duplicate-rate', type=float, default=0.1, help='share of emails already in OXIO')
+    args = parser.parse_args()
+
+    simulator = OXIOSimulator(latency_ms=args.latency_ms, seed=7)
+    os.environ['OXIO_ENVIRONMENT'] = simulator.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            service = OXIOService()
+
+        def emails():
+            batch = [f"bench-{uuid.uuid4().hex[:12]}@example.com" for _ in range(args.activations)]
+            for email in batch[:int(args.activations * args.duplicate_rate)]:
+                service.create_oxio_user('Bench', 'User', email)  # forces the 6805 path
+            return batch
+
+        print(f"Activations: {args.activations}, concurrency: {args.concurrency}, "
+              f"OXIO latency: {args.latency_ms}ms, duplicates: {args.duplicate_rate:.0%}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            batch = emails()
+        report('healthy', *run(service, batch, args.concurrency))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            batch = emails()
+        simulator.error_rate = args.error_rate
+        report(f'{args.error_rate:.0%} errors', *run(service, batch, args.concurrency))
+        print(f"  breakers: { {family: stats['state'] for family, stats in service.get_health()['breakers'].items()} }")
+        print(f"  simulator responses: {simulator.get_stats()['responses']}")
+    finally:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark: OXIO HTTP Client
+Compares per-call latency of one-off requests.get calls (new connection and
+re-encoded auth headers each time, as before) with OXIOService's pooled
+keep-alive session, against a local OXIO stub server. The stub is plain HTTP,
+so real OXIO traffic also saves a TLS handshake per call.
+
+Usage: python benchmarks/oxio_client.py [--requests 500] [--concurrency 8] [--delay-ms 5]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OXIO_API_KEY', 'bench_key')
+os.environ.setdefault('OXIO_AUTH_TOKEN', 'bench_token')
+
+import requests
+from oxio_service import OXIOService
+
+
+def start_stub(delay):
+    """Local keep-alive server answering every GET like /v3/phone-numbers/available"""
+    body = json.dumps({'phoneNumbers': [{'phoneNumber': '+12125550100'}]}).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Headers and body are separate writes; avoid Nagle/delayed-ACK stalls on keep-alive
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def legacy_call(service, url):
+    """The previous pattern: module-level requests and freshly encoded headers"""
+    credentials = base64.b64encode(f"{service.api_key}:{service.auth_token}".encode()).decode()
+    headers = {'Content-Type': 'application/json', 'Accept': 'application/json',
+               'Authorization': f'Basic {credentials}', 'User-Agent': 'DOTM-Platform/1.0'}
+    return requests.get(url, headers=headers, params={'limit': 10}, timeout=30)
+
+
+def pooled_call(service, url):
+    return service._request('GET', 'search_numbers', url, params={'limit': 10})
+
+
+def run(call, service, url, count, concurrency):
+    def timed(_):
+        started = time.perf_counter()
+        response = call(service, url)
+        response.raise_for_status()
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, range(min(concurrency, count))))  # warm up
+        started = time.perf_counter()
+        samples = sorted(pool.map(timed, range(count)))
+        elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def report(name, samples, elapsed):
+    def pick(p):
+        return samples[min(int(round(p / 100 * (len(samples) - 1))), len(samples) - 1)]
+    print(f"  {name:<22} p50 {pick(50):6.2f}ms  p99 {pick(99):6.2f}ms  "
+          f"{len(samples) / elapsed:8.1f} req/sec")
+    return pick(50), pick(99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--delay-ms', type=float, default=5, help='simulated OXIO processing time')
+    args = parser.parse_args()
+
+    server, base_url = start_stub(args.delay_ms / 1000)
+    service = OXIOService()
+    url = f"{base_url}/v3/phone-numbers/available"
+
+    try:
+        print(f"Requests: {args.requests}, concurrency: {args.concurrency}, stub delay: {args.delay_ms}ms")
+        legacy = report('new connection/call', *run(legacy_call, service, url, args.requests, args.concurrency))
+        pooled = report('pooled session', *run(pooled_call, service, url, args.requests, args.concurrency))
+        print(f"  p50 speedup {legacy[0] / pooled[0]:.2f}x, p99 speedup {legacy[1] / pooled[1]:.2f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Synthetic Stripe Events
+Builds checkout.session.completed events for the products the webhook fulfils
+and signs them the way Stripe does, for benchmarks and load tests
+"""
+
+import hmac
+import json
+import time
+import uuid
+import hashlib
+from typing import Dict, Tuple
+
+# Product metadata as the checkout endpoints set it, and the amount charged (cents)
+PRODUCTS = {
+    'esim_beta': ({'product': 'esim_beta'}, 100),
+    'global_data_10gb': ({'product': 'global_data_10gb'}, 2000),
+    'basic_membership': ({'product_id': 'basic_membership'}, 2400),
+    'full_membership': ({'product_id': 'full_membership'}, 6600),
+}
+
+
+def sign_payload(payload: str, secret: str, timestamp: int = None) -> str:
+    """stripe-signature header value for payload (v1 scheme: HMAC-SHA256 of 't.payload')"""
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def make_event(event_type: str, data_object: Dict, event_id: str = None) -> Dict:
+    return {
+        'id': event_id or f"evt_{uuid.uuid4().hex[:24]}",
+        'object': 'event',
+        'api_version': '2023-10-16',
+        'created': int(time.time()),
+        'type': event_type,
+        'livemode': False,
+        'data': {'object': data_object}
+    }
+
+
+def checkout_completed_event(product: str, firebase_uid: str, email: str, name: str = 'Load Test',
+                             event_id: str = None) -> Dict:
+    """A checkout.session.completed event for one of PRODUCTS"""
+    metadata, amount = PRODUCTS[product]
+    session_id = f"cs_test_{uuid.uuid4().hex[:24]}"
+    return make_event('checkout.session.completed', {
+        'id': session_id,
+        'object': 'checkout.session',
+        'amount_total': amount,
+        'currency': 'usd',
+        'customer': None,
+        'payment_intent': f"pi_{uuid.uuid4().hex[:24]}",
+        'payment_status': 'paid',
+        'mode': 'payment',
+        'metadata': dict(metadata, firebase_uid=firebase_uid, user_email=email, user_name=name)
+    }, event_id)
+
+
+def signed_delivery(event: Dict, secret: str) -> Tuple[str, str]:
+    """(payload, stripe-signature header) ready to POST to the webhook"""
+    payload = json.dumps(event)
+    return payload, sign_payload(payload, secret)
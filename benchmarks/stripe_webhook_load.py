@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Load Test: Stripe Webhook
+Fires signed synthetic checkout.session.completed events (with duplicate
+deliveries) at the webhook at a configurable concurrency, waits for the job
+queue to drain and reports latency percentiles, duplicate-handling correctness
+and ICCID assignment contention. Uses the database at DATABASE_URL.
+
+By default the app runs in-process with OXIO, Resend, Ethereum and Stripe API
+calls stubbed (--stub-latency-ms simulates their response time). With --url the
+events go to an already running server, which must be configured with the same
+STRIPE_WEBHOOK_SECRET and its own stubs.
+
+Usage: python benchmarks/stripe_webhook_load.py [--events 100] [--concurrency 20]
+           [--duplicates 3] [--mix esim_beta=6,global_data_10gb=2,basic_membership=2]
+           [--iccids N] [--stub-latency-ms 150] [--url URL] [--keep-data]
+"""
+
+import io
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('STRIPE_WEBHOOK_SECRET', 'whsec_loadtest')
+
+import requests
+from db_pool import get_db_connection
+from iccid_inventory import ICCIDInventory, luhn_valid
+from stripe_events import PRODUCTS, checkout_completed_event, signed_delivery
+
+WEBHOOK_PATH = '/stripe/webhook/7f3a9b2c8d1e4f5a6b7c8d9e0f1a2b3c'
+
+
+def percentiles(samples):
+    if not samples:
+        return 'n/a'
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+    return (f"p50 {pick(50):7.1f}ms  p90 {pick(90):7.1f}ms  "
+            f"p99 {pick(99):7.1f}ms  max {ordered[-1]:7.1f}ms")
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        product, _, weight = part.partition('=')
+        if product not in PRODUCTS:
+            raise SystemExit(f"Unknown product {product}; choose from {', '.join(PRODUCTS)}")
+        weights[product] = float(weight or 1)
+    return weights
+
+
+def make_iccids(count, run_id):
+    """Luhn-valid synthetic ICCIDs in the 8999 (test) issuer range"""
+    iccids = []
+    for i in range(count):
+        body = f"8999{run_id:06d}{i:08d}"
+        iccids.append(next(body + d for d in '0123456789' if luhn_valid(body + d)))
+    return iccids
+
+
+def install_stubs(latency):
+    """Replace external calls with stubs that sleep `latency` seconds"""
+    import email_service
+    import ethereum_helper
+    import stripe
+    from eth_tx_manager import TxHandle
+    from oxio_service import oxio_service
+
+    def slow(result):
+        def stub(*args, **kwargs):
+            time.sleep(latency)
+            return result() if callable(result) else result
+        return stub
+
+    def activated_line():
+        line = uuid.uuid4().hex
+        return {'success': True, 'data': {
+            'lineId': line,
+            'iccid': f"8999{random.randint(0, 10**15):015d}",
+            'phoneNumbers': [{'phoneNumber': f"+1212555{random.randint(0, 9999):04d}"}],
+            'sim': {'activationCode': f"LPA:1$smdp.loadtest.example$LT-{line[:12]}"}
+        }}
+
+    def queued_reward(*args, **kwargs):
+        handle = TxHandle('load test reward', None)
+        handle.tx_hash = f"0x{uuid.uuid4().hex}"
+        return True, handle
+
+    oxio_service.find_user_by_email = slow({'success': False})
+    oxio_service.create_oxio_user = slow(lambda: {'success': True, 'oxio_user_id': f"oxio-lt-{uuid.uuid4().hex}"})
+    oxio_service.activate_line = slow(activated_line)
+    email_service.send_email = slow(True)
+    ethereum_helper.reward_data_purchase = queued_reward  # only enqueues; the send happens off the request path
+    ethereum_helper.check_and_award_first_transaction_bonus = slow((False, 'Stubbed for load test'))
+    stripe.checkout.Session.modify = slow(None)
+
+    # The 10GB plan path calls oxio_service.request directly
+    class StubResponse:
+        status_code = 201
+        text = '{"id": "sub-loadtest"}'
+
+        def json(self):
+            return {'id': f"sub-lt-{uuid.uuid4().hex[:12]}"}
+
+    oxio_service.request = slow(StubResponse())
+
+
+def start_local_server():
+    """Serve main.app on a free local port in a background thread"""
+    from werkzeug.serving import make_server
+    with contextlib.redirect_stdout(io.StringIO()):
+        import main
+    server = make_server('127.0.0.1', 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def wait_for_jobs(event_ids, timeout):
+    """Poll stripe_webhook_jobs until every job for event_ids has finished"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT COUNT(*) FROM stripe_webhook_jobs
+                    WHERE event_id = ANY(%s) AND status IN ('queued', 'running')
+                """, (event_ids,))
+                if cur.fetchone()[0] == 0:
+                    return True
+        time.sleep(1)
+    return False
+
+
+def collect_results(event_ids, uid_prefix, iccids):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT event_id, status, attempts, last_error,
+                       EXTRACT(EPOCH FROM completed_at - created_at) * 1000
+                FROM stripe_webhook_jobs WHERE event_id = ANY(%s)
+            """, (event_ids,))
+            jobs = cur.fetchall()
+
+            cur.execute("""
+                SELECT allocated_to_firebase_uid, COUNT(*) FROM iccid_inventory
+                WHERE allocated_to_firebase_uid LIKE %s
+                GROUP BY allocated_to_firebase_uid
+            """, (f'{uid_prefix}%',))
+            allocations = dict(cur.fetchall())
+
+            cur.execute("SELECT COUNT(*) FROM iccid_inventory WHERE iccid = ANY(%s) AND status = 'available'",
+                        (iccids,))
+            unassigned = cur.fetchone()[0]
+    return jobs, allocations, unassigned
+
+
+def cleanup(event_ids, uid_prefix, iccids):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM stripe_webhook_jobs WHERE event_id = ANY(%s)", (event_ids,))
+            cur.execute("DELETE FROM processed_stripe_events WHERE event_id = ANY(%s)", (event_ids,))
+            cur.execute("DELETE FROM iccid_inventory WHERE iccid = ANY(%s) OR allocated_to_firebase_uid LIKE %s",
+                        (iccids, f'{uid_prefix}%'))
+            cur.execute("DELETE FROM esim_activation_workflows WHERE firebase_uid LIKE %s", (f'{uid_prefix}%',))
+            cur.execute("DELETE FROM oxio_activations WHERE firebase_uid LIKE %s", (f'{uid_prefix}%',))
+            cur.execute("DELETE FROM purchases WHERE firebaseuid LIKE %s", (f'{uid_prefix}%',))
+            cur.execute("DELETE FROM users WHERE firebase_uid LIKE %s", (f'{uid_prefix}%',))
+            conn.commit()
+
+
+def main_load_test():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duplicates', type=int, default=3, help='deliveries per event (Stripe retries)')
+    parser.add_argument('--mix', default='esim_beta=6,global_data_10gb=2,basic_membership=2')
+    parser.add_argument('--iccids', type=int, default=None,
+                        help='ICCIDs to seed (default: one per eSIM event; fewer forces exhaustion)')
+    parser.add_argument('--stub-latency-ms', type=float, default=150)
+    parser.add_argument('--url', default=None, help='target a running server instead of an in-process one')
+    parser.add_argument('--drain-timeout', type=int, default=300)
+    parser.add_argument('--keep-data', action='store_true')
+    args = parser.parse_args()
+
+    run_id = random.randint(0, 999999)
+    uid_prefix = f'loadtest_{run_id:06d}_'
+    weights = parse_mix(args.mix)
+    products = random.choices(list(weights), weights=list(weights.values()), k=args.events)
+
+    events = [
+        checkout_completed_event(product, f'{uid_prefix}{i}', f'loadtest+{run_id}-{i}@example.com')
+        for i, product in enumerate(products)
+    ]
+    event_ids = [event['id'] for event in events]
+    secret = os.environ['STRIPE_WEBHOOK_SECRET']
+    deliveries = [(event['id'], signed_delivery(event, secret)) for event in events for _ in range(args.duplicates)]
+    random.shuffle(deliveries)
+
+    esim_events = products.count('esim_beta')
+    iccids = make_iccids(esim_events if args.iccids is None else args.iccids, run_id)
+    seeded = ICCIDInventory(get_db_connection).import_records(
+        {'iccid': iccid, 'lpa_code': f'LPA:1$smdp.loadtest.example${iccid[-8:]}'} for iccid in iccids)
+    if not seeded.get('success'):
+        raise SystemExit(f"Could not seed ICCID inventory: {seeded.get('error')}")
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        install_stubs(args.stub_latency_ms / 1000)
+        base_url, server = start_local_server()
+
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    def deliver(item):
+        event_id, (payload, header) = item
+        started = time.perf_counter()
+        response = session.post(base_url + WEBHOOK_PATH, data=payload, timeout=60,
+                                headers={'stripe-signature': header, 'Content-Type': 'application/json'})
+        latency = (time.perf_counter() - started) * 1000
+        try:
+            status = response.json().get('status')
+        except ValueError:
+            status = None
+        return event_id, response.status_code, status, latency
+
+    try:
+        print(f"Firing {len(deliveries)} deliveries ({args.events} events x {args.duplicates}) "
+              f"at concurrency {args.concurrency} -> {base_url}")
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(args.concurrency) as pool:
+            responses = list(pool.map(deliver, deliveries))
+            elapsed = time.perf_counter() - started
+            drained = wait_for_jobs(event_ids, args.drain_timeout)
+        jobs, allocations, unassigned = collect_results(event_ids, uid_prefix, iccids)
+    finally:
+        if server:
+            server.shutdown()
+        if not args.keep_data:
+            cleanup(event_ids, uid_prefix, iccids)
+
+    # Duplicate handling: exactly one accepted delivery and one job per event
+    accepted = {}
+    errors = 0
+    for event_id, code, status, _ in responses:
+        if code != 200:
+            errors += 1
+        elif status in ('queued', 'success'):
+            accepted[event_id] = accepted.get(event_id, 0) + 1
+    double_accepted = sum(1 for count in accepted.values() if count > 1)
+    never_accepted = len(event_ids) - len(accepted)
+    job_counts = {}
+    for job in jobs:
+        job_counts[job[0]] = job_counts.get(job[0], 0) + 1
+
+    outcomes = {}
+    for _, status, _, _, _ in jobs:
+        outcomes[status] = outcomes.get(status, 0) + 1
+    exhausted = sum(1 for job in jobs if job[3] and 'No available eSIMs' in job[3])
+
+    print(f"\nDeliveries: {len(responses)} in {elapsed:.2f}s ({len(responses) / elapsed:.1f} req/sec), "
+          f"{errors} non-200 responses")
+    print(f"  webhook latency:  {percentiles([r[3] for r in responses])}")
+    print(f"  job end-to-end:   {percentiles([float(job[4]) for job in jobs if job[4] is not None])}")
+    print(f"  jobs:             {outcomes} (drained: {'yes' if drained else 'NO - timed out'})")
+    print(f"\nDuplicate handling ({args.duplicates} deliveries per event):")
+    print(f"  events accepted more than once: {double_accepted}")
+    print(f"  events never accepted:          {never_accepted}")
+    print(f"  events with more than one job:  {sum(1 for count in job_counts.values() if count > 1)}")
+    print(f"\nICCID contention ({esim_events} eSIM purchases, {len(iccids)} ICCIDs seeded):")
+    print(f"  users with an ICCID:            {len(allocations)}")
+    print(f"  users with more than one ICCID: {sum(1 for count in allocations.values() if count > 1)}")
+    print(f"  seeded ICCIDs left available:   {unassigned}")
+    print(f"  jobs failed on empty inventory: {exhausted}")
+
+    ok = not errors and not double_accepted and not never_accepted and all(
+        count == 1 for count in allocations.values())
+    print(f"\n{'✅ PASS' if ok else '❌ FAIL'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main_load_test()
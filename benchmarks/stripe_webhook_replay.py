@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Stripe Webhook Duplicate Replay
+Replays signed duplicate deliveries through the webhook endpoint and compares
+requests/sec with the processed-event LRU enabled and disabled (every duplicate
+then hits processed_stripe_events) on the database at DATABASE_URL
+
+Usage: python benchmarks/stripe_webhook_replay.py [--events 200] [--replays 5]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('STRIPE_WEBHOOK_SECRET', 'whsec_benchmark')
+
+import main
+from db_pool import get_db_connection
+from stripe_webhook_queue import ProcessedEventCache
+from stripe_events import make_event, signed_delivery
+
+WEBHOOK_PATH = '/stripe/webhook/7f3a9b2c8d1e4f5a6b7c8d9e0f1a2b3c'
+
+
+def deliver(client, deliveries):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for payload, header in deliveries:
+            response = client.post(WEBHOOK_PATH, data=payload, headers={'stripe-signature': header},
+                                   content_type='application/json')
+            if response.status_code != 200:
+                raise SystemExit(f"Webhook returned {response.status_code}: {response.get_data(as_text=True)}")
+    return time.perf_counter() - start
+
+
+def cleanup(prefix):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM processed_stripe_events WHERE event_id LIKE %s", (f'{prefix}%',))
+            conn.commit()
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--replays', type=int, default=5, help='duplicate deliveries per event')
+    args = parser.parse_args()
+
+    prefix = f'evt_bench_{uuid.uuid4().hex[:8]}_'
+    # An event type the webhook records but does not fulfil
+    deliveries = [
+        signed_delivery(make_event('benchmark.replayed', {}, f'{prefix}{i}'), os.environ['STRIPE_WEBHOOK_SECRET'])
+        for i in range(args.events)
+    ]
+    duplicates = deliveries * args.replays
+    client = main.app.test_client()
+
+    try:
+        first = deliver(client, deliveries)
+
+        main.processed_event_cache = ProcessedEventCache(max_size=0)
+        uncached = deliver(client, duplicates)
+
+        main.processed_event_cache = ProcessedEventCache()
+        for payload, _ in deliveries:
+            main.processed_event_cache.add(json.loads(payload)['id'])
+        cached = deliver(client, duplicates)
+    finally:
+        cleanup(prefix)
+
+    print(f"Events: {args.events}, duplicate deliveries: {len(duplicates)}")
+    print(f"  first delivery:          {args.events / first:10.1f} req/sec")
+    print(f"  duplicates, table only:  {len(duplicates) / uncached:10.1f} req/sec")
+    print(f"  duplicates, LRU hit:     {len(duplicates) / cached:10.1f} req/sec")
+    print(f"  speedup:                 {uncached / cached:10.1f}x")
+    print(f"  cache: {main.processed_event_cache.get_stats()}")
+
+
+if __name__ == '__main__':
+    main_benchmark()
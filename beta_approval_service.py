@@ -9,17 +9,18 @@ import uuid
 import time
 from typing import Dict, Any, Optional
 from email_service import send_email
-from oxio_service import OXIOService
+from oxio_service import oxio_service
 import random
 import string
 import json
 from datetime import datetime, timedelta
+from db_pool import get_db_connection
 
 class BetaApprovalService:
     def __init__(self):
         self.admin_email = os.environ.get('ADMIN_EMAIL', 'admin@dotmobile.app')
         self.approval_base_url = os.environ.get('APPROVAL_BASE_URL', 'https://gorse.dotmobile.app')
-        self.oxio_service = OXIOService()
+        self.oxio_service = oxio_service
 
     def submit_beta_request(self, user_email: str, firebase_uid: str, user_name: str = None) -> Dict[str, Any]:
         """
@@ -38,29 +39,9 @@ class BetaApprovalService:
             request_id = str(uuid.uuid4())
             
             # Store request in database
-            from main import get_db_connection
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
-                        # Create beta_requests table if it doesn't exist
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS beta_requests (
-                                id VARCHAR(36) PRIMARY KEY,
-                                user_email VARCHAR(255) NOT NULL,
-                                firebase_uid VARCHAR(128) NOT NULL,
-                                user_name VARCHAR(255),
-                                status VARCHAR(50) DEFAULT 'pending',
-                                requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                approved_at TIMESTAMP NULL,
-                                approved_by VARCHAR(255) NULL,
-                                phone_number VARCHAR(20) NULL,
-                                oxio_user_id VARCHAR(255) NULL,
-                                oxio_group_id VARCHAR(255) NULL,
-                                resin_data TEXT NULL,
-                                rejection_reason TEXT NULL
-                            )
-                        """)
-                        
                         # Insert the request
                         cur.execute("""
                             INSERT INTO beta_requests 
@@ -151,7 +132,6 @@ This request requires manual approval before the user can access beta features.
             Dictionary with approval status and activation details
         """
         try:
-            from main import get_db_connection
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
@@ -255,7 +235,6 @@ This request requires manual approval before the user can access beta features.
             Dictionary with rejection status
         """
         try:
-            from main import get_db_connection
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
@@ -447,7 +426,6 @@ DOTM Team
     def get_user_beta_status(self, firebase_uid: str) -> Dict[str, Any]:
         """Get beta status for a user"""
         try:
-            from main import get_db_connection
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
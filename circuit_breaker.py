@@ -0,0 +1,170 @@
+"""
+Circuit Breaker and Bulkhead
+Fail fast when a downstream API is erroring or slow (rolling-window circuit
+breaker with half-open probing) and cap concurrent calls to it (bulkhead)
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker
+
+    Calls are recorded with their outcome and latency. Once at least min_calls
+    were made in the last window_seconds and the share that failed or took
+    longer than slow_call_seconds reaches failure_rate, the circuit opens and
+    calls are rejected for open_seconds. It then half-opens: up to
+    half_open_calls probes go through, and the circuit closes if they all
+    succeed or reopens on the first failure.
+    """
+
+    def __init__(self, name: str, failure_rate: float = 0.5, min_calls: int = 10,
+                 window_seconds: float = 60, open_seconds: float = 30,
+                 slow_call_seconds: float = 10, half_open_calls: int = 2):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.half_open_calls = half_open_calls
+
+        self._lock = threading.Lock()
+        self._calls = deque()  # (timestamp, failed, latency_seconds)
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes_in_flight = 0
+        self._probes_succeeded = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def _open(self, now: float):
+        self._state = OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self._probes_succeeded = 0
+        self.times_opened += 1
+        print(f"⚡ Circuit {self.name} opened")
+
+    def allow(self) -> bool:
+        """Whether a call may proceed now; every allowed call must be followed by record()"""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == OPEN:
+                if now - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self._state = HALF_OPEN
+                print(f"🔎 Circuit {self.name} half-open, probing")
+
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_calls:
+                    self.rejected += 1
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def record(self, success: bool, latency_seconds: float):
+        """Record the outcome of an allowed call"""
+        now = time.monotonic()
+        failed = not success or latency_seconds >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                if failed:
+                    self._open(now)
+                    return
+                self._probes_succeeded += 1
+                if self._probes_succeeded >= self.half_open_calls:
+                    self._state = CLOSED
+                    self._calls.clear()
+                    print(f"✅ Circuit {self.name} closed")
+                return
+
+            self._calls.append((now, failed, latency_seconds))
+            self._trim(now)
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, call_failed, _ in self._calls if call_failed)
+                if failures / len(self._calls) >= self.failure_rate:
+                    self._open(now)
+
+    def cancel(self):
+        """Give back an allowed call that was never made, without recording an outcome"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def retry_after(self) -> Optional[float]:
+        """Seconds until an open circuit half-opens (None unless open)"""
+        with self._lock:
+            if self._state != OPEN:
+                return None
+            return max(self.open_seconds - (time.monotonic() - self._opened_at), 0)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def get_stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            calls = list(self._calls)
+        latencies = sorted(latency for _, _, latency in calls)
+        failures = sum(1 for _, failed, _ in calls if failed)
+        return {
+            'state': self.state,
+            'window_calls': len(calls),
+            'window_failure_rate': round(failures / len(calls), 4) if calls else 0.0,
+            'window_p50_ms': int(latencies[len(latencies) // 2] * 1000) if latencies else None,
+            'window_max_ms': int(latencies[-1] * 1000) if latencies else None,
+            'retry_after_seconds': self.retry_after(),
+            'times_opened': self.times_opened,
+            'rejected': self.rejected
+        }
+
+
+class Bulkhead:
+    """Caps concurrent calls; callers wait up to max_wait_seconds for a slot"""
+
+    def __init__(self, name: str, max_concurrent: int, max_wait_seconds: float = 0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_wait_seconds = max_wait_seconds
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def acquire(self) -> bool:
+        if not self._slots.acquire(timeout=self.max_wait_seconds):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {'max_concurrent': self.max_concurrent, 'in_flight': self.in_flight, 'rejected': self.rejected}
@@ -29,6 +29,21 @@ contract DOTMToken is ERC20, Ownable {
         _mint(to, amount);
     }
     
+    // Function to mint accumulated rewards to many members in one transaction (amounts in wei)
+    function mintBatch(address[] calldata recipients, uint256[] calldata amounts) public onlyOwner {
+        require(recipients.length == amounts.length, "Recipients and amounts length mismatch");
+        
+        uint256 total = 0;
+        for (uint256 i = 0; i < amounts.length; i++) {
+            total += amounts[i];
+        }
+        require(totalSupply() + total <= MAX_SUPPLY, "Minting would exceed max supply");
+        
+        for (uint256 i = 0; i < recipients.length; i++) {
+            _mint(recipients[i], amounts[i]);
+        }
+    }
+    
     // Function to calculate and award data purchase rewards (10.33%)
     function rewardDataPurchase(address user, uint256 purchaseAmountCents) public onlyOwner {
         require(totalSupply() < MAX_SUPPLY, "Max supply reached");
@@ -0,0 +1,508 @@
+"""
+Telemetry Data Retention
+Keeps high-volume tables in daily partitions, rolls expired partitions up into
+summary tables and drops them, recording rows and bytes reclaimed. Each table
+also has a <table>_default partition so inserts never fail when the daily
+partitions were not created in time; its rows are moved into proper daily
+partitions on the next run
+"""
+
+import os
+import re
+import time
+import atexit
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from psycopg2 import sql
+
+# Retention configuration (overridable via environment)
+DATA_RETENTION_INTERVAL = int(os.environ.get('DATA_RETENTION_INTERVAL', 3600))  # seconds between runs
+PARTITION_PREMAKE_DAYS = int(os.environ.get('DATA_RETENTION_PREMAKE_DAYS', 7))  # daily partitions created ahead
+DATA_RETENTION_LOCK_ID = 727073004  # pg_advisory lock so only one worker runs retention
+
+# Per-table policies: raw rows are kept retention_days, then the partition is
+# rolled up with rollup_sql (if any) and dropped
+RETENTION_POLICIES = [
+    {
+        'table': 'data_usage_metrics',
+        'time_column': 'created_at',
+        'retention_days': int(os.environ.get('DATA_USAGE_RETENTION_DAYS', 35)),
+        # Already summarized inline into data_usage_rollups
+        'rollup_sql': None
+    },
+    {
+        'table': 'mcp_api_requests',
+        'time_column': 'timestamp',
+        'retention_days': int(os.environ.get('MCP_REQUEST_LOG_RETENTION_DAYS', 1)),
+        'rollup_sql': """
+            INSERT INTO mcp_api_requests_daily AS d (day, key_hash, request_path, response_status, request_count)
+            SELECT DATE(timestamp), key_hash, COALESCE(request_path, ''), COALESCE(response_status, 0), COUNT(*)
+            FROM {partition}
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (day, key_hash, request_path, response_status)
+            DO UPDATE SET request_count = d.request_count + EXCLUDED.request_count
+        """
+    },
+    {
+        'table': 'token_price_pings',
+        'time_column': 'created_at',
+        'retention_days': int(os.environ.get('TOKEN_PRICE_PING_RETENTION_DAYS', 30)),
+        'rollup_sql': """
+            INSERT INTO token_price_pings_hourly AS h (
+                hour, source, ping_destination, ping_count,
+                avg_token_price, min_token_price, max_token_price, avg_roundtrip_ms
+            )
+            SELECT
+                DATE_TRUNC('hour', created_at), COALESCE(source, ''), COALESCE(ping_destination, ''),
+                COUNT(*), AVG(token_price), MIN(token_price), MAX(token_price), AVG(roundtrip_ms)
+            FROM {partition}
+            GROUP BY 1, 2, 3
+            ON CONFLICT (hour, source, ping_destination)
+            DO UPDATE SET
+                avg_token_price = (h.avg_token_price * h.ping_count + EXCLUDED.avg_token_price * EXCLUDED.ping_count)
+                    / (h.ping_count + EXCLUDED.ping_count),
+                avg_roundtrip_ms = COALESCE(
+                    (h.avg_roundtrip_ms * h.ping_count + EXCLUDED.avg_roundtrip_ms * EXCLUDED.ping_count)
+                        / (h.ping_count + EXCLUDED.ping_count),
+                    h.avg_roundtrip_ms, EXCLUDED.avg_roundtrip_ms),
+                min_token_price = LEAST(h.min_token_price, EXCLUDED.min_token_price),
+                max_token_price = GREATEST(h.max_token_price, EXCLUDED.max_token_price),
+                ping_count = h.ping_count + EXCLUDED.ping_count
+        """
+    },
+    {
+        'table': 'help_interactions',
+        'time_column': 'interaction_timestamp',
+        'retention_days': int(os.environ.get('HELP_INTERACTION_RETENTION_DAYS', 180)),
+        'rollup_sql': """
+            INSERT INTO help_interactions_daily AS d (
+                day, interaction_type, interaction_count, satisfied_count, unsatisfied_count
+            )
+            SELECT
+                DATE(interaction_timestamp), interaction_type, COUNT(*),
+                COUNT(*) FILTER (WHERE user_satisfaction), COUNT(*) FILTER (WHERE NOT user_satisfaction)
+            FROM {partition}
+            GROUP BY 1, 2
+            ON CONFLICT (day, interaction_type)
+            DO UPDATE SET
+                interaction_count = d.interaction_count + EXCLUDED.interaction_count,
+                satisfied_count = d.satisfied_count + EXCLUDED.satisfied_count,
+                unsatisfied_count = d.unsatisfied_count + EXCLUDED.unsatisfied_count
+        """
+    },
+]
+
+# data_usage_rollups resolutions (minutes) thinned out after N days; daily buckets are kept
+ROLLUP_RETENTION_DAYS = {1: 7, 5: 30, 60: 730}
+
+# Stripe retries a delivery for up to 3 days; idempotency records and finished
+# webhook jobs are kept well past that, then deleted in batches
+STRIPE_EVENT_RETENTION_DAYS = int(os.environ.get('STRIPE_EVENT_RETENTION_DAYS', 30))
+STRIPE_EVENT_DELETE_BATCH = 10000
+
+# OXIO call telemetry windows (oxio_api_metrics), one row per endpoint per minute per host
+OXIO_METRICS_RETENTION_DAYS = int(os.environ.get('OXIO_METRICS_RETENTION_DAYS', 90))
+
+_BOUND_RE = re.compile(r"FROM \((MINVALUE|'[^']+')\) TO \((MAXVALUE|'[^']+')\)")
+
+
+def _parse_partition_bound(expr: str):
+    """
+    Parse pg_get_expr(relpartbound) of a range partition.
+    Returns (lower, upper) datetimes; None stands for MINVALUE/MAXVALUE.
+    """
+    match = _BOUND_RE.search(expr or '')
+    if not match:
+        return None, None
+
+    def value(token):
+        if token in ('MINVALUE', 'MAXVALUE'):
+            return None
+        return datetime.fromisoformat(token.strip("'"))
+
+    return value(match.group(1)), value(match.group(2))
+
+
+def _missing_partition_days(partitions: List[Dict], first_day: datetime, days_ahead: int) -> List[datetime]:
+    """Days from first_day through first_day + days_ahead not covered by any partition"""
+    missing = []
+    for offset in range(days_ahead + 1):
+        day = first_day + timedelta(days=offset)
+        covered = any(
+            (p['lower'] is None or p['lower'] <= day) and (p['upper'] is None or day < p['upper'])
+            for p in partitions
+        )
+        if not covered:
+            missing.append(day)
+    return missing
+
+
+def _expired_partitions(partitions: List[Dict], cutoff: datetime) -> List[Dict]:
+    """Partitions whose every row is older than cutoff"""
+    return [p for p in partitions if p['upper'] is not None and p['upper'] <= cutoff]
+
+
+class DataRetentionManager:
+    """Create upcoming partitions and expire old ones for each retention policy"""
+
+    def __init__(self, get_db_connection, policies: Optional[List[Dict]] = None):
+        self.get_db_connection = get_db_connection
+        self.policies = policies if policies is not None else RETENTION_POLICIES
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'runs': 0,
+            'partitions_created': 0,
+            'default_rows_drained': 0,
+            'partitions_dropped': 0,
+            'rows_rolled_up': 0,
+            'rows_reclaimed': 0,
+            'bytes_reclaimed': 0,
+            'stripe_events_deleted': 0,
+            'oxio_metrics_deleted': 0,
+            'last_run_at': None,
+            'last_error': None
+        }
+        self._worker = None
+        self._worker_stop = threading.Event()
+
+    def _list_partitions(self, cur, table: str) -> List[Dict]:
+        cur.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+        """, (table,))
+        partitions = []
+        for name, bound in cur.fetchall():
+            if bound == 'DEFAULT':
+                continue
+            lower, upper = _parse_partition_bound(bound)
+            partitions.append({'name': name, 'lower': lower, 'upper': upper})
+        return sorted(partitions, key=lambda p: p['upper'] or datetime.max)
+
+    def _default_partition(self, cur, table: str) -> Optional[str]:
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'
+        """, (table,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    def _create_partition(self, cur, table: str, column: str, day: datetime, default: Optional[str]) -> int:
+        """
+        Create the daily partition for day. With a default partition, the new
+        table is filled with the default's rows for that day and then attached
+        (Postgres refuses a new partition while the default holds its rows).
+        Returns rows moved out of the default partition.
+        """
+        name = sql.Identifier(f"{table}_p{day:%Y%m%d}")
+        bounds = (day, day + timedelta(days=1))
+        if not default:
+            cur.execute(sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)"
+            ).format(name, sql.Identifier(table)), bounds)
+            return 0
+
+        # Writers queue for the moment it takes; the default partition is normally empty
+        cur.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(sql.Identifier(default)))
+        cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)").format(
+            name, sql.Identifier(table)))
+        cur.execute(sql.SQL("""
+            WITH moved AS (DELETE FROM {default} WHERE {column} >= %s AND {column} < %s RETURNING *)
+            INSERT INTO {partition} SELECT * FROM moved
+        """).format(default=sql.Identifier(default), column=sql.Identifier(column), partition=name), bounds)
+        moved = cur.rowcount
+        cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)").format(
+            sql.Identifier(table), name), bounds)
+        return moved
+
+    def ensure_partitions(self, days_ahead: int = PARTITION_PREMAKE_DAYS) -> int:
+        """
+        Create any missing daily partitions from today through days_ahead, plus
+        one for each day that has rows in the default partition (which are moved
+        into it); returns count created
+        """
+        created = drained = 0
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return 0
+
+                with conn.cursor() as cur:
+                    cur.execute("SELECT DATE_TRUNC('day', LOCALTIMESTAMP)")
+                    today = cur.fetchone()[0]
+
+                    for policy in self.policies:
+                        table, column = policy['table'], policy['time_column']
+                        partitions = self._list_partitions(cur, table)
+                        if not partitions:
+                            continue  # Not partitioned (migration 11 not applied)
+
+                        days = set(_missing_partition_days(partitions, today, days_ahead))
+                        default = self._default_partition(cur, table)
+                        if default:
+                            cur.execute(sql.SQL("SELECT DISTINCT DATE_TRUNC('day', {}) FROM {}").format(
+                                sql.Identifier(column), sql.Identifier(default)))
+                            stray_days = [row[0] for row in cur.fetchall()]
+                            if stray_days:
+                                print(f"⚠️ {default} holds rows for {len(stray_days)} day(s); moving them "
+                                      f"into daily partitions")
+                            days.update(stray_days)
+
+                        for day in sorted(days):
+                            drained += self._create_partition(cur, table, column, day, default)
+                            created += 1
+                    conn.commit()
+        except Exception as e:
+            print(f"Error creating telemetry partitions: {str(e)}")
+            created = drained = 0  # rolled back
+
+        if created:
+            print(f"Created {created} telemetry partitions")
+        with self._stats_lock:
+            self.stats['partitions_created'] += created
+            self.stats['default_rows_drained'] += drained
+        return created
+
+    def _expire_table(self, conn, policy: Dict) -> Dict:
+        """Roll up and drop a table's expired partitions in one transaction"""
+        started = time.time()
+        table = policy['table']
+        result = {'table': table, 'partitions_dropped': 0, 'rows_rolled_up': 0,
+                  'rows_reclaimed': 0, 'bytes_reclaimed': 0}
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT LOCALTIMESTAMP - (%s * INTERVAL '1 day')", (policy['retention_days'],))
+            cutoff = cur.fetchone()[0]
+
+            for partition in _expired_partitions(self._list_partitions(cur, table), cutoff):
+                name = sql.Identifier(partition['name'])
+                cur.execute(sql.SQL("SELECT COUNT(*), pg_total_relation_size(%s::regclass) FROM {}").format(name),
+                            (partition['name'],))
+                rows, size = cur.fetchone()
+
+                if policy.get('rollup_sql') and rows:
+                    cur.execute(sql.SQL(policy['rollup_sql']).format(partition=name))
+                    result['rows_rolled_up'] += rows
+
+                cur.execute(sql.SQL("DROP TABLE {}").format(name))
+                result['partitions_dropped'] += 1
+                result['rows_reclaimed'] += rows
+                result['bytes_reclaimed'] += size
+
+            result['duration_ms'] = int((time.time() - started) * 1000)
+            if result['partitions_dropped']:
+                cur.execute("""
+                    INSERT INTO data_retention_runs (
+                        table_name, partitions_dropped, rows_rolled_up,
+                        rows_reclaimed, bytes_reclaimed, duration_ms
+                    ) VALUES (%s, %s, %s, %s, %s, %s)
+                """, (table, result['partitions_dropped'], result['rows_rolled_up'],
+                      result['rows_reclaimed'], result['bytes_reclaimed'], result['duration_ms']))
+        conn.commit()
+        return result
+
+    def _thin_usage_rollups(self, conn) -> int:
+        """Delete fine-grained data_usage_rollups buckets past their retention; returns rows deleted"""
+        deleted = 0
+        with conn.cursor() as cur:
+            for resolution, days in ROLLUP_RETENTION_DAYS.items():
+                cur.execute("""
+                    DELETE FROM data_usage_rollups
+                    WHERE resolution_minutes = %s
+                        AND bucket_start < LOCALTIMESTAMP - (%s * INTERVAL '1 day')
+                """, (resolution, days))
+                deleted += cur.rowcount
+        conn.commit()
+        return deleted
+
+    def _expire_stripe_events(self, conn) -> Dict:
+        """
+        Delete processed_stripe_events past the retry horizon (unless their job is
+        still pending) and succeeded stripe_webhook_jobs; dead jobs are kept
+        """
+        deleted = {'stripe_events_deleted': 0, 'stripe_jobs_deleted': 0}
+        with conn.cursor() as cur:
+            while True:
+                cur.execute("""
+                    DELETE FROM stripe_webhook_jobs
+                    WHERE id IN (
+                        SELECT id FROM stripe_webhook_jobs
+                        WHERE status = 'succeeded'
+                            AND completed_at < LOCALTIMESTAMP - (%s * INTERVAL '1 day')
+                        LIMIT %s
+                    )
+                """, (STRIPE_EVENT_RETENTION_DAYS, STRIPE_EVENT_DELETE_BATCH))
+                deleted['stripe_jobs_deleted'] += cur.rowcount
+                conn.commit()
+                if cur.rowcount < STRIPE_EVENT_DELETE_BATCH:
+                    break
+
+            while True:
+                cur.execute("""
+                    DELETE FROM processed_stripe_events
+                    WHERE id IN (
+                        SELECT e.id FROM processed_stripe_events e
+                        WHERE e.created_at < LOCALTIMESTAMP - (%s * INTERVAL '1 day')
+                            AND NOT EXISTS (
+                                SELECT 1 FROM stripe_webhook_jobs j
+                                WHERE j.event_id = e.event_id AND j.status IN ('queued', 'running')
+                            )
+                        LIMIT %s
+                    )
+                """, (STRIPE_EVENT_RETENTION_DAYS, STRIPE_EVENT_DELETE_BATCH))
+                deleted['stripe_events_deleted'] += cur.rowcount
+                conn.commit()
+                if cur.rowcount < STRIPE_EVENT_DELETE_BATCH:
+                    break
+        return deleted
+
+    def _expire_oxio_metrics(self, conn) -> int:
+        """Delete oxio_api_metrics windows older than OXIO_METRICS_RETENTION_DAYS"""
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM oxio_api_metrics WHERE window_start < LOCALTIMESTAMP - (%s * INTERVAL '1 day')
+            """, (OXIO_METRICS_RETENTION_DAYS,))
+            deleted = cur.rowcount
+        conn.commit()
+        return deleted
+
+    def run(self) -> Dict:
+        """
+        Apply every retention policy once (skipped if another worker holds the lock)
+
+        Returns:
+            dict: Per-table partitions dropped, rows rolled up and rows/bytes reclaimed
+        """
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return {'success': False, 'error': 'Database unavailable'}
+
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_lock(%s)", (DATA_RETENTION_LOCK_ID,))
+                    locked = cur.fetchone()[0]
+                conn.commit()
+                if not locked:
+                    return {'success': True, 'skipped': True, 'tables': []}
+
+                tables = []
+                errors = []
+                try:
+                    for policy in self.policies:
+                        try:
+                            tables.append(self._expire_table(conn, policy))
+                        except Exception as e:
+                            conn.rollback()
+                            errors.append(f"{policy['table']}: {str(e)}")
+                            print(f"Error applying retention to {policy['table']}: {str(e)}")
+                    rollups_deleted = self._thin_usage_rollups(conn)
+                    try:
+                        stripe_deleted = self._expire_stripe_events(conn)
+                    except Exception as e:
+                        conn.rollback()
+                        stripe_deleted = {}
+                        errors.append(f"processed_stripe_events: {str(e)}")
+                        print(f"Error expiring Stripe idempotency records: {str(e)}")
+                    try:
+                        oxio_metrics_deleted = self._expire_oxio_metrics(conn)
+                    except Exception as e:
+                        conn.rollback()
+                        oxio_metrics_deleted = 0
+                        errors.append(f"oxio_api_metrics: {str(e)}")
+                        print(f"Error expiring OXIO API metrics: {str(e)}")
+                finally:
+                    conn.rollback()  # session advisory locks survive rollback
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", (DATA_RETENTION_LOCK_ID,))
+                    conn.commit()
+        except Exception as e:
+            print(f"Error running data retention: {str(e)}")
+            with self._stats_lock:
+                self.stats['last_error'] = str(e)
+            return {'success': False, 'error': str(e)}
+
+        with self._stats_lock:
+            self.stats['runs'] += 1
+            self.stats['last_run_at'] = datetime.now().isoformat()
+            self.stats['last_error'] = '; '.join(errors) or None
+            for result in tables:
+                for key in ('partitions_dropped', 'rows_rolled_up', 'rows_reclaimed', 'bytes_reclaimed'):
+                    self.stats[key] += result[key]
+            self.stats['stripe_events_deleted'] += stripe_deleted.get('stripe_events_deleted', 0)
+            self.stats['oxio_metrics_deleted'] += oxio_metrics_deleted
+
+        dropped = sum(result['partitions_dropped'] for result in tables)
+        if dropped:
+            reclaimed_mb = sum(result['bytes_reclaimed'] for result in tables) / (1024 * 1024)
+            print(f"🧹 Retention dropped {dropped} partitions, reclaimed {reclaimed_mb:.1f} MB")
+        return {
+            'success': not errors,
+            'tables': tables,
+            'usage_rollups_deleted': rollups_deleted,
+            **stripe_deleted,
+            'oxio_metrics_deleted': oxio_metrics_deleted,
+            'errors': errors
+        }
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['policies'] = {p['table']: p['retention_days'] for p in self.policies}
+        stats['policies']['processed_stripe_events'] = STRIPE_EVENT_RETENTION_DAYS
+        stats['policies']['oxio_api_metrics'] = OXIO_METRICS_RETENTION_DAYS
+        return stats
+
+    def get_recent_runs(self, limit: int = 20) -> List[Dict]:
+        """Most recent data_retention_runs rows that reclaimed something"""
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return []
+
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT table_name, partitions_dropped, rows_rolled_up,
+                               rows_reclaimed, bytes_reclaimed, duration_ms, created_at
+                        FROM data_retention_runs
+                        ORDER BY created_at DESC
+                        LIMIT %s
+                    """, (limit,))
+                    return [{
+                        'table': row[0],
+                        'partitions_dropped': row[1],
+                        'rows_rolled_up': row[2],
+                        'rows_reclaimed': row[3],
+                        'bytes_reclaimed': row[4],
+                        'duration_ms': row[5],
+                        'created_at': row[6].isoformat() if row[6] else None
+                    } for row in cur.fetchall()]
+        except Exception as e:
+            print(f"Error getting retention runs: {str(e)}")
+            return []
+
+    def start_scheduler(self, interval_seconds: int = DATA_RETENTION_INTERVAL):
+        """
+        Start the background job that creates upcoming partitions and applies
+        retention, once at startup and then every interval_seconds
+        """
+        if self._worker and self._worker.is_alive():
+            return
+
+        def run():
+            while True:
+                self.ensure_partitions()
+                self.run()
+                if self._worker_stop.wait(interval_seconds):
+                    break
+
+        self._worker_stop.clear()
+        self._worker = threading.Thread(target=run, name="data-retention", daemon=True)
+        self._worker.start()
+        atexit.register(self.stop_scheduler)
+
+    def stop_scheduler(self):
+        self._worker_stop.set()
@@ -4,11 +4,17 @@ Tracks network data consumption with detailed metrics for Stripe metered billing
 """
 
 import os
-import time
+import io
+import csv
+import math
+import uuid
+import atexit
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, Optional, List
 import stripe
 from decimal import Decimal
+from psycopg2.extras import execute_values
 
 # Initialize Stripe
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
@@ -16,94 +22,111 @@ stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
 # Pricing configuration
 DATA_COST_PER_GB = 0.10  # $0.10 per GB
 
+# Stripe reporting: usage is queued in data_usage_billing_events with the event
+# and sent by a background worker (overridable via environment)
+DATA_USAGE_BILLING_INTERVAL = int(os.environ.get('DATA_USAGE_BILLING_INTERVAL', 15))  # seconds between passes
+DATA_USAGE_BILLING_BATCH = 100  # pending billing events reported per pass
+DATA_USAGE_BILLING_MAX_ATTEMPTS = int(os.environ.get('DATA_USAGE_BILLING_MAX_ATTEMPTS', 10))
+DATA_USAGE_BILLING_RETRY_BASE = int(os.environ.get('DATA_USAGE_BILLING_RETRY_BASE', 60))  # seconds, doubled per attempt
+DATA_USAGE_BILLING_RETRY_MAX_SECONDS = 6 * 3600
+
+# Bulk ingestion
+MAX_BATCH_EVENTS = int(os.environ.get('DATA_USAGE_MAX_BATCH_EVENTS', 5000))
+NETWORK_TYPES = ('4G', '5G')
+CONNECTION_TYPES = ('Mobile', 'Home', 'WiFi')
+
+# Usage history rollups: bucket sizes in minutes kept in data_usage_rollups
+ROLLUP_RESOLUTIONS = (1, 5, 60, 1440)
+MAX_HISTORY_POINTS = int(os.environ.get('DATA_USAGE_MAX_HISTORY_POINTS', 500))
+
+# Start of the resolution-sized bucket containing LOCALTIMESTAMP (r = minutes)
+ROLLUP_BUCKET_SQL = (
+    "TIMESTAMP 'epoch' + FLOOR(EXTRACT(EPOCH FROM LOCALTIMESTAMP) / (r * 60)) * (r * 60) * INTERVAL '1 second'"
+)
+
+# data_usage_metrics columns written by COPY, in CSV column order
+BATCH_COLUMNS = (
+    'firebase_uid', 'stripe_customer_id', 'network_type', 'connection_type',
+    'speed_mbps', 'priority', 'provider', 'data_used_mb', 'data_used_gb',
+    'cost_usd', 'session_id', 'device_id', 'ip_address', 'location'
+)
+# Maximum lengths of the VARCHAR columns above
+COLUMN_LIMITS = {
+    'firebase_uid': 128, 'stripe_customer_id': 255, 'priority': 20, 'provider': 100,
+    'session_id': 64, 'device_id': 128, 'ip_address': 45, 'location': 100
+}
+
+
+def _validate_event(event) -> Dict:
+    """
+    Validate and normalize one batch event against the data_usage_metrics schema.
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(event, dict):
+        raise ValueError('event must be an object')
+    
+    row = {}
+    for column, limit in COLUMN_LIMITS.items():
+        value = event.get(column)
+        if value is None or value == '':
+            row[column] = None
+            continue
+        value = str(value)
+        if len(value) > limit:
+            raise ValueError(f'{column} longer than {limit} characters')
+        row[column] = value
+    if not row['firebase_uid']:
+        raise ValueError('firebase_uid is required')
+    
+    row['network_type'] = event.get('network_type', '4G')
+    if row['network_type'] not in NETWORK_TYPES:
+        raise ValueError(f"network_type must be one of {', '.join(NETWORK_TYPES)}")
+    row['connection_type'] = event.get('connection_type', 'Mobile')
+    if row['connection_type'] not in CONNECTION_TYPES:
+        raise ValueError(f"connection_type must be one of {', '.join(CONNECTION_TYPES)}")
+    
+    for field in ('speed_mbps', 'data_used_mb'):
+        try:
+            value = float(event.get(field, 0))
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a number')
+        if not math.isfinite(value) or value < 0:
+            raise ValueError(f'{field} must be a non-negative number')
+        row[field] = value
+    
+    row['data_used_gb'] = row['data_used_mb'] / 1024
+    row['cost_usd'] = row['data_used_gb'] * DATA_COST_PER_GB
+    return row
+
+
+def _history_resolution(hours: int, interval_minutes: int):
+    """
+    Pick the chart interval and the rollup to read it from.
+    
+    The interval is widened so the range yields at most MAX_HISTORY_POINTS
+    buckets, then rounded up to a multiple of the coarsest rollup that fits.
+    
+    Returns:
+        tuple: (interval_minutes, rollup resolution in minutes)
+    """
+    interval = max(int(interval_minutes), 1, math.ceil(hours * 60 / MAX_HISTORY_POINTS))
+    resolution = max(r for r in ROLLUP_RESOLUTIONS if r <= interval)
+    return math.ceil(interval / resolution) * resolution, resolution
+
 
 class DataUsageMonitor:
-    """Monitor and track real-time network data usage with detailed metrics"""
+    """
+    Monitor and track real-time network data usage with detailed metrics
+
+    Billable usage is written to data_usage_billing_events in the same
+    transaction as the raw events, and reported to Stripe by the billing
+    worker, so a Stripe outage or a crash after commit never loses usage.
+    """
     
     def __init__(self, get_db_connection):
         self.get_db_connection = get_db_connection
-        self._ensure_table_exists()
-    
-    def _ensure_table_exists(self):
-        """Create data_usage_metrics table if it doesn't exist"""
-        try:
-            with self.get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS data_usage_metrics (
-                                id SERIAL PRIMARY KEY,
-                                firebase_uid VARCHAR(128) NOT NULL,
-                                stripe_customer_id VARCHAR(255),
-                                
-                                -- Network type and connection
-                                network_type VARCHAR(10) NOT NULL,  -- '4G' or '5G'
-                                connection_type VARCHAR(20) NOT NULL,  -- 'Mobile', 'Home', or 'WiFi'
-                                
-                                -- Performance metrics
-                                speed_mbps DECIMAL(10, 2) NOT NULL,
-                                priority VARCHAR(20),  -- 'High', 'Medium', 'Low'
-                                provider VARCHAR(100),
-                                
-                                -- Usage data
-                                data_used_mb DECIMAL(15, 6) NOT NULL,
-                                data_used_gb DECIMAL(10, 3) NOT NULL,
-                                cost_usd DECIMAL(10, 2) NOT NULL,
-                                
-                                -- Session tracking
-                                session_id VARCHAR(64),
-                                session_start TIMESTAMP,
-                                session_duration_seconds INTEGER,
-                                
-                                -- Metadata
-                                device_id VARCHAR(128),
-                                ip_address VARCHAR(45),
-                                location VARCHAR(100),
-                                
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                
-                                CONSTRAINT check_network_type CHECK (network_type IN ('4G', '5G')),
-                                CONSTRAINT check_connection_type CHECK (connection_type IN ('Mobile', 'Home', 'WiFi'))
-                            );
-                            
-                            -- Indexes for fast queries
-                            CREATE INDEX IF NOT EXISTS idx_data_usage_firebase_uid 
-                                ON data_usage_metrics(firebase_uid);
-                            CREATE INDEX IF NOT EXISTS idx_data_usage_created_at 
-                                ON data_usage_metrics(created_at);
-                            CREATE INDEX IF NOT EXISTS idx_data_usage_session 
-                                ON data_usage_metrics(session_id);
-                            
-                            -- Aggregated usage view for faster real-time queries
-                            CREATE TABLE IF NOT EXISTS data_usage_realtime (
-                                firebase_uid VARCHAR(128) PRIMARY KEY,
-                                current_session_id VARCHAR(64),
-                                
-                                -- Current metrics
-                                network_type VARCHAR(10),
-                                connection_type VARCHAR(20),
-                                speed_mbps DECIMAL(10, 2),
-                                priority VARCHAR(20),
-                                provider VARCHAR(100),
-                                
-                                -- Real-time usage (last hour)
-                                data_used_gb_hour DECIMAL(10, 1),
-                                cost_usd_hour DECIMAL(10, 1),
-                                
-                                -- Cumulative today
-                                data_used_gb_today DECIMAL(10, 1),
-                                cost_usd_today DECIMAL(10, 2),
-                                
-                                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            );
-                            
-                            CREATE INDEX IF NOT EXISTS idx_data_usage_realtime_updated 
-                                ON data_usage_realtime(last_updated);
-                        """)
-                        conn.commit()
-                        print("Data usage monitoring tables created/verified successfully")
-        except Exception as e:
-            print(f"Error creating data usage monitoring tables: {str(e)}")
+        self._worker = None
+        self._worker_stop = threading.Event()
     
     def log_usage_event(
         self,
@@ -165,100 +188,400 @@ class DataUsageMonitor:
                     ))
                     
                     event_id = cur.fetchone()[0]
+                    
+                    # Add to real-time aggregates and history rollups in the same transaction
+                    self._apply_realtime_increment(
+                        cur, firebase_uid, session_id, network_type, connection_type,
+                        speed_mbps, priority, provider, data_used_gb, cost_usd
+                    )
+                    self._apply_rollup_increment(
+                        cur, firebase_uid, data_used_gb, cost_usd, speed_mbps, 1,
+                        1 if network_type == '5G' else 0
+                    )
+                    if stripe_customer_id:
+                        self._queue_billing_events(cur, [(
+                            firebase_uid, stripe_customer_id, data_used_gb, 1,
+                            network_type, connection_type, provider
+                        )])
                     conn.commit()
+            
+            return {
+                'success': True,
+                'event_id': event_id,
+                'data_gb': round(data_used_gb, 3),
+                'cost_usd': round(cost_usd, 2)
+            }
                     
-                    # Update real-time aggregates
-                    self._update_realtime_metrics(firebase_uid)
+        except Exception as e:
+            print(f"Error logging usage event: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    def log_usage_events(self, events: List[Dict]) -> Dict:
+        """
+        Log a batch of data usage events
+        
+        Events take the same fields as log_usage_event (plus firebase_uid) and are
+        validated in one pass; invalid events are rejected individually. Valid
+        events are written with a single COPY, real-time aggregates and history
+        rollups are updated once per user, and Stripe usage is queued once per customer per batch.
+        
+        Args:
+            events: List of event dicts
+            
+        Returns:
+            dict: Counts of accepted and rejected events, with rejection reasons
+        """
+        if len(events) > MAX_BATCH_EVENTS:
+            return {'success': False, 'error': f'Batch exceeds {MAX_BATCH_EVENTS} events'}
+        
+        rows = []
+        rejected = []
+        for index, event in enumerate(events):
+            try:
+                rows.append(_validate_event(event))
+            except ValueError as e:
+                rejected.append({'index': index, 'error': str(e)})
+        
+        if not rows:
+            return {'success': not rejected, 'accepted': 0, 'rejected': rejected}
+        
+        # Per-user aggregate deltas; the last event in the batch sets the network details
+        per_user = {}
+        per_customer = {}
+        for row in rows:
+            totals = per_user.setdefault(row['firebase_uid'], {'gb': 0.0, 'cost': 0.0, 'speed': 0.0, 'count': 0, '5g': 0})
+            totals['gb'] += row['data_used_gb']
+            totals['cost'] += row['cost_usd']
+            totals['speed'] += row['speed_mbps']
+            totals['count'] += 1
+            totals['5g'] += row['network_type'] == '5G'
+            totals['latest'] = row
+            if row['stripe_customer_id']:
+                per_customer.setdefault(row['stripe_customer_id'], []).append(row)
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['' if row[column] is None else row[column] for column in BATCH_COLUMNS])
+        buffer.seek(0)
+        
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return {'success': False, 'error': 'Database unavailable'}
+                
+                with conn.cursor() as cur:
+                    cur.copy_expert(
+                        f"COPY data_usage_metrics ({', '.join(BATCH_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                        buffer
+                    )
                     
-                    # Report to Stripe if customer ID available
-                    if stripe_customer_id:
-                        self._report_to_stripe(
-                            stripe_customer_id,
-                            data_used_gb,
-                            network_type,
-                            connection_type,
-                            provider
+                    # Sorted so concurrent batches lock data_usage_realtime rows in the same order
+                    for firebase_uid in sorted(per_user):
+                        totals = per_user[firebase_uid]
+                        latest = totals['latest']
+                        self._apply_realtime_increment(
+                            cur, firebase_uid, latest['session_id'], latest['network_type'],
+                            latest['connection_type'], latest['speed_mbps'], latest['priority'],
+                            latest['provider'], totals['gb'], totals['cost']
+                        )
+                        # Every row in the batch shares the transaction's created_at bucket
+                        self._apply_rollup_increment(
+                            cur, firebase_uid, totals['gb'], totals['cost'],
+                            totals['speed'], totals['count'], totals['5g']
                         )
                     
-                    return {
-                        'success': True,
-                        'event_id': event_id,
-                        'data_gb': round(data_used_gb, 3),
-                        'cost_usd': round(cost_usd, 2)
-                    }
+                    billing = []
+                    for customer_id, customer_rows in per_customer.items():
+                        latest = customer_rows[-1]
+                        billing.append((
+                            latest['firebase_uid'], customer_id,
+                            sum(row['data_used_gb'] for row in customer_rows), len(customer_rows),
+                            latest['network_type'], latest['connection_type'], latest['provider']
+                        ))
+                    if billing:
+                        self._queue_billing_events(cur, billing)
+                    conn.commit()
                     
         except Exception as e:
-            print(f"Error logging usage event: {str(e)}")
+            print(f"Error logging usage event batch: {str(e)}")
             return {'success': False, 'error': str(e)}
+        
+        total_gb = sum(totals['gb'] for totals in per_user.values())
+        print(f"📶 Logged {len(rows)} usage events for {len(per_user)} users ({len(rejected)} rejected)")
+        return {
+            'success': True,
+            'accepted': len(rows),
+            'rejected': rejected,
+            'users': len(per_user),
+            'data_gb': round(total_gb, 3),
+            'cost_usd': round(total_gb * DATA_COST_PER_GB, 2)
+        }
     
-    def _update_realtime_metrics(self, firebase_uid: str):
-        """Update real-time aggregated metrics for a user"""
+    def _apply_realtime_increment(
+        self,
+        cur,
+        firebase_uid: str,
+        session_id: Optional[str],
+        network_type: str,
+        connection_type: str,
+        speed_mbps: float,
+        priority: Optional[str],
+        provider: Optional[str],
+        data_used_gb: float,
+        cost_usd: float
+    ):
+        """
+        Add one event to the user's data_usage_realtime row (O(1), no scan).
+        Hour/day totals restart when the event falls in a newer hour/day bucket.
+        An event from an older bucket (a transaction that committed late) is left
+        out of the totals, since that bucket has already rolled over.
+        """
+        cur.execute("""
+            INSERT INTO data_usage_realtime AS rt (
+                firebase_uid, current_session_id, network_type,
+                connection_type, speed_mbps, priority, provider,
+                data_used_gb_hour, cost_usd_hour,
+                data_used_gb_today, cost_usd_today,
+                hour_bucket, day_bucket, last_updated
+            ) VALUES (
+                %(uid)s, %(session_id)s, %(network_type)s,
+                %(connection_type)s, %(speed)s, %(priority)s, %(provider)s,
+                %(gb)s, %(cost)s, %(gb)s, %(cost)s,
+                DATE_TRUNC('hour', LOCALTIMESTAMP), DATE_TRUNC('day', LOCALTIMESTAMP),
+                CURRENT_TIMESTAMP
+            )
+            ON CONFLICT (firebase_uid)
+            DO UPDATE SET
+                current_session_id = EXCLUDED.current_session_id,
+                network_type = EXCLUDED.network_type,
+                connection_type = EXCLUDED.connection_type,
+                speed_mbps = EXCLUDED.speed_mbps,
+                priority = EXCLUDED.priority,
+                provider = EXCLUDED.provider,
+                data_used_gb_hour = CASE
+                    WHEN rt.hour_bucket = EXCLUDED.hour_bucket THEN rt.data_used_gb_hour + EXCLUDED.data_used_gb_hour
+                    WHEN rt.hour_bucket IS NULL OR rt.hour_bucket < EXCLUDED.hour_bucket THEN EXCLUDED.data_used_gb_hour
+                    ELSE rt.data_used_gb_hour END,
+                cost_usd_hour = CASE
+                    WHEN rt.hour_bucket = EXCLUDED.hour_bucket THEN rt.cost_usd_hour + EXCLUDED.cost_usd_hour
+                    WHEN rt.hour_bucket IS NULL OR rt.hour_bucket < EXCLUDED.hour_bucket THEN EXCLUDED.cost_usd_hour
+                    ELSE rt.cost_usd_hour END,
+                data_used_gb_today = CASE
+                    WHEN rt.day_bucket = EXCLUDED.day_bucket THEN rt.data_used_gb_today + EXCLUDED.data_used_gb_today
+                    WHEN rt.day_bucket IS NULL OR rt.day_bucket < EXCLUDED.day_bucket THEN EXCLUDED.data_used_gb_today
+                    ELSE rt.data_used_gb_today END,
+                cost_usd_today = CASE
+                    WHEN rt.day_bucket = EXCLUDED.day_bucket THEN rt.cost_usd_today + EXCLUDED.cost_usd_today
+                    WHEN rt.day_bucket IS NULL OR rt.day_bucket < EXCLUDED.day_bucket THEN EXCLUDED.cost_usd_today
+                    ELSE rt.cost_usd_today END,
+                hour_bucket = GREATEST(rt.hour_bucket, EXCLUDED.hour_bucket),
+                day_bucket = GREATEST(rt.day_bucket, EXCLUDED.day_bucket),
+                last_updated = CURRENT_TIMESTAMP
+        """, {
+            'uid': firebase_uid, 'session_id': session_id, 'network_type': network_type,
+            'connection_type': connection_type, 'speed': speed_mbps, 'priority': priority,
+            'provider': provider, 'gb': data_used_gb, 'cost': cost_usd
+        })
+    
+    def _apply_rollup_increment(
+        self,
+        cur,
+        firebase_uid: str,
+        data_used_gb: float,
+        cost_usd: float,
+        speed_sum: float,
+        event_count: int,
+        events_5g: int
+    ):
+        """
+        Add usage to the current bucket of every data_usage_rollups resolution.
+        Buckets use LOCALTIMESTAMP, which is what created_at defaults to.
+        """
+        cur.execute(f"""
+            INSERT INTO data_usage_rollups AS ru (
+                firebase_uid, resolution_minutes, bucket_start,
+                data_used_gb, cost_usd, speed_sum, event_count, events_5g
+            )
+            SELECT
+                %(uid)s, r, {ROLLUP_BUCKET_SQL},
+                %(gb)s, %(cost)s, %(speed_sum)s, %(count)s, %(events_5g)s
+            FROM UNNEST(%(resolutions)s::int[]) AS r
+            ON CONFLICT (firebase_uid, resolution_minutes, bucket_start)
+            DO UPDATE SET
+                data_used_gb = ru.data_used_gb + EXCLUDED.data_used_gb,
+                cost_usd = ru.cost_usd + EXCLUDED.cost_usd,
+                speed_sum = ru.speed_sum + EXCLUDED.speed_sum,
+                event_count = ru.event_count + EXCLUDED.event_count,
+                events_5g = ru.events_5g + EXCLUDED.events_5g
+        """, {
+            'uid': firebase_uid, 'gb': data_used_gb, 'cost': cost_usd,
+            'speed_sum': speed_sum, 'count': event_count, 'events_5g': events_5g,
+            'resolutions': list(ROLLUP_RESOLUTIONS)
+        })
+    
+    def reconcile_realtime_metrics(self, firebase_uid: Optional[str] = None) -> Dict:
+        """
+        Rebuild data_usage_realtime for the current hour/day buckets from raw
+        data_usage_metrics events (all users, or one user)
+        
+        Returns:
+            dict: Number of users rebuilt and reset
+        """
         try:
             with self.get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        # Calculate hourly usage
-                        one_hour_ago = datetime.now() - timedelta(hours=1)
-                        
-                        cur.execute("""
-                            WITH hourly_data AS (
-                                SELECT 
-                                    SUM(data_used_gb) as gb_hour,
-                                    SUM(cost_usd) as cost_hour
-                                FROM data_usage_metrics
-                                WHERE firebase_uid = %s
-                                    AND created_at >= %s
-                            ),
-                            daily_data AS (
-                                SELECT 
-                                    SUM(data_used_gb) as gb_today,
-                                    SUM(cost_usd) as cost_today
-                                FROM data_usage_metrics
-                                WHERE firebase_uid = %s
-                                    AND created_at >= DATE_TRUNC('day', CURRENT_TIMESTAMP)
-                            ),
-                            latest_metrics AS (
-                                SELECT 
-                                    network_type, connection_type, speed_mbps,
-                                    priority, provider, session_id
-                                FROM data_usage_metrics
-                                WHERE firebase_uid = %s
-                                ORDER BY created_at DESC
-                                LIMIT 1
-                            )
-                            INSERT INTO data_usage_realtime (
-                                firebase_uid, current_session_id, network_type, 
-                                connection_type, speed_mbps, priority, provider,
-                                data_used_gb_hour, cost_usd_hour,
-                                data_used_gb_today, cost_usd_today, last_updated
+                if not conn:
+                    return {'success': False, 'error': 'Database unavailable'}
+                
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        WITH today AS (
+                            SELECT *
+                            FROM data_usage_metrics
+                            WHERE created_at >= DATE_TRUNC('day', LOCALTIMESTAMP)
+                                AND (%(uid)s::varchar IS NULL OR firebase_uid = %(uid)s)
+                        ),
+                        totals AS (
+                            SELECT
+                                firebase_uid,
+                                COALESCE(SUM(data_used_gb) FILTER (
+                                    WHERE created_at >= DATE_TRUNC('hour', LOCALTIMESTAMP)), 0) AS gb_hour,
+                                COALESCE(SUM(cost_usd) FILTER (
+                                    WHERE created_at >= DATE_TRUNC('hour', LOCALTIMESTAMP)), 0) AS cost_hour,
+                                SUM(data_used_gb) AS gb_today,
+                                SUM(cost_usd) AS cost_today
+                            FROM today
+                            GROUP BY firebase_uid
+                        ),
+                        latest AS (
+                            SELECT DISTINCT ON (firebase_uid)
+                                firebase_uid, session_id, network_type, connection_type,
+                                speed_mbps, priority, provider
+                            FROM today
+                            ORDER BY firebase_uid, created_at DESC, id DESC
+                        )
+                        INSERT INTO data_usage_realtime (
+                            firebase_uid, current_session_id, network_type,
+                            connection_type, speed_mbps, priority, provider,
+                            data_used_gb_hour, cost_usd_hour,
+                            data_used_gb_today, cost_usd_today,
+                            hour_bucket, day_bucket, last_updated
+                        )
+                        SELECT
+                            t.firebase_uid, l.session_id, l.network_type,
+                            l.connection_type, l.speed_mbps, l.priority, l.provider,
+                            t.gb_hour, t.cost_hour, t.gb_today, t.cost_today,
+                            DATE_TRUNC('hour', LOCALTIMESTAMP), DATE_TRUNC('day', LOCALTIMESTAMP),
+                            CURRENT_TIMESTAMP
+                        FROM totals t
+                        JOIN latest l ON l.firebase_uid = t.firebase_uid
+                        ON CONFLICT (firebase_uid)
+                        DO UPDATE SET
+                            current_session_id = EXCLUDED.current_session_id,
+                            network_type = EXCLUDED.network_type,
+                            connection_type = EXCLUDED.connection_type,
+                            speed_mbps = EXCLUDED.speed_mbps,
+                            priority = EXCLUDED.priority,
+                            provider = EXCLUDED.provider,
+                            data_used_gb_hour = EXCLUDED.data_used_gb_hour,
+                            cost_usd_hour = EXCLUDED.cost_usd_hour,
+                            data_used_gb_today = EXCLUDED.data_used_gb_today,
+                            cost_usd_today = EXCLUDED.cost_usd_today,
+                            hour_bucket = EXCLUDED.hour_bucket,
+                            day_bucket = EXCLUDED.day_bucket,
+                            last_updated = CURRENT_TIMESTAMP
+                    """, {'uid': firebase_uid})
+                    rebuilt = cur.rowcount
+                    
+                    # Users with no events today keep their last network details but zero totals
+                    cur.execute("""
+                        UPDATE data_usage_realtime rt
+                        SET data_used_gb_hour = 0, cost_usd_hour = 0,
+                            data_used_gb_today = 0, cost_usd_today = 0,
+                            hour_bucket = DATE_TRUNC('hour', LOCALTIMESTAMP),
+                            day_bucket = DATE_TRUNC('day', LOCALTIMESTAMP)
+                        WHERE (%(uid)s::varchar IS NULL OR rt.firebase_uid = %(uid)s)
+                            AND NOT EXISTS (
+                                SELECT 1 FROM data_usage_metrics m
+                                WHERE m.firebase_uid = rt.firebase_uid
+                                    AND m.created_at >= DATE_TRUNC('day', LOCALTIMESTAMP)
                             )
-                            SELECT 
-                                %s, lm.session_id, lm.network_type,
-                                lm.connection_type, lm.speed_mbps, lm.priority, lm.provider,
-                                COALESCE(hd.gb_hour, 0), COALESCE(hd.cost_hour, 0),
-                                COALESCE(dd.gb_today, 0), COALESCE(dd.cost_today, 0),
-                                CURRENT_TIMESTAMP
-                            FROM latest_metrics lm
-                            CROSS JOIN hourly_data hd
-                            CROSS JOIN daily_data dd
-                            ON CONFLICT (firebase_uid) 
-                            DO UPDATE SET
-                                current_session_id = EXCLUDED.current_session_id,
-                                network_type = EXCLUDED.network_type,
-                                connection_type = EXCLUDED.connection_type,
-                                speed_mbps = EXCLUDED.speed_mbps,
-                                priority = EXCLUDED.priority,
-                                provider = EXCLUDED.provider,
-                                data_used_gb_hour = EXCLUDED.data_used_gb_hour,
-                                cost_usd_hour = EXCLUDED.cost_usd_hour,
-                                data_used_gb_today = EXCLUDED.data_used_gb_today,
-                                cost_usd_today = EXCLUDED.cost_usd_today,
-                                last_updated = CURRENT_TIMESTAMP
-                        """, (firebase_uid, one_hour_ago, firebase_uid, firebase_uid, firebase_uid))
-                        
-                        conn.commit()
+                    """, {'uid': firebase_uid})
+                    reset = cur.rowcount
+                    conn.commit()
+                    
+                    print(f"Reconciled real-time usage: {rebuilt} rebuilt, {reset} reset")
+                    return {'success': True, 'rebuilt': rebuilt, 'reset': reset}
+                    
         except Exception as e:
-            print(f"Error updating real-time metrics: {str(e)}")
+            print(f"Error reconciling real-time metrics: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    def _queue_billing_events(self, cur, billing: List[tuple]):
+        """
+        Queue Stripe usage in the caller's transaction.
+        billing rows: (firebase_uid, stripe_customer_id, data_used_gb, event_count,
+        network_type, connection_type, provider)
+        """
+        execute_values(cur, """
+            INSERT INTO data_usage_billing_events
+            (firebase_uid, stripe_customer_id, data_used_gb, event_count,
+             network_type, connection_type, provider, idempotency_key)
+            VALUES %s
+        """, [row + (f"data-usage-{uuid.uuid4()}",) for row in billing])
+    
+    def report_pending_billing_events(self) -> Dict:
+        """
+        Send due data_usage_billing_events to Stripe as meter events.
+        Each event's stored idempotency key is the meter event identifier, so a
+        retry after a crash or timeout is deduplicated by Stripe. Claiming pushes
+        next_attempt_at out with exponential backoff; after
+        DATA_USAGE_BILLING_MAX_ATTEMPTS the event is marked 'failed'.
+        """
+        reported = failed = 0
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return {'success': False, 'error': 'Database unavailable'}
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE data_usage_billing_events
+                        SET attempts = attempts + 1,
+                            next_attempt_at = CURRENT_TIMESTAMP
+                                + LEAST(%s * POWER(2, attempts), %s) * INTERVAL '1 second'
+                        WHERE id IN (
+                            SELECT id FROM data_usage_billing_events
+                            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                            ORDER BY next_attempt_at, id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING id, stripe_customer_id, data_used_gb, network_type, connection_type,
+                                  provider, created_at, idempotency_key, attempts
+                    """, (DATA_USAGE_BILLING_RETRY_BASE, DATA_USAGE_BILLING_RETRY_MAX_SECONDS,
+                          DATA_USAGE_BILLING_BATCH))
+                    events = cur.fetchall()
+                    conn.commit()
+            
+            for (event_id, customer_id, data_gb, network_type, connection_type,
+                 provider, created_at, key, attempts) in events:
+                result = self._report_to_stripe(
+                    customer_id, float(data_gb), network_type, connection_type, provider, created_at, key
+                )
+                give_up = not result.get('success') and attempts >= DATA_USAGE_BILLING_MAX_ATTEMPTS
+                self._mark_billing_event(event_id, result, give_up)
+                if result.get('success'):
+                    reported += 1
+                else:
+                    failed += 1
+                    if give_up:
+                        print(f"❌ Data usage billing event {event_id} for {customer_id} failed after "
+                              f"{attempts} attempts: {result.get('error')}")
+            
+            return {'success': True, 'reported': reported, 'failed': failed}
+        except Exception as e:
+            print(f"Error reporting data usage to Stripe: {str(e)}")
+            return {'success': False, 'error': str(e), 'reported': reported, 'failed': failed}
     
     def _report_to_stripe(
         self,
@@ -266,8 +589,10 @@ class DataUsageMonitor:
         data_gb: float,
         network_type: str,
         connection_type: str,
-        provider: Optional[str]
-    ):
+        provider: Optional[str],
+        timestamp: datetime,
+        identifier: str
+    ) -> Dict:
         """Report usage to Stripe with detailed metadata"""
         try:
             event = stripe.billing.MeterEvent.create(
@@ -279,11 +604,55 @@ class DataUsageMonitor:
                     'connection_type': connection_type,
                     'provider': provider or 'Unknown'
                 },
-                timestamp=int(time.time())
+                identifier=identifier,
+                timestamp=int(timestamp.timestamp())
             )
             print(f"✅ Reported {data_gb:.3f} GB ({network_type} {connection_type}) to Stripe for {customer_id}")
+            return {'success': True, 'event_id': event.identifier}
         except Exception as e:
             print(f"Error reporting to Stripe: {str(e)}")
+            return {'success': False, 'error': str(e)}
+    
+    def _mark_billing_event(self, event_id: int, result: Dict, give_up: bool = False):
+        """Record the outcome of a Stripe meter event; give_up marks it failed"""
+        try:
+            with self.get_db_connection() as conn:
+                if conn:
+                    with conn.cursor() as cur:
+                        if result.get('success'):
+                            cur.execute("""
+                                UPDATE data_usage_billing_events
+                                SET status = 'reported', stripe_event_id = %s,
+                                    reported_at = CURRENT_TIMESTAMP, last_error = NULL
+                                WHERE id = %s
+                            """, (result.get('event_id'), event_id))
+                        else:
+                            cur.execute("""
+                                UPDATE data_usage_billing_events
+                                SET last_error = %s, status = %s
+                                WHERE id = %s
+                            """, (result.get('error'), 'failed' if give_up else 'pending', event_id))
+                        conn.commit()
+        except Exception as e:
+            print(f"Error updating data usage billing event {event_id}: {str(e)}")
+    
+    def start_billing_worker(self, interval: int = DATA_USAGE_BILLING_INTERVAL):
+        """Start the background job that reports queued usage to Stripe"""
+        if self._worker and self._worker.is_alive():
+            return
+        
+        def run():
+            while not self._worker_stop.wait(interval):
+                self.report_pending_billing_events()
+        
+        self._worker_stop.clear()
+        self._worker = threading.Thread(target=run, name="data-usage-billing-worker", daemon=True)
+        self._worker.start()
+        atexit.register(self.stop_billing_worker)
+    
+    def stop_billing_worker(self):
+        """Stop the background job; queued usage is reported on the next start"""
+        self._worker_stop.set()
     
     def get_realtime_metrics(self, firebase_uid: str) -> Dict:
         """Get real-time metrics for a user"""
@@ -293,12 +662,19 @@ class DataUsageMonitor:
                     return {'success': False, 'error': 'Database unavailable'}
                 
                 with conn.cursor() as cur:
+                    # Totals from an earlier hour/day bucket have rolled over to zero
                     cur.execute("""
                         SELECT 
                             network_type, connection_type, speed_mbps,
                             priority, provider,
-                            data_used_gb_hour, cost_usd_hour,
-                            data_used_gb_today, cost_usd_today,
+                            CASE WHEN hour_bucket = DATE_TRUNC('hour', LOCALTIMESTAMP)
+                                 THEN data_used_gb_hour ELSE 0 END,
+                            CASE WHEN hour_bucket = DATE_TRUNC('hour', LOCALTIMESTAMP)
+                                 THEN cost_usd_hour ELSE 0 END,
+                            CASE WHEN day_bucket = DATE_TRUNC('day', LOCALTIMESTAMP)
+                                 THEN data_used_gb_today ELSE 0 END,
+                            CASE WHEN day_bucket = DATE_TRUNC('day', LOCALTIMESTAMP)
+                                 THEN cost_usd_today ELSE 0 END,
                             last_updated
                         FROM data_usage_realtime
                         WHERE firebase_uid = %s
@@ -354,10 +730,11 @@ class DataUsageMonitor:
         Args:
             firebase_uid: User's Firebase UID
             hours: Number of hours of history to retrieve
-            interval_minutes: Data aggregation interval in minutes
+            interval_minutes: Data aggregation interval in minutes; widened to
+                keep the response within MAX_HISTORY_POINTS buckets
             
         Returns:
-            dict: Historical usage data with timestamps
+            dict: Historical usage data with timestamps and the interval used
         """
         try:
             with self.get_db_connection() as conn:
@@ -366,19 +743,29 @@ class DataUsageMonitor:
                 
                 with conn.cursor() as cur:
                     start_time = datetime.now() - timedelta(hours=hours)
+                    interval_minutes, resolution = _history_resolution(hours, interval_minutes)
                     
+                    # Regroup the coarsest fitting rollup into interval-sized buckets;
+                    # network_type is 5G when any event in the bucket was (as MAX() did on raw rows)
                     cur.execute("""
                         SELECT 
-                            DATE_TRUNC('minute', created_at) as time_bucket,
+                            TIMESTAMP 'epoch' + FLOOR(EXTRACT(EPOCH FROM bucket_start) / %(step)s)
+                                * %(step)s * INTERVAL '1 second' as time_bucket,
                             SUM(data_used_gb) as total_gb,
-                            AVG(speed_mbps) as avg_speed,
-                            MAX(network_type) as network_type
-                        FROM data_usage_metrics
-                        WHERE firebase_uid = %s
-                            AND created_at >= %s
-                        GROUP BY DATE_TRUNC('minute', created_at)
+                            SUM(speed_sum) / NULLIF(SUM(event_count), 0) as avg_speed,
+                            CASE WHEN SUM(events_5g) > 0 THEN '5G' ELSE '4G' END as network_type
+                        FROM data_usage_rollups
+                        WHERE firebase_uid = %(uid)s
+                            AND resolution_minutes = %(resolution)s
+                            AND bucket_start >= TIMESTAMP 'epoch'
+                                + FLOOR(EXTRACT(EPOCH FROM %(start)s::timestamp) / %(step)s)
+                                * %(step)s * INTERVAL '1 second'
+                        GROUP BY 1
                         ORDER BY time_bucket ASC
-                    """, (firebase_uid, start_time))
+                    """, {
+                        'uid': firebase_uid, 'resolution': resolution,
+                        'step': interval_minutes * 60, 'start': start_time
+                    })
                     
                     history = []
                     for row in cur.fetchall():
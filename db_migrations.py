@@ -0,0 +1,1173 @@
+#!/usr/bin/env python3
+"""
+Database Schema Migrations
+Ordered, versioned schema changes recorded in schema_migrations and applied once
+from the command line instead of at import time or inside request handlers.
+
+Usage:
+    python db_migrations.py            # apply all pending migrations
+    python db_migrations.py status     # list applied and pending versions
+
+Every statement is written to be idempotent (IF NOT EXISTS) so the first run
+against a database created by the old import-time DDL only records versions.
+"""
+
+import sys
+import time
+from typing import Dict, List
+from db_pool import get_db_connection
+
+MIGRATIONS_TABLE = 'schema_migrations'
+MIGRATION_LOCK_ID = 727073001  # pg_advisory_lock key shared by all workers
+
+# (version, name, sql) - append new migrations to the end, never edit applied ones
+MIGRATIONS = [
+    (1, 'core_tables', """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            email VARCHAR(255) NOT NULL,
+            firebase_uid VARCHAR(128) UNIQUE NOT NULL,
+            stripe_customer_id VARCHAR(100),
+            display_name VARCHAR(255),
+            photo_url TEXT,
+            imei VARCHAR(100),
+            eth_address VARCHAR(42),
+            oxio_user_id VARCHAR(100),
+            oxio_group_id VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS purchases (
+            PurchaseID SERIAL PRIMARY KEY,
+            StripeID VARCHAR(100),
+            StripeProductID VARCHAR(100) NOT NULL,
+            PriceID VARCHAR(100) NOT NULL,
+            TotalAmount INTEGER NOT NULL,
+            DateCreated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UserID INTEGER,
+            StripeTransactionID VARCHAR(100),
+            FirebaseUID VARCHAR(128)
+        );
+        CREATE INDEX IF NOT EXISTS idx_purchases_stripe ON purchases(StripeID);
+        CREATE INDEX IF NOT EXISTS idx_purchases_product ON purchases(StripeProductID);
+        CREATE INDEX IF NOT EXISTS idx_purchases_user ON purchases(UserID);
+        CREATE INDEX IF NOT EXISTS idx_purchases_firebase_uid ON purchases(FirebaseUID);
+
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            subscription_id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            subscription_type VARCHAR(100) NOT NULL,
+            stripe_subscription_id VARCHAR(100),
+            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_date TIMESTAMP,
+            status VARCHAR(50) DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id ON subscriptions(user_id);
+
+        CREATE TABLE IF NOT EXISTS product_rules (
+            rule_id SERIAL PRIMARY KEY,
+            stripe_product_id VARCHAR(100) UNIQUE NOT NULL,
+            product_name VARCHAR(255),
+            one_time_charge DECIMAL(10, 2) DEFAULT 0,
+            weekly_charge DECIMAL(10, 2) DEFAULT 0,
+            monthly_charge DECIMAL(10, 2) DEFAULT 0,
+            yearly_charge DECIMAL(10, 2) DEFAULT 0,
+            token_reward_percentage DECIMAL(5, 2) DEFAULT 1.0,
+            additional_rules JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS beta_testers (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            firebase_uid VARCHAR(128) NOT NULL,
+            stripe_customer_id VARCHAR(100),
+            action VARCHAR(50),
+            status VARCHAR(50) DEFAULT 'not_enrolled',
+            stripe_session_id VARCHAR(255),
+            stripe_payment_intent_id VARCHAR(255),
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS fcm_tokens (
+            id SERIAL PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            fcm_token TEXT NOT NULL,
+            platform VARCHAR(20) DEFAULT 'web',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(firebase_uid, platform)
+        );
+        CREATE INDEX IF NOT EXISTS idx_fcm_tokens_firebase_uid ON fcm_tokens(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_fcm_tokens_platform ON fcm_tokens(platform);
+
+        CREATE TABLE IF NOT EXISTS notifications (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER,
+            firebase_uid VARCHAR(128),
+            title VARCHAR(255) NOT NULL,
+            body TEXT,
+            notification_type VARCHAR(50) DEFAULT 'general',
+            delivered BOOLEAN DEFAULT FALSE,
+            read_status BOOLEAN DEFAULT FALSE,
+            fcm_response TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            delivered_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_notifications_firebase_uid ON notifications(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_notifications_delivered ON notifications(delivered);
+        CREATE INDEX IF NOT EXISTS idx_notifications_read_status ON notifications(read_status);
+
+        CREATE TABLE IF NOT EXISTS iccid_inventory (
+            id SERIAL PRIMARY KEY,
+            iccid VARCHAR(50) UNIQUE NOT NULL,
+            lpa_code VARCHAR(200),
+            country VARCHAR(10) DEFAULT 'US',
+            line_id VARCHAR(100),
+            status VARCHAR(20) DEFAULT 'available',
+            assigned_firebase_uid VARCHAR(128),
+            assigned_email VARCHAR(255),
+            assigned_at TIMESTAMP,
+            batch_upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_iccid_status ON iccid_inventory(status);
+        CREATE INDEX IF NOT EXISTS idx_iccid_assigned_firebase_uid ON iccid_inventory(assigned_firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_iccid_batch_upload ON iccid_inventory(batch_upload_date);
+
+        CREATE TABLE IF NOT EXISTS processed_stripe_events (
+            id SERIAL PRIMARY KEY,
+            event_id VARCHAR(100) UNIQUE NOT NULL,
+            event_type VARCHAR(100) NOT NULL,
+            processing_result TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_processed_events_event_id ON processed_stripe_events(event_id);
+
+        CREATE TABLE IF NOT EXISTS welcome_messages (
+            id SERIAL PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            language VARCHAR(10) NOT NULL,
+            voice_profile VARCHAR(50) NOT NULL,
+            message_type VARCHAR(50) NOT NULL DEFAULT 'welcome',
+            audio_data BYTEA NOT NULL,
+            content_type VARCHAR(50) DEFAULT 'audio/mpeg',
+            generation_time_ms INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(firebase_uid, language, voice_profile, message_type)
+        );
+        CREATE INDEX IF NOT EXISTS idx_welcome_messages_firebase_uid ON welcome_messages(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_welcome_messages_language ON welcome_messages(language);
+        CREATE INDEX IF NOT EXISTS idx_welcome_messages_voice_profile ON welcome_messages(voice_profile);
+        CREATE INDEX IF NOT EXISTS idx_welcome_messages_message_type ON welcome_messages(message_type);
+
+        CREATE TABLE IF NOT EXISTS user_message_history (
+            id SERIAL PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            message_type VARCHAR(50) NOT NULL,
+            language VARCHAR(10) NOT NULL,
+            voice_profile VARCHAR(50) NOT NULL,
+            completed BOOLEAN DEFAULT FALSE,
+            listened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_message_history_firebase_uid ON user_message_history(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_user_message_history_message_type ON user_message_history(message_type);
+
+        CREATE TABLE IF NOT EXISTS oxio_activations (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            firebase_uid VARCHAR(128),
+            purchase_id VARCHAR(200),
+            product_id VARCHAR(100),
+            iccid VARCHAR(50),
+            line_id VARCHAR(100),
+            phone_number VARCHAR(20),
+            activation_status VARCHAR(50),
+            plan_id VARCHAR(100),
+            group_id VARCHAR(100),
+            esim_qr_code TEXT,
+            activation_url TEXT,
+            activation_code VARCHAR(200),
+            oxio_response TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_oxio_activations_firebase_uid ON oxio_activations(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_oxio_activations_user_id ON oxio_activations(user_id);
+        CREATE INDEX IF NOT EXISTS idx_oxio_activations_iccid ON oxio_activations(iccid);
+
+        CREATE TABLE IF NOT EXISTS invites (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER,
+            email VARCHAR(255) NOT NULL,
+            invitation_status VARCHAR(50) NOT NULL DEFAULT 'pending',
+            invited_by_user_id INTEGER,
+            invited_by_firebase_uid VARCHAR(255),
+            invitation_token VARCHAR(255),
+            personal_message TEXT,
+            is_demo_user BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP + INTERVAL '7 days'),
+            accepted_at TIMESTAMP,
+            rejected_at TIMESTAMP,
+            cancelled_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_invites_email ON invites(email);
+        CREATE INDEX IF NOT EXISTS idx_invites_token ON invites(invitation_token);
+        CREATE INDEX IF NOT EXISTS idx_invites_user_id ON invites(user_id);
+        CREATE INDEX IF NOT EXISTS idx_invites_invited_by_firebase_uid ON invites(invited_by_firebase_uid);
+
+        CREATE TABLE IF NOT EXISTS data_usage_log (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            stripe_customer_id VARCHAR(100),
+            megabytes_used BIGINT NOT NULL,
+            stripe_event_id VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_data_usage_user_id ON data_usage_log(user_id);
+        CREATE INDEX IF NOT EXISTS idx_data_usage_stripe_customer_id ON data_usage_log(stripe_customer_id);
+
+        CREATE TABLE IF NOT EXISTS token_price_pings (
+            id SERIAL PRIMARY KEY,
+            token_price DECIMAL(18,9) NOT NULL,
+            request_time_ms INTEGER,
+            response_time_ms INTEGER,
+            roundtrip_ms INTEGER,
+            ping_destination VARCHAR(255),
+            source VARCHAR(100),
+            additional_data TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_token_price_pings_created_at ON token_price_pings(created_at);
+
+        CREATE TABLE IF NOT EXISTS user_network_preferences (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            stripe_product_id VARCHAR(100) NOT NULL,
+            enabled BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, stripe_product_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_network_preferences_user_id ON user_network_preferences(user_id);
+        CREATE INDEX IF NOT EXISTS idx_user_network_preferences_stripe_product_id ON user_network_preferences(stripe_product_id);
+
+        CREATE TABLE IF NOT EXISTS first_transaction_bonuses (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER UNIQUE NOT NULL,
+            firebase_uid VARCHAR(128),
+            eth_address VARCHAR(42),
+            is_founding_member BOOLEAN DEFAULT FALSE,
+            bonus_amount DECIMAL(18, 6),
+            tx_hash VARCHAR(66),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS phone_number_changes (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER,
+            firebase_uid VARCHAR(128) NOT NULL,
+            search_type VARCHAR(20),
+            search_params JSONB,
+            previous_number VARCHAR(20),
+            selected_number VARCHAR(20),
+            status VARCHAR(20) DEFAULT 'pending',
+            oxio_request JSONB,
+            oxio_response JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_phone_number_changes_firebase_uid ON phone_number_changes(firebase_uid);
+    """),
+
+    (2, 'feature_tables', """
+        CREATE TABLE IF NOT EXISTS compatibility_checks (
+            id SERIAL PRIMARY KEY,
+            imei VARCHAR(50) NOT NULL,
+            device_make VARCHAR(100),
+            device_model VARCHAR(100),
+            device_year INTEGER,
+            four_g_support BOOLEAN,
+            five_g_support BOOLEAN,
+            volte_support BOOLEAN,
+            wifi_calling_support VARCHAR(20),
+            is_compatible BOOLEAN,
+            search_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS email_templates (
+            id SERIAL PRIMARY KEY,
+            template_type VARCHAR(50) NOT NULL,
+            subject TEXT NOT NULL,
+            content TEXT NOT NULL,
+            modified_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            modified_by VARCHAR(100) DEFAULT 'Admin',
+            is_active BOOLEAN DEFAULT TRUE
+        );
+
+        CREATE TABLE IF NOT EXISTS user_addresses (
+            id SERIAL PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            billing_address JSONB,
+            mailing_address JSONB,
+            broadband_address JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(firebase_uid)
+        );
+
+        CREATE TABLE IF NOT EXISTS token_assignments (
+            id SERIAL PRIMARY KEY,
+            wallet_address VARCHAR(42) NOT NULL,
+            token_amount NUMERIC(20, 0) NOT NULL,
+            reason VARCHAR(100) NOT NULL,
+            tx_hash VARCHAR(66),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_token_assignments_wallet_reason
+            ON token_assignments(wallet_address, reason);
+
+        CREATE TABLE IF NOT EXISTS beta_requests (
+            id VARCHAR(36) PRIMARY KEY,
+            user_email VARCHAR(255) NOT NULL,
+            firebase_uid VARCHAR(128) NOT NULL,
+            user_name VARCHAR(255),
+            status VARCHAR(50) DEFAULT 'pending',
+            requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            approved_at TIMESTAMP NULL,
+            approved_by VARCHAR(255) NULL,
+            phone_number VARCHAR(20) NULL,
+            oxio_user_id VARCHAR(255) NULL,
+            oxio_group_id VARCHAR(255) NULL,
+            resin_data TEXT NULL,
+            rejection_reason TEXT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS network_features (
+            id SERIAL PRIMARY KEY,
+            stripe_product_id VARCHAR(100) UNIQUE NOT NULL,
+            feature_name VARCHAR(255) NOT NULL,
+            feature_title VARCHAR(255) NOT NULL,
+            description TEXT,
+            default_enabled BOOLEAN DEFAULT FALSE,
+            price_cents INTEGER DEFAULT 0,
+            eligibility_required BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """),
+
+    (3, 'mcp_tables', """
+        CREATE TABLE IF NOT EXISTS mcp_api_keys (
+            id SERIAL PRIMARY KEY,
+            key_hash VARCHAR(64) UNIQUE NOT NULL,
+            key_name VARCHAR(255) NOT NULL,
+            description TEXT,
+            rate_limit INTEGER DEFAULT 1000,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP,
+            total_requests BIGINT DEFAULT 0,
+            firebase_uid VARCHAR(128),
+            allowed_origins TEXT[],
+            metadata JSONB
+        );
+        CREATE INDEX IF NOT EXISTS idx_mcp_api_keys_key_hash ON mcp_api_keys(key_hash);
+        CREATE INDEX IF NOT EXISTS idx_mcp_api_keys_is_active ON mcp_api_keys(is_active);
+        CREATE INDEX IF NOT EXISTS idx_mcp_api_keys_firebase_uid ON mcp_api_keys(firebase_uid);
+
+        CREATE TABLE IF NOT EXISTS mcp_api_requests (
+            id SERIAL PRIMARY KEY,
+            key_hash VARCHAR(64) NOT NULL,
+            request_path VARCHAR(255),
+            request_method VARCHAR(10),
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_address INET,
+            user_agent TEXT,
+            response_status INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_mcp_api_requests_key_hash_timestamp
+            ON mcp_api_requests(key_hash, timestamp);
+
+        CREATE TABLE IF NOT EXISTS mcp_billing_events (
+            id SERIAL PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            stripe_customer_id VARCHAR(255) NOT NULL,
+            request_count INTEGER NOT NULL,
+            megabytes_used DECIMAL(10, 6) NOT NULL,
+            stripe_event_id VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_mcp_billing_events_firebase_uid ON mcp_billing_events(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_mcp_billing_events_created_at ON mcp_billing_events(created_at);
+    """),
+
+    (4, 'data_usage_tables', """
+        CREATE TABLE IF NOT EXISTS data_usage_metrics (
+            id SERIAL PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            stripe_customer_id VARCHAR(255),
+            network_type VARCHAR(10) NOT NULL,
+            connection_type VARCHAR(20) NOT NULL,
+            speed_mbps DECIMAL(10, 2) NOT NULL,
+            priority VARCHAR(20),
+            provider VARCHAR(100),
+            data_used_mb DECIMAL(15, 6) NOT NULL,
+            data_used_gb DECIMAL(10, 3) NOT NULL,
+            cost_usd DECIMAL(10, 2) NOT NULL,
+            session_id VARCHAR(64),
+            session_start TIMESTAMP,
+            session_duration_seconds INTEGER,
+            device_id VARCHAR(128),
+            ip_address VARCHAR(45),
+            location VARCHAR(100),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT check_network_type CHECK (network_type IN ('4G', '5G')),
+            CONSTRAINT check_connection_type CHECK (connection_type IN ('Mobile', 'Home', 'WiFi'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_data_usage_firebase_uid ON data_usage_metrics(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_data_usage_created_at ON data_usage_metrics(created_at);
+        CREATE INDEX IF NOT EXISTS idx_data_usage_session ON data_usage_metrics(session_id);
+
+        CREATE TABLE IF NOT EXISTS data_usage_realtime (
+            firebase_uid VARCHAR(128) PRIMARY KEY,
+            current_session_id VARCHAR(64),
+            network_type VARCHAR(10),
+            connection_type VARCHAR(20),
+            speed_mbps DECIMAL(10, 2),
+            priority VARCHAR(20),
+            provider VARCHAR(100),
+            data_used_gb_hour DECIMAL(10, 1),
+            cost_usd_hour DECIMAL(10, 1),
+            data_used_gb_today DECIMAL(10, 1),
+            cost_usd_today DECIMAL(10, 2),
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_data_usage_realtime_updated ON data_usage_realtime(last_updated);
+    """),
+
+    (5, 'help_desk_tables', """
+        CREATE TABLE IF NOT EXISTS need_for_help (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER,
+            firebase_uid VARCHAR(128),
+            session_id VARCHAR(255) NOT NULL,
+            help_started_at TIMESTAMP NOT NULL,
+            help_ended_at TIMESTAMP,
+            total_duration_seconds INTEGER,
+            click_count INTEGER DEFAULT 1,
+            last_activity_at TIMESTAMP NOT NULL,
+            jira_ticket_key VARCHAR(50),
+            jira_ticket_status VARCHAR(50),
+            resolution_time_seconds INTEGER,
+            live_callback_requested BOOLEAN DEFAULT FALSE,
+            live_callback_completed_at TIMESTAMP,
+            ai_assistance_provided BOOLEAN DEFAULT FALSE,
+            ai_response_count INTEGER DEFAULT 0,
+            user_agent TEXT,
+            ip_address INET,
+            page_url TEXT,
+            issue_category VARCHAR(100),
+            issue_description TEXT,
+            satisfaction_rating INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS help_interactions (
+            id SERIAL PRIMARY KEY,
+            help_session_id INTEGER REFERENCES need_for_help(id),
+            interaction_type VARCHAR(50) NOT NULL,
+            interaction_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_since_last_action INTEGER,
+            ai_query TEXT,
+            ai_response TEXT,
+            user_satisfaction BOOLEAN,
+            additional_data JSONB
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_help_user_id ON need_for_help(user_id);
+        CREATE INDEX IF NOT EXISTS idx_help_firebase_uid ON need_for_help(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_help_session_id ON need_for_help(session_id);
+        CREATE INDEX IF NOT EXISTS idx_help_jira_ticket ON need_for_help(jira_ticket_key);
+        CREATE INDEX IF NOT EXISTS idx_help_interactions_session ON help_interactions(help_session_id);
+    """),
+
+    # Columns that request handlers used to add on the fly
+    (6, 'backfill_request_time_columns', """
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS oxio_user_id VARCHAR(100);
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS oxio_group_id VARCHAR(100);
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS eth_address VARCHAR(42);
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS phone_number VARCHAR(20);
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS esim_lpa_address TEXT;
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS esim_iccid VARCHAR(50);
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS esim_qr_code TEXT;
+
+        ALTER TABLE purchases ADD COLUMN IF NOT EXISTS StripeTransactionID VARCHAR(100);
+        ALTER TABLE purchases ADD COLUMN IF NOT EXISTS FirebaseUID VARCHAR(128);
+
+        ALTER TABLE beta_testers ADD COLUMN IF NOT EXISTS status VARCHAR(50) DEFAULT 'not_enrolled';
+
+        ALTER TABLE iccid_inventory ADD COLUMN IF NOT EXISTS allocated_to_firebase_uid VARCHAR(128);
+        ALTER TABLE iccid_inventory ADD COLUMN IF NOT EXISTS assigned_to VARCHAR(255);
+
+        ALTER TABLE welcome_messages ADD COLUMN IF NOT EXISTS location_context TEXT;
+        ALTER TABLE welcome_messages ADD COLUMN IF NOT EXISTS generated_at_local_time TIMESTAMP;
+
+        ALTER TABLE user_addresses ADD COLUMN IF NOT EXISTS broadband_address JSONB;
+
+        ALTER TABLE need_for_help ADD COLUMN IF NOT EXISTS context_provided_at TIMESTAMP;
+        ALTER TABLE need_for_help ADD COLUMN IF NOT EXISTS context_category VARCHAR(100);
+        ALTER TABLE need_for_help ADD COLUMN IF NOT EXISTS context_description TEXT;
+
+        -- eSIM activations store the Stripe checkout session ID here
+        ALTER TABLE oxio_activations ALTER COLUMN purchase_id TYPE VARCHAR(200);
+    """),
+
+    # Background pruning of MCP request logs deletes by timestamp alone
+    (7, 'mcp_api_requests_timestamp_index', """
+        CREATE INDEX IF NOT EXISTS idx_mcp_api_requests_timestamp ON mcp_api_requests(timestamp);
+    """),
+
+    # Aggregated MCP billing: staged request counts rolled into one meter event per customer
+    (8, 'mcp_usage_staging', """
+        CREATE TABLE IF NOT EXISTS mcp_usage_staging (
+            id BIGSERIAL PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            request_count INTEGER NOT NULL,
+            recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_mcp_usage_staging_recorded_at ON mcp_usage_staging(recorded_at);
+
+        -- Rows written before aggregation were reported individually
+        ALTER TABLE mcp_billing_events ADD COLUMN IF NOT EXISTS period_start TIMESTAMP;
+        ALTER TABLE mcp_billing_events ADD COLUMN IF NOT EXISTS period_end TIMESTAMP;
+        ALTER TABLE mcp_billing_events ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);
+        ALTER TABLE mcp_billing_events ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'reported';
+        ALTER TABLE mcp_billing_events ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE mcp_billing_events ADD COLUMN IF NOT EXISTS last_error TEXT;
+        ALTER TABLE mcp_billing_events ADD COLUMN IF NOT EXISTS reported_at TIMESTAMP;
+        ALTER TABLE mcp_billing_events ALTER COLUMN megabytes_used TYPE DECIMAL(14, 6);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_mcp_billing_events_idempotency_key
+            ON mcp_billing_events(idempotency_key);
+        CREATE INDEX IF NOT EXISTS idx_mcp_billing_events_pending
+            ON mcp_billing_events(id) WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS idx_mcp_billing_events_period_end ON mcp_billing_events(period_end);
+    """),
+
+    # Real-time usage is maintained incrementally; buckets mark which hour/day the totals cover
+    (9, 'data_usage_realtime_buckets', """
+        ALTER TABLE data_usage_realtime ADD COLUMN IF NOT EXISTS hour_bucket TIMESTAMP;
+        ALTER TABLE data_usage_realtime ADD COLUMN IF NOT EXISTS day_bucket TIMESTAMP;
+
+        -- One-decimal columns would round away each small increment
+        ALTER TABLE data_usage_realtime ALTER COLUMN data_used_gb_hour TYPE DECIMAL(14, 6);
+        ALTER TABLE data_usage_realtime ALTER COLUMN cost_usd_hour TYPE DECIMAL(14, 6);
+        ALTER TABLE data_usage_realtime ALTER COLUMN data_used_gb_today TYPE DECIMAL(14, 6);
+        ALTER TABLE data_usage_realtime ALTER COLUMN cost_usd_today TYPE DECIMAL(14, 6);
+
+        UPDATE data_usage_realtime
+        SET hour_bucket = DATE_TRUNC('hour', last_updated),
+            day_bucket = DATE_TRUNC('day', last_updated)
+        WHERE hour_bucket IS NULL;
+    """),
+
+    (10, 'data_usage_rollups', """
+        -- Per-user usage pre-aggregated into 1-minute, 5-minute, hourly and daily buckets
+        CREATE TABLE IF NOT EXISTS data_usage_rollups (
+            firebase_uid VARCHAR(128) NOT NULL,
+            resolution_minutes INTEGER NOT NULL,
+            bucket_start TIMESTAMP NOT NULL,
+            data_used_gb DECIMAL(16, 6) NOT NULL DEFAULT 0,
+            cost_usd DECIMAL(16, 6) NOT NULL DEFAULT 0,
+            speed_sum DECIMAL(18, 2) NOT NULL DEFAULT 0,
+            event_count INTEGER NOT NULL DEFAULT 0,
+            events_5g INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (firebase_uid, resolution_minutes, bucket_start)
+        );
+
+        INSERT INTO data_usage_rollups (
+            firebase_uid, resolution_minutes, bucket_start,
+            data_used_gb, cost_usd, speed_sum, event_count, events_5g
+        )
+        SELECT
+            m.firebase_uid, res.r,
+            TIMESTAMP 'epoch' + FLOOR(EXTRACT(EPOCH FROM m.created_at) / (res.r * 60)) * (res.r * 60) * INTERVAL '1 second',
+            SUM(m.data_used_gb), SUM(m.cost_usd), SUM(m.speed_mbps),
+            COUNT(*), COUNT(*) FILTER (WHERE m.network_type = '5G')
+        FROM data_usage_metrics m
+        CROSS JOIN (VALUES (1), (5), (60), (1440)) AS res(r)
+        WHERE m.created_at IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (firebase_uid, resolution_minutes, bucket_start) DO NOTHING;
+    """),
+
+    # Telemetry tables become daily range partitions so retention drops whole
+    # partitions. Existing rows stay in one <table>_legacy partition covering
+    # everything up to tomorrow; data_retention.py creates partitions from there on.
+    (11, 'partition_telemetry_tables', """
+        CREATE OR REPLACE FUNCTION pg_temp.partition_by_day(tbl TEXT, col TEXT) RETURNS VOID AS $$
+        DECLARE
+            legacy TEXT := tbl || '_legacy';
+            bound TIMESTAMP;
+            newest TIMESTAMP;
+            day TIMESTAMP;
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = tbl::regclass) = 'p' THEN
+                RETURN;
+            END IF;
+
+            EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, legacy);
+            -- Range partitions cannot route NULL keys; such rows count as oldest
+            EXECUTE format('UPDATE %I SET %I = TIMESTAMP ''epoch'' WHERE %I IS NULL', legacy, col, col);
+            EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET NOT NULL', legacy, col);
+
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (%I)',
+                tbl, legacy, col
+            );
+            EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, %I)', tbl, col);
+            -- The id sequence must outlive the legacy partition
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.id', pg_get_serial_sequence(legacy, 'id'), tbl);
+
+            EXECUTE format('SELECT MAX(%I) FROM %I', col, legacy) INTO newest;
+            bound := GREATEST(
+                DATE_TRUNC('day', LOCALTIMESTAMP),
+                COALESCE(DATE_TRUNC('day', newest), DATE_TRUNC('day', LOCALTIMESTAMP))
+            ) + INTERVAL '1 day';
+            EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (MINVALUE) TO (%L)', tbl, legacy, bound);
+
+            FOR i IN 0..6 LOOP
+                day := bound + i * INTERVAL '1 day';
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                    tbl || '_p' || TO_CHAR(day, 'YYYYMMDD'), tbl, day, day + INTERVAL '1 day'
+                );
+            END LOOP;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        SELECT pg_temp.partition_by_day('data_usage_metrics', 'created_at');
+        SELECT pg_temp.partition_by_day('mcp_api_requests', 'timestamp');
+        SELECT pg_temp.partition_by_day('token_price_pings', 'created_at');
+        SELECT pg_temp.partition_by_day('help_interactions', 'interaction_timestamp');
+
+        -- Indexes and foreign keys on the parents cascade to every partition
+        CREATE INDEX IF NOT EXISTS idx_data_usage_metrics_part_uid ON data_usage_metrics(firebase_uid);
+        CREATE INDEX IF NOT EXISTS idx_data_usage_metrics_part_created_at ON data_usage_metrics(created_at);
+        CREATE INDEX IF NOT EXISTS idx_data_usage_metrics_part_session ON data_usage_metrics(session_id);
+        CREATE INDEX IF NOT EXISTS idx_mcp_api_requests_part_key_hash_timestamp ON mcp_api_requests(key_hash, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_mcp_api_requests_part_timestamp ON mcp_api_requests(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_token_price_pings_part_created_at ON token_price_pings(created_at);
+        CREATE INDEX IF NOT EXISTS idx_help_interactions_part_session ON help_interactions(help_session_id);
+        ALTER TABLE help_interactions
+            ADD CONSTRAINT help_interactions_help_session_id_fkey
+            FOREIGN KEY (help_session_id) REFERENCES need_for_help(id);
+
+        -- Rollups that outlive the raw partitions
+        CREATE TABLE IF NOT EXISTS mcp_api_requests_daily (
+            day DATE NOT NULL,
+            key_hash VARCHAR(64) NOT NULL,
+            request_path VARCHAR(255) NOT NULL DEFAULT '',
+            response_status INTEGER NOT NULL DEFAULT 0,
+            request_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, key_hash, request_path, response_status)
+        );
+
+        CREATE TABLE IF NOT EXISTS token_price_pings_hourly (
+            hour TIMESTAMP NOT NULL,
+            source VARCHAR(100) NOT NULL DEFAULT '',
+            ping_destination VARCHAR(255) NOT NULL DEFAULT '',
+            ping_count INTEGER NOT NULL DEFAULT 0,
+            avg_token_price DECIMAL(18, 9),
+            min_token_price DECIMAL(18, 9),
+            max_token_price DECIMAL(18, 9),
+            avg_roundtrip_ms DECIMAL(12, 2),
+            PRIMARY KEY (hour, source, ping_destination)
+        );
+
+        CREATE TABLE IF NOT EXISTS help_interactions_daily (
+            day DATE NOT NULL,
+            interaction_type VARCHAR(50) NOT NULL,
+            interaction_count INTEGER NOT NULL DEFAULT 0,
+            satisfied_count INTEGER NOT NULL DEFAULT 0,
+            unsatisfied_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, interaction_type)
+        );
+
+        CREATE TABLE IF NOT EXISTS data_retention_runs (
+            id SERIAL PRIMARY KEY,
+            table_name VARCHAR(100) NOT NULL,
+            partitions_dropped INTEGER NOT NULL DEFAULT 0,
+            rows_rolled_up INTEGER NOT NULL DEFAULT 0,
+            rows_reclaimed BIGINT NOT NULL DEFAULT 0,
+            bytes_reclaimed BIGINT NOT NULL DEFAULT 0,
+            duration_ms INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_data_retention_runs_created_at ON data_retention_runs(created_at);
+    """),
+
+    # Stripe webhooks are processed by background workers (stripe_webhook_queue.py)
+    (12, 'stripe_webhook_jobs', """
+        CREATE TABLE IF NOT EXISTS stripe_webhook_jobs (
+            id SERIAL PRIMARY KEY,
+            event_id VARCHAR(100) UNIQUE NOT NULL,
+            event_type VARCHAR(100) NOT NULL,
+            payload JSONB NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 8,
+            run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            locked_by VARCHAR(100),
+            locked_at TIMESTAMP,
+            last_error TEXT,
+            result JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            CONSTRAINT check_webhook_job_status CHECK (status IN ('queued', 'running', 'succeeded', 'dead'))
+        );
+        -- Workers only scan unfinished jobs
+        CREATE INDEX IF NOT EXISTS idx_stripe_webhook_jobs_due
+            ON stripe_webhook_jobs(run_after, id) WHERE status IN ('queued', 'running');
+        CREATE INDEX IF NOT EXISTS idx_stripe_webhook_jobs_status ON stripe_webhook_jobs(status);
+    """),
+
+    # Checkpointed eSIM activation workflows (esim_activation_service.py)
+    (13, 'esim_activation_workflows', """
+        CREATE TABLE IF NOT EXISTS esim_activation_workflows (
+            id SERIAL PRIMARY KEY,
+            workflow_key VARCHAR(200) UNIQUE NOT NULL,
+            firebase_uid VARCHAR(128) NOT NULL,
+            user_email VARCHAR(255),
+            user_name VARCHAR(255),
+            stripe_session_id VARCHAR(200),
+            purchase_amount INTEGER,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            current_step VARCHAR(50),
+            steps JSONB NOT NULL DEFAULT '{}'::jsonb,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            lease_expires_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP,
+            CONSTRAINT check_esim_workflow_status CHECK (status IN ('pending', 'running', 'failed', 'completed'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_esim_activation_workflows_uid
+            ON esim_activation_workflows(firebase_uid, created_at);
+    """),
+
+    # ICCID lookups go through allocated_to_firebase_uid (the old index covers the
+    # unused assigned_firebase_uid column); allocation scans only available rows
+    (14, 'iccid_inventory_lookup_indexes', """
+        CREATE INDEX IF NOT EXISTS idx_iccid_allocated_firebase_uid
+            ON iccid_inventory(allocated_to_firebase_uid, assigned_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_iccid_available
+            ON iccid_inventory(id) WHERE status = 'available';
+        DROP INDEX IF EXISTS idx_iccid_assigned_firebase_uid;
+    """),
+
+    # Retention deletes for Stripe idempotency records and finished webhook jobs
+    # (data_retention.py); event_id lookups already use the UNIQUE constraint's index
+    (15, 'stripe_event_retention_indexes', """
+        CREATE INDEX IF NOT EXISTS idx_processed_events_created_at ON processed_stripe_events(created_at);
+        DROP INDEX IF EXISTS idx_processed_events_event_id;
+        CREATE INDEX IF NOT EXISTS idx_stripe_webhook_jobs_completed
+            ON stripe_webhook_jobs(completed_at) WHERE status = 'succeeded';
+    """),
+
+    # OXIO call telemetry (oxio_telemetry.py): one row per endpoint per flush window,
+    # kept apart from token_price_pings
+    (16, 'oxio_api_metrics', """
+        CREATE TABLE IF NOT EXISTS oxio_api_metrics (
+            id BIGSERIAL PRIMARY KEY,
+            window_start TIMESTAMP NOT NULL,
+            window_end TIMESTAMP NOT NULL,
+            hostname VARCHAR(255),
+            endpoint VARCHAR(64) NOT NULL,
+            calls INTEGER NOT NULL,
+            errors INTEGER NOT NULL DEFAULT 0,
+            p50_ms INTEGER,
+            p90_ms INTEGER,
+            p99_ms INTEGER,
+            max_ms INTEGER,
+            total_ms BIGINT,
+            status_counts JSONB,
+            error_classes JSONB,
+            histogram JSONB
+        );
+        CREATE INDEX IF NOT EXISTS idx_oxio_api_metrics_endpoint_window ON oxio_api_metrics(endpoint, window_start);
+        CREATE INDEX IF NOT EXISTS idx_oxio_api_metrics_window_start ON oxio_api_metrics(window_start);
+    """),
+
+    # Fleet-wide OXIO line reconciliation (oxio_line_sync.py): content hash of each
+    # line as last written, so unchanged lines cost no writes, and one row per run
+    (17, 'oxio_line_sync', """
+        CREATE TABLE IF NOT EXISTS oxio_line_sync_state (
+            line_id VARCHAR(100) PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            iccid VARCHAR(50),
+            content_hash CHAR(64) NOT NULL,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_oxio_line_sync_state_user_id ON oxio_line_sync_state(user_id);
+
+        CREATE TABLE IF NOT EXISTS oxio_line_sync_runs (
+            id SERIAL PRIMARY KEY,
+            trigger VARCHAR(20) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'running',
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            users_scanned INTEGER DEFAULT 0,
+            lines_seen INTEGER DEFAULT 0,
+            lines_new INTEGER DEFAULT 0,
+            lines_changed INTEGER DEFAULT 0,
+            lines_unchanged INTEGER DEFAULT 0,
+            lines_missing INTEGER DEFAULT 0,
+            fetch_errors INTEGER DEFAULT 0,
+            apply_errors INTEGER DEFAULT 0,
+            duration_ms INTEGER,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_oxio_user_id ON users(id) WHERE oxio_user_id IS NOT NULL;
+    """),
+    (18, 'token_reward_ledger', """
+        CREATE TABLE IF NOT EXISTS token_reward_batches (
+            id SERIAL PRIMARY KEY,
+            status VARCHAR(20) NOT NULL DEFAULT 'sending',
+            recipients INTEGER NOT NULL,
+            rewards INTEGER NOT NULL,
+            total_wei NUMERIC(78, 0) NOT NULL,
+            tx_id VARCHAR(40),
+            tx_hash VARCHAR(66),
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            settled_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_token_reward_batches_open
+            ON token_reward_batches(id) WHERE status IN ('sending', 'sent');
+
+        CREATE TABLE IF NOT EXISTS token_reward_ledger (
+            id SERIAL PRIMARY KEY,
+            eth_address VARCHAR(42) NOT NULL,
+            user_id INTEGER,
+            amount_wei NUMERIC(78, 0) NOT NULL,
+            reason VARCHAR(50) NOT NULL,
+            reference VARCHAR(255) UNIQUE,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            batch_id INTEGER REFERENCES token_reward_batches(id),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            settled_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_token_reward_ledger_pending
+            ON token_reward_ledger(eth_address, created_at) WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS idx_token_reward_ledger_address_status ON token_reward_ledger(eth_address, status);
+        CREATE INDEX IF NOT EXISTS idx_token_reward_ledger_batch_id ON token_reward_ledger(batch_id);
+    """),
+
+    # Durable outbox for admin wallet transactions (eth_tx_manager.py), and one
+    # token assignment per wallet and reason so the guard row blocks a second mint
+    (19, 'admin_transaction_outbox', """
+        CREATE TABLE IF NOT EXISTS admin_transactions (
+            id BIGSERIAL PRIMARY KEY,
+            tx_id VARCHAR(40) UNIQUE NOT NULL,
+            sender VARCHAR(42) NOT NULL,
+            description TEXT,
+            contract_address VARCHAR(42) NOT NULL,
+            fn_name VARCHAR(100) NOT NULL,
+            fn_args JSONB NOT NULL,
+            tx_params JSONB,
+            record_table VARCHAR(50),
+            record_id INTEGER,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            nonce INTEGER,
+            gas_price NUMERIC(30, 0),
+            tx_hash VARCHAR(66),
+            hashes JSONB NOT NULL DEFAULT '[]'::jsonb,
+            block_number BIGINT,
+            error TEXT,
+            locked_by VARCHAR(100),
+            heartbeat_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            finished_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_admin_transactions_unfinished
+            ON admin_transactions(sender, id) WHERE status IN ('queued', 'sent');
+
+        -- The award paths used to check then insert, so a wallet can already hold
+        -- duplicate (wallet_address, reason) rows, which would fail the unique index.
+        -- Keep the first row of each and move the rest to token_assignments_duplicates
+        -- for review (their tokens were minted; nothing is reversed on chain).
+        CREATE TABLE IF NOT EXISTS token_assignments_duplicates (
+            id INTEGER PRIMARY KEY,
+            kept_id INTEGER NOT NULL,
+            wallet_address VARCHAR(42) NOT NULL,
+            token_amount NUMERIC(20, 0) NOT NULL,
+            reason VARCHAR(100) NOT NULL,
+            tx_hash VARCHAR(66),
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        WITH kept AS (
+            SELECT wallet_address, reason, MIN(id) AS kept_id
+            FROM token_assignments
+            GROUP BY wallet_address, reason
+            HAVING COUNT(*) > 1
+        ), duplicates AS (
+            DELETE FROM token_assignments t
+            USING kept k
+            WHERE t.wallet_address = k.wallet_address AND t.reason = k.reason AND t.id <> k.kept_id
+            RETURNING t.id, k.kept_id, t.wallet_address, t.token_amount, t.reason, t.tx_hash, t.created_at
+        )
+        INSERT INTO token_assignments_duplicates
+            (id, kept_id, wallet_address, token_amount, reason, tx_hash, created_at)
+        SELECT id, kept_id, wallet_address, token_amount, reason, tx_hash, created_at FROM duplicates;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_token_assignments_wallet_reason_unique
+            ON token_assignments(wallet_address, reason);
+        DROP INDEX IF EXISTS idx_token_assignments_wallet_reason;
+    """),
+
+    # Reward batches look up their admin transaction by record when the batch
+    # never saved its tx_id (reward_ledger.py reconcile)
+    (20, 'admin_transactions_record_index', """
+        CREATE INDEX IF NOT EXISTS idx_admin_transactions_record
+            ON admin_transactions(record_table, record_id) WHERE record_table IS NOT NULL;
+    """),
+
+    # MCP billing batches back off between Stripe attempts and stop at 'failed'
+    # (mcp_usage_service.py report_pending_billing_events)
+    (21, 'mcp_billing_events_backoff', """
+        ALTER TABLE mcp_billing_events
+            ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+        DROP INDEX IF EXISTS idx_mcp_billing_events_pending;
+        CREATE INDEX IF NOT EXISTS idx_mcp_billing_events_pending
+            ON mcp_billing_events(next_attempt_at, id) WHERE status = 'pending';
+    """),
+
+    # Data usage is queued for Stripe with the raw events and reported by a worker
+    # (data_usage_monitor.py report_pending_billing_events)
+    (22, 'data_usage_billing_events', """
+        CREATE TABLE IF NOT EXISTS data_usage_billing_events (
+            id BIGSERIAL PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            stripe_customer_id VARCHAR(255) NOT NULL,
+            data_used_gb DECIMAL(18, 9) NOT NULL,
+            event_count INTEGER NOT NULL DEFAULT 1,
+            network_type VARCHAR(10),
+            connection_type VARCHAR(20),
+            provider VARCHAR(100),
+            idempotency_key VARCHAR(64) NOT NULL UNIQUE,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            stripe_event_id VARCHAR(255),
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            reported_at TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_data_usage_billing_events_pending
+            ON data_usage_billing_events(next_attempt_at, id) WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS idx_data_usage_billing_events_customer
+            ON data_usage_billing_events(stripe_customer_id);
+    """),
+
+    # Paid plan activations are recorded before the OXIO subscription POST so a
+    # retried webhook job never creates a second subscription (plan_activations.py)
+    (23, 'oxio_plan_activations', """
+        CREATE TABLE IF NOT EXISTS oxio_plan_activations (
+            stripe_session_id VARCHAR(255) PRIMARY KEY,
+            firebase_uid VARCHAR(128) NOT NULL,
+            oxio_plan_id VARCHAR(100) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'started',
+            subscription_id VARCHAR(255),
+            purchase_id INTEGER,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT check_plan_activation_status
+                CHECK (status IN ('started', 'subscribed', 'recorded', 'rejected'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_oxio_plan_activations_firebase_uid
+            ON oxio_plan_activations(firebase_uid);
+    """),
+
+    # Instances poll recently revoked MCP keys to evict them from their
+    # validation caches (mcp_auth.py)
+    (24, 'mcp_api_keys_revoked_at', """
+        ALTER TABLE mcp_api_keys ADD COLUMN IF NOT EXISTS revoked_at TIMESTAMP;
+        CREATE INDEX IF NOT EXISTS idx_mcp_api_keys_revoked_at
+            ON mcp_api_keys(revoked_at) WHERE revoked_at IS NOT NULL;
+    """),
+
+    # Inserts land in <table>_default instead of failing when the daily
+    # partitions were not created in time; data_retention.py drains it
+    (25, 'telemetry_default_partitions', """
+        DO $$
+        DECLARE
+            tbl TEXT;
+        BEGIN
+            FOREACH tbl IN ARRAY ARRAY['data_usage_metrics', 'mcp_api_requests', 'token_price_pings', 'help_interactions'] LOOP
+                IF (SELECT relkind FROM pg_class WHERE oid = tbl::regclass) = 'p' THEN
+                    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I DEFAULT', tbl || '_default', tbl);
+                END IF;
+            END LOOP;
+        END;
+        $$;
+    """),
+]
+
+
+def _ensure_migrations_table(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INTEGER
+        )
+    """)
+
+
+def get_applied_versions(conn) -> List[int]:
+    """Versions already recorded in schema_migrations (empty if the table is missing)"""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT version FROM {MIGRATIONS_TABLE} ORDER BY version")
+            return [row[0] for row in cur.fetchall()]
+    except Exception:
+        conn.rollback()
+        return []
+
+
+def get_pending_migrations(conn) -> list:
+    """Migrations not yet applied, in version order"""
+    applied = set(get_applied_versions(conn))
+    return [m for m in sorted(MIGRATIONS) if m[0] not in applied]
+
+
+def run_migrations(target_version: int = None) -> Dict:
+    """
+    Apply pending migrations in order, one transaction each
+
+    Args:
+        target_version: Stop after this version (default: latest)
+
+    Returns:
+        dict: Applied versions and resulting schema version
+    """
+    with get_db_connection() as conn:
+        if not conn:
+            return {'success': False, 'error': 'Database unavailable'}
+
+        applied = []
+        with conn.cursor() as cur:
+            # Serialize concurrent runners (e.g. several workers deploying at once)
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            with conn.cursor() as cur:
+                _ensure_migrations_table(cur)
+            conn.commit()
+
+            for version, name, sql in get_pending_migrations(conn):
+                if target_version is not None and version > target_version:
+                    break
+
+                print(f"Applying migration {version:04d}_{name}...")
+                started = time.time()
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(sql)
+                        duration_ms = int((time.time() - started) * 1000)
+                        cur.execute(f"""
+                            INSERT INTO {MIGRATIONS_TABLE} (version, name, duration_ms)
+                            VALUES (%s, %s, %s)
+                        """, (version, name, duration_ms))
+                    conn.commit()
+                    applied.append(version)
+                    print(f"✅ Migration {version:04d}_{name} applied in {duration_ms}ms")
+                except Exception as e:
+                    conn.rollback()
+                    print(f"❌ Migration {version:04d}_{name} failed: {str(e)}")
+                    return {
+                        'success': False,
+                        'error': str(e),
+                        'failed_version': version,
+                        'applied': applied
+                    }
+
+            current = get_applied_versions(conn)
+            return {
+                'success': True,
+                'applied': applied,
+                'current_version': current[-1] if current else 0
+            }
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+
+
+def check_schema_current() -> bool:
+    """
+    Cheap startup check (one query) that warns when migrations are pending.
+    Does not modify the schema.
+    """
+    try:
+        with get_db_connection() as conn:
+            if not conn:
+                print("No database connection available for schema check")
+                return False
+            pending = get_pending_migrations(conn)
+    except Exception as e:
+        print(f"Error checking schema version: {str(e)}")
+        return False
+
+    if pending:
+        versions = ', '.join(f"{m[0]:04d}_{m[1]}" for m in pending)
+        print(f"⚠️ Database schema is behind: {len(pending)} pending migration(s): {versions}")
+        print("   Run: python db_migrations.py")
+        return False
+
+    print(f"Database schema is current (version {MIGRATIONS[-1][0]})")
+    return True
+
+
+def print_status():
+    with get_db_connection() as conn:
+        if not conn:
+            print("Database unavailable")
+            return
+        applied = set(get_applied_versions(conn))
+
+    for version, name, _ in sorted(MIGRATIONS):
+        state = 'applied' if version in applied else 'pending'
+        print(f"  {version:04d}_{name}: {state}")
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'migrate'
+
+    if command == 'status':
+        print_status()
+    elif command == 'migrate':
+        result = run_migrations()
+        if not result.get('success'):
+            print(f"Migration failed: {result.get('error')}")
+            sys.exit(1)
+        print(f"Schema at version {result['current_version']} "
+              f"({len(result['applied'])} migration(s) applied)")
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,270 @@
+"""
+Shared PostgreSQL Connection Pool
+Thread-safe, instrumented pool used by every service module for database access
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+# Pool configuration (overridable via environment)
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 20))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', 10))  # seconds
+DB_POOL_HEALTH_CHECK_IDLE = float(os.environ.get('DB_POOL_HEALTH_CHECK_IDLE', 30))  # seconds idle before ping
+DB_POOL_LEAK_THRESHOLD = float(os.environ.get('DB_POOL_LEAK_THRESHOLD', 300))  # seconds held before flagged
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the acquire timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections safe to share between threads.
+
+    Checkouts block (up to acquire_timeout) when max_size connections are in
+    use. Connections are health-checked on checkout and rolled back on return.
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str],
+        min_size: int = DB_POOL_MIN_SIZE,
+        max_size: int = DB_POOL_MAX_SIZE,
+        acquire_timeout: float = DB_POOL_ACQUIRE_TIMEOUT,
+        health_check_idle: float = DB_POOL_HEALTH_CHECK_IDLE,
+        leak_threshold: float = DB_POOL_LEAK_THRESHOLD,
+        connect=psycopg2.connect
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_idle = health_check_idle
+        self.leak_threshold = leak_threshold
+        self._connect = connect
+
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, returned_at) pairs, most recently used last
+        self._in_use = {}  # id(connection) -> checkout record
+        self._size = 0
+        self._closed = False
+
+        # Counters
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.leaks = 0
+        self.health_check_failures = 0
+        self.connections_created = 0
+        self.connections_discarded = 0
+
+        for _ in range(min_size):
+            self._idle.append((self._new_connection(), time.monotonic()))
+            self._size += 1
+
+    def _new_connection(self):
+        connection = self._connect(self.dsn)
+        self.connections_created += 1
+        return connection
+
+    def _discard(self, connection):
+        """Close a connection and free its slot (caller must hold the lock)"""
+        try:
+            if not connection.closed:
+                connection.close()
+        except Exception:
+            pass
+        self._size -= 1
+        self.connections_discarded += 1
+        self._cond.notify()
+
+    def _is_healthy(self, connection, idle_since: float) -> bool:
+        """Validate a connection before handing it out"""
+        if connection.closed:
+            return False
+        try:
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            if time.monotonic() - idle_since >= self.health_check_idle:
+                with connection.cursor() as cur:
+                    cur.execute("SELECT 1")
+                connection.rollback()
+            return True
+        except Exception as e:
+            print(f"Discarding unhealthy pooled connection: {str(e)}")
+            return False
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Check out a connection, waiting up to timeout seconds for a free slot"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            connection = None
+            idle_since = None
+
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("connection pool is closed")
+                    if self._idle:
+                        connection, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {timeout:.1f}s waiting for a database connection "
+                            f"({self.max_size} in use)"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if connection is None:
+                try:
+                    connection = self._new_connection()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(connection, idle_since):
+                with self._cond:
+                    self.health_check_failures += 1
+                    self._discard(connection)
+                continue
+
+            wait_time = time.monotonic() - start
+            with self._cond:
+                self.checkouts += 1
+                if waited:
+                    self.waits += 1
+                    self.wait_time_total += wait_time
+                    self.max_wait_time = max(self.max_wait_time, wait_time)
+                self._in_use[id(connection)] = {
+                    'checked_out_at': time.monotonic(),
+                    'thread': threading.current_thread().name,
+                    'leak_reported': False
+                }
+            return connection
+
+    def putconn(self, connection, close: bool = False):
+        """Return a connection to the pool"""
+        with self._cond:
+            record = self._in_use.pop(id(connection), None)
+            if record is None:
+                raise PoolError("trying to put unkeyed connection")
+
+            held_for = time.monotonic() - record['checked_out_at']
+            if held_for >= self.leak_threshold and not record['leak_reported']:
+                self.leaks += 1
+                print(f"⚠️ Database connection held for {held_for:.1f}s by thread {record['thread']}")
+
+            if close or self._closed or connection.closed:
+                self._discard(connection)
+                return
+
+        # Roll back outside the lock; it is a network round-trip
+        try:
+            if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Exception:
+            with self._cond:
+                self._discard(connection)
+            return
+
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def _scan_for_leaks(self):
+        """Count checkouts held past the leak threshold (caller must hold the lock)"""
+        now = time.monotonic()
+        for record in self._in_use.values():
+            if not record['leak_reported'] and now - record['checked_out_at'] >= self.leak_threshold:
+                record['leak_reported'] = True
+                self.leaks += 1
+
+    def get_stats(self) -> Dict:
+        """Snapshot of pool sizing and counters"""
+        with self._cond:
+            self._scan_for_leaks()
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time_ms_total': round(self.wait_time_total * 1000, 2),
+                'wait_time_ms_max': round(self.max_wait_time * 1000, 2),
+                'timeouts': self.timeouts,
+                'leaks': self.leaks,
+                'health_check_failures': self.health_check_failures,
+                'connections_created': self.connections_created,
+                'connections_discarded': self.connections_discarded,
+                'acquire_timeout_seconds': self.acquire_timeout
+            }
+
+    def closeall(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._discard(connection)
+            self._cond.notify_all()
+
+
+# Initialize the shared pool
+database_url = os.environ.get('DATABASE_URL')
+try:
+    pool = ConnectionPool(database_url)
+    print(f"Database connection pool initialized successfully "
+          f"(min={pool.min_size}, max={pool.max_size}, timeout={pool.acquire_timeout}s)")
+except Exception as e:
+    print(f"Error initializing database connection pool: {str(e)}")
+    # Fallback for development without DB
+    pool = None
+
+
+@contextmanager
+def get_db_connection():
+    """Check out a pooled connection for the duration of the with-block (None if no DB)"""
+    if pool is None:
+        yield None
+        return
+
+    connection = pool.getconn()
+    try:
+        yield connection
+    finally:
+        pool.putconn(connection)
+
+
+def get_pool_stats() -> Dict:
+    """Get pool counters for monitoring endpoints"""
+    if pool is None:
+        return {'available': False}
+    stats = pool.get_stats()
+    stats['available'] = True
+    return stats
@@ -2,18 +2,8 @@ import hashlib
 from datetime import datetime, timedelta
 from user_agents import parse
 from typing import Dict, Optional, Tuple
-import psycopg2
 from psycopg2.extras import RealDictCursor
-
-def get_db_connection():
-    """Get database connection"""
-    import os
-    try:
-        conn = psycopg2.connect(os.environ.get("DATABASE_URL"))
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {str(e)}")
-        return None
+from db_pool import get_db_connection
 
 def parse_user_agent(user_agent_string: str) -> Dict:
     """Parse user agent string and extract device information"""
@@ -158,157 +148,151 @@ def register_or_update_device(
     estimated_value = estimate_device_value(device_info['device_brand'], device_info['device_model'], device_info['os_version'])
     storage, color = get_device_storage_and_color(device_info['device_model'])
     
-    conn = get_db_connection()
-    if not conn:
-        return {'success': False, 'error': 'Database connection failed'}
+    with get_db_connection() as conn:
+        if not conn:
+            return {'success': False, 'error': 'Database connection failed'}
     
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT id, last_active FROM devices 
-                WHERE device_fingerprint = %s
-                """,
-                (fingerprint,)
-            )
-            existing_device = cur.fetchone()
-            
-            if existing_device:
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
                     """
-                    UPDATE devices SET
-                        last_active = CURRENT_TIMESTAMP,
-                        device_status = 'online',
-                        ip_address = %s,
-                        updated_at = CURRENT_TIMESTAMP
+                    SELECT id, last_active FROM devices 
                     WHERE device_fingerprint = %s
-                    RETURNING id
                     """,
-                    (ip_address, fingerprint)
+                    (fingerprint,)
                 )
-                device_id = cur.fetchone()['id']
-                conn.commit()
-                
-                return {
-                    'success': True,
-                    'device_id': device_id,
-                    'action': 'updated',
-                    'message': 'Device information updated'
-                }
-            else:
-                cur.execute(
-                    """
-                    INSERT INTO devices (
-                        user_id, firebase_uid, device_type, device_brand, device_model,
-                        os_family, os_version, browser_family, browser_version,
-                        user_agent, device_fingerprint, ip_address,
-                        estimated_value, storage_capacity, color, condition, device_status
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'online'
+                existing_device = cur.fetchone()
+            
+                if existing_device:
+                    cur.execute(
+                        """
+                        UPDATE devices SET
+                            last_active = CURRENT_TIMESTAMP,
+                            device_status = 'online',
+                            ip_address = %s,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE device_fingerprint = %s
+                        RETURNING id
+                        """,
+                        (ip_address, fingerprint)
                     )
-                    RETURNING id
-                    """,
-                    (
-                        user_id, firebase_uid, device_info['device_type'],
-                        device_info['device_brand'], device_info['device_model'],
-                        device_info['os_family'], device_info['os_version'],
-                        device_info['browser_family'], device_info['browser_version'],
-                        user_agent, fingerprint, ip_address,
-                        estimated_value, storage, color, 'excellent'
+                    device_id = cur.fetchone()['id']
+                    conn.commit()
+                
+                    return {
+                        'success': True,
+                        'device_id': device_id,
+                        'action': 'updated',
+                        'message': 'Device information updated'
+                    }
+                else:
+                    cur.execute(
+                        """
+                        INSERT INTO devices (
+                            user_id, firebase_uid, device_type, device_brand, device_model,
+                            os_family, os_version, browser_family, browser_version,
+                            user_agent, device_fingerprint, ip_address,
+                            estimated_value, storage_capacity, color, condition, device_status
+                        ) VALUES (
+                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'online'
+                        )
+                        RETURNING id
+                        """,
+                        (
+                            user_id, firebase_uid, device_info['device_type'],
+                            device_info['device_brand'], device_info['device_model'],
+                            device_info['os_family'], device_info['os_version'],
+                            device_info['browser_family'], device_info['browser_version'],
+                            user_agent, fingerprint, ip_address,
+                            estimated_value, storage, color, 'excellent'
+                        )
                     )
-                )
-                device_id = cur.fetchone()['id']
-                conn.commit()
+                    device_id = cur.fetchone()['id']
+                    conn.commit()
                 
-                return {
-                    'success': True,
-                    'device_id': device_id,
-                    'action': 'created',
-                    'message': 'New device registered'
-                }
+                    return {
+                        'success': True,
+                        'device_id': device_id,
+                        'action': 'created',
+                        'message': 'New device registered'
+                    }
     
-    except Exception as e:
-        conn.rollback()
-        print(f"Error registering device: {str(e)}")
-        return {'success': False, 'error': str(e)}
-    finally:
-        conn.close()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error registering device: {str(e)}")
+            return {'success': False, 'error': str(e)}
 
 def get_user_devices(firebase_uid: str) -> Dict:
     """Get all devices associated with a user"""
-    conn = get_db_connection()
-    if not conn:
-        return {'success': False, 'error': 'Database connection failed'}
+    with get_db_connection() as conn:
+        if not conn:
+            return {'success': False, 'error': 'Database connection failed'}
     
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT 
-                    id, device_type, device_brand, device_model,
-                    os_family, os_version, browser_family, browser_version,
-                    last_active, first_seen, device_status,
-                    estimated_value, storage_capacity, color, condition,
-                    is_primary
-                FROM devices
-                WHERE firebase_uid = %s
-                ORDER BY last_active DESC
-                """,
-                (firebase_uid,)
-            )
-            devices = cur.fetchall()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    """
+                    SELECT 
+                        id, device_type, device_brand, device_model,
+                        os_family, os_version, browser_family, browser_version,
+                        last_active, first_seen, device_status,
+                        estimated_value, storage_capacity, color, condition,
+                        is_primary
+                    FROM devices
+                    WHERE firebase_uid = %s
+                    ORDER BY last_active DESC
+                    """,
+                    (firebase_uid,)
+                )
+                devices = cur.fetchall()
             
-            for device in devices:
-                time_diff = datetime.now() - device['last_active']
-                if time_diff < timedelta(minutes=5):
-                    device['device_status'] = 'online'
-                else:
-                    device['device_status'] = 'offline'
+                for device in devices:
+                    time_diff = datetime.now() - device['last_active']
+                    if time_diff < timedelta(minutes=5):
+                        device['device_status'] = 'online'
+                    else:
+                        device['device_status'] = 'offline'
             
-            return {
-                'success': True,
-                'devices': devices,
-                'count': len(devices)
-            }
+                return {
+                    'success': True,
+                    'devices': devices,
+                    'count': len(devices)
+                }
     
-    except Exception as e:
-        print(f"Error fetching devices: {str(e)}")
-        return {'success': False, 'error': str(e)}
-    finally:
-        conn.close()
+        except Exception as e:
+            print(f"Error fetching devices: {str(e)}")
+            return {'success': False, 'error': str(e)}
 
 def mark_devices_offline(firebase_uid: str, exclude_fingerprint: Optional[str] = None):
     """Mark all devices as offline except the current one"""
-    conn = get_db_connection()
-    if not conn:
-        return
+    with get_db_connection() as conn:
+        if not conn:
+            return
     
-    try:
-        with conn.cursor() as cur:
-            if exclude_fingerprint:
-                cur.execute(
-                    """
-                    UPDATE devices 
-                    SET device_status = 'offline'
-                    WHERE firebase_uid = %s 
-                    AND device_fingerprint != %s
-                    AND last_active < NOW() - INTERVAL '5 minutes'
-                    """,
-                    (firebase_uid, exclude_fingerprint)
-                )
-            else:
-                cur.execute(
-                    """
-                    UPDATE devices 
-                    SET device_status = 'offline'
-                    WHERE firebase_uid = %s
-                    AND last_active < NOW() - INTERVAL '5 minutes'
-                    """,
-                    (firebase_uid,)
-                )
-            conn.commit()
-    except Exception as e:
-        print(f"Error marking devices offline: {str(e)}")
-        conn.rollback()
-    finally:
-        conn.close()
+        try:
+            with conn.cursor() as cur:
+                if exclude_fingerprint:
+                    cur.execute(
+                        """
+                        UPDATE devices 
+                        SET device_status = 'offline'
+                        WHERE firebase_uid = %s 
+                        AND device_fingerprint != %s
+                        AND last_active < NOW() - INTERVAL '5 minutes'
+                        """,
+                        (firebase_uid, exclude_fingerprint)
+                    )
+                else:
+                    cur.execute(
+                        """
+                        UPDATE devices 
+                        SET device_status = 'offline'
+                        WHERE firebase_uid = %s
+                        AND last_active < NOW() - INTERVAL '5 minutes'
+                        """,
+                        (firebase_uid,)
+                    )
+                conn.commit()
+        except Exception as e:
+            print(f"Error marking devices offline: {str(e)}")
+            conn.rollback()
@@ -4,6 +4,42 @@ import time
 from typing import Dict, Any, Optional
 from datetime import datetime
 from oxio_service import oxio_service
+from db_pool import get_db_connection
+from parallel_tasks import run_parallel
+
+# Activation workflow steps, run in order. Each completed step's output is
+# checkpointed in esim_activation_workflows so a retry resumes at the first
+# incomplete step instead of repeating OXIO calls, DB writes or token awards.
+ACTIVATION_STEPS = (
+    'user_data',
+    'oxio_user',
+    'line_activation',
+    'activation_data',
+    'activation_record',
+    'user_esim_details',
+    'token_reward',
+    'activation_email',
+)
+WORKFLOW_LEASE_SECONDS = 300  # a running workflow is considered abandoned after this
+
+# Steps that only depend on activation_data and run concurrently once the
+# activation record is stored; a timed-out step checkpoints itself on completion
+PARALLEL_STEPS = ('user_esim_details', 'token_reward', 'activation_email')
+PARALLEL_STEP_TIMEOUTS = {
+    'user_esim_details': 10,
+    'token_reward': int(os.environ.get('ACTIVATION_TOKEN_REWARD_TIMEOUT', 60)),
+    'activation_email': int(os.environ.get('ACTIVATION_EMAIL_TIMEOUT', 30)),
+}
+
+
+class ActivationStepError(Exception):
+    """A workflow step failed; the workflow stops there and can be resumed"""
+
+    def __init__(self, step: str, message: str, details: Dict[str, Any] = None):
+        super().__init__(message)
+        self.step = step
+        self.details = details or {}
+
 
 class eSIMActivationService:
     def __init__(self):
@@ -14,115 +50,357 @@ class eSIMActivationService:
                                    user_email: str, 
                                    user_name: str = None,
                                    stripe_session_id: str = None,
-                                   purchase_amount: int = 100) -> Dict[str, Any]:
+                                   purchase_amount: int = 100,
+                                   workflow_key: str = None) -> Dict[str, Any]:
         """
         Complete eSIM activation workflow after successful Stripe payment
 
+        Repeated calls for the same Stripe session resume the persisted workflow
+        at its first incomplete step; a completed workflow returns its stored result.
+
         Args:
             firebase_uid: User's Firebase UID
             user_email: User's email address
             user_name: User's display name (optional)
             stripe_session_id: Stripe checkout session ID
             purchase_amount: Payment amount in cents
+            workflow_key: Workflow identity (default: Stripe session ID, else Firebase UID)
 
         Returns:
             Dictionary with activation results
         """
+        workflow_key = workflow_key or stripe_session_id or f"uid:{firebase_uid}"
         try:
-            print(f"🎯 Starting eSIM activation workflow for Firebase UID: {firebase_uid}")
-
-            # Step 1: Get or create user data in database
-            user_data = self._get_or_create_user_data(firebase_uid, user_email, user_name)
-            if not user_data:
-                return {
-                    'success': False,
-                    'error': 'Failed to get/create user data',
-                    'step': 'user_data_creation'
-                }
-
-            user_id = user_data['user_id']
-            existing_oxio_user_id = user_data.get('oxio_user_id')
-            existing_oxio_group_id = user_data.get('oxio_group_id')
+            workflow = self._claim_workflow(workflow_key, {
+                'firebase_uid': firebase_uid,
+                'user_email': user_email,
+                'user_name': user_name,
+                'stripe_session_id': stripe_session_id,
+                'purchase_amount': purchase_amount
+            })
+        except Exception as e:
+            print(f"❌ Error claiming eSIM activation workflow {workflow_key}: {str(e)}")
+            return {'success': False, 'error': str(e), 'step': 'workflow_claim'}
 
-            print(f"📊 User data: ID={user_id}, OXIO User={existing_oxio_user_id}, OXIO Group={existing_oxio_group_id}")
+        if not workflow:
+            return {
+                'success': False,
+                'error': 'Activation already in progress',
+                'step': 'workflow_in_progress'
+            }
+        return self._run_workflow(workflow)
 
-            # Step 2: Ensure OXIO user exists first (needed for group creation)
-            oxio_user_id = self._ensure_oxio_user(
-                user_id, firebase_uid, user_email, user_name, 
-                existing_oxio_user_id  # Groups excluded entirely
+    def resume_activation(self, firebase_uid: str, user_email: str = None, user_name: str = None) -> Dict[str, Any]:
+        """
+        Resume the user's most recent unfinished activation workflow. Without one,
+        start a manual workflow unless the user already has an activation record.
+        """
+        with get_db_connection() as conn:
+            if not conn:
+                return {'success': False, 'error': 'Database unavailable', 'step': 'workflow_claim'}
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT workflow_key, user_email, user_name, stripe_session_id, purchase_amount
+                    FROM esim_activation_workflows
+                    WHERE firebase_uid = %s AND status <> 'completed'
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                """, (firebase_uid,))
+                pending = cur.fetchone()
+
+                if not pending:
+                    cur.execute("SELECT 1 FROM oxio_activations WHERE firebase_uid = %s LIMIT 1", (firebase_uid,))
+                    if cur.fetchone():
+                        return {'success': True, 'already_activated': True,
+                                'message': 'Activation record already exists'}
+
+        if pending:
+            workflow_key, stored_email, stored_name, stripe_session_id, purchase_amount = pending
+            print(f"🔁 Resuming eSIM activation workflow {workflow_key}")
+            return self.activate_esim_after_payment(
+                firebase_uid, stored_email or user_email, stored_name or user_name,
+                stripe_session_id, purchase_amount, workflow_key=workflow_key
             )
-            if not oxio_user_id:
-                return {
-                    'success': False,
-                    'error': 'Failed to create/get OXIO user',
-                    'step': 'oxio_user_creation'
-                }
 
-            # Step 3: OXIO Groups disabled - continue without group ID to prevent webhook failures
-            oxio_group_id = None  # Groups excluded entirely from activation flow
+        return self.activate_esim_after_payment(
+            firebase_uid, user_email, user_name,
+            stripe_session_id='manual_fix', purchase_amount=100,
+            workflow_key=f"manual_fix:{firebase_uid}"
+        )
 
-            # Step 3.5: Update users table with OXIO user ID for profile display
-            self._update_user_oxio_data(firebase_uid, oxio_user_id, oxio_group_id)
-
-            # Step 4: Activate eSIM line with proper payload structure
-            activation_result = self._activate_esim_line(oxio_user_id)
-            if not activation_result.get('success'):
-                return {
-                    'success': False,
-                    'error': f"eSIM activation failed: {activation_result.get('message', 'Unknown error')}",
-                    'step': 'esim_activation',
-                    'oxio_response': activation_result
-                }
-
-            # Step 5: Process activation data and store results
-            esim_data = self._process_activation_data(activation_result)
+    def _claim_workflow(self, workflow_key: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Create or load the workflow and take its lease.
+        Returns None if another run holds an unexpired lease.
+        """
+        with get_db_connection() as conn:
+            if not conn:
+                raise Exception('Database unavailable')
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO esim_activation_workflows
+                        (workflow_key, firebase_uid, user_email, user_name, stripe_session_id, purchase_amount)
+                    VALUES (%(key)s, %(firebase_uid)s, %(user_email)s, %(user_name)s,
+                            %(stripe_session_id)s, %(purchase_amount)s)
+                    ON CONFLICT (workflow_key) DO NOTHING
+                """, {'key': workflow_key, **params})
+
+                cur.execute("""
+                    UPDATE esim_activation_workflows
+                    SET status = CASE WHEN status = 'completed' THEN status ELSE 'running' END,
+                        attempts = attempts + CASE WHEN status = 'completed' THEN 0 ELSE 1 END,
+                        lease_expires_at = CURRENT_TIMESTAMP + (%s * INTERVAL '1 second'),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE workflow_key = %s
+                        AND (status <> 'running' OR lease_expires_at < CURRENT_TIMESTAMP)
+                    RETURNING id, status, attempts, steps, firebase_uid, user_email, user_name,
+                              stripe_session_id, purchase_amount
+                """, (WORKFLOW_LEASE_SECONDS, workflow_key))
+                row = cur.fetchone()
+                conn.commit()
+
+        if not row:
+            return None
+        steps = row[3] if isinstance(row[3], dict) else json.loads(row[3] or '{}')
+        return {
+            'id': row[0],
+            'workflow_key': workflow_key,
+            'status': row[1],
+            'attempts': row[2],
+            'steps': steps,
+            'firebase_uid': row[4],
+            'user_email': row[5],
+            'user_name': row[6],
+            'stripe_session_id': row[7],
+            'purchase_amount': row[8]
+        }
+
+    def _checkpoint(self, workflow_id: int, step: str, output: Any = None, status: str = None,
+                    error: str = None):
+        """Persist a completed step's output and/or the workflow's state (status None keeps it)"""
+        try:
+            with get_db_connection() as conn:
+                if not conn:
+                    print(f"⚠️ Could not checkpoint step {step}: database unavailable")
+                    return
+
+                with conn.cursor() as cur:
+                    step_state = None
+                    if output is not None:
+                        step_state = json.dumps({step: {
+                            'output': output,
+                            'completed_at': datetime.now().isoformat()
+                        }})
+                    cur.execute("""
+                        UPDATE esim_activation_workflows
+                        SET steps = CASE WHEN %(state)s::jsonb IS NULL THEN steps ELSE steps || %(state)s::jsonb END,
+                            current_step = CASE WHEN %(status)s IS NULL AND status = 'completed'
+                                                THEN current_step ELSE %(step)s END,
+                            status = COALESCE(%(status)s, status),
+                            last_error = CASE WHEN %(status)s IS NULL THEN last_error ELSE %(error)s END,
+                            lease_expires_at = CASE WHEN COALESCE(%(status)s, status) = 'running'
+                                                    THEN lease_expires_at END,
+                            completed_at = CASE WHEN %(status)s = 'completed' THEN CURRENT_TIMESTAMP
+                                                ELSE completed_at END,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %(id)s
+                    """, {'state': step_state, 'step': step, 'status': status, 'error': error, 'id': workflow_id})
+                    conn.commit()
+        except Exception as e:
+            print(f"⚠️ Could not checkpoint step {step}: {str(e)}")
 
-            # Step 6: Store activation record in database
-            stored_activation = self._store_activation_record(
-                user_id, firebase_uid, stripe_session_id, esim_data, activation_result
-            )
+    def _run_workflow(self, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        """Run every step not yet completed, checkpointing after each one"""
+        outputs = {name: state.get('output') for name, state in workflow['steps'].items()}
+        ctx = dict(workflow, outputs=outputs)
+        completed = [name for name in ACTIVATION_STEPS if name in outputs]
 
-            # Step 7: Update Users table with eSIM details for profile display
-            self._update_user_esim_details(
-                firebase_uid, 
-                phone_number=esim_data.get('phone_number'),
-                lpa_address=esim_data.get('activation_url'),
-                iccid=esim_data.get('iccid'),
-                qr_code=esim_data.get('qr_code')
-            )
+        if workflow['status'] == 'completed':
+            print(f"✅ eSIM activation workflow {workflow['workflow_key']} already completed")
+            return self._workflow_result(ctx, resumed_from=None)
 
-            # Step 8: Award tokens for purchase (10.33% reward)
-            token_result = self._award_purchase_tokens(user_data.get('eth_address'), purchase_amount)
+        resumed_from = next((name for name in ACTIVATION_STEPS if name not in outputs), None)
+        if completed:
+            print(f"🔁 Resuming eSIM activation workflow {workflow['workflow_key']} at step "
+                  f"{resumed_from} ({len(completed)}/{len(ACTIVATION_STEPS)} done)")
+        else:
+            print(f"🎯 Starting eSIM activation workflow for Firebase UID: {workflow['firebase_uid']}")
 
-            # Step 9: Send confirmation email
-            email_sent = self._send_activation_email(
-                user_email, user_name, esim_data, oxio_user_id
-            )
+        try:
+            for name in ACTIVATION_STEPS:
+                if name in outputs or name in PARALLEL_STEPS:
+                    continue
+                outputs[name] = self._run_step(ctx, name)
 
-            return {
-                'success': True,
-                'message': 'eSIM activation completed successfully',
-                'esim_data': esim_data,
-                'oxio_user_id': oxio_user_id,
-                'oxio_group_id': oxio_group_id,
-                'activation_id': stored_activation.get('activation_id'),
-                'token_reward': token_result,
-                'email_sent': email_sent,
-                'stripe_session_id': stripe_session_id
-            }
+            ctx['side_effects'] = self._run_parallel_steps(ctx)
 
+        except ActivationStepError as e:
+            self._checkpoint(workflow['id'], e.step, status='failed', error=str(e))
+            result = {'success': False, 'error': str(e), 'step': e.step, 'resumable': True}
+            result.update(e.details)
+            return result
         except Exception as e:
             print(f"❌ Error in eSIM activation workflow: {str(e)}")
+            self._checkpoint(workflow['id'], 'workflow_exception', status='failed', error=str(e))
             return {
                 'success': False,
                 'error': str(e),
-                'step': 'workflow_exception'
+                'step': 'workflow_exception',
+                'resumable': True
             }
 
+        incomplete = [name for name in PARALLEL_STEPS if name not in outputs]
+        if incomplete:
+            # The line is active, but leave the workflow resumable so the next
+            # run retries the post-activation steps that did not succeed
+            error = 'Post-activation steps incomplete: ' + ', '.join(
+                f"{name} ({ctx['side_effects'][name]['error']})" if name in ctx['side_effects'] else name
+                for name in incomplete
+            )
+            self._checkpoint(workflow['id'], incomplete[0], status='failed', error=error)
+            result = self._workflow_result(ctx, resumed_from if completed else None)
+            result.update({'resumable': True, 'incomplete_steps': incomplete, 'error': error})
+            return result
+
+        self._checkpoint(workflow['id'], ACTIVATION_STEPS[-1], status='completed')
+        return self._workflow_result(ctx, resumed_from if completed else None)
+
+    def _run_step(self, ctx: Dict[str, Any], name: str) -> Any:
+        """Run one step and checkpoint its output"""
+        output = getattr(self, f'_step_{name}')(ctx)
+        self._checkpoint(ctx['id'], name, output)
+        return output
+
+    def _run_parallel_steps(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fan out the independent post-activation steps so activation latency is
+        bounded by the slowest of them rather than their sum. A step that fails
+        or times out is left unrecorded (the workflow stays resumable); a late
+        success still checkpoints itself.
+        """
+        outputs = ctx['outputs']
+        pending = [name for name in PARALLEL_STEPS if name not in outputs]
+        if not pending:
+            return {}
+
+        results = run_parallel(
+            {name: (lambda name=name: self._run_step(ctx, name)) for name in pending},
+            timeouts=PARALLEL_STEP_TIMEOUTS
+        )
+        for name, result in results.items():
+            if result['success']:
+                outputs[name] = result['result']
+            else:
+                print(f"⚠️ Activation step {name} did not complete: {result['error']}")
+
+        print("⚡ Post-activation steps finished: " +
+              ", ".join(f"{name}={result['elapsed_ms']}ms" for name, result in results.items()))
+        return {
+            name: {key: result.get(key) for key in ('success', 'error', 'timed_out', 'elapsed_ms')}
+            for name, result in results.items()
+        }
+
+    def _workflow_result(self, ctx: Dict[str, Any], resumed_from: Optional[str]) -> Dict[str, Any]:
+        outputs = ctx['outputs']
+        return {
+            'success': True,
+            'message': 'eSIM activation completed successfully',
+            'esim_data': outputs.get('activation_data') or {},
+            'oxio_user_id': outputs.get('oxio_user'),
+            'oxio_group_id': None,  # Groups excluded entirely from activation flow
+            'activation_id': (outputs.get('activation_record') or {}).get('activation_id'),
+            'token_reward': outputs.get('token_reward'),
+            'email_sent': outputs.get('activation_email'),
+            'stripe_session_id': ctx['stripe_session_id'],
+            'workflow_id': ctx['id'],
+            'resumed_from': resumed_from,
+            'side_effects': ctx.get('side_effects', {})
+        }
+
+    # Workflow steps: each returns a JSON-serializable output or raises ActivationStepError
+
+    def _step_user_data(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 1: Get or create user data in database"""
+        user_data = self._get_or_create_user_data(ctx['firebase_uid'], ctx['user_email'], ctx['user_name'])
+        if not user_data:
+            raise ActivationStepError('user_data', 'Failed to get/create user data')
+        print(f"📊 User data: ID={user_data['user_id']}, OXIO User={user_data.get('oxio_user_id')}")
+        return user_data
+
+    def _step_oxio_user(self, ctx: Dict[str, Any]) -> str:
+        """Step 2: Ensure OXIO user exists and is saved on the users row (OXIO groups are not used)"""
+        user_data = ctx['outputs']['user_data']
+        oxio_user_id = self._ensure_oxio_user(
+            user_data['user_id'], ctx['firebase_uid'], ctx['user_email'], ctx['user_name'],
+            user_data.get('oxio_user_id')
+        )
+        if not oxio_user_id:
+            raise ActivationStepError('oxio_user', 'Failed to create/get OXIO user')
+        self._update_user_oxio_data(ctx['firebase_uid'], oxio_user_id, None)
+        return oxio_user_id
+
+    def _step_line_activation(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 3: Activate eSIM line with OXIO"""
+        activation_result = self._activate_esim_line(ctx['outputs']['oxio_user'])
+        if not activation_result.get('success'):
+            raise ActivationStepError(
+                'line_activation',
+                f"eSIM activation failed: {activation_result.get('message', 'Unknown error')}",
+                {'oxio_response': activation_result}
+            )
+        return activation_result
+
+    def _step_activation_data(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 4: Extract eSIM details and render the QR code"""
+        return self._process_activation_data(ctx['outputs']['line_activation'])
+
+    def _step_activation_record(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 5: Store activation record in database"""
+        stored = self._store_activation_record(
+            ctx['outputs']['user_data']['user_id'], ctx['firebase_uid'], ctx['stripe_session_id'],
+            ctx['outputs']['activation_data'], ctx['outputs']['line_activation']
+        )
+        if not stored.get('success'):
+            raise ActivationStepError('activation_record', f"Failed to store activation record: {stored.get('error')}")
+        return stored
+
+    def _step_user_esim_details(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """Step 6: Update Users table with eSIM details for profile display"""
+        esim_data = ctx['outputs']['activation_data']
+        self._update_user_esim_details(
+            ctx['firebase_uid'],
+            phone_number=esim_data.get('phone_number'),
+            lpa_address=esim_data.get('activation_url'),
+            iccid=esim_data.get('iccid'),
+            qr_code=esim_data.get('qr_code')
+        )
+        return {}
+
+    def _step_token_reward(self, ctx: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Step 7: Award tokens for purchase (10.33% reward); checkpointed so it is never repeated.
+        A failed award is not checkpointed, so the next run retries it.
+        """
+        reward = self._award_purchase_tokens(ctx['outputs']['user_data'].get('eth_address'), ctx['purchase_amount'])
+        if not reward.get('success') and not reward.get('skipped'):
+            raise ActivationStepError('token_reward', f"Token reward failed: {reward.get('error')}", {'token_reward': reward})
+        return reward
+
+    def _step_activation_email(self, ctx: Dict[str, Any]) -> bool:
+        """Step 8: Send confirmation email; an unsent email is not checkpointed, so the next run retries it"""
+        sent = self._send_activation_email(
+            ctx['user_email'], ctx['user_name'], ctx['outputs']['activation_data'], ctx['outputs']['oxio_user']
+        )
+        if not sent:
+            raise ActivationStepError('activation_email', f"Failed to send activation email to {ctx['user_email']}")
+        return True
+
     def _get_or_create_user_data(self, firebase_uid: str, user_email: str, user_name: str = None) -> Optional[Dict[str, Any]]:
         """Get user data from database or create if missing"""
         try:
-            from main import get_db_connection, get_user_by_firebase_uid
+            from main import get_user_by_firebase_uid
 
             # Try to get existing user
             user_data = get_user_by_firebase_uid(firebase_uid)
@@ -344,33 +622,9 @@ class eSIMActivationService:
                                 esim_data: Dict[str, Any], activation_result: Dict[str, Any]) -> Dict[str, Any]:
         """Store activation record in database"""
         try:
-            from main import get_db_connection
-
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
-                        # Ensure oxio_activations table exists with all required columns
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS oxio_activations (
-                                id SERIAL PRIMARY KEY,
-                                user_id INTEGER NOT NULL,
-                                firebase_uid VARCHAR(128),
-                                purchase_id VARCHAR(200),
-                                product_id VARCHAR(100),
-                                iccid VARCHAR(50),
-                                line_id VARCHAR(100),
-                                phone_number VARCHAR(20),
-                                activation_status VARCHAR(50),
-                                plan_id VARCHAR(100),
-                                group_id VARCHAR(100),
-                                esim_qr_code TEXT,
-                                activation_url VARCHAR(500),
-                                activation_code VARCHAR(200),
-                                oxio_response TEXT,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        """)
-
                         # Insert activation record
                         cur.execute("""
                             INSERT INTO oxio_activations 
@@ -403,8 +657,6 @@ class eSIMActivationService:
     def _update_user_oxio_data(self, firebase_uid: str, oxio_user_id: str = None, oxio_group_id: str = None):
         """Update user record with OXIO data"""
         try:
-            from main import get_db_connection
-
             if not oxio_user_id and not oxio_group_id:
                 return
 
@@ -437,8 +689,6 @@ class eSIMActivationService:
                                    lpa_address: str = None, iccid: str = None, qr_code: str = None):
         """Update user record with eSIM details for profile display"""
         try:
-            from main import get_db_connection
-
             if not any([phone_number, lpa_address, iccid, qr_code]):
                 print("⚠️ No eSIM details provided to update")
                 return
@@ -482,24 +732,26 @@ class eSIMActivationService:
         """Award 10.33% DOTM tokens for purchase"""
         try:
             if not eth_address or purchase_amount <= 0:
-                return {'success': False, 'message': 'No ETH address or invalid amount'}
+                # Nothing to award; retrying cannot change that
+                return {'success': False, 'skipped': True, 'message': 'No ETH address or invalid amount'}
 
             from ethereum_helper import reward_data_purchase
 
-            success, tx_hash = reward_data_purchase(eth_address, purchase_amount)
+            success, result = reward_data_purchase(eth_address, purchase_amount)
 
             if success:
                 reward_amount = (purchase_amount / 100) * 0.1033
-                print(f"🪙 Awarded {reward_amount:.4f} DOTM tokens to {eth_address}: {tx_hash}")
+                print(f"🪙 Queued {reward_amount:.4f} DOTM token reward to {eth_address}: {result}")
                 return {
                     'success': True,
-                    'tx_hash': tx_hash,
+                    'tx_id': result.id,
+                    'tx_hash': result.tx_hash,
                     'reward_amount_usd': reward_amount,
                     'eth_address': eth_address
                 }
             else:
-                print(f"❌ Failed to award tokens: {tx_hash}")
-                return {'success': False, 'error': tx_hash}
+                print(f"❌ Failed to award tokens: {result}")
+                return {'success': False, 'error': result}
 
         except Exception as e:
             print(f"❌ Error awarding tokens: {str(e)}")
@@ -572,8 +824,6 @@ class eSIMActivationService:
     def _get_email_template(self, template_type: str) -> Optional[Dict[str, str]]:
         """Get email template from database"""
         try:
-            from main import get_db_connection
-
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
@@ -8,6 +8,103 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 
+def line_fields(line_data: Dict[str, Any]) -> Dict[str, str]:
+    """The OXIO line fields stored locally, normalized (missing values become '')"""
+    sim_info = line_data.get('sim') or {}
+    phone_numbers = line_data.get('phoneNumbers') or []
+    return {
+        'line_id': line_data.get('lineId') or '',
+        'status': line_data.get('status') or 'UNKNOWN',
+        'iccid': sim_info.get('iccid') or '',
+        'activation_code': sim_info.get('activationCode') or '',
+        'activation_url': sim_info.get('activationUrl') or '',
+        'country': sim_info.get('countryCode') or 'US',
+        'phone_number': (phone_numbers[0].get('phoneNumber') or '') if phone_numbers else ''
+    }
+
+
+def upsert_iccid(cursor, firebase_uid: str, fields: Dict[str, str]):
+    cursor.execute("""
+        INSERT INTO iccid_inventory 
+            (iccid, lpa_code, country, status, allocated_to_firebase_uid, assigned_at, line_id)
+        VALUES (%s, %s, %s, %s, %s, NOW(), %s)
+        ON CONFLICT (iccid) 
+        DO UPDATE SET
+            lpa_code = EXCLUDED.lpa_code,
+            status = 'assigned',
+            allocated_to_firebase_uid = EXCLUDED.allocated_to_firebase_uid,
+            assigned_at = NOW(),
+            line_id = EXCLUDED.line_id
+    """, (fields['iccid'], fields['activation_code'] or fields['activation_url'], fields['country'],
+          'assigned', firebase_uid, fields['line_id']))
+
+
+def upsert_activation(cursor, firebase_uid: str, user_id: int, fields: Dict[str, str], line_data: Dict[str, Any]):
+    # Map OXIO status to our activation status
+    activation_status = 'activated' if fields['status'] in ['ACTIVE', 'INITIATING'] else 'pending'
+    
+    # Store full OXIO response for debugging
+    oxio_response_json = json.dumps({
+        'success': True,
+        'data': line_data,
+        'synced_from_oxio': True,
+        'sync_timestamp': datetime.now().isoformat()
+    })
+    
+    # oxio_activations has no unique (user_id, iccid) constraint, so update first
+    cursor.execute("""
+        UPDATE oxio_activations SET
+            line_id = %s,
+            phone_number = %s,
+            activation_status = %s,
+            activation_url = %s,
+            activation_code = %s,
+            oxio_response = %s
+        WHERE user_id = %s AND iccid = %s
+    """, (fields['line_id'], fields['phone_number'], activation_status, fields['activation_url'],
+          fields['activation_code'], oxio_response_json, user_id, fields['iccid']))
+    
+    if cursor.rowcount == 0:
+        cursor.execute("""
+            INSERT INTO oxio_activations 
+                (user_id, firebase_uid, product_id, iccid, line_id, phone_number, 
+                 activation_status, esim_qr_code, activation_url, activation_code, 
+                 oxio_response, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+        """, (
+            user_id, firebase_uid, 'esim_beta', fields['iccid'], fields['line_id'], fields['phone_number'],
+            activation_status, None, fields['activation_url'], fields['activation_code'], oxio_response_json
+        ))
+
+
+def ensure_recovered_purchase(cursor, firebase_uid: str, user_id: int) -> bool:
+    """Create a minimal purchase record tagged as recovered from OXIO if none exists; returns True if created"""
+    cursor.execute("""
+        SELECT purchaseid FROM purchases 
+        WHERE firebaseuid = %s AND stripeproductid = 'esim_beta'
+        LIMIT 1
+    """, (firebase_uid,))
+    
+    if cursor.fetchone():
+        return False
+    
+    cursor.execute("""
+        INSERT INTO purchases 
+            (stripeid, stripeproductid, priceid, totalamount, datecreated, 
+             userid, stripetransactionid, firebaseuid)
+        VALUES (%s, %s, %s, %s, NOW(), %s, %s, %s)
+    """, (
+        f'recovered_from_oxio_{firebase_uid}_{int(datetime.now().timestamp())}',
+        'esim_beta',
+        'price_1S7Yc6JnTfh0bNQQVeLeprXe',
+        100,  # $1.00 in cents
+        user_id,
+        'recovered_from_oxio',
+        firebase_uid
+    ))
+    return True
+
+
 def reconcile_oxio_line_to_database(firebase_uid: str, user_id: int, line_data: Dict[str, Any], conn) -> Dict[str, Any]:
     """
     Reconcile a single OXIO line into local database tables
@@ -30,121 +127,34 @@ def reconcile_oxio_line_to_database(firebase_uid: str, user_id: int, line_data:
             'errors': []
         }
         
-        # Extract line details
-        line_id = line_data.get('lineId', '')
-        status = line_data.get('status', 'UNKNOWN')
-        
-        # Extract SIM details
-        sim_info = line_data.get('sim', {})
-        iccid = sim_info.get('iccid', '')
-        activation_code = sim_info.get('activationCode', '')
-        activation_url = sim_info.get('activationUrl', '')
-        country = sim_info.get('countryCode', 'US')
+        fields = line_fields(line_data)
+        iccid = fields['iccid']
         
-        # Extract phone number
-        phone_numbers = line_data.get('phoneNumbers', [])
-        phone_number = phone_numbers[0].get('phoneNumber', '') if phone_numbers else ''
-        
-        if not iccid or not line_id:
+        if not iccid or not fields['line_id']:
             results['errors'].append('Missing required ICCID or Line ID from OXIO data')
             return results
         
-        print(f"📊 Reconciling OXIO line: ICCID={iccid}, Line ID={line_id}, Status={status}")
-        
-        # Step 1: Upsert into iccid_inventory
-        try:
-            cursor.execute("""
-                INSERT INTO iccid_inventory 
-                    (iccid, lpa_code, country, status, allocated_to_firebase_uid, assigned_at, line_id)
-                VALUES (%s, %s, %s, %s, %s, NOW(), %s)
-                ON CONFLICT (iccid) 
-                DO UPDATE SET
-                    lpa_code = EXCLUDED.lpa_code,
-                    status = 'assigned',
-                    allocated_to_firebase_uid = EXCLUDED.allocated_to_firebase_uid,
-                    assigned_at = NOW(),
-                    line_id = EXCLUDED.line_id
-            """, (iccid, activation_code or activation_url, country, 'assigned', firebase_uid, line_id))
-            
-            results['iccid_updated'] = True
-            print(f"✅ ICCID inventory updated for {iccid}")
-        except Exception as iccid_error:
-            results['errors'].append(f'ICCID update failed: {str(iccid_error)}')
-            print(f"❌ ICCID update failed: {iccid_error}")
-        
-        # Step 2: Upsert into oxio_activations
-        try:
-            # Map OXIO status to our activation status
-            activation_status = 'activated' if status in ['ACTIVE', 'INITIATING'] else 'pending'
-            
-            # Store full OXIO response for debugging
-            oxio_response_json = json.dumps({
-                'success': True,
-                'data': line_data,
-                'synced_from_oxio': True,
-                'sync_timestamp': datetime.now().isoformat()
-            })
-            
-            cursor.execute("""
-                INSERT INTO oxio_activations 
-                    (user_id, firebase_uid, product_id, iccid, line_id, phone_number, 
-                     activation_status, esim_qr_code, activation_url, activation_code, 
-                     oxio_response, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-                ON CONFLICT (user_id, iccid) 
-                DO UPDATE SET
-                    line_id = EXCLUDED.line_id,
-                    phone_number = EXCLUDED.phone_number,
-                    activation_status = EXCLUDED.activation_status,
-                    activation_url = EXCLUDED.activation_url,
-                    activation_code = EXCLUDED.activation_code,
-                    oxio_response = EXCLUDED.oxio_response
-            """, (
-                user_id, firebase_uid, 'esim_beta', iccid, line_id, phone_number,
-                activation_status, None, activation_url, activation_code, oxio_response_json
-            ))
-            
-            results['activation_updated'] = True
-            print(f"✅ OXIO activation updated for {iccid}")
-        except Exception as activation_error:
-            results['errors'].append(f'Activation update failed: {str(activation_error)}')
-            print(f"❌ Activation update failed: {activation_error}")
-        
-        # Step 3: Ensure purchase record exists (create minimal record if missing)
-        try:
-            # Check if purchase already exists
-            cursor.execute("""
-                SELECT purchaseid FROM purchases 
-                WHERE firebaseuid = %s AND stripeproductid = 'esim_beta'
-                LIMIT 1
-            """, (firebase_uid,))
-            
-            existing_purchase = cursor.fetchone()
-            
-            if not existing_purchase:
-                # Create minimal purchase record tagged as recovered from OXIO
-                cursor.execute("""
-                    INSERT INTO purchases 
-                        (stripeid, stripeproductid, priceid, totalamount, datecreated, 
-                         userid, stripetransactionid, firebaseuid)
-                    VALUES (%s, %s, %s, %s, NOW(), %s, %s, %s)
-                """, (
-                    f'recovered_from_oxio_{firebase_uid}_{int(datetime.now().timestamp())}',
-                    'esim_beta',
-                    'price_1S7Yc6JnTfh0bNQQVeLeprXe',
-                    100,  # $1.00 in cents
-                    user_id,
-                    'recovered_from_oxio',
-                    firebase_uid
-                ))
-                
-                results['purchase_created'] = True
-                print(f"✅ Purchase record created (recovered from OXIO)")
-            else:
-                print(f"ℹ️  Purchase record already exists")
-        except Exception as purchase_error:
-            results['errors'].append(f'Purchase creation failed: {str(purchase_error)}')
-            print(f"❌ Purchase creation failed: {purchase_error}")
+        print(f"📊 Reconciling OXIO line: ICCID={iccid}, Line ID={fields['line_id']}, Status={fields['status']}")
+        
+        # Each step runs in a savepoint so one failure doesn't abort the others
+        steps = [
+            ('iccid_updated', 'ICCID update', lambda: upsert_iccid(cursor, firebase_uid, fields)),
+            ('activation_updated', 'Activation update',
+             lambda: upsert_activation(cursor, firebase_uid, user_id, fields, line_data)),
+            ('purchase_created', 'Purchase creation',
+             lambda: ensure_recovered_purchase(cursor, firebase_uid, user_id)),
+        ]
+        for key, label, step in steps:
+            try:
+                cursor.execute("SAVEPOINT reconcile_step")
+                outcome = step()
+                cursor.execute("RELEASE SAVEPOINT reconcile_step")
+                results[key] = outcome if key == 'purchase_created' else True
+                print(f"✅ {label} done for {iccid}")
+            except Exception as step_error:
+                cursor.execute("ROLLBACK TO SAVEPOINT reconcile_step")
+                results['errors'].append(f'{label} failed: {str(step_error)}')
+                print(f"❌ {label} failed: {step_error}")
         
         # Commit changes
         conn.commit()
@@ -175,7 +185,7 @@ def sync_oxio_lines_for_user(firebase_uid: str, oxio_user_id: str, conn) -> Dict
         Dictionary with sync results
     """
     try:
-        from oxio_service import OXIOService
+        from oxio_service import oxio_service
         
         cursor = conn.cursor()
         
@@ -193,7 +203,6 @@ def sync_oxio_lines_for_user(firebase_uid: str, oxio_user_id: str, conn) -> Dict
         user_id = user_row[0]
         
         # Fetch lines from OXIO
-        oxio_service = OXIOService()
         lines_response = oxio_service.get_user_lines(oxio_user_id)
         
         if not lines_response.get('success'):
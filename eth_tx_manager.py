@@ -0,0 +1,577 @@
+"""
+Admin Wallet Transaction Manager
+Owns the admin account's nonce locally and sends its transactions one at a time
+from a queue on a background thread, so concurrent rewards never share a nonce
+and callers get a handle back without waiting on RPC. Pending transactions are
+watched for receipts and re-sent with a higher gas price when they get stuck.
+With an outbox, every queued transaction is written to admin_transactions
+before submit returns, so a restart or scale-down resumes it instead of losing it
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import atexit
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ETH_TX_GAS_LIMIT = int(os.environ.get('ETH_TX_GAS_LIMIT', 200000))
+ETH_TX_STUCK_SECONDS = int(os.environ.get('ETH_TX_STUCK_SECONDS', 180))  # unmined this long -> gas bump
+ETH_TX_GAS_BUMP = float(os.environ.get('ETH_TX_GAS_BUMP', 1.15))  # nodes need >= 1.10 to accept a replacement
+ETH_TX_MAX_GAS_PRICE_GWEI = float(os.environ.get('ETH_TX_MAX_GAS_PRICE_GWEI', 200))
+ETH_TX_POLL_INTERVAL = float(os.environ.get('ETH_TX_POLL_INTERVAL', 5))  # seconds between receipt checks
+ETH_TX_HISTORY = 1000  # finished handles kept for status lookups
+ETH_TX_OUTBOX_STALE_SECONDS = int(os.environ.get('ETH_TX_OUTBOX_STALE_SECONDS', 300))  # unfinished rows adopted after this
+ETH_TX_DRAIN_SECONDS = float(os.environ.get('ETH_TX_DRAIN_SECONDS', 10))  # shutdown waits this long to send queued rows
+
+# Tables whose row (by id) gets the transaction hash written when it is sent
+RECORD_TABLES = ('token_assignments', 'first_transaction_bonuses', 'token_reward_batches')
+# Record tables whose row marks an award as taken; deleted when the transaction
+# was never mined, so the award can be made again
+GUARD_RECORD_TABLES = ('token_assignments', 'first_transaction_bonuses')
+
+# RPC errors meaning our local nonce no longer matches the chain
+NONCE_ERRORS = ('nonce too low', 'nonce too high', 'replacement transaction underpriced')
+
+
+class TxHandle:
+    """
+    Status of one queued admin transaction
+
+    status moves queued -> sent -> mined | failed (reverted or never sent) |
+    dropped (its nonce was used by a transaction we did not send)
+    """
+
+    def __init__(self, description: str, contract_function, tx_params: Optional[Dict] = None,
+                 on_sent: Optional[Callable[[str, Optional[str]], None]] = None):
+        self.id = f"tx_{uuid.uuid4().hex[:16]}"
+        self.description = description
+        self.contract_function = contract_function
+        self.tx_params = tx_params or {}
+        self.on_sent = on_sent
+
+        self.status = 'queued'
+        self.nonce = None
+        self.gas_price = None
+        self.tx_hash = None
+        self.hashes = []
+        self.error = None
+        self.block_number = None
+        self.created_at = datetime.now()
+        self.sent_at = None
+        self.last_sent_monotonic = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until mined, failed or dropped; True if finished within timeout"""
+        return self._done.wait(timeout)
+
+    def _finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.now()
+        self._done.set()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'description': self.description,
+            'status': self.status,
+            'nonce': self.nonce,
+            'tx_hash': self.tx_hash,
+            'replaced_hashes': self.hashes[:-1],
+            'gas_price_gwei': self.gas_price / 10 ** 9 if self.gas_price else None,
+            'block_number': self.block_number,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __str__(self):
+        return self.tx_hash or f"{self.id} ({self.status})"
+
+
+class AdminTxOutbox:
+    """
+    Durable copy of the manager's queue in admin_transactions
+
+    Each row stores the contract call (address, function name, arguments) so
+    any instance can rebuild and send it, plus the send state (status, nonce,
+    hashes). Rows are owned by one manager at a time through locked_by and a
+    heartbeat; rows whose owner stopped heartbeating are adopted by another.
+
+    Args:
+        load_call(contract_address, fn_name, args) -> contract function to send
+    """
+
+    def __init__(self, get_db_connection, load_call: Callable[[str, str, list], Any],
+                 stale_seconds: int = ETH_TX_OUTBOX_STALE_SECONDS):
+        self.get_db_connection = get_db_connection
+        self.load_call = load_call
+        self.stale_seconds = stale_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def add(self, handle: 'TxHandle', sender: str, record: Optional[Tuple[str, int]] = None):
+        """Persist a newly submitted handle; raises if it cannot be stored"""
+        if record and record[0] not in RECORD_TABLES:
+            raise ValueError(f"Unsupported record table: {record[0]}")
+        call = handle.contract_function
+        with self.get_db_connection() as conn:
+            if not conn:
+                raise RuntimeError('Database unavailable; transaction not queued')
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO admin_transactions
+                        (tx_id, sender, description, contract_address, fn_name, fn_args, tx_params,
+                         record_table, record_id, locked_by, heartbeat_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                """, (handle.id, sender, handle.description, call.address, call.fn_name,
+                      json.dumps(list(call.args)), json.dumps(handle.tx_params),
+                      record[0] if record else None, record[1] if record else None, self.owner))
+            conn.commit()
+
+    def confirm_owner(self, handle: 'TxHandle') -> bool:
+        """True if this manager still owns the queued row, so sending it cannot duplicate another instance"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                raise RuntimeError('Database unavailable')
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE admin_transactions SET heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE tx_id = %s AND locked_by = %s AND status = 'queued'
+                """, (handle.id, self.owner))
+                owned = cur.rowcount == 1
+            conn.commit()
+        return owned
+
+    def save(self, handle: 'TxHandle'):
+        """
+        Persist the handle's send state and copy its hash onto the linked record
+        row. A guard row whose transaction failed without a receipt or was
+        dropped is deleted: nothing was mined, so the award is still owed.
+        """
+        with self.get_db_connection() as conn:
+            if not conn:
+                raise RuntimeError('Database unavailable')
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE admin_transactions
+                    SET status = %s, nonce = %s, gas_price = %s, tx_hash = %s, hashes = %s,
+                        error = %s, block_number = %s, sent_at = %s, finished_at = %s,
+                        heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE tx_id = %s
+                    RETURNING record_table, record_id
+                """, (handle.status, handle.nonce, handle.gas_price, handle.tx_hash, json.dumps(handle.hashes),
+                      handle.error, handle.block_number, handle.sent_at, handle.finished_at, handle.id))
+                row = cur.fetchone()
+                never_mined = handle.status == 'dropped' or (handle.status == 'failed' and handle.block_number is None)
+                if row and row[0] in GUARD_RECORD_TABLES and never_mined:
+                    cur.execute(f"DELETE FROM {row[0]} WHERE id = %s", (row[1],))
+                    print(f"↩️ Released {row[0]} row {row[1]}: {handle.description} was {handle.status} unmined")
+                elif row and row[0] in RECORD_TABLES and handle.tx_hash:
+                    cur.execute(f"UPDATE {row[0]} SET tx_hash = %s WHERE id = %s", (handle.tx_hash, row[1]))
+            conn.commit()
+
+    def claim_unfinished(self, sender: str) -> List['TxHandle']:
+        """Take over queued/sent rows that have no live owner; returns them as handles in submit order"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                return []
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE admin_transactions
+                    SET locked_by = %s, heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE sender = %s AND status IN ('queued', 'sent')
+                        AND (locked_by IS NULL
+                             OR heartbeat_at < CURRENT_TIMESTAMP - (%s * INTERVAL '1 second'))
+                    RETURNING id, tx_id, description, contract_address, fn_name, fn_args, tx_params,
+                              status, nonce, gas_price, hashes
+                """, (self.owner, sender, self.stale_seconds))
+                rows = sorted(cur.fetchall())
+            conn.commit()
+
+        def decode(value):
+            return value if isinstance(value, (dict, list)) else json.loads(value or 'null')
+
+        handles = []
+        for _, tx_id, description, address, fn_name, fn_args, tx_params, status, nonce, gas_price, hashes in rows:
+            try:
+                call = self.load_call(address, fn_name, decode(fn_args))
+            except Exception as e:
+                call = None
+                print(f"⚠️ Could not rebuild admin transaction {tx_id} ({fn_name}): {str(e)}")
+            handle = TxHandle(description, call, decode(tx_params))
+            handle.id = tx_id
+            handle.status = status
+            handle.nonce = nonce
+            handle.gas_price = int(gas_price) if gas_price is not None else None
+            handle.hashes = decode(hashes) or []
+            handle.tx_hash = handle.hashes[-1] if handle.hashes else None
+            handles.append(handle)
+        return handles
+
+    def heartbeat(self):
+        """Keep this manager's unfinished rows from being adopted by another instance"""
+        with self.get_db_connection() as conn:
+            if conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE admin_transactions SET heartbeat_at = CURRENT_TIMESTAMP
+                        WHERE locked_by = %s AND status IN ('queued', 'sent')
+                    """, (self.owner,))
+                conn.commit()
+
+    def release(self):
+        """Give up this manager's unfinished rows so another instance adopts them right away"""
+        with self.get_db_connection() as conn:
+            if conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE admin_transactions SET locked_by = NULL
+                        WHERE locked_by = %s AND status IN ('queued', 'sent')
+                    """, (self.owner,))
+                conn.commit()
+
+    def find_tx_id(self, record_table: str, record_id: int) -> Optional[str]:
+        """Latest transaction submitted for a record row (e.g. a reward batch)"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                return None
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT tx_id FROM admin_transactions
+                    WHERE record_table = %s AND record_id = %s
+                    ORDER BY id DESC LIMIT 1
+                """, (record_table, record_id))
+                row = cur.fetchone()
+        return row[0] if row else None
+
+    def get(self, tx_id: str) -> Optional[Dict[str, Any]]:
+        """Stored state of a transaction, for status lookups after its handle is gone"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                return None
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT tx_id, description, status, nonce, tx_hash, block_number, error,
+                           created_at, sent_at, finished_at
+                    FROM admin_transactions WHERE tx_id = %s
+                """, (tx_id,))
+                row = cur.fetchone()
+        if not row:
+            return None
+        keys = ('id', 'description', 'status', 'nonce', 'tx_hash', 'block_number', 'error',
+                'created_at', 'sent_at', 'finished_at')
+        stored = dict(zip(keys, row))
+        for key in ('created_at', 'sent_at', 'finished_at'):
+            stored[key] = stored[key].isoformat() if stored[key] else None
+        return stored
+
+
+class AdminTransactionManager:
+    """
+    Serialized sender for one admin private key
+
+    The nonce is read from the chain (pending block) on the first send and
+    again after any nonce error, then incremented locally. on_sent(tx_hash,
+    previous_hash) runs on the sender thread whenever a transaction gets a new
+    hash: previous_hash is None for the first send and the replaced hash after
+    a gas bump.
+
+    With an outbox, submit only returns once the transaction is stored, every
+    state change is saved, and start() resumes rows left unfinished by a
+    previous process. stop() sends what is still queued for up to
+    ETH_TX_DRAIN_SECONDS and hands the rest back to the outbox.
+    """
+
+    def __init__(self, web3, private_key: str,
+                 stuck_seconds: float = ETH_TX_STUCK_SECONDS,
+                 gas_bump: float = ETH_TX_GAS_BUMP,
+                 max_gas_price_gwei: float = ETH_TX_MAX_GAS_PRICE_GWEI,
+                 poll_interval: float = ETH_TX_POLL_INTERVAL,
+                 outbox: Optional[AdminTxOutbox] = None):
+        self.web3 = web3
+        self.outbox = outbox
+        self.account = web3.eth.account.from_key(private_key)
+        self.address = self.account.address
+        self.stuck_seconds = stuck_seconds
+        self.gas_bump = gas_bump
+        self.max_gas_price = int(max_gas_price_gwei * 10 ** 9)
+        self.poll_interval = poll_interval
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._nonce = None
+        self._pending: Dict[int, TxHandle] = {}  # nonce -> handle awaiting a receipt
+        self._handles: 'OrderedDict[str, TxHandle]' = OrderedDict()
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.stats = {'submitted': 0, 'sent': 0, 'mined': 0, 'failed': 0, 'dropped': 0,
+                      'gas_bumps': 0, 'nonce_resyncs': 0, 'resumed': 0}
+
+    def submit(self, contract_function, description: str, tx_params: Optional[Dict] = None,
+               on_sent: Optional[Callable[[str, Optional[str]], None]] = None,
+               record: Optional[Tuple[str, int]] = None) -> TxHandle:
+        """
+        Queue a contract call (e.g. token_contract.functions.mint(to, amount)) and return its handle
+
+        tx_params are passed to build_transaction (e.g. chainId, gas, gasPrice);
+        nonce and from are always set by the manager. record=(table, id) names a
+        row in RECORD_TABLES whose tx_hash column follows the transaction's hash;
+        unlike on_sent it survives a restart. Raises if the outbox cannot store it.
+        """
+        handle = TxHandle(description, contract_function, tx_params, on_sent)
+        if self.outbox:
+            self.outbox.add(handle, self.address, record)
+        self._track(handle)
+        self._queue.put(handle)
+        return handle
+
+    def _track(self, handle: TxHandle):
+        with self._lock:
+            self._handles[handle.id] = handle
+            while len(self._handles) > ETH_TX_HISTORY:
+                oldest_id, oldest = next(iter(self._handles.items()))
+                if not oldest._done.is_set():
+                    break
+                del self._handles[oldest_id]
+            self.stats['submitted'] += 1
+
+    def get_handle(self, tx_id: str) -> Optional[TxHandle]:
+        with self._lock:
+            return self._handles.get(tx_id)
+
+    # Sender thread
+
+    def _sync_nonce(self):
+        self._nonce = self.web3.eth.get_transaction_count(self.address, 'pending')
+        with self._lock:
+            self.stats['nonce_resyncs'] += 1
+        print(f"🔢 Admin wallet {self.address[:10]}... nonce synced from chain: {self._nonce}")
+
+    def _broadcast(self, handle: TxHandle, nonce: int, gas_price: int) -> str:
+        params = {'gas': ETH_TX_GAS_LIMIT}
+        params.update(handle.tx_params)
+        params.update({'from': self.address, 'nonce': nonce, 'gasPrice': gas_price})
+        tx = handle.contract_function.build_transaction(params)
+        signed = self.account.sign_transaction(tx)
+        try:
+            tx_hash = self.web3.eth.send_raw_transaction(signed.raw_transaction)
+        except Exception as e:
+            if 'already known' not in str(e).lower():
+                raise
+            tx_hash = signed.hash  # identical transaction already in the mempool
+        return self.web3.to_hex(tx_hash)
+
+    def _save(self, handle: TxHandle):
+        if not self.outbox:
+            return
+        try:
+            self.outbox.save(handle)
+        except Exception as e:
+            print(f"⚠️ Could not save admin transaction {handle.id} to the outbox: {str(e)}")
+
+    def _finish(self, handle: TxHandle, status: str, error: Optional[str] = None):
+        handle._finish(status, error)
+        with self._lock:
+            self.stats[status] += 1
+        self._save(handle)
+
+    def _set_hash(self, handle: TxHandle, tx_hash: str):
+        previous = handle.tx_hash
+        handle.tx_hash = tx_hash
+        self._save(handle)
+        if handle.on_sent:
+            try:
+                handle.on_sent(tx_hash, previous)
+            except Exception as e:
+                print(f"Error in on_sent for {handle.description}: {str(e)}")
+
+    def _record_hash(self, handle: TxHandle, tx_hash: str, gas_price: int):
+        handle.hashes.append(tx_hash)
+        handle.gas_price = gas_price
+        handle.last_sent_monotonic = time.monotonic()
+        self._set_hash(handle, tx_hash)
+
+    def _send(self, handle: TxHandle):
+        if handle.contract_function is None:
+            self._finish(handle, 'failed', 'Contract call could not be rebuilt')
+            return
+        for attempt in range(2):
+            try:
+                if self._nonce is None:
+                    self._sync_nonce()
+                gas_price = handle.tx_params.get('gasPrice') or self.web3.eth.gas_price
+                tx_hash = self._broadcast(handle, self._nonce, gas_price)
+            except Exception as e:
+                message = str(e)
+                self._nonce = None  # resync before the next send, whatever went wrong
+                if attempt == 0 and any(error in message.lower() for error in NONCE_ERRORS):
+                    continue
+                print(f"❌ Admin transaction failed to send ({handle.description}): {message}")
+                self._finish(handle, 'failed', message)
+                return
+
+            handle.nonce = self._nonce
+            handle.status = 'sent'
+            handle.sent_at = datetime.now()
+            self._nonce += 1
+            with self._lock:
+                self._pending[handle.nonce] = handle
+                self.stats['sent'] += 1
+            self._record_hash(handle, tx_hash, gas_price)
+            print(f"📤 Sent {handle.description} (nonce {handle.nonce}): {tx_hash}")
+            return
+
+    def _receipt(self, tx_hash: str):
+        try:
+            return self.web3.eth.get_transaction_receipt(tx_hash)
+        except Exception:
+            return None  # TransactionNotFound while pending
+
+    def check_pending(self):
+        """Finish mined transactions and gas-bump ones unmined for stuck_seconds"""
+        with self._lock:
+            pending = sorted(self._pending.items())
+        if not pending:
+            return
+
+        confirmed_nonce = None
+        for nonce, handle in pending:
+            receipt = next(filter(None, (self._receipt(tx_hash) for tx_hash in reversed(handle.hashes))), None)
+            if receipt:
+                mined_hash = self.web3.to_hex(receipt['transactionHash'])
+                if mined_hash != handle.tx_hash:
+                    self._set_hash(handle, mined_hash)  # an earlier, cheaper send won the nonce
+                handle.block_number = receipt.get('blockNumber')
+                mined = receipt.get('status', 1) == 1
+                with self._lock:
+                    del self._pending[nonce]
+                self._finish(handle, 'mined' if mined else 'failed', None if mined else 'Transaction reverted')
+                continue
+
+            if confirmed_nonce is None:
+                confirmed_nonce = self.web3.eth.get_transaction_count(self.address, 'latest')
+            if nonce < confirmed_nonce:
+                if any(self._receipt(tx_hash) for tx_hash in handle.hashes):
+                    continue  # mined since the first look; finished on the next check
+                # Nonce used on chain but none of our hashes have a receipt
+                with self._lock:
+                    del self._pending[nonce]
+                self._finish(handle, 'dropped', 'Nonce was used by another transaction')
+            elif time.monotonic() - handle.last_sent_monotonic >= self.stuck_seconds:
+                self._bump(handle)
+
+    def _bump(self, handle: TxHandle):
+        gas_price = max(int(handle.gas_price * self.gas_bump), self.web3.eth.gas_price)
+        if gas_price > self.max_gas_price:
+            if handle.gas_price >= self.max_gas_price:
+                return  # already at the cap; keep waiting
+            gas_price = self.max_gas_price
+        try:
+            tx_hash = self._broadcast(handle, handle.nonce, gas_price)
+        except Exception as e:
+            print(f"⚠️ Gas bump failed for {handle.description} (nonce {handle.nonce}): {str(e)}")
+            handle.last_sent_monotonic = time.monotonic()
+            return
+        with self._lock:
+            self.stats['gas_bumps'] += 1
+        self._record_hash(handle, tx_hash, gas_price)
+        print(f"⛽ Re-sent {handle.description} (nonce {handle.nonce}) at {gas_price / 10 ** 9:.2f} gwei: {tx_hash}")
+
+    def process_next(self, timeout: float = 0) -> bool:
+        """Send the next queued transaction if there is one; returns whether one was processed"""
+        try:
+            handle = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+        except queue.Empty:
+            return False
+        try:
+            if self.outbox and not self.outbox.confirm_owner(handle):
+                print(f"ℹ️ Admin transaction {handle.id} was adopted by another instance; not sending")
+                return True
+        except Exception as e:
+            self._queue.put(handle)  # cannot prove ownership while the database is down; retry later
+            raise RuntimeError(f"Outbox unavailable, {handle.id} left queued: {str(e)}")
+        self._send(handle)
+        return True
+
+    def resume(self) -> int:
+        """Adopt unfinished outbox rows (ours from a previous process, or a dead instance's)"""
+        if not self.outbox:
+            return 0
+        handles = self.outbox.claim_unfinished(self.address)
+        for handle in handles:
+            self._track(handle)
+            if handle.status == 'sent' and handle.nonce is not None and handle.hashes:
+                handle.last_sent_monotonic = time.monotonic()
+                with self._lock:
+                    self._pending[handle.nonce] = handle
+            else:
+                handle.status = 'queued'
+                self._queue.put(handle)
+        if handles:
+            with self._lock:
+                self.stats['resumed'] += len(handles)
+            print(f"🔁 Resumed {len(handles)} admin transaction(s) for {self.address[:10]}... from the outbox")
+        return len(handles)
+
+    def start(self):
+        """Resume unfinished outbox rows and start the sender thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        try:
+            self.resume()
+        except Exception as e:
+            print(f"Error resuming admin transactions: {str(e)}")
+
+        def run():
+            next_check = time.monotonic() + self.poll_interval
+            while not self._stop.is_set():
+                try:
+                    self.process_next(timeout=max(next_check - time.monotonic(), 0.01))
+                    if time.monotonic() >= next_check:
+                        next_check = time.monotonic() + self.poll_interval
+                        self.check_pending()
+                        if self.outbox:
+                            self.outbox.heartbeat()
+                            self.resume()
+                except Exception as e:
+                    print(f"Error in admin transaction sender: {str(e)}")
+                    self._stop.wait(self.poll_interval)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name=f"eth-tx-{self.address[:10]}", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, drain_timeout: float = ETH_TX_DRAIN_SECONDS):
+        """Send what is still queued (up to drain_timeout), stop the sender and release outbox rows"""
+        deadline = time.monotonic() + drain_timeout
+        while (self._thread and self._thread.is_alive() and not self._queue.empty()
+               and time.monotonic() < deadline):
+            time.sleep(0.05)
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=max(deadline - time.monotonic(), 0) + self.poll_interval)
+        if self.outbox:
+            try:
+                self.outbox.release()
+            except Exception as e:
+                print(f"Error releasing admin transactions: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats,
+                        address=self.address,
+                        next_nonce=self._nonce,
+                        queued=self._queue.qsize(),
+                        pending=[handle.to_dict() for _, handle in sorted(self._pending.items())],
+                        sender_running=bool(self._thread and self._thread.is_alive()))
@@ -1,6 +1,15 @@
 import os
 from web3 import Web3
 import json
+import threading
+from db_pool import get_db_connection
+from eth_tx_manager import AdminTransactionManager, AdminTxOutbox
+from reward_ledger import RewardLedger, REWARD_BATCHING_ENABLED
+
+NEW_MEMBER_REWARD_WEI = 1033 * 10 ** 16  # DOTMToken.NEW_MEMBER_REWARD
+DATA_REWARD_BASIS_POINTS = 1033  # DOTMToken.dataRewardPercentage, applied on-chain by rewardDataPurchase
+REWARD_BATCH_GAS_BASE = 60000
+REWARD_BATCH_GAS_PER_RECIPIENT = 60000  # a mint to a fresh balance slot costs ~50k
 
 # Load contract ABI
 with open('contracts/DOTMToken.json', 'r') as f:
@@ -17,6 +26,100 @@ def get_web3_connection():
 
     return Web3(Web3.HTTPProvider(ethereum_url))
 
+# One serialized transaction sender per admin key, so concurrent rewards never share a nonce
+_tx_managers = {}
+_tx_managers_lock = threading.Lock()
+
+def load_contract_call(contract_address, fn_name, args):
+    """Rebuild a stored admin transaction's contract call (used when resuming the outbox)"""
+    contract = get_web3_connection().eth.contract(address=contract_address, abi=contract_abi)
+    return contract.functions[fn_name](*args)
+
+# Queued admin transactions are stored in admin_transactions, so a restart resumes them
+admin_tx_outbox = AdminTxOutbox(get_db_connection, load_contract_call)
+
+def get_admin_tx_manager(private_key):
+    with _tx_managers_lock:
+        manager = _tx_managers.get(private_key)
+        if manager is None:
+            manager = _tx_managers[private_key] = AdminTransactionManager(
+                get_web3_connection(), private_key, outbox=admin_tx_outbox
+            )
+            manager.start()
+        return manager
+
+def get_admin_transaction(tx_id):
+    """Handle for a queued admin transaction by id, from any admin key's manager"""
+    with _tx_managers_lock:
+        managers = list(_tx_managers.values())
+    for manager in managers:
+        handle = manager.get_handle(tx_id)
+        if handle:
+            return handle
+    return None
+
+def get_admin_transaction_status(tx_id):
+    """Admin transaction as a dict: the live handle if this process has it, else the outbox row"""
+    handle = get_admin_transaction(tx_id)
+    if handle:
+        return handle.to_dict()
+    try:
+        return admin_tx_outbox.get(tx_id)
+    except Exception as e:
+        print(f"Error reading admin transaction {tx_id}: {str(e)}")
+        return None
+
+def get_admin_tx_stats():
+    with _tx_managers_lock:
+        return [manager.get_stats() for manager in _tx_managers.values()]
+
+def get_admin_tx_status(tx_id, tx_hash=None, record=None):
+    """
+    Status of an admin transaction from its handle, its outbox row, or its receipt;
+    record=(table, id) finds the transaction when its tx_id was never saved
+    """
+    if not tx_id and record:
+        tx_id = admin_tx_outbox.find_tx_id(*record)
+    handle = get_admin_transaction(tx_id) if tx_id else None
+    if handle:
+        return handle.status
+    stored = admin_tx_outbox.get(tx_id) if tx_id else None
+    if stored and stored['status'] != 'sent':
+        return stored['status']
+    tx_hash = tx_hash or (stored or {}).get('tx_hash')
+    if not tx_hash:
+        return stored['status'] if stored else 'unknown'
+    try:
+        receipt = get_web3_connection().eth.get_transaction_receipt(tx_hash)
+    except Exception:
+        return 'sent'
+    return 'mined' if receipt.get('status', 1) == 1 else 'failed'
+
+def insert_guard_row(insert_sql, params):
+    """
+    Insert the row that marks an award as taken (tx_hash NULL until sent) before
+    the transaction is queued; returns its id, or None if it already exists
+    """
+    with get_db_connection() as conn:
+        if not conn:
+            raise RuntimeError("Database unavailable")
+        with conn.cursor() as cur:
+            cur.execute(insert_sql, params)
+            row = cur.fetchone()
+        conn.commit()
+    return row[0] if row else None
+
+def delete_guard_row(table, row_id):
+    """Remove a guard row whose transaction could not be queued, so the award can be retried"""
+    try:
+        with get_db_connection() as conn:
+            if conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"DELETE FROM {table} WHERE id = %s AND tx_hash IS NULL", (row_id,))
+                conn.commit()
+    except Exception as e:
+        print(f"Error removing {table} guard row {row_id}: {str(e)}")
+
 # Get contract instance
 def get_token_contract():
     web3 = get_web3_connection()
@@ -45,7 +148,6 @@ def get_token_balance(address):
 # Award tokens for data purchase (10.33% of purchase amount)
 def award_data_purchase_tokens(user_id, purchase_amount):
     try:
-        from main import get_db_connection
         web3 = get_web3_connection()
         token_contract = get_token_contract()
         admin_key = os.environ.get('ETHEREUM_ADMIN_KEY')
@@ -57,41 +159,27 @@ def award_data_purchase_tokens(user_id, purchase_amount):
         with get_db_connection() as conn:
             if conn:
                 with conn.cursor() as cur:
-                    # First check if eth_address column exists
+                    # Check if the column name uses uppercase or lowercase
                     cur.execute("""
                         SELECT column_name FROM information_schema.columns 
-                        WHERE table_name='users' AND column_name='eth_address'
+                        WHERE table_name='users' AND lower(column_name)='userid'
                     """)
-                    if cur.fetchone() is None:
-                        # Column doesn't exist, create it
-                        cur.execute("ALTER TABLE users ADD COLUMN eth_address VARCHAR(255)")
-                        conn.commit()
-
-                    # Now get the address
-                    with get_db_connection() as conn:
-                        if conn:
-                            with conn.cursor() as cur:
-                                # Check if the column name uses uppercase or lowercase
-                                cur.execute("""
-                                    SELECT column_name FROM information_schema.columns 
-                                    WHERE table_name='users' AND lower(column_name)='userid'
-                                """)
-                                column_info = cur.fetchone()
+                    column_info = cur.fetchone()
 
-                                if column_info:
-                                    # Use the exact column name case we found
-                                    user_id_column = column_info[0]
-                                    cur.execute(f"SELECT eth_address FROM users WHERE {user_id_column} = %s", (user_id,))
-                                else:
-                                    # Try with lowercase as fallback
-                                    cur.execute("SELECT eth_address FROM users WHERE userid = %s", (user_id,))
+                    if column_info:
+                        # Use the exact column name case we found
+                        user_id_column = column_info[0]
+                        cur.execute(f"SELECT eth_address FROM users WHERE {user_id_column} = %s", (user_id,))
+                    else:
+                        # Try with lowercase as fallback
+                        cur.execute("SELECT eth_address FROM users WHERE userid = %s", (user_id,))
 
-                                result = cur.fetchone()
+                    result = cur.fetchone()
 
-                                if not result or not result[0]:
-                                    return False, "User has no ETH address"
+                    if not result or not result[0]:
+                        return False, "User has no ETH address"
 
-                                eth_address = result[0]
+                    eth_address = result[0]
 
         # Calculate reward (10.33% of purchase)
         reward_amount = float(purchase_amount) * 0.1033
@@ -99,26 +187,18 @@ def award_data_purchase_tokens(user_id, purchase_amount):
         # Convert to wei (assuming 18 decimals)
         reward_wei = int(reward_amount * (10 ** 18))
 
-        # Send tokens
-        admin_account = web3.eth.account.from_key(admin_key)
-        nonce = web3.eth.get_transaction_count(admin_account.address)
-
-        # Create transaction
-        tx = token_contract.functions.rewardDataPurchase(
-            eth_address,
-            reward_wei
-        ).build_transaction({
-            'chainId': 1, # Mainnet
-            'gas': 200000,
-            'gasPrice': web3.to_wei('50', 'gwei'),
-            'nonce': nonce,
-        })
-
-        # Sign and send transaction
-        signed_tx = web3.eth.account.sign_transaction(tx, admin_key)
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-
-        return True, web3.to_hex(tx_hash)
+        # Queue the transfer; the admin transaction manager assigns the nonce and sends it
+        handle = get_admin_tx_manager(admin_key).submit(
+            token_contract.functions.rewardDataPurchase(eth_address, reward_wei),
+            f"data purchase reward for user {user_id}",
+            tx_params={
+                'chainId': 1, # Mainnet
+                'gas': 200000,
+                'gasPrice': web3.to_wei('50', 'gwei'),
+            }
+        )
+
+        return True, handle
     except Exception as e:
         print(f"Error awarding tokens: {str(e)}")
         return False, str(e)
@@ -158,38 +238,11 @@ def get_token_price_from_etherscan():
         print(f"Could not connect to Sepolia directly: {str(e)}")
         roundtrip_ms = random.randint(50, 200)  # Fallback to simulated latency
 
-    # Create token_price_pings table if it doesn't exist
+    # Record the ping in token_price_pings
     try:
-        from main import get_db_connection
         with get_db_connection() as conn:
             if conn:
                 with conn.cursor() as cur:
-                    # Check if table exists
-                    cur.execute(
-                        "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'token_price_pings')"
-                    )
-                    table_exists = cur.fetchone()[0]
-
-                    # Create table if it doesn't exist
-                    if not table_exists:
-                        print("Creating token_price_pings table...")
-                        create_table_sql = """
-                        CREATE TABLE token_price_pings (
-                            id SERIAL PRIMARY KEY,
-                            token_price DECIMAL(18,9) NOT NULL,
-                            request_time_ms INTEGER,
-                            response_time_ms INTEGER,
-                            roundtrip_ms INTEGER,
-                            ping_destination VARCHAR(255),
-                            source VARCHAR(100),
-                            additional_data TEXT,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                        """
-                        cur.execute(create_table_sql)
-                        conn.commit()
-                        print("token_price_pings table created successfully")
-
                     # Generate some simulated price data
                     # In a real app, you'd fetch this from an API
                     end_time = time.time() * 1000
@@ -219,27 +272,8 @@ def get_token_price_from_etherscan():
                     except Exception as e:
                         print(f"Error recording token price ping: {str(e)}")
                         conn.rollback()
-
-                    if not table_exists:
-                        print("Creating token_price_pings table...")
-                        cur.execute("""
-                            CREATE TABLE token_price_pings (
-                                id SERIAL PRIMARY KEY,
-                                token_price NUMERIC(10, 4) NOT NULL,
-                                request_time_ms INTEGER,
-                                response_time_ms INTEGER,
-                                ping_destination VARCHAR(100),
-                                roundtrip_ms INTEGER,
-                                source VARCHAR(50),
-                                additional_data JSONB,
-                                timestamp TIMESTAMP,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        """)
-                        conn.commit()
-                        print("token_price_pings table created successfully")
     except Exception as create_err:
-        print(f"Error checking/creating token_price_pings table: {str(create_err)}")
+        print(f"Error recording token price ping: {str(create_err)}")
 
     try:
         # Try to use Etherscan API if configured
@@ -278,7 +312,6 @@ def get_token_price_from_etherscan():
         current_timestamp = datetime.now()
 
         # Store ping data in database
-        from main import get_db_connection
 
         with get_db_connection() as conn:
             if conn:
@@ -323,7 +356,6 @@ def get_token_price_from_etherscan():
 
         # Even on error, try to log the attempt
         try:
-            from main import get_db_connection
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
@@ -362,36 +394,36 @@ def get_token_price_from_etherscan():
         }
 
 def reward_data_purchase(user_address, purchase_amount_cents):
-    """Reward 10.33% of purchase amount in DOTM tokens"""
+    """Reward 10.33% of purchase amount in DOTM tokens; returns (success, TxHandle/LedgerEntry or error)"""
     try:
-        web3 = get_web3_connection()
-        token_contract = get_token_contract()
-
         # Calculate 10.33% token reward for all purchases
         token_reward = (purchase_amount_cents / 100) * 0.1033  # 10.33% of purchase in token units
 
         print(f"Rewarding {token_reward} DOTM tokens for purchase of {purchase_amount_cents} cents")
 
-        # Get admin account
+        if REWARD_BATCHING_ENABLED:
+            # mintBatch mints amounts as given, so apply the percentage rewardDataPurchase
+            # applies on-chain; both paths then mint the same amount
+            reward_wei = int(token_reward * (10 ** 18)) * DATA_REWARD_BASIS_POINTS // 10000
+            result = reward_ledger.accrue(user_address, reward_wei, 'data_purchase')
+            return (True, result['entry']) if result['success'] else (False, result['error'])
+
+        token_contract = get_token_contract()
+
         admin_private_key = os.environ.get('ADMIN_PRIVATE_KEY')
-        admin_account = web3.eth.account.from_key(admin_private_key)
-
-        # Build transaction
-        tx = token_contract.functions.rewardDataPurchase(
-            user_address,
-            int(token_reward * (10 ** 18))  # Convert to wei
-        ).build_transaction({
-            'from': admin_account.address,
-            'nonce': web3.eth.get_transaction_count(admin_account.address),
-            'gas': 200000,
-            'gasPrice': web3.eth.gas_price
-        })
-
-        # Sign and send transaction
-        signed_tx = web3.eth.account.sign_transaction(tx, admin_private_key)
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-
-        return True, web3.to_hex(tx_hash)
+        if not admin_private_key:
+            return False, "Admin key not configured"
+
+        # Queue the transaction; gas price is read from the network when it is sent
+        handle = get_admin_tx_manager(admin_private_key).submit(
+            token_contract.functions.rewardDataPurchase(
+                user_address,
+                int(token_reward * (10 ** 18))  # Convert to wei
+            ),
+            f"data purchase reward to {user_address}"
+        )
+
+        return True, handle
     except Exception as e:
         print(f"Error in reward_data_purchase: {str(e)}")
         return False, str(e)
@@ -399,7 +431,11 @@ def reward_data_purchase(user_address, purchase_amount_cents):
 # Award $10.33 USD worth of DOTM tokens to new member
 def award_new_member_token(member_address):
     """Awards 10.33 USD worth of DOTM tokens to a new member's wallet"""
-    web3 = get_web3_connection()
+    if REWARD_BATCHING_ENABLED:
+        result = reward_ledger.accrue(member_address, NEW_MEMBER_REWARD_WEI, 'new_member',
+                                      reference=f"new_member:{member_address.lower()}")
+        return (True, result['entry']) if result['success'] else (False, result['error'])
+
     token_contract = get_token_contract()
 
     # Get admin account
@@ -407,48 +443,6 @@ def award_new_member_token(member_address):
     if not admin_private_key:
         return False, "Admin key not configured"
 
-    admin_account = web3.eth.account.from_key(admin_private_key)
-
-    try:
-        # Record this token assignment for tracking
-        from main import get_db_connection
-        with get_db_connection() as conn:
-            if conn:
-                with conn.cursor() as cur:
-                    # Check if we've already assigned tokens to this address
-                    cur.execute(
-                        "SELECT EXISTS (SELECT 1 FROM token_assignments WHERE wallet_address = %s AND reason = 'new_member')",
-                        (member_address,)
-                    )
-                    already_assigned = cur.fetchone()[0]
-
-                    if already_assigned:
-                        return False, "This address has already received new member token"
-
-                    # Check if the token_assignments table exists
-                    cur.execute(
-                        "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'token_assignments')"
-                    )
-                    table_exists = cur.fetchone()[0]
-
-                    if not table_exists:
-                        # Create the table if it doesn't exist
-                        cur.execute("""
-                            CREATE TABLE token_assignments (
-                                id SERIAL PRIMARY KEY,
-                                wallet_address VARCHAR(42) NOT NULL,
-                                token_amount NUMERIC(20, 0) NOT NULL,
-                                reason VARCHAR(100) NOT NULL,
-                                tx_hash VARCHAR(66),
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                INDEX(wallet_address, reason)
-                            )
-                        """)
-                        conn.commit()
-    except Exception as e:
-        print(f"Database error in award_new_member_token: {str(e)}")
-        # Continue with the token minting even if DB operations fail
-
     try:
         # Build transaction - mint $10.33 USD worth of DOTM tokens
         usd_per_dotm = get_token_price_from_etherscan()['price']
@@ -462,43 +456,38 @@ def award_new_member_token(member_address):
         # Convert DOTM amount to wei
         token_amount_wei = int(dotm_amount * (10 ** 18))
 
-        tx = token_contract.functions.awardNewMember(
-            member_address
-        ).build_transaction({
-            'from': admin_account.address,
-            'nonce': web3.eth.get_transaction_count(admin_account.address),
-            'gas': 200000,
-            'gasPrice': web3.eth.gas_price
-        })
-
-        # Sign and send transaction
-        signed_tx = web3.eth.account.sign_transaction(tx, admin_private_key)
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        # Record the assignment first, so a concurrent or repeated call cannot mint again
+        assignment_id = insert_guard_row(
+            """INSERT INTO token_assignments (wallet_address, token_amount, reason)
+               VALUES (%s, %s, 'new_member')
+               ON CONFLICT (wallet_address, reason) DO NOTHING
+               RETURNING id""",
+            (member_address, token_amount_wei)
+        )
+        if assignment_id is None:
+            return False, "This address has already received new member token"
+    except Exception as e:
+        print(f"Database error in award_new_member_token: {str(e)}")
+        return False, f"Database error: {str(e)}"
 
-        # Record the transaction in database
-        try:
-            from main import get_db_connection
-            with get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            "INSERT INTO token_assignments (wallet_address, token_amount, reason, tx_hash) VALUES (%s, %s, %s, %s)",
-                            (member_address, token_amount_wei, 'new_member', web3.to_hex(tx_hash))
-                        )
-                        conn.commit()
-        except Exception as db_err:
-            print(f"Database error recording new member token assignment: {str(db_err)}")
+    try:
+        # Queue the transaction; the assignment gets its tx_hash once it is sent
+        handle = get_admin_tx_manager(admin_private_key).submit(
+            token_contract.functions.awardNewMember(member_address),
+            f"new member award to {member_address}",
+            record=('token_assignments', assignment_id)
+        )
 
-        return True, web3.to_hex(tx_hash)
+        return True, handle
 
     except Exception as e:
         print(f"Error in award_new_member_token: {str(e)}")
+        delete_guard_row('token_assignments', assignment_id)
         return False, str(e)
 
 # Assign one token to a founding member
 def assign_founding_token(member_address):
     """Assigns 100 DOTM tokens to a founding member's wallet"""
-    web3 = get_web3_connection()
     token_contract = get_token_contract()
 
     # Get admin account
@@ -506,83 +495,39 @@ def assign_founding_token(member_address):
     if not admin_private_key:
         return False, "Admin key not configured"
 
-    admin_account = web3.eth.account.from_key(admin_private_key)
+    # Build transaction - mint 100 tokens
+    token_amount = 100 * (10 ** 18)  # 100 tokens in wei
 
     try:
-        # Record this token assignment for tracking
-        from main import get_db_connection
-        with get_db_connection() as conn:
-            if conn:
-                with conn.cursor() as cur:
-                    # Check if we've already assigned tokens to this address
-                    cur.execute(
-                        "SELECT EXISTS (SELECT 1 FROM token_assignments WHERE wallet_address = %s)",
-                        (member_address,)
-                    )
-                    already_assigned = cur.fetchone()[0]
-
-                    if already_assigned:
-                        return False, "This address has already received founding tokens"
-
-                    # Check if the token_assignments table exists
-                    cur.execute(
-                        "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'token_assignments')"
-                    )
-                    table_exists = cur.fetchone()[0]
-
-                    if not table_exists:
-                        # Create the table if it doesn't exist
-                        cur.execute("""
-                            CREATE TABLE token_assignments (
-                                id SERIAL PRIMARY KEY,
-                                wallet_address VARCHAR(42) NOT NULL UNIQUE,
-                                token_amount NUMERIC(20, 0) NOT NULL,
-                                reason VARCHAR(100) NOT NULL,
-                                tx_hash VARCHAR(66),
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        """)
-                        conn.commit()
+        # Record the assignment first (only for addresses with no assignment yet),
+        # so a concurrent or repeated call cannot mint again
+        assignment_id = insert_guard_row(
+            """INSERT INTO token_assignments (wallet_address, token_amount, reason)
+               SELECT %s, %s, 'founding_member'
+               WHERE NOT EXISTS (SELECT 1 FROM token_assignments WHERE wallet_address = %s)
+               ON CONFLICT (wallet_address, reason) DO NOTHING
+               RETURNING id""",
+            (member_address, token_amount, member_address)
+        )
+        if assignment_id is None:
+            return False, "This address has already received founding tokens"
     except Exception as e:
         print(f"Database error in assign_founding_token: {str(e)}")
-        # Continue with the token minting even if DB operations fail
+        return False, f"Database error: {str(e)}"
 
     try:
-        # Build transaction - mint 100 tokens
-        token_amount = 100 * (10 ** 18)  # 100 tokens in wei
-
-        tx = token_contract.functions.mint(
-            member_address,
-            token_amount
-        ).build_transaction({
-            'from': admin_account.address,
-            'nonce': web3.eth.get_transaction_count(admin_account.address),
-            'gas': 200000,
-            'gasPrice': web3.eth.gas_price
-        })
-
-        # Sign and send transaction
-        signed_tx = web3.eth.account.sign_transaction(tx, admin_private_key)
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-
-        # Record the transaction in database
-        try:
-            from main import get_db_connection
-            with get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            "INSERT INTO token_assignments (wallet_address, token_amount, reason, tx_hash) VALUES (%s, %s, %s, %s)",
-                            (member_address, token_amount, 'founding_member', web3.to_hex(tx_hash))
-                        )
-                        conn.commit()
-        except Exception as db_err:
-            print(f"Database error recording token assignment: {str(db_err)}")
+        # Queue the transaction; the assignment gets its tx_hash once it is sent
+        handle = get_admin_tx_manager(admin_private_key).submit(
+            token_contract.functions.mint(member_address, token_amount),
+            f"founding member mint to {member_address}",
+            record=('token_assignments', assignment_id)
+        )
 
-        return True, web3.to_hex(tx_hash)
+        return True, handle
 
     except Exception as e:
         print(f"Error in assign_founding_token: {str(e)}")
+        delete_guard_row('token_assignments', assignment_id)
         return False, str(e)
 
 def award_first_transaction_bonus(user_id, firebase_uid, eth_address, is_founding_member=False):
@@ -591,84 +536,56 @@ def award_first_transaction_bonus(user_id, firebase_uid, eth_address, is_foundin
     - Regular members: 10.33 DOTM
     - Founding members: 100.33 DOTM
     
-    Returns: (success, message/tx_hash)
+    Returns: (success, message/TxHandle)
     """
-    from main import get_db_connection
-    
-    try:
-        with get_db_connection() as conn:
-            if conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        "SELECT EXISTS (SELECT 1 FROM first_transaction_bonuses WHERE user_id = %s)",
-                        (user_id,)
-                    )
-                    already_awarded = cur.fetchone()[0]
-                    
-                    if already_awarded:
-                        return False, "First transaction bonus already awarded to this user"
-    except Exception as e:
-        print(f"Database error checking first transaction bonus: {str(e)}")
-        return False, f"Database error: {str(e)}"
     
     if not eth_address:
         return False, "User does not have an Ethereum address"
     
-    web3 = get_web3_connection()
     token_contract = get_token_contract()
     
     admin_private_key = os.environ.get('ADMIN_PRIVATE_KEY')
     if not admin_private_key:
         return False, "Admin key not configured"
     
-    admin_account = web3.eth.account.from_key(admin_private_key)
+    bonus_dotm = 100.33 if is_founding_member else 10.33
+    
+    try:
+        # Record the bonus first (user_id is unique), so a webhook retry or a
+        # concurrent call cannot pass the check and mint again
+        bonus_id = insert_guard_row(
+            """INSERT INTO first_transaction_bonuses 
+               (user_id, firebase_uid, eth_address, is_founding_member, bonus_amount) 
+               VALUES (%s, %s, %s, %s, %s)
+               ON CONFLICT (user_id) DO NOTHING
+               RETURNING id""",
+            (user_id, firebase_uid, eth_address, is_founding_member, bonus_dotm)
+        )
+        if bonus_id is None:
+            return False, "First transaction bonus already awarded to this user"
+    except Exception as e:
+        print(f"Database error checking first transaction bonus: {str(e)}")
+        return False, f"Database error: {str(e)}"
     
     try:
-        bonus_amount = 10033 * (10 ** 16) if is_founding_member else 1033 * (10 ** 16)
-        bonus_dotm = 100.33 if is_founding_member else 10.33
-        
         if is_founding_member:
-            tx = token_contract.functions.awardFirstTransactionBonusFounding(
-                eth_address
-            ).build_transaction({
-                'from': admin_account.address,
-                'nonce': web3.eth.get_transaction_count(admin_account.address),
-                'gas': 200000,
-                'gasPrice': web3.eth.gas_price
-            })
+            contract_function = token_contract.functions.awardFirstTransactionBonusFounding(eth_address)
         else:
-            tx = token_contract.functions.awardFirstTransactionBonusRegular(
-                eth_address
-            ).build_transaction({
-                'from': admin_account.address,
-                'nonce': web3.eth.get_transaction_count(admin_account.address),
-                'gas': 200000,
-                'gasPrice': web3.eth.gas_price
-            })
-        
-        signed_tx = web3.eth.account.sign_transaction(tx, admin_private_key)
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
-        tx_hash_hex = web3.to_hex(tx_hash)
+            contract_function = token_contract.functions.awardFirstTransactionBonusRegular(eth_address)
         
-        try:
-            with get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            """INSERT INTO first_transaction_bonuses 
-                               (user_id, firebase_uid, eth_address, is_founding_member, bonus_amount, tx_hash) 
-                               VALUES (%s, %s, %s, %s, %s, %s)""",
-                            (user_id, firebase_uid, eth_address, is_founding_member, bonus_dotm, tx_hash_hex)
-                        )
-                        conn.commit()
-                        print(f"First transaction bonus recorded for user {user_id}: {bonus_dotm} DOTM, tx: {tx_hash_hex}")
-        except Exception as db_err:
-            print(f"Database error recording first transaction bonus: {str(db_err)}")
+        # Queue the transaction; the bonus row gets its tx_hash once it is sent
+        handle = get_admin_tx_manager(admin_private_key).submit(
+            contract_function,
+            f"first transaction bonus for user {user_id}",
+            record=('first_transaction_bonuses', bonus_id)
+        )
+        print(f"First transaction bonus queued for user {user_id}: {bonus_dotm} DOTM ({handle.id})")
         
-        return True, tx_hash_hex
+        return True, handle
         
     except Exception as e:
         print(f"Error awarding first transaction bonus: {str(e)}")
+        delete_guard_row('first_transaction_bonuses', bonus_id)
         return False, str(e)
 
 def check_and_award_first_transaction_bonus(user_id, firebase_uid, eth_address):
@@ -676,7 +593,6 @@ def check_and_award_first_transaction_bonus(user_id, firebase_uid, eth_address):
     Checks if user is eligible for first transaction bonus and awards it
     Returns: (success, message)
     """
-    from main import get_db_connection
     
     try:
         with get_db_connection() as conn:
@@ -712,4 +628,22 @@ def check_and_award_first_transaction_bonus(user_id, firebase_uid, eth_address):
                     
     except Exception as e:
         print(f"Error in check_and_award_first_transaction_bonus: {str(e)}")
-        return False, str(e)
\ No newline at end of file
+        return False, str(e)
+
+def send_reward_batch(recipients, amounts_wei, on_sent, record=None):
+    """Queue one mintBatch transaction for settled ledger rewards; returns its TxHandle"""
+    admin_private_key = os.environ.get('ADMIN_PRIVATE_KEY')
+    if not admin_private_key:
+        raise ValueError("Admin key not configured")
+
+    token_contract = get_token_contract()
+    return get_admin_tx_manager(admin_private_key).submit(
+        token_contract.functions.mintBatch(recipients, amounts_wei),
+        f"reward batch to {len(recipients)} addresses",
+        tx_params={'gas': REWARD_BATCH_GAS_BASE + REWARD_BATCH_GAS_PER_RECIPIENT * len(recipients)},
+        on_sent=on_sent,
+        record=record
+    )
+
+# Pending rewards are settled in batches when REWARD_BATCHING_ENABLED (the settler is started by main)
+reward_ledger = RewardLedger(get_db_connection, send_reward_batch, get_admin_tx_status)
@@ -3,6 +3,7 @@ import firebase_admin
 from firebase_admin import credentials, auth
 from functools import wraps
 from flask import request, jsonify
+from db_pool import get_db_connection
 
 # Initialize Firebase Admin SDK
 try:
@@ -43,7 +44,6 @@ def verify_firebase_token(request):
 def get_user_by_firebase_uid(firebase_uid):
     """Get user information from database by Firebase UID"""
     try:
-        from main import get_db_connection
         with get_db_connection() as conn:
             if conn:
                 with conn.cursor() as cur:
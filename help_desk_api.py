@@ -2,6 +2,7 @@
 from flask import request, jsonify, current_app
 from help_desk_service import help_desk
 import uuid
+from db_pool import get_db_connection
 
 # Get app instance from current_app to avoid circular import
 def get_app():
@@ -349,8 +350,6 @@ def get_help_analytics():
 def get_help_sessions():
     """Get help sessions for admin dashboard"""
     try:
-        from main import get_db_connection
-        
         with get_db_connection() as conn:
             if conn:
                 with conn.cursor() as cur:
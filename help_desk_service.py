@@ -5,7 +5,7 @@ import json
 from datetime import datetime, timedelta
 from contextlib import contextmanager
 import psycopg2
-from main import get_db_connection
+from db_pool import get_db_connection
 import openai
 
 class HelpDeskService:
@@ -33,96 +33,7 @@ class HelpDeskService:
         
         # OpenAI configuration
         openai.api_key = os.environ.get('OPENAI_API_KEY')
-        
-        # Initialize database tables
-        self.create_help_tables()
-    
-    def create_help_tables(self):
-        """Create help-related database tables"""
-        try:
-            with get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        # Create need_for_help table
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS need_for_help (
-                                id SERIAL PRIMARY KEY,
-                                user_id INTEGER,
-                                firebase_uid VARCHAR(128),
-                                session_id VARCHAR(255) NOT NULL,
-                                help_started_at TIMESTAMP NOT NULL,
-                                help_ended_at TIMESTAMP,
-                                total_duration_seconds INTEGER,
-                                click_count INTEGER DEFAULT 1,
-                                last_activity_at TIMESTAMP NOT NULL,
-                                jira_ticket_key VARCHAR(50),
-                                jira_ticket_status VARCHAR(50),
-                                resolution_time_seconds INTEGER,
-                                live_callback_requested BOOLEAN DEFAULT FALSE,
-                                live_callback_completed_at TIMESTAMP,
-                                ai_assistance_provided BOOLEAN DEFAULT FALSE,
-                                ai_response_count INTEGER DEFAULT 0,
-                                user_agent TEXT,
-                                ip_address INET,
-                                page_url TEXT,
-                                issue_category VARCHAR(100),
-                                issue_description TEXT,
-                                satisfaction_rating INTEGER,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        """)
-                        
-                        # Create help interactions table for detailed tracking
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS help_interactions (
-                                id SERIAL PRIMARY KEY,
-                                help_session_id INTEGER REFERENCES need_for_help(id),
-                                interaction_type VARCHAR(50) NOT NULL, -- 'help_open', 'help_close', 'ai_query', 'callback_request'
-                                interaction_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                duration_since_last_action INTEGER,
-                                ai_query TEXT,
-                                ai_response TEXT,
-                                user_satisfaction BOOLEAN,
-                                additional_data JSONB
-                            )
-                        """)
-                        
-                        # Create indexes for performance
-                        cur.execute("""
-                            CREATE INDEX IF NOT EXISTS idx_help_user_id ON need_for_help(user_id);
-                            CREATE INDEX IF NOT EXISTS idx_help_firebase_uid ON need_for_help(firebase_uid);
-                            CREATE INDEX IF NOT EXISTS idx_help_session_id ON need_for_help(session_id);
-                            CREATE INDEX IF NOT EXISTS idx_help_jira_ticket ON need_for_help(jira_ticket_key);
-                            CREATE INDEX IF NOT EXISTS idx_help_interactions_session ON help_interactions(help_session_id);
-                        """)
-                        
-                        # Add context fields if they don't exist (for backward compatibility)
-                        cur.execute("""
-                            DO $$ 
-                            BEGIN
-                                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                             WHERE table_name='need_for_help' AND column_name='context_provided_at') THEN
-                                    ALTER TABLE need_for_help ADD COLUMN context_provided_at TIMESTAMP;
-                                END IF;
-                                
-                                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                             WHERE table_name='need_for_help' AND column_name='context_category') THEN
-                                    ALTER TABLE need_for_help ADD COLUMN context_category VARCHAR(100);
-                                END IF;
-                                
-                                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                                             WHERE table_name='need_for_help' AND column_name='context_description') THEN
-                                    ALTER TABLE need_for_help ADD COLUMN context_description TEXT;
-                                END IF;
-                            END $$;
-                        """)
-                        
-                        conn.commit()
-                        print("Help desk tables created successfully")
-        except Exception as e:
-            print(f"Error creating help desk tables: {str(e)}")
-    
+
     def start_help_session(self, user_data):
         """Start a new help session"""
         try:
@@ -0,0 +1,322 @@
+"""
+ICCID Inventory
+Bulk imports eSIM ICCID/LPA batches (CSV or JSON) through COPY into a staging
+table, and monitors available stock against a low-stock threshold
+"""
+
+import io
+import os
+import re
+import csv
+import json
+import atexit
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, TextIO
+
+# Inventory configuration (overridable via environment)
+ICCID_LOW_STOCK_THRESHOLD = int(os.environ.get('ICCID_LOW_STOCK_THRESHOLD', 50))
+ICCID_STOCK_CHECK_INTERVAL = int(os.environ.get('ICCID_STOCK_CHECK_INTERVAL', 300))  # seconds
+ICCID_IMPORT_CHUNK_ROWS = 5000  # rows buffered per COPY into the staging table
+MAX_REPORTED_REJECTIONS = 100
+
+STAGING_COLUMNS = ('iccid', 'lpa_code', 'country', 'line_id')
+
+# ITU-T E.118: '89' telecom prefix, up to 19 digits plus a Luhn check digit
+ICCID_RE = re.compile(r'^89\d{16,18}$')
+# GSMA SGP.22 activation code: LPA:1$<SM-DP+ address>$<matching ID>[$<OID>[$<confirmation flag>]]
+LPA_RE = re.compile(r'^LPA:1\$[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)+(:\d+)?\$[A-Za-z0-9-]*(\$[0-9.]*)?(\$1)?$')
+COUNTRY_RE = re.compile(r'^[A-Z]{2}$')
+
+
+def luhn_valid(digits: str) -> bool:
+    """True if the digit string (check digit last) passes the Luhn checksum"""
+    total = 0
+    for position, char in enumerate(reversed(digits)):
+        digit = int(char)
+        if position % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def validate_inventory_row(row: Dict) -> Dict:
+    """
+    Normalize one inventory record; raises ValueError describing the first problem
+
+    Accepts 'iccid' plus 'lpa_code' (or 'lpa'/'activation_code'), and optional
+    'country' (ISO alpha-2, default US) and 'line_id'.
+    """
+    if not isinstance(row, dict):
+        raise ValueError('Record must be an object')
+
+    iccid = str(row.get('iccid') or '').strip().replace(' ', '')
+    if iccid[-1:] in ('F', 'f'):
+        iccid = iccid[:-1]  # Some vendors pad odd-length ICCIDs with a filler nibble
+    if not ICCID_RE.match(iccid):
+        raise ValueError(f"Invalid ICCID format: {iccid or 'missing'}")
+    if not luhn_valid(iccid):
+        raise ValueError(f"ICCID fails Luhn checksum: {iccid}")
+
+    lpa_code = str(row.get('lpa_code') or row.get('lpa') or row.get('activation_code') or '').strip()
+    if not LPA_RE.match(lpa_code) or len(lpa_code) > 200:
+        raise ValueError(f"Invalid LPA activation code for {iccid}")
+
+    country = str(row.get('country') or 'US').strip().upper()
+    if not COUNTRY_RE.match(country):
+        raise ValueError(f"Invalid country code for {iccid}: {country}")
+
+    line_id = str(row.get('line_id') or '').strip() or None
+    if line_id and len(line_id) > 100:
+        raise ValueError(f"line_id too long for {iccid}")
+
+    return {'iccid': iccid, 'lpa_code': lpa_code, 'country': country, 'line_id': line_id}
+
+
+def parse_inventory_file(stream: TextIO, file_format: str = 'csv') -> Iterable[Dict]:
+    """
+    Yield raw records from a CSV (header row required), JSON Lines or JSON
+    array file. CSV and JSON Lines are read incrementally.
+    """
+    if file_format == 'csv':
+        for record in csv.DictReader(stream):
+            yield {(key or '').strip().lower(): value for key, value in record.items()}
+        return
+
+    if file_format in ('jsonl', 'ndjson'):
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+        return
+
+    if file_format == 'json':
+        records = json.load(stream)
+        if isinstance(records, dict):
+            records = records.get('iccids') or records.get('inventory') or []
+        if not isinstance(records, list):
+            raise ValueError('Expected a JSON array of ICCID records')
+        yield from records
+        return
+
+    raise ValueError(f"Unsupported inventory file format: {file_format}")
+
+
+class ICCIDInventory:
+    """Bulk loader and stock monitor for iccid_inventory"""
+
+    def __init__(self, get_db_connection, low_stock_threshold: int = ICCID_LOW_STOCK_THRESHOLD):
+        self.get_db_connection = get_db_connection
+        self.low_stock_threshold = low_stock_threshold
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'imports': 0,
+            'rows_imported': 0,
+            'rows_rejected': 0,
+            'low_stock_warnings': 0,
+            'last_import': None,
+            'last_check': None
+        }
+        self._worker = None
+        self._worker_stop = threading.Event()
+
+    def import_records(self, records: Iterable[Dict], dry_run: bool = False) -> Dict:
+        """
+        Validate, deduplicate and load inventory records in one transaction
+
+        Valid rows are streamed with COPY into a temporary staging table in
+        chunks, then moved into iccid_inventory as 'available'; ICCIDs already
+        in inventory are left untouched. Nothing is written if dry_run is set.
+
+        Returns:
+            dict: Counts of received, valid, inserted and skipped rows, plus up to
+                  MAX_REPORTED_REJECTIONS rejected records with their line number
+        """
+        seen = set()
+        rejected = []
+        counts = {'received': 0, 'rejected': 0, 'duplicates_in_file': 0}
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        started = datetime.now()
+
+        def flush(cur):
+            buffer.seek(0)
+            cur.copy_expert(
+                f"COPY iccid_inventory_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+            buffer.seek(0)
+            buffer.truncate()
+
+        def stage(cur):
+            buffered = 0
+            for line_number, record in enumerate(records, start=1):
+                counts['received'] += 1
+                try:
+                    row = validate_inventory_row(record)
+                except ValueError as e:
+                    counts['rejected'] += 1
+                    if len(rejected) < MAX_REPORTED_REJECTIONS:
+                        rejected.append({'line': line_number, 'error': str(e)})
+                    continue
+
+                if row['iccid'] in seen:
+                    counts['duplicates_in_file'] += 1
+                    continue
+                seen.add(row['iccid'])
+
+                writer.writerow(['' if row[column] is None else row[column] for column in STAGING_COLUMNS])
+                buffered += 1
+                if cur and buffered >= ICCID_IMPORT_CHUNK_ROWS:
+                    flush(cur)
+                    buffered = 0
+            if cur and buffered:
+                flush(cur)
+
+        inserted = 0
+        try:
+            if dry_run:
+                stage(None)
+            else:
+                with self.get_db_connection() as conn:
+                    if not conn:
+                        return {'success': False, 'error': 'Database unavailable'}
+
+                    with conn.cursor() as cur:
+                        cur.execute("""
+                            CREATE TEMP TABLE iccid_inventory_staging (
+                                iccid VARCHAR(50) NOT NULL,
+                                lpa_code VARCHAR(200) NOT NULL,
+                                country VARCHAR(10) NOT NULL,
+                                line_id VARCHAR(100)
+                            ) ON COMMIT DROP
+                        """)
+                        stage(cur)
+                        cur.execute("""
+                            INSERT INTO iccid_inventory (iccid, lpa_code, country, line_id, status, batch_upload_date)
+                            SELECT iccid, lpa_code, country, NULLIF(line_id, ''), 'available', CURRENT_TIMESTAMP
+                            FROM iccid_inventory_staging
+                            ORDER BY iccid
+                            ON CONFLICT (iccid) DO NOTHING
+                        """)
+                        inserted = cur.rowcount
+                        conn.commit()
+        except (ValueError, csv.Error) as e:
+            return {'success': False, 'error': f"Could not parse inventory file: {str(e)}",
+                    'received': counts['received']}
+        except Exception as e:
+            print(f"Error importing ICCID inventory: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+        result = {
+            'success': True,
+            'dry_run': dry_run,
+            'received': counts['received'],
+            'valid': len(seen),
+            'inserted': inserted,
+            'already_in_inventory': 0 if dry_run else len(seen) - inserted,
+            'duplicates_in_file': counts['duplicates_in_file'],
+            'rejected_count': counts['rejected'],
+            'rejected': rejected,
+            'duration_ms': int((datetime.now() - started).total_seconds() * 1000)
+        }
+
+        if not dry_run:
+            with self._stats_lock:
+                self.stats['imports'] += 1
+                self.stats['rows_imported'] += inserted
+                self.stats['rows_rejected'] += counts['rejected']
+                self.stats['last_import'] = {key: result[key] for key in (
+                    'received', 'inserted', 'already_in_inventory', 'duplicates_in_file', 'rejected_count')}
+                self.stats['last_import']['at'] = started.isoformat()
+            print(f"📦 Imported {inserted} ICCIDs ({result['already_in_inventory']} already in inventory, "
+                  f"{counts['duplicates_in_file']} duplicates, {counts['rejected']} rejected)")
+        return result
+
+    def import_file(self, stream: TextIO, file_format: str = 'csv', dry_run: bool = False) -> Dict:
+        """Import a CSV/JSON/JSON Lines inventory file (see parse_inventory_file)"""
+        return self.import_records(parse_inventory_file(stream, file_format), dry_run=dry_run)
+
+    def get_stock_levels(self) -> Dict:
+        """Available/assigned counts overall and per country, plus the last day's assignment rate"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                return {'success': False, 'error': 'Database unavailable'}
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT country,
+                           COUNT(*) FILTER (WHERE status = 'available'),
+                           COUNT(*) FILTER (WHERE status = 'assigned'),
+                           COUNT(*),
+                           COUNT(*) FILTER (WHERE status = 'assigned'
+                                            AND assigned_at > CURRENT_TIMESTAMP - INTERVAL '1 day')
+                    FROM iccid_inventory
+                    GROUP BY country
+                    ORDER BY country
+                """)
+                rows = cur.fetchall()
+
+        by_country = {
+            country or 'unknown': {'available': available, 'assigned': assigned, 'total': total}
+            for country, available, assigned, total, _ in rows
+        }
+        available = sum(row[1] for row in rows)
+        assigned_last_24h = sum(row[4] for row in rows)
+        return {
+            'success': True,
+            'available': available,
+            'assigned': sum(row[2] for row in rows),
+            'total': sum(row[3] for row in rows),
+            'assigned_last_24h': assigned_last_24h,
+            'days_of_stock': round(available / assigned_last_24h, 1) if assigned_last_24h else None,
+            'by_country': by_country,
+            'low_stock_threshold': self.low_stock_threshold,
+            'low_stock': available < self.low_stock_threshold
+        }
+
+    def check_stock(self) -> Dict:
+        """Refresh stock metrics and warn when available inventory is below the threshold"""
+        try:
+            levels = self.get_stock_levels()
+        except Exception as e:
+            print(f"Error checking ICCID inventory: {str(e)}")
+            return {'success': False, 'error': str(e)}
+        if not levels.get('success'):
+            return levels
+
+        levels['checked_at'] = datetime.now().isoformat()
+        if levels['low_stock']:
+            runway = f", ~{levels['days_of_stock']} days at current rate" if levels['days_of_stock'] is not None else ''
+            print(f"⚠️ ICCID inventory low: {levels['available']} available "
+                  f"(threshold {self.low_stock_threshold}{runway})")
+
+        with self._stats_lock:
+            if levels['low_stock']:
+                self.stats['low_stock_warnings'] += 1
+            self.stats['last_check'] = levels
+        return levels
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def start_monitor(self, interval_seconds: int = ICCID_STOCK_CHECK_INTERVAL):
+        """Start the background stock check, once at startup and then every interval_seconds"""
+        if self._worker and self._worker.is_alive():
+            return
+
+        def run():
+            while True:
+                self.check_stock()
+                if self._worker_stop.wait(interval_seconds):
+                    break
+
+        self._worker_stop.clear()
+        self._worker = threading.Thread(target=run, name="iccid-stock-monitor", daemon=True)
+        self._worker.start()
+        atexit.register(self.stop_monitor)
+
+    def stop_monitor(self):
+        self._worker_stop.set()
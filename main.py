@@ -5,8 +5,6 @@ import os
 import sys
 from typing import Optional
 import psycopg2
-from psycopg2.pool import SimpleConnectionPool
-from contextlib import contextmanager
 from functools import wraps
 import time
 import threading
@@ -16,32 +14,19 @@ import secrets
 import re
 from datetime import datetime, timedelta
 
-# Initialize connection pool
-database_url = os.environ.get('DATABASE_URL')
-try:
-    pool = SimpleConnectionPool(1, 20, database_url)
-    print("Database connection pool initialized successfully")
-
-    @contextmanager
-    def get_db_connection():
-        connection = pool.getconn()
-        try:
-            yield connection
-        finally:
-            pool.putconn(connection)
-except Exception as e:
-    print(f"Error initializing database connection pool: {str(e)}")
-    # Fallback for development without DB
-    @contextmanager
-    def get_db_connection():
-        yield None
+# Shared thread-safe connection pool (see db_pool.py)
+from db_pool import get_db_connection, get_pool_stats
+from db_migrations import check_schema_current
+from stripe_webhook_queue import StripeWebhookQueue, PermanentJobError, DeferJobError, ProcessedEventCache
+from parallel_tasks import run_parallel
+from plan_activations import PlanActivationLedger, activate_plan_once
 
 # Initialize Stripe
 import stripe
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
 
 # Import OXIO service
-from oxio_service import oxio_service
+from oxio_service import oxio_service, OXIO_CACHE_TTLS, OXIO_CACHE_STALE_SECONDS
 
 # Import product setup function
 from stripe_products import create_stripe_products
@@ -66,476 +51,9 @@ if stripe.api_key:
     except Exception as e:
         print(f"Error setting up Stripe products: {str(e)}")
 
-# Create database tables on startup
-try:
-    with get_db_connection() as conn:
-        if conn:
-            print("Attempting to create database tables...")
-            with conn.cursor() as cur:
-                # Check if purchases table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'purchases')")
-                purchases_exists = cur.fetchone()[0]
-
-                if not purchases_exists:
-                    print("Creating purchases table...")
-                    with open('create_purchases_table.sql', 'r') as sql_file:
-                        sql_script = sql_file.read()
-                        cur.execute(sql_script)
-                    print("Purchases table created successfully")
-                else:
-                    print("Purchases table already exists")
-
-                # Check if subscriptions table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'subscriptions')")
-                subscriptions_exists = cur.fetchone()[0]
-
-                if not subscriptions_exists:
-                    print("Creating subscriptions table...")
-                    with open('create_subscriptions_table.sql', 'r') as sql_file:
-                        sql_script = sql_file.read()
-                        cur.execute(sql_script)
-                    print("Subscriptions table created successfully")
-                else:
-                    print("Subscriptions table already exists")
-
-                # Check if product_rules table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'product_rules')")
-                product_rules_exists = cur.fetchone()[0]
-
-                if not product_rules_exists:
-                    print("Creating product_rules table...")
-                    with open('create_product_rules_table.sql', 'r') as sql_file:
-                        sql_script = sql_file.read()
-                        cur.execute(sql_script)
-                    print("Product rules table created successfully")
-                else:
-                    print("Product rules table already exists")
-
-                # Check if beta_testers table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'beta_testers')")
-                beta_testers_exists = cur.fetchone()[0]
-
-                if not beta_testers_exists:
-                    print("Creating beta_testers table...")
-                    create_beta_testers_sql = """
-                        CREATE TABLE beta_testers (
-                            id SERIAL PRIMARY KEY,
-                            user_id INTEGER NOT NULL,
-                            firebase_uid VARCHAR(128) NOT NULL,
-                            stripe_customer_id VARCHAR(100),
-                            action VARCHAR(50),
-                            status VARCHAR(50),
-                            stripe_session_id VARCHAR(255),
-                            stripe_payment_intent_id VARCHAR(255),
-                            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                    """
-                    cur.execute(create_beta_testers_sql)
-                    conn.commit()
-                    print("beta_testers table created successfully")
-                else:
-                    print("beta_testers table already exists")
-                    # Check if status column exists and add it if missing
-                    cur.execute("""
-                        SELECT column_name FROM information_schema.columns
-                        WHERE table_name = 'beta_testers' AND column_name = 'status'
-                    """)
-                    status_column_exists = cur.fetchone()
-
-                    if not status_column_exists:
-                        print("Adding status column to beta_testers table...")
-                        cur.execute("ALTER TABLE beta_testers ADD COLUMN status VARCHAR(50) DEFAULT 'not_enrolled'")
-                        conn.commit()
-                        print("Status column added successfully")
-
-                # Check if fcm_tokens table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'fcm_tokens')")
-                fcm_tokens_exists = cur.fetchone()[0]
-
-                if not fcm_tokens_exists:
-                    print("Creating fcm_tokens table...")
-                    create_fcm_tokens_sql = """
-                        CREATE TABLE fcm_tokens (
-                            id SERIAL PRIMARY KEY,
-                            firebase_uid VARCHAR(128) NOT NULL,
-                            fcm_token TEXT NOT NULL,
-                            platform VARCHAR(20) DEFAULT 'web',
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            UNIQUE(firebase_uid, platform)
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_fcm_tokens_firebase_uid ON fcm_tokens(firebase_uid);
-                        CREATE INDEX IF NOT EXISTS idx_fcm_tokens_platform ON fcm_tokens(platform);
-                    """
-                    cur.execute(create_fcm_tokens_sql)
-                    conn.commit()
-                    print("fcm_tokens table created successfully")
-                else:
-                    print("fcm_tokens table already exists")
-
-                # Check if notifications table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'notifications')")
-                notifications_exists = cur.fetchone()[0]
-
-                if not notifications_exists:
-                    print("Creating notifications table...")
-                    create_notifications_sql = """
-                        CREATE TABLE notifications (
-                            id SERIAL PRIMARY KEY,
-                            user_id INTEGER,
-                            firebase_uid VARCHAR(128),
-                            title VARCHAR(255) NOT NULL,
-                            body TEXT,
-                            notification_type VARCHAR(50) DEFAULT 'general',
-                            delivered BOOLEAN DEFAULT FALSE,
-                            read_status BOOLEAN DEFAULT FALSE,
-                            fcm_response TEXT,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            delivered_at TIMESTAMP
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_notifications_firebase_uid ON notifications(firebase_uid);
-                        CREATE INDEX IF NOT EXISTS idx_notifications_delivered ON notifications(delivered);
-                        CREATE INDEX IF NOT EXISTS idx_notifications_read_status ON notifications(read_status);
-                    """
-                    cur.execute(create_notifications_sql)
-                    conn.commit()
-                    print("notifications table created successfully")
-                else:
-                    print("notifications table already exists")
-
-                # Check if iccid_inventory table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'iccid_inventory')")
-                iccid_inventory_exists = cur.fetchone()[0]
-
-                if not iccid_inventory_exists:
-                    print("Creating iccid_inventory table...")
-                    create_iccid_inventory_sql = """
-                        CREATE TABLE iccid_inventory (
-                            id SERIAL PRIMARY KEY,
-                            iccid VARCHAR(50) UNIQUE NOT NULL,
-                            lpa_code VARCHAR(200),
-                            country VARCHAR(10) DEFAULT 'US',
-                            line_id VARCHAR(100),
-                            status VARCHAR(20) DEFAULT 'available',
-                            assigned_firebase_uid VARCHAR(128),
-                            assigned_email VARCHAR(255),
-                            assigned_at TIMESTAMP,
-                            batch_upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_iccid_status ON iccid_inventory(status);
-                        CREATE INDEX IF NOT EXISTS idx_iccid_assigned_firebase_uid ON iccid_inventory(assigned_firebase_uid);
-                        CREATE INDEX IF NOT EXISTS idx_iccid_batch_upload ON iccid_inventory(batch_upload_date);
-                    """
-                    cur.execute(create_iccid_inventory_sql)
-                    conn.commit()
-                    print("iccid_inventory table created successfully")
-                else:
-                    print("iccid_inventory table already exists")
-
-                # Check if processed_stripe_events table exists (for webhook idempotency)
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'processed_stripe_events')")
-                processed_events_exists = cur.fetchone()[0]
-
-                if not processed_events_exists:
-                    print("Creating processed_stripe_events table...")
-                    create_processed_events_sql = """
-                        CREATE TABLE processed_stripe_events (
-                            id SERIAL PRIMARY KEY,
-                            event_id VARCHAR(100) UNIQUE NOT NULL,
-                            event_type VARCHAR(100) NOT NULL,
-                            processing_result TEXT,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_processed_events_event_id ON processed_stripe_events(event_id);
-                    """
-                    cur.execute(create_processed_events_sql)
-                    conn.commit()
-                    print("processed_stripe_events table created successfully")
-                else:
-                    print("processed_stripe_events table already exists")
-
-                # Check if welcome_messages table exists (for caching ElevenLabs audio)
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'welcome_messages')")
-                welcome_messages_exists = cur.fetchone()[0]
-
-                if not welcome_messages_exists:
-                    print("Creating welcome_messages table...")
-                    create_welcome_messages_sql = """
-                        CREATE TABLE welcome_messages (
-                            id SERIAL PRIMARY KEY,
-                            firebase_uid VARCHAR(128) NOT NULL,
-                            language VARCHAR(10) NOT NULL,
-                            voice_profile VARCHAR(50) NOT NULL,
-                            message_type VARCHAR(50) NOT NULL DEFAULT 'welcome',
-                            audio_data BYTEA NOT NULL,
-                            content_type VARCHAR(50) DEFAULT 'audio/mpeg',
-                            generation_time_ms INTEGER,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            UNIQUE(firebase_uid, language, voice_profile, message_type)
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_welcome_messages_firebase_uid ON welcome_messages(firebase_uid);
-                        CREATE INDEX IF NOT EXISTS idx_welcome_messages_language ON welcome_messages(language);
-                        CREATE INDEX IF NOT EXISTS idx_welcome_messages_voice_profile ON welcome_messages(voice_profile);
-                        CREATE INDEX IF NOT EXISTS idx_welcome_messages_message_type ON welcome_messages(message_type);
-                    """
-                    cur.execute(create_welcome_messages_sql)
-                    conn.commit()
-                    print("welcome_messages table created successfully")
-                else:
-                    print("welcome_messages table already exists")
-
-                # Check if user_message_history table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'user_message_history')")
-                user_message_history_exists = cur.fetchone()[0]
-
-                if not user_message_history_exists:
-                    print("Creating user_message_history table...")
-                    create_user_message_history_sql = """
-                        CREATE TABLE user_message_history (
-                            id SERIAL PRIMARY KEY,
-                            firebase_uid VARCHAR(128) NOT NULL,
-                            message_type VARCHAR(50) NOT NULL,
-                            language VARCHAR(10) NOT NULL,
-                            voice_profile VARCHAR(50) NOT NULL,
-                            completed BOOLEAN DEFAULT FALSE,
-                            listened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_user_message_history_firebase_uid ON user_message_history(firebase_uid);
-                        CREATE INDEX IF NOT EXISTS idx_user_message_history_message_type ON user_message_history(message_type);
-                    """
-                    cur.execute(create_user_message_history_sql)
-                    conn.commit()
-                    print("user_message_history table created successfully")
-                else:
-                    print("user_message_history table already exists")
-
-                # Check if oxio_activations table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'oxio_activations')")
-                oxio_activations_exists = cur.fetchone()[0]
-
-                if not oxio_activations_exists:
-                    print("Creating oxio_activations table...")
-                    create_oxio_activations_sql = """
-                        CREATE TABLE oxio_activations (
-                            id SERIAL PRIMARY KEY,
-                            user_id INTEGER NOT NULL,
-                            firebase_uid VARCHAR(128),
-                            purchase_id INTEGER,
-                            product_id VARCHAR(100),
-                            iccid VARCHAR(50),
-                            line_id VARCHAR(100),
-                            phone_number VARCHAR(20),
-                            activation_status VARCHAR(50),
-                            plan_id VARCHAR(100),
-                            group_id VARCHAR(100),
-                            esim_qr_code TEXT,
-                            activation_url TEXT,
-                            activation_code VARCHAR(200),
-                            oxio_response TEXT,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_oxio_activations_firebase_uid ON oxio_activations(firebase_uid);
-                        CREATE INDEX IF NOT EXISTS idx_oxio_activations_user_id ON oxio_activations(user_id);
-                        CREATE INDEX IF NOT EXISTS idx_oxio_activations_iccid ON oxio_activations(iccid);
-                    """
-                    cur.execute(create_oxio_activations_sql)
-                    conn.commit()
-                    print("oxio_activations table created successfully")
-                else:
-                    print("oxio_activations table already exists")
-
-
-                # Check if invites table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'invites')")
-                invites_exists = cur.fetchone()[0]
-
-                if not invites_exists:
-                    print("Creating invites table...")
-                    create_invites_sql = """
-                        CREATE TABLE invites (
-                            id SERIAL PRIMARY KEY,
-                            user_id INTEGER,
-                            email VARCHAR(255) NOT NULL,
-                            invitation_status VARCHAR(50) NOT NULL DEFAULT 'pending',
-                            invited_by_user_id INTEGER,
-                            invited_by_firebase_uid VARCHAR(255),
-                            invitation_token VARCHAR(255),
-                            personal_message TEXT,
-                            is_demo_user BOOLEAN DEFAULT FALSE,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            expires_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP + INTERVAL '7 days'),
-                            accepted_at TIMESTAMP,
-                            rejected_at TIMESTAMP,
-                            cancelled_at TIMESTAMP
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_invites_email ON invites(email);
-                        CREATE INDEX IF NOT EXISTS idx_invites_token ON invites(invitation_token);
-                        CREATE INDEX IF NOT EXISTS idx_invites_user_id ON invites(user_id);
-                        CREATE INDEX IF NOT EXISTS idx_invites_invited_by_firebase_uid ON invites(invited_by_firebase_uid);
-                    """
-                    cur.execute(create_invites_sql)
-                    conn.commit()
-                    print("invites table created successfully")
-                else:
-                    print("invites table already exists")
-
-                # Check if data_usage_log table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'data_usage_log')")
-                data_usage_log_exists = cur.fetchone()[0]
-
-                if not data_usage_log_exists:
-                    print("Creating data_usage_log table...")
-                    create_data_usage_log_sql = """
-                        CREATE TABLE data_usage_log (
-                            id SERIAL PRIMARY KEY,
-                            user_id INTEGER NOT NULL,
-                            stripe_customer_id VARCHAR(100),
-                            megabytes_used BIGINT NOT NULL,
-                            stripe_event_id VARCHAR(100),
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_data_usage_user_id ON data_usage_log(user_id);
-                        CREATE INDEX IF NOT EXISTS idx_data_usage_stripe_customer_id ON data_usage_log(stripe_customer_id);
-                    """
-                    cur.execute(create_data_usage_log_sql)
-                    conn.commit()
-                    print("data_usage_log table created successfully")
-                else:
-                    print("data_usage_log table already exists")
-
-                # Check if token_price_pings table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'token_price_pings')")
-                token_price_pings_exists = cur.fetchone()[0]
-
-                if not token_price_pings_exists:
-                    print("Creating token_price_pings table...")
-                    create_token_pings_table_sql = """
-                        CREATE TABLE token_price_pings (
-                            id SERIAL PRIMARY KEY,
-                            token_price DECIMAL(18,9) NOT NULL,
-                            request_time_ms INTEGER,
-                            response_time_ms INTEGER,
-                            roundtrip_ms INTEGER,
-                            ping_destination VARCHAR(255),
-                            source VARCHAR(100),
-                            additional_data TEXT,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_token_price_pings_created_at ON token_price_pings(created_at);
-                    """
-                    cur.execute(create_token_pings_table_sql)
-                    conn.commit()
-                    print("token_price_pings table created successfully")
-                else:
-                    print("token_price_pings table already exists")
-
-                # Check if user_network_preferences table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'user_network_preferences')")
-                user_network_preferences_exists = cur.fetchone()[0]
-
-                if not user_network_preferences_exists:
-                    print("Creating user_network_preferences table...")
-                    create_user_network_preferences_sql = """
-                        CREATE TABLE user_network_preferences (
-                            id SERIAL PRIMARY KEY,
-                            user_id INTEGER NOT NULL,
-                            stripe_product_id VARCHAR(100) NOT NULL,
-                            enabled BOOLEAN DEFAULT FALSE,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            UNIQUE(user_id, stripe_product_id)
-                        );
-                        CREATE INDEX IF NOT EXISTS idx_user_network_preferences_user_id ON user_network_preferences(user_id);
-                        CREATE INDEX IF NOT EXISTS idx_user_network_preferences_stripe_product_id ON user_network_preferences(stripe_product_id);
-                    """
-                    cur.execute(create_user_network_preferences_sql)
-                    conn.commit()
-                    print("user_network_preferences table created successfully")
-                else:
-                    print("user_network_preferences table already exists")
-
-                # Check if first_transaction_bonuses table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'first_transaction_bonuses')")
-                first_transaction_bonuses_exists = cur.fetchone()[0]
-
-                if not first_transaction_bonuses_exists:
-                    print("Creating first_transaction_bonuses table...")
-                    with open('create_first_transaction_bonus_table.sql', 'r') as sql_file:
-                        sql_script = sql_file.read()
-                        cur.execute(sql_script)
-                    conn.commit()
-                    print("first_transaction_bonuses table created successfully")
-                else:
-                    print("first_transaction_bonuses table already exists")
-
-                # Check if phone_number_changes table exists
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'phone_number_changes')")
-                phone_number_changes_exists = cur.fetchone()[0]
-
-                if not phone_number_changes_exists:
-                    print("Creating phone_number_changes table...")
-                    with open('create_phone_number_changes_table.sql', 'r') as sql_file:
-                        sql_script = sql_file.read()
-                        cur.execute(sql_script)
-                    conn.commit()
-                    print("phone_number_changes table created successfully")
-                else:
-                    print("phone_number_changes table already exists")
-
-                # Check if MCP API keys tables exist
-                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'mcp_api_keys')")
-                mcp_api_keys_exists = cur.fetchone()[0]
-
-                if not mcp_api_keys_exists:
-                    print("Creating MCP API keys tables...")
-                    cur.execute("""
-                        CREATE TABLE mcp_api_keys (
-                            id SERIAL PRIMARY KEY,
-                            key_hash VARCHAR(64) UNIQUE NOT NULL,
-                            key_name VARCHAR(255) NOT NULL,
-                            description TEXT,
-                            rate_limit INTEGER DEFAULT 1000,
-                            is_active BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            last_used_at TIMESTAMP,
-                            total_requests BIGINT DEFAULT 0,
-                            firebase_uid VARCHAR(128),
-                            allowed_origins TEXT[],
-                            metadata JSONB
-                        );
-                        
-                        CREATE INDEX idx_mcp_api_keys_key_hash ON mcp_api_keys(key_hash);
-                        CREATE INDEX idx_mcp_api_keys_is_active ON mcp_api_keys(is_active);
-                        CREATE INDEX idx_mcp_api_keys_firebase_uid ON mcp_api_keys(firebase_uid);
-                        
-                        CREATE TABLE mcp_api_requests (
-                            id SERIAL PRIMARY KEY,
-                            key_hash VARCHAR(64) NOT NULL,
-                            request_path VARCHAR(255),
-                            request_method VARCHAR(10),
-                            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            ip_address INET,
-                            user_agent TEXT,
-                            response_status INTEGER
-                        );
-                        
-                        CREATE INDEX idx_mcp_api_requests_key_hash_timestamp 
-                            ON mcp_api_requests(key_hash, timestamp);
-                    """)
-                    conn.commit()
-                    print("MCP API keys tables created successfully")
-                else:
-                    print("MCP API keys tables already exist")
-
-                conn.commit()
-        else:
-            print("No database connection available for table creation")
-except Exception as e:
-    print(f"Error creating tables on startup: {str(e)}")
-    print("Continuing without table creation...")
+# Schema is managed by db_migrations.py (run before starting the app);
+# only warn here if the database is behind
+check_schema_current()
 
 
 app = Flask(__name__, static_url_path='/static', template_folder='templates') # Added template_folder
@@ -702,6 +220,12 @@ def oxio_test_connection():
             'message': 'Failed to test OXIO connection'
         }), 500
 
+@app.route('/api/oxio/health', methods=['GET'])
+def oxio_health():
+    """Circuit breaker and bulkhead state for OXIO calls (no OXIO request is made)"""
+    health = oxio_service.get_health()
+    return jsonify(dict(health, success=True)), 200 if health['healthy'] else 503
+
 @app.route('/api/oxio/test-plans', methods=['GET'])
 def oxio_test_plans():
     """Test OXIO plans endpoint specifically"""
@@ -847,7 +371,13 @@ def oxio_get_available_area_codes():
 
 @app.route('/api/oxio/search-numbers', methods=['GET'])
 def oxio_search_available_numbers():
-    """Search for available phone numbers by NPA NXX or ZIP code"""
+    """
+    Search for available phone numbers by NPA NXX or ZIP code
+
+    Served from the in-memory number inventory; also accepts prefix (leading
+    digits), pattern (e.g. xxx-xxx-CAFE, matched from the end when shorter than
+    ten positions) and contains (digits or vanity letters anywhere)
+    """
     try:
         npa = request.args.get('npa')
         nxx = request.args.get('nxx')
@@ -855,13 +385,25 @@ def oxio_search_available_numbers():
         area_code = request.args.get('areaCode')
         limit = int(request.args.get('limit', 10))
         
-        result = oxio_service.search_available_numbers(
-            npa=npa,
-            nxx=nxx,
-            zip_code=zip_code,
-            area_code=area_code,
-            limit=limit
-        )
+        if number_inventory:
+            result = number_inventory.search(
+                npa=npa or area_code,
+                nxx=nxx,
+                zip_code=zip_code,
+                prefix=request.args.get('prefix'),
+                pattern=request.args.get('pattern'),
+                contains=request.args.get('contains'),
+                limit=limit,
+                holder=request.args.get('firebaseUid')
+            )
+        else:
+            result = oxio_service.search_available_numbers(
+                npa=npa,
+                nxx=nxx,
+                zip_code=zip_code,
+                area_code=area_code,
+                limit=limit
+            )
         
         if result.get('success'):
             return jsonify(result), 200
@@ -876,6 +418,28 @@ def oxio_search_available_numbers():
             'message': 'Failed to search available numbers'
         }), 500
 
+@app.route('/api/oxio/reserve-number', methods=['POST', 'DELETE'])
+def oxio_reserve_number():
+    """Hold an available number for a user while they finish activation (POST) or release it (DELETE)"""
+    data = request.get_json(silent=True) or {}
+    phone_number = data.get('phoneNumber') or request.args.get('phoneNumber')
+    firebase_uid = data.get('firebaseUid') or request.args.get('firebaseUid')
+    
+    if not phone_number or not firebase_uid:
+        return jsonify({'success': False, 'error': 'phoneNumber and firebaseUid are required'}), 400
+    if not number_inventory:
+        return jsonify({'success': False, 'error': 'Number inventory not initialized'}), 503
+    
+    if request.method == 'DELETE':
+        released = number_inventory.release(phone_number, firebase_uid)
+        return jsonify({'success': released, 'released': released}), 200 if released else 404
+    
+    result = number_inventory.reserve(phone_number, firebase_uid)
+    if result.get('success'):
+        print(f"📞 Reserved {result['phone_number']} for {firebase_uid}")
+        return jsonify(result), 200
+    return jsonify(result), result.get('status_code', 500)
+
 # Now initialize Flask-RESTX AFTER the OXIO routes are defined
 api = Api(app, version='1.0', title='IMEI API',
     description='Get android phone IMEI API with telephony permissions for eSIM activation',
@@ -1010,19 +574,6 @@ def send_notification():
                 with get_db_connection() as conn:
                     if conn:
                         with conn.cursor() as cur:
-                            # Check if fcm_tokens table exists, create if not
-                            cur.execute("""
-                                CREATE TABLE IF NOT EXISTS fcm_tokens (
-                                    id SERIAL PRIMARY KEY,
-                                    firebase_uid VARCHAR(128) NOT NULL,
-                                    fcm_token TEXT NOT NULL,
-                                    platform VARCHAR(20) DEFAULT 'web',
-                                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                    UNIQUE(firebase_uid, platform)
-                                )
-                            """)
-
                             # Get user's FCM token
                             cur.execute("""
                                 SELECT fcm_token FROM fcm_tokens
@@ -1151,71 +702,6 @@ def register_firebase_user():
         with get_db_connection() as conn:
             if conn:
                 with conn.cursor() as cur:
-                    # Check if users table exists
-                    cur.execute(
-                        "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'users')"
-                    )
-                    table_exists = cur.fetchone()[0]
-
-                    if not table_exists:
-                        # Create users table with correct column names including OXIO user ID
-                        cur.execute("""
-                            CREATE TABLE users (
-                                id SERIAL PRIMARY KEY,
-                                email VARCHAR(255) NOT NULL,
-                                firebase_uid VARCHAR(128) UNIQUE NOT NULL,
-                                stripe_customer_id VARCHAR(100),
-                                display_name VARCHAR(255),
-                                photo_url TEXT,
-                                imei VARCHAR(100),
-                                eth_address VARCHAR(42),
-                                oxio_user_id VARCHAR(100),
-                                oxio_group_id VARCHAR(100),
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        """)
-                        conn.commit()
-                        print("Users table created with Firebase fields and OXIO user ID")
-                    else:
-                        # Check if oxio_user_id column exists and add it if missing
-                        cur.execute("""
-                            SELECT column_name FROM information_schema.columns
-                            WHERE table_name = 'users' AND column_name = 'oxio_user_id'
-                        """)
-                        oxio_column_exists = cur.fetchone()
-
-                        if not oxio_column_exists:
-                            print("Adding oxio_user_id column to users table...")
-                            cur.execute("ALTER TABLE users ADD COLUMN oxio_user_id VARCHAR(100)")
-                            conn.commit()
-                            print("OXIO user ID column added successfully")
-
-                        # Check if oxio_group_id column exists and add it if missing
-                        cur.execute("""
-                            SELECT column_name FROM information_schema.columns
-                            WHERE table_name = 'users' AND column_name = 'oxio_group_id'
-                        """)
-                        oxio_group_column_exists = cur.fetchone()
-
-                        if not oxio_group_column_exists:
-                            print("Adding oxio_group_id column to users table...")
-                            cur.execute("ALTER TABLE users ADD COLUMN oxio_group_id VARCHAR(100)")
-                            conn.commit()
-                            print("OXIO group ID column added successfully")
-
-                        # Ensure eth_address column exists separately
-                        cur.execute("""
-                            SELECT column_name FROM information_schema.columns
-                            WHERE table_name = 'users' AND column_name = 'eth_address'
-                        """)
-                        eth_column_exists = cur.fetchone()
-
-                        if not eth_column_exists:
-                            print("Adding eth_address column to users table...")
-                            cur.execute("ALTER TABLE users ADD COLUMN eth_address VARCHAR(42)")
-                            conn.commit()
-                            print("ETH address column added successfully")
-
                     # Check if user already exists by Firebase UID
                     cur.execute("SELECT id, stripe_customer_id FROM users WHERE firebase_uid = %s", (firebase_uid,))
                     existing_user = cur.fetchone()
@@ -1548,24 +1034,6 @@ def check_imei_compatibility():
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
-                        # Create compatibility_checks table if it doesn't exist
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS compatibility_checks (
-                                id SERIAL PRIMARY KEY,
-                                imei VARCHAR(50) NOT NULL,
-                                device_make VARCHAR(100),
-                                device_model VARCHAR(100),
-                                device_year INTEGER,
-                                four_g_support BOOLEAN,
-                                five_g_support BOOLEAN,
-                                volte_support BOOLEAN,
-                                wifi_calling_support VARCHAR(20),
-                                is_compatible BOOLEAN,
-                                search_id INTEGER,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            )
-                        """)
-
                         # Insert compatibility check record
                         device = result.get('device', {})
                         capabilities = result.get('capabilities', {})
@@ -1768,18 +1236,6 @@ def get_member_count():
         with get_db_connection() as conn:
             if conn:
                 with conn.cursor() as cur:
-                    # Check if users table exists
-                    cur.execute("""
-                        SELECT EXISTS (
-                            SELECT FROM information_schema.tables
-                            WHERE table_name = 'users'
-                        )
-                    """)
-                    table_exists = cur.fetchone()[0]
-
-                    if not table_exists:
-                        return jsonify({'count': 1, 'error': 'Users table does not exist'})
-
                     # Count total number of users
                     cur.execute("SELECT COUNT(*) FROM users")
                     count = cur.fetchone()[0]
@@ -1828,52 +1284,6 @@ def record_purchase(stripe_id, product_id, price_id, amount, user_id=None, trans
                 if conn:
                     try:
                         with conn.cursor() as cur:
-                            # First, check if the purchases table exists
-                            cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'purchases')")
-                            table_exists = cur.fetchone()[0]
-
-                            # Create the table if it doesn't exist
-                            if not table_exists:
-                                print("Purchases table does not exist. Creating it now...")
-                                create_table_sql = """
-                                CREATE TABLE IF NOT EXISTS purchases (
-                                    PurchaseID SERIAL PRIMARY KEY,
-                                    StripeID VARCHAR(100),
-                                    StripeProductID VARCHAR(100) NOT NULL,
-                                    PriceID VARCHAR(100) NOT NULL,
-                                    TotalAmount INTEGER NOT NULL,
-                                    DateCreated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                    UserID INTEGER,
-                                    StripeTransactionID VARCHAR(100),
-                                    FirebaseUID VARCHAR(128)
-                                );
-
-                                CREATE INDEX IF NOT EXISTS idx_purchases_stripe ON purchases(StripeID);
-                                CREATE INDEX IF NOT EXISTS idx_purchases_product ON purchases(StripeProductID);
-                                CREATE INDEX IF NOT EXISTS idx_purchases_user ON purchases(UserID);
-                                CREATE INDEX IF NOT EXISTS idx_purchases_firebase_uid ON purchases(FirebaseUID);
-                                """
-                                cur.execute(create_table_sql)
-                                conn.commit()
-                                print("Purchases table created successfully")
-                            else:
-                                # Check if new columns exist and add them if needed
-                                cur.execute("""
-                                    SELECT column_name FROM information_schema.columns
-                                    WHERE table_name = 'purchases'
-                                """)
-                                columns = [row[0] for row in cur.fetchall()]
-
-                                if 'stripetransactionid' not in [col.lower() for col in columns]:
-                                    print("Adding StripeTransactionID column to purchases table...")
-                                    cur.execute("ALTER TABLE purchases ADD COLUMN StripeTransactionID VARCHAR(100)")
-
-                                if 'firebaseuid' not in [col.lower() for col in columns]:
-                                    print("Adding FirebaseUID column to purchases table...")
-                                    cur.execute("ALTER TABLE purchases ADD COLUMN FirebaseUID VARCHAR(128)")
-
-                                conn.commit()
-
                             # Handle null StripeID (make it empty string instead)
                             if stripe_id is None:
                                 stripe_id = ''
@@ -2582,6 +1992,35 @@ def get_admin_stats():
         print(f"Error getting admin stats: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/db-pool/stats', methods=['GET'])
+def get_db_pool_stats():
+    """Database connection pool counters (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+
+    return jsonify({
+        'success': True,
+        'pool': get_pool_stats()
+    })
+
+@app.route('/api/admin/mcp/request-log/stats', methods=['GET'])
+def get_mcp_request_log_stats():
+    """MCP request log writer, rate limiter and API key cache counters (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+
+    if not mcp_auth_manager:
+        return jsonify({'success': False, 'error': 'Auth manager not initialized'}), 500
+
+    return jsonify({
+        'success': True,
+        'request_log': mcp_auth_manager.request_log.get_stats(),
+        'rate_limiter': mcp_auth_manager.rate_limiter.get_statistics(),
+        'key_cache': mcp_auth_manager.get_cache_stats()
+    })
+
 @app.route('/admin/shopify')
 def shopify_admin():
     """Shopify management admin interface"""
@@ -2609,19 +2048,6 @@ def save_email_template():
         with get_db_connection() as conn:
             if conn:
                 with conn.cursor() as cur:
-                    # Create email_templates table if not exists
-                    cur.execute("""
-                        CREATE TABLE IF NOT EXISTS email_templates (
-                            id SERIAL PRIMARY KEY,
-                            template_type VARCHAR(50) NOT NULL,
-                            subject TEXT NOT NULL,
-                            content TEXT NOT NULL,
-                            modified_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            modified_by VARCHAR(100) DEFAULT 'Admin',
-                            is_active BOOLEAN DEFAULT TRUE
-                        )
-                    """)
-
                     # Deactivate old templates of this type
                     cur.execute("""
                         UPDATE email_templates
@@ -3273,6 +2699,346 @@ def assign_iccid_to_user_atomic(firebase_uid, user_email):
         print(f"Error assigning ICCID to user: {e}")
         return None
 
+def defer_if_oxio_unavailable():
+    """Requeue the current job, without spending an attempt, while OXIO provisioning is circuit-broken"""
+    if not oxio_service.is_available('provisioning'):
+        retry_after = oxio_service.breakers['provisioning'].retry_after() or 0
+        raise DeferJobError('OXIO provisioning circuit open', delay=max(int(retry_after) + 1, 5))
+
+def process_stripe_event(event):
+    """
+    Fulfil a verified Stripe event (run by StripeWebhookQueue workers)
+
+    Raises to have the job retried with backoff; PermanentJobError sends it
+    straight to the dead-letter state and DeferJobError requeues it while
+    OXIO is unavailable.
+    """
+    # Handle successful payment events
+    if event['type'] == 'checkout.session.completed':
+        session = event['data']['object']
+
+        # Extract product information from metadata
+        product_id = session['metadata'].get('product_id')  # Legacy format
+        product = session['metadata'].get('product')        # New format
+        firebase_uid = session['metadata'].get('firebase_uid')  # Legacy
+        oxio_user_id = session['metadata'].get('oxio_user_id')  # New direct OXIO format
+        customer_id = session.get('customer')
+
+        print(f"Payment successful - Product: {product or product_id}, Firebase UID: {firebase_uid}, OXIO User: {oxio_user_id}")
+
+        # Handle eSIM Beta activation using dedicated service
+        if product == 'esim_beta':
+            assigned_iccid = None
+            defer_if_oxio_unavailable()
+            try:
+                print(f"💰 Processing $1 eSIM Beta activation with ICCID assignment")
+
+                # Import the new eSIM activation service
+                from esim_activation_service import esim_activation_service
+
+                # Get user details from session metadata
+                firebase_uid = session['metadata'].get('firebase_uid', '')
+                user_email = session['metadata'].get('user_email', '')
+                user_name = session['metadata'].get('user_name', '')
+
+                # Step 1: Check if user already has an assigned ICCID (idempotency)
+                existing_iccid = get_user_assigned_iccid_data(firebase_uid)
+
+                if existing_iccid:
+                    print(f"✅ User {firebase_uid} already has assigned ICCID: {existing_iccid['iccid']}")
+                    assigned_iccid = existing_iccid
+                else:
+                    # Assign new ICCID to user with atomic locking to prevent race conditions
+                    assigned_iccid = assign_iccid_to_user_atomic(firebase_uid, user_email)
+
+                    if not assigned_iccid:
+                        print(f"❌ No available ICCIDs for user {firebase_uid}")
+                        raise Exception('No available eSIMs in inventory')
+
+                    print(f"✅ Assigned new ICCID {assigned_iccid['iccid']} to user {firebase_uid}")
+
+                total_amount = session.get('amount_total', 100)  # Default $1.00 in cents
+
+                print(f"🎯 eSIM activation parameters: Firebase UID={firebase_uid}, Email={user_email}, Amount=${total_amount/100:.2f}, ICCID={assigned_iccid['iccid']}")
+
+                if not firebase_uid or not user_email:
+                    print(f"❌ Missing required parameters for eSIM activation")
+                    raise PermanentJobError('Missing Firebase UID or email')
+
+                # Call the dedicated eSIM activation service
+                activation_result = esim_activation_service.activate_esim_after_payment(
+                    firebase_uid=firebase_uid,
+                    user_email=user_email,
+                    user_name=user_name,
+                    stripe_session_id=session['id'],
+                    purchase_amount=total_amount
+                )
+
+                if activation_result.get('success'):
+                    print(f"✅ eSIM activation service completed successfully")
+                    if activation_result.get('incomplete_steps'):
+                        print(f"⚠️ Activation workflow left resumable: {activation_result.get('error')}")
+
+                    # The activation service already sends the confirmation email
+                    # No need to send a separate receipt email here
+
+                    def record_purchase_and_update_receipt():
+                        # Record the purchase in database
+                        purchase_id = record_purchase(
+                            stripe_id=session.get('id'),
+                            product_id='esim_beta',
+                            price_id='price_1S7Yc6JnTfh0bNQQVeLeprXe',
+                            amount=total_amount,
+                            user_id=None,  # Will be looked up from Firebase UID
+                            transaction_id=session.get('payment_intent'),
+                            firebase_uid=firebase_uid,
+                            stripe_transaction_id=session.get('payment_intent')
+                        )
+                        print(f"💾 Purchase recorded with ID: {purchase_id}")
+
+                        # Update Stripe receipt with eSIM details
+                        try:
+                            esim_data = activation_result.get('esim_data', {}) or {}  # Ensure it's always a dict
+                            enhanced_metadata = {
+                                **session.get('metadata', {}),
+                                'esim_phone_number': esim_data.get('phone_number', 'Pending assignment'),
+                                'esim_iccid': assigned_iccid['iccid'],  # Use our assigned ICCID
+                                'esim_lpa_code': assigned_iccid['lpa_code'],  # Include LPA code
+                                'esim_country': assigned_iccid['country'],
+                                'esim_line_id': esim_data.get('line_id', assigned_iccid.get('line_id', 'System assigned')),
+                                'esim_activation_status': 'completed',
+                                'esim_activation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                                'esim_qr_available': 'yes',  # Always yes since we generate QR codes
+                                'iccid_assigned': 'true',  # Flag that ICCID was assigned
+                                'oxio_user_id': activation_result.get('oxio_user_id', ''),
+                                'oxio_group_id': activation_result.get('oxio_group_id', ''),
+                                'purchase_id': str(purchase_id) if purchase_id else '',
+                                'receipt_enhanced': 'true'
+                            }
+
+                            stripe.checkout.Session.modify(session['id'], metadata=enhanced_metadata)
+                            print(f"✅ Enhanced Stripe receipt with eSIM details")
+
+                        except Exception as stripe_update_error:
+                            print(f"⚠️ Could not update Stripe receipt: {stripe_update_error}")
+                        return purchase_id
+
+                    def award_first_transaction_bonus():
+                        # Award first transaction bonus if eligible
+                        user_data = get_user_by_firebase_uid(firebase_uid)
+                        if not user_data:
+                            return None
+                        eth_address = user_data.get('eth_address')
+                        if not eth_address:
+                            print(f"⚠️ User {firebase_uid} does not have an Ethereum address for DOTM bonus")
+                            return None
+
+                        bonus_success, bonus_message = ethereum_helper.check_and_award_first_transaction_bonus(
+                            user_data.get('id'), firebase_uid, eth_address
+                        )
+                        if bonus_success:
+                            print(f"🎁 {bonus_message}")
+                        else:
+                            print(f"ℹ️ First transaction bonus: {bonus_message}")
+                        return bonus_success
+
+                    # The purchase record (which the receipt references) and the
+                    # on-chain bonus are independent, so run them concurrently
+                    side_effects = run_parallel({
+                        'purchase_receipt': record_purchase_and_update_receipt,
+                        'first_transaction_bonus': award_first_transaction_bonus
+                    })
+                    purchase_effect = side_effects['purchase_receipt']
+                    if not purchase_effect['success']:
+                        if not purchase_effect['timed_out']:
+                            raise Exception(f"Failed to record purchase: {purchase_effect['error']}")
+                        # Still running in the background; retrying would record the purchase twice
+                        print(f"⚠️ Purchase record still pending for session {session['id']}")
+                    if not side_effects['first_transaction_bonus']['success']:
+                        print(f"⚠️ Error awarding first transaction bonus: {side_effects['first_transaction_bonus']['error']}")
+                else:
+                    print(f"❌ eSIM activation service failed: {activation_result.get('error', 'Unknown error')}")
+                    print(f"   Failed at step: {activation_result.get('step', 'unknown')}")
+                    print(f"   Note: ICCID {assigned_iccid.get('iccid') if assigned_iccid else 'N/A'} assigned after payment - no rollback needed")
+
+                    # The workflow resumes from its checkpoint once OXIO recovers
+                    defer_if_oxio_unavailable()
+                    raise Exception(
+                        f"eSIM activation failed at step {activation_result.get('step', 'unknown')}: "
+                        f"{activation_result.get('error', 'Activation failed')}"
+                    )
+
+            except Exception as e:
+                print(f"❌ Error in eSIM Beta activation: {str(e)}")
+                print(f"   Note: ICCID {assigned_iccid.get('iccid') if assigned_iccid else 'N/A'} assigned after payment - no rollback needed")
+                raise
+
+        # Handle Global Data 10GB activation with OXIO
+        elif (product_id == 'global_data_10gb' or product == 'global_data_10gb') and firebase_uid:
+            defer_if_oxio_unavailable()
+            try:
+                print(f"💰 Processing 10GB Global Data purchase for Firebase UID: {firebase_uid}")
+                
+                # Get OXIO plan ID from metadata or environment variable
+                oxio_plan_id = session['metadata'].get('oxio_plan_id') or os.environ.get('OXIO_10GB_PLAN_ID', '9d521906-ea2f-4c2b-b717-1ce36744c36a')
+                user_email = session['metadata'].get('user_email', '')
+                user_name = session['metadata'].get('user_name', '')
+                total_amount = session.get('amount_total', 2000)  # Default $20.00 in cents
+                
+                print(f"📋 10GB Activation params: Firebase UID={firebase_uid}, Email={user_email}, Plan ID={oxio_plan_id}, Amount=${total_amount/100:.2f}")
+                
+                # Get or create user data
+                with get_db_connection() as conn:
+                    if conn:
+                        with conn.cursor() as cur:
+                            cur.execute("""
+                                SELECT id, email, display_name, oxio_user_id
+                                FROM users
+                                WHERE firebase_uid = %s
+                            """, (firebase_uid,))
+                            user_data = cur.fetchone()
+                            
+                            if not user_data:
+                                print(f"⚠️ User not found in database, creating new user")
+                                cur.execute("""
+                                    INSERT INTO users (email, firebase_uid, display_name)
+                                    VALUES (%s, %s, %s)
+                                    RETURNING id
+                                """, (user_email, firebase_uid, user_name))
+                                user_id = cur.fetchone()[0]
+                                oxio_user_id = None
+                                conn.commit()
+                            else:
+                                user_id = user_data[0]
+                                user_email = user_data[1] or user_email
+                                user_name = user_data[2] or user_name
+                                oxio_user_id = user_data[3]
+                
+                # Import OXIO service
+                from oxio_service import oxio_service
+                
+                # Ensure OXIO user exists
+                if not oxio_user_id:
+                    print(f"🆕 Creating OXIO user for {user_email}")
+                    name_parts = (user_name or "User").split(' ', 1)
+                    first_name = name_parts[0] if name_parts else "User"
+                    last_name = name_parts[1] if len(name_parts) > 1 else "Account"
+                    
+                    user_result = oxio_service.create_oxio_user(
+                        first_name=first_name,
+                        last_name=last_name,
+                        email=user_email,
+                        firebase_uid=firebase_uid
+                    )
+                    
+                    if user_result.get('success'):
+                        oxio_user_id = user_result.get('oxio_user_id')
+                        print(f"✅ Created OXIO user: {oxio_user_id}")
+                        
+                        # Update user record with OXIO user ID
+                        with get_db_connection() as conn:
+                            if conn:
+                                with conn.cursor() as cur:
+                                    cur.execute("""
+                                        UPDATE users SET oxio_user_id = %s
+                                        WHERE firebase_uid = %s
+                                    """, (oxio_user_id, firebase_uid))
+                                    conn.commit()
+                    else:
+                        print(f"❌ Failed to create OXIO user: {user_result.get('message', 'Unknown error')}")
+                        raise Exception(f"Failed to create OXIO user: {user_result.get('message', 'Unknown error')}")
+                
+                # Activate OXIO data plan
+                print(f"🚀 Activating OXIO 10GB plan for user: {oxio_user_id}")
+                
+                # Create plan subscription payload
+                plan_payload = {
+                    "endUserId": oxio_user_id,
+                    "planId": oxio_plan_id
+                }
+                
+                print(f"📤 OXIO Plan Activation Request:")
+                print(f"   URL: {oxio_service.base_url}/v3/subscriptions")
+                print(f"   Payload: {json.dumps(plan_payload, indent=2)}")
+                
+                # Make OXIO API call to activate plan (booster) on the service's pooled session,
+                # at most once per checkout session even if this job is retried
+                # Note: Endpoint for adding booster to existing line
+                # You'll need to update this URL when you have the correct OXIO booster endpoint
+                def create_subscription():
+                    response = oxio_service.request('POST', '/v3/subscriptions', 'subscriptions', json=plan_payload)
+                    print(f"📥 OXIO Plan Activation Response:")
+                    print(f"   Status Code: {response.status_code}")
+                    print(f"   Response: {response.text}")
+                    return response
+
+                def record_10gb_purchase(subscription_id):
+                    return record_purchase(
+                        stripe_id=session.get('id'),
+                        product_id='global_data_10gb',
+                        price_id='price_1RM9sxJnTfh0bNQQgj2sacLZ',
+                        amount=total_amount,
+                        user_id=user_id,
+                        transaction_id=session.get('payment_intent'),
+                        firebase_uid=firebase_uid,
+                        stripe_transaction_id=session.get('payment_intent')
+                    )
+
+                activation = activate_plan_once(
+                    plan_activation_ledger, session.get('id'), firebase_uid, oxio_plan_id,
+                    create_subscription, record_10gb_purchase
+                )
+                if activation['resumed']:
+                    print(f"♻️ Resumed 10GB activation for session {session.get('id')} without a new OXIO POST")
+                print(f"✅ OXIO 10GB plan activated successfully")
+                print(f"   Subscription ID: {activation['subscription_id']}")
+                print(f"💾 Purchase recorded with ID: {activation['purchase_id']}")
+
+                # Award first transaction bonus if eligible
+                try:
+                    user_data = get_user_by_firebase_uid(firebase_uid)
+                    if user_data:
+                        eth_address = user_data.get('eth_address')
+                        
+                        if eth_address:
+                            bonus_success, bonus_message = ethereum_helper.check_and_award_first_transaction_bonus(
+                                user_id, firebase_uid, eth_address
+                            )
+                            if bonus_success:
+                                print(f"🎁 {bonus_message}")
+                            else:
+                                print(f"ℹ️ First transaction bonus: {bonus_message}")
+                except Exception as bonus_error:
+                    print(f"⚠️ Error awarding first transaction bonus: {str(bonus_error)}")
+
+            except Exception as e:
+                print(f"❌ Error in 10GB Global Data activation: {str(e)}")
+                raise
+        
+        # Handle other product activations (existing logic)
+        elif (product_id in ['basic_membership', 'full_membership'] or product in ['basic_membership', 'full_membership']) and firebase_uid:
+            print(f"Membership activation for {product or product_id} will be handled by existing subscription flow")
+
+    return {'status': 'processed', 'event_type': event['type']}
+
+
+# Paid OXIO plan activations, so a retried webhook job never subscribes twice
+plan_activation_ledger = PlanActivationLedger(get_db_connection)
+
+# Stripe events fulfilled by background workers instead of inside the webhook request
+QUEUED_STRIPE_EVENT_TYPES = {'checkout.session.completed'}
+
+# Recently recorded Stripe event IDs, so retried deliveries skip the database
+processed_event_cache = ProcessedEventCache()
+
+try:
+    stripe_webhook_queue = StripeWebhookQueue(get_db_connection, process_stripe_event)
+    stripe_webhook_queue.start_workers()
+    print("Stripe webhook queue workers started")
+except Exception as e:
+    print(f"Error starting Stripe webhook queue: {str(e)}")
+    stripe_webhook_queue = None
+
 @app.route('/stripe/webhook/7f3a9b2c8d1e4f5a6b7c8d9e0f1a2b3c', methods=['POST'])
 def handle_stripe_webhook():
     """Handle Stripe webhook events, especially payment success"""
@@ -3308,347 +3074,51 @@ def handle_stripe_webhook():
 
         print(f"📨 Stripe webhook received: {event['type']} (ID: {event['id']})")
 
-        # IDEMPOTENCY: Check if we've already processed this event
+        # IDEMPOTENCY: record the event and queue its job in one transaction
         event_id = event['id']
-        event_type = event['type']
-
-        try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-
-                # Check if event already processed
-                cursor.execute("SELECT id, processing_result FROM processed_stripe_events WHERE event_id = %s", (event_id,))
-                existing_event = cursor.fetchone()
-
-                if existing_event:
-                    print(f"⚠️ Event {event_id} already processed - returning previous result")
-                    return jsonify({'status': 'already_processed', 'event_id': event_id}), 200
-
-                # Mark event as being processed (prevents race conditions) with UNIQUE constraint
-                cursor.execute("""
-                    INSERT INTO processed_stripe_events (event_id, event_type)
-                    VALUES (%s, %s)
-                    ON CONFLICT (event_id) DO NOTHING
-                """, (event_id, event_type))
-
-                # Check if we actually inserted (vs conflict)
-                if cursor.rowcount == 0:
-                    print(f"🔄 Event {event_id} was already being processed by another request")
-                    return jsonify({'status': 'already_processed', 'event_id': event_id}), 200
-                conn.commit()
-                print(f"🔄 Processing new event: {event_id} (type: {event_type})")
-
-        except Exception as db_error:
-            print(f"❌ CRITICAL: Database error in idempotency check: {db_error}")
-            # FAIL CLOSED - Do not process if idempotency cannot be guaranteed
-            return jsonify({'error': 'Idempotency check failed', 'retry': True}), 500
-
-        # Handle successful payment events
-        if event['type'] == 'checkout.session.completed':
-            session = event['data']['object']
-
-            # Extract product information from metadata
-            product_id = session['metadata'].get('product_id')  # Legacy format
-            product = session['metadata'].get('product')        # New format
-            firebase_uid = session['metadata'].get('firebase_uid')  # Legacy
-            oxio_user_id = session['metadata'].get('oxio_user_id')  # New direct OXIO format
-            customer_id = session.get('customer')
-
-            print(f"Payment successful - Product: {product or product_id}, Firebase UID: {firebase_uid}, OXIO User: {oxio_user_id}")
-
-            # Handle eSIM Beta activation using dedicated service
-            if product == 'esim_beta':
-                try:
-                    print(f"💰 Processing $1 eSIM Beta activation with ICCID assignment")
-
-                    # Import the new eSIM activation service
-                    from esim_activation_service import esim_activation_service
-
-                    # Get user details from session metadata
-                    firebase_uid = session['metadata'].get('firebase_uid', '')
-                    user_email = session['metadata'].get('user_email', '')
-                    user_name = session['metadata'].get('user_name', '')
-
-                    # Step 1: Check if user already has an assigned ICCID (idempotency)
-                    existing_iccid = get_user_assigned_iccid_data(firebase_uid)
-
-                    if existing_iccid:
-                        print(f"✅ User {firebase_uid} already has assigned ICCID: {existing_iccid['iccid']}")
-                        assigned_iccid = existing_iccid
-                    else:
-                        # Assign new ICCID to user with atomic locking to prevent race conditions
-                        assigned_iccid = assign_iccid_to_user_atomic(firebase_uid, user_email)
-
-                        if not assigned_iccid:
-                            print(f"❌ No available ICCIDs for user {firebase_uid}")
-                            return jsonify({'error': 'No available eSIMs in inventory'}), 500
-
-                        print(f"✅ Assigned new ICCID {assigned_iccid['iccid']} to user {firebase_uid}")
-
-                    total_amount = session.get('amount_total', 100)  # Default $1.00 in cents
-
-                    print(f"🎯 eSIM activation parameters: Firebase UID={firebase_uid}, Email={user_email}, Amount=${total_amount/100:.2f}, ICCID={assigned_iccid['iccid']}")
-
-                    if not firebase_uid or not user_email:
-                        print(f"❌ Missing required parameters for eSIM activation")
-                        return jsonify({'status': 'error', 'message': 'Missing Firebase UID or email'}), 400
-
-                    # Call the dedicated eSIM activation service
-                    activation_result = esim_activation_service.activate_esim_after_payment(
-                        firebase_uid=firebase_uid,
-                        user_email=user_email,
-                        user_name=user_name,
-                        stripe_session_id=session['id'],
-                        purchase_amount=total_amount
-                    )
-
-                    if activation_result.get('success'):
-                        print(f"✅ eSIM activation service completed successfully")
-
-                        # The activation service already sends the confirmation email
-                        # No need to send a separate receipt email here
-
-                        # Record the purchase in database
-                        purchase_id = record_purchase(
-                            stripe_id=session.get('id'),
-                            product_id='esim_beta',
-                            price_id='price_1S7Yc6JnTfh0bNQQVeLeprXe',
-                            amount=total_amount,
-                            user_id=None,  # Will be looked up from Firebase UID
-                            transaction_id=session.get('payment_intent'),
-                            firebase_uid=firebase_uid,
-                            stripe_transaction_id=session.get('payment_intent')
-                        )
-                        print(f"💾 Purchase recorded with ID: {purchase_id}")
-
-                        # Award first transaction bonus if eligible
-                        try:
-                            user_data = get_user_by_firebase_uid(firebase_uid)
-                            if user_data:
-                                user_id = user_data.get('id')
-                                eth_address = user_data.get('eth_address')
-                                
-                                if eth_address:
-                                    bonus_success, bonus_message = ethereum_helper.check_and_award_first_transaction_bonus(
-                                        user_id, firebase_uid, eth_address
-                                    )
-                                    if bonus_success:
-                                        print(f"🎁 {bonus_message}")
-                                    else:
-                                        print(f"ℹ️ First transaction bonus: {bonus_message}")
-                                else:
-                                    print(f"⚠️ User {firebase_uid} does not have an Ethereum address for DOTM bonus")
-                        except Exception as bonus_error:
-                            print(f"⚠️ Error awarding first transaction bonus: {str(bonus_error)}")
+        event_type = event['type']
 
-                        # Update Stripe receipt with eSIM details
-                        try:
-                            esim_data = activation_result.get('esim_data', {}) or {}  # Ensure it's always a dict
-                            enhanced_metadata = {
-                                **session.get('metadata', {}),
-                                'esim_phone_number': esim_data.get('phone_number', 'Pending assignment'),
-                                'esim_iccid': assigned_iccid['iccid'],  # Use our assigned ICCID
-                                'esim_lpa_code': assigned_iccid['lpa_code'],  # Include LPA code
-                                'esim_country': assigned_iccid['country'],
-                                'esim_line_id': esim_data.get('line_id', assigned_iccid.get('line_id', 'System assigned')),
-                                'esim_activation_status': 'completed',
-                                'esim_activation_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                'esim_qr_available': 'yes',  # Always yes since we generate QR codes
-                                'iccid_assigned': 'true',  # Flag that ICCID was assigned
-                                'oxio_user_id': activation_result.get('oxio_user_id', ''),
-                                'oxio_group_id': activation_result.get('oxio_group_id', ''),
-                                'purchase_id': str(purchase_id) if purchase_id else '',
-                                'receipt_enhanced': 'true'
-                            }
+        if event_id in processed_event_cache:
+            print(f"⚠️ Event {event_id} already received - skipping")
+            return jsonify({'status': 'already_processed', 'event_id': event_id}), 200
 
-                            stripe.checkout.Session.modify(session['id'], metadata=enhanced_metadata)
-                            print(f"✅ Enhanced Stripe receipt with eSIM details")
+        if not stripe_webhook_queue:
+            print(f"⚠️ Webhook queue unavailable - processing {event_id} inline")
 
-                        except Exception as stripe_update_error:
-                            print(f"⚠️ Could not update Stripe receipt: {stripe_update_error}")
-                    else:
-                        print(f"❌ eSIM activation service failed: {activation_result.get('error', 'Unknown error')}")
-                        print(f"   Failed at step: {activation_result.get('step', 'unknown')}")
-                        print(f"   Note: ICCID {assigned_iccid.get('iccid') if assigned_iccid else 'N/A'} assigned after payment - no rollback needed")
+        try:
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
 
-                        return jsonify({
-                            'status': 'activation_failed',
-                            'error': activation_result.get('error', 'Activation failed'),
-                            'step': activation_result.get('step', 'unknown')
-                        }), 500
+                # Mark event as received (UNIQUE constraint makes Stripe retries no-ops)
+                cursor.execute("""
+                    INSERT INTO processed_stripe_events (event_id, event_type)
+                    VALUES (%s, %s)
+                    ON CONFLICT (event_id) DO NOTHING
+                """, (event_id, event_type))
 
-                except Exception as e:
-                    print(f"❌ Error in eSIM Beta activation: {str(e)}")
-                    print(f"   Note: ICCID {assigned_iccid.get('iccid') if assigned_iccid else 'N/A'} assigned after payment - no rollback needed")
+                if cursor.rowcount == 0:
+                    processed_event_cache.add(event_id)
+                    print(f"⚠️ Event {event_id} already received - skipping")
+                    return jsonify({'status': 'already_processed', 'event_id': event_id}), 200
 
-                    return jsonify({
-                        'status': 'error',
-                        'error': 'eSIM activation failed',
-                        'message': str(e)
-                    }), 500
+                queued = False
+                if stripe_webhook_queue and event_type in QUEUED_STRIPE_EVENT_TYPES:
+                    queued = stripe_webhook_queue.enqueue(cursor, event_id, event_type, json.loads(payload))
+                conn.commit()
+                processed_event_cache.add(event_id)
 
-            # Handle Global Data 10GB activation with OXIO
-            elif (product_id == 'global_data_10gb' or product == 'global_data_10gb') and firebase_uid:
-                try:
-                    print(f"💰 Processing 10GB Global Data purchase for Firebase UID: {firebase_uid}")
-                    
-                    # Get OXIO plan ID from metadata or environment variable
-                    oxio_plan_id = session['metadata'].get('oxio_plan_id') or os.environ.get('OXIO_10GB_PLAN_ID', '9d521906-ea2f-4c2b-b717-1ce36744c36a')
-                    user_email = session['metadata'].get('user_email', '')
-                    user_name = session['metadata'].get('user_name', '')
-                    total_amount = session.get('amount_total', 2000)  # Default $20.00 in cents
-                    
-                    print(f"📋 10GB Activation params: Firebase UID={firebase_uid}, Email={user_email}, Plan ID={oxio_plan_id}, Amount=${total_amount/100:.2f}")
-                    
-                    # Get or create user data
-                    with get_db_connection() as conn:
-                        if conn:
-                            with conn.cursor() as cur:
-                                cur.execute("""
-                                    SELECT id, email, display_name, oxio_user_id
-                                    FROM users
-                                    WHERE firebase_uid = %s
-                                """, (firebase_uid,))
-                                user_data = cur.fetchone()
-                                
-                                if not user_data:
-                                    print(f"⚠️ User not found in database, creating new user")
-                                    cur.execute("""
-                                        INSERT INTO users (email, firebase_uid, display_name)
-                                        VALUES (%s, %s, %s)
-                                        RETURNING id
-                                    """, (user_email, firebase_uid, user_name))
-                                    user_id = cur.fetchone()[0]
-                                    oxio_user_id = None
-                                    conn.commit()
-                                else:
-                                    user_id = user_data[0]
-                                    user_email = user_data[1] or user_email
-                                    user_name = user_data[2] or user_name
-                                    oxio_user_id = user_data[3]
-                    
-                    # Import OXIO service
-                    from oxio_service import oxio_service
-                    
-                    # Ensure OXIO user exists
-                    if not oxio_user_id:
-                        print(f"🆕 Creating OXIO user for {user_email}")
-                        name_parts = (user_name or "User").split(' ', 1)
-                        first_name = name_parts[0] if name_parts else "User"
-                        last_name = name_parts[1] if len(name_parts) > 1 else "Account"
-                        
-                        user_result = oxio_service.create_oxio_user(
-                            first_name=first_name,
-                            last_name=last_name,
-                            email=user_email,
-                            firebase_uid=firebase_uid
-                        )
-                        
-                        if user_result.get('success'):
-                            oxio_user_id = user_result.get('oxio_user_id')
-                            print(f"✅ Created OXIO user: {oxio_user_id}")
-                            
-                            # Update user record with OXIO user ID
-                            with get_db_connection() as conn:
-                                if conn:
-                                    with conn.cursor() as cur:
-                                        cur.execute("""
-                                            UPDATE users SET oxio_user_id = %s
-                                            WHERE firebase_uid = %s
-                                        """, (oxio_user_id, firebase_uid))
-                                        conn.commit()
-                        else:
-                            print(f"❌ Failed to create OXIO user: {user_result.get('message', 'Unknown error')}")
-                            return jsonify({'error': 'Failed to create OXIO user'}), 500
-                    
-                    # Activate OXIO data plan
-                    print(f"🚀 Activating OXIO 10GB plan for user: {oxio_user_id}")
-                    
-                    # Create plan subscription payload
-                    plan_payload = {
-                        "endUserId": oxio_user_id,
-                        "planId": oxio_plan_id
-                    }
-                    
-                    print(f"📤 OXIO Plan Activation Request:")
-                    print(f"   URL: {oxio_service.base_url}/v3/subscriptions")
-                    print(f"   Payload: {json.dumps(plan_payload, indent=2)}")
-                    
-                    # Make OXIO API call to activate plan (booster)
-                    import requests
-                    import base64
-                    from oxio_service import oxio_service
-                    
-                    # Use OXIO service's authentication method (Basic Auth)
-                    headers = oxio_service.get_headers()
-                    
-                    # Note: Endpoint for adding booster to existing line
-                    # You'll need to update this URL when you have the correct OXIO booster endpoint
-                    response = requests.post(
-                        f'{oxio_service.base_url}/v3/subscriptions',
-                        json=plan_payload,
-                        headers=headers,
-                        timeout=30
-                    )
-                    
-                    print(f"📥 OXIO Plan Activation Response:")
-                    print(f"   Status Code: {response.status_code}")
-                    print(f"   Response: {response.text}")
-                    
-                    if response.status_code in [200, 201]:
-                        oxio_response = response.json()
-                        subscription_id = oxio_response.get('id') or oxio_response.get('subscriptionId')
-                        
-                        print(f"✅ OXIO 10GB plan activated successfully")
-                        print(f"   Subscription ID: {subscription_id}")
-                        
-                        # Record purchase in database
-                        purchase_id = record_purchase(
-                            stripe_id=session.get('id'),
-                            product_id='global_data_10gb',
-                            price_id='price_1RM9sxJnTfh0bNQQgj2sacLZ',
-                            amount=total_amount,
-                            user_id=user_id,
-                            transaction_id=session.get('payment_intent'),
-                            firebase_uid=firebase_uid,
-                            stripe_transaction_id=session.get('payment_intent')
-                        )
-                        print(f"💾 Purchase recorded with ID: {purchase_id}")
-                        
-                        # Award first transaction bonus if eligible
-                        try:
-                            user_data = get_user_by_firebase_uid(firebase_uid)
-                            if user_data:
-                                eth_address = user_data.get('eth_address')
-                                
-                                if eth_address:
-                                    bonus_success, bonus_message = ethereum_helper.check_and_award_first_transaction_bonus(
-                                        user_id, firebase_uid, eth_address
-                                    )
-                                    if bonus_success:
-                                        print(f"🎁 {bonus_message}")
-                                    else:
-                                        print(f"ℹ️ First transaction bonus: {bonus_message}")
-                        except Exception as bonus_error:
-                            print(f"⚠️ Error awarding first transaction bonus: {str(bonus_error)}")
-                        
-                    else:
-                        print(f"❌ OXIO plan activation failed")
-                        return jsonify({
-                            'error': 'OXIO plan activation failed',
-                            'status_code': response.status_code,
-                            'message': response.text
-                        }), 500
-                        
-                except Exception as e:
-                    print(f"❌ Error in 10GB Global Data activation: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-                    return jsonify({'error': str(e)}), 500
-            
-            # Handle other product activations (existing logic)
-            elif (product_id in ['basic_membership', 'full_membership'] or product in ['basic_membership', 'full_membership']) and firebase_uid:
-                print(f"Membership activation for {product or product_id} will be handled by existing subscription flow")
+        except Exception as db_error:
+            print(f"❌ CRITICAL: Database error recording webhook event: {db_error}")
+            # FAIL CLOSED - Stripe retries the delivery
+            return jsonify({'error': 'Idempotency check failed', 'retry': True}), 500
+
+        if queued:
+            stripe_webhook_queue.notify()
+            print(f"📥 Queued event {event_id} (type: {event_type}) for processing")
+            return jsonify({'status': 'queued', 'event_id': event_id}), 200
+
+        if not stripe_webhook_queue:
+            process_stripe_event(event)
 
         return jsonify({'status': 'success'}), 200
 
@@ -3951,28 +3421,6 @@ def activate_esim_for_user(firebase_uid: str, checkout_session) -> dict:
                     with get_db_connection() as conn:
                         if conn:
                             with conn.cursor() as cur:
-                                # Create enhanced oxio_activations table
-                                cur.execute("""
-                                    CREATE TABLE IF NOT EXISTS oxio_activations (
-                                        id SERIAL PRIMARY KEY,
-                                        user_id INTEGER NOT NULL,
-                                        firebase_uid VARCHAR(128),
-                                        purchase_id INTEGER,
-                                        product_id VARCHAR(100),
-                                        iccid VARCHAR(50),
-                                        line_id VARCHAR(100),
-                                        phone_number VARCHAR(20),
-                                        activation_status VARCHAR(50),
-                                        plan_id VARCHAR(100),
-                                        group_id VARCHAR(100),
-                                        esim_qr_code TEXT,
-                                        activation_url TEXT,
-                                        activation_code VARCHAR(200),
-                                        oxio_response TEXT,
-                                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                                    )
-                                """)
-
                                 cur.execute("""
                                     INSERT INTO oxio_activations
                                     (user_id, firebase_uid, purchase_id, product_id, iccid,
@@ -4175,6 +3623,26 @@ class CurrentUserBalance(Resource):
                 'created_at': None
             }
 
+@token_ns.route('/pending-rewards')
+class PendingRewards(Resource):
+    @firebase_auth_required
+    def get(self):
+        """DOTM rewards recorded for the current user but not yet minted in a batch"""
+        try:
+            firebase_uid = request.firebase_user.get('uid')
+            user_data = get_user_by_firebase_uid(firebase_uid)
+            eth_address = user_data.get('eth_address') if user_data else None
+            if not eth_address:
+                return {'eth_address': None, 'pending_wei': '0', 'settling_wei': '0',
+                        'pending_rewards': 0, 'unminted_dotm': 0.0}
+            
+            balance = ethereum_helper.reward_ledger.get_pending_balance(eth_address)
+            return dict(balance, eth_address=eth_address,
+                        pending_wei=str(balance['pending_wei']), settling_wei=str(balance['settling_wei']))
+        except Exception as e:
+            print(f"Error getting pending rewards: {str(e)}")
+            return {'error': str(e)}, 500
+
 @token_ns.route('/founding-token')
 class FoundingToken(Resource):
     def post(self):
@@ -4190,8 +3658,9 @@ class FoundingToken(Resource):
             if success:
                 return {
                     'status': 'success',
-                    'message': 'Founding member token assigned',
-                    'tx_hash': result,
+                    'message': 'Founding member token queued',
+                    'tx_id': result.id,
+                    'tx_hash': result.tx_hash,
                     'address': address,
                     'amount': '100 DOTM'
                 }
@@ -4220,24 +3689,6 @@ class CreateTestWallet(Resource):
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
-                        # Check if users table exists
-                        cur.execute(
-                            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'users')"
-                        )
-                        table_exists = cur.fetchone()[0]
-
-                        if not table_exists:
-                            # Create users table
-                            cur.execute("""
-                                CREATE TABLE users (
-                                    UserID SERIAL PRIMARY KEY,
-                                    email VARCHAR(255),
-                                    stripe_customer_id VARCHAR(100),
-                                    eth_address VARCHAR(42),
-                                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                                )
-                            """)
-
                         # Check if user exists
                         cur.execute("SELECT UserID FROM users WHERE email = %s", (email,))
                         user = cur.fetchone()
@@ -4279,7 +3730,8 @@ class CreateTestWallet(Resource):
                 },
                 'tokens': {
                     'amount': '100 DOTM',
-                    'tx_hash': result
+                    'tx_id': result.id,
+                    'tx_hash': result.tx_hash
                 },
                 'note': 'IMPORTANT: Save the private key securely. It will not be shown again.'
             }
@@ -4288,6 +3740,15 @@ class CreateTestWallet(Resource):
             print(f"Error creating test wallet: {str(e)}")
             return {'error': str(e)}, 500
 
+@token_ns.route('/tx/<string:tx_id>')
+class AdminTransactionStatus(Resource):
+    def get(self, tx_id):
+        """Status of a queued token transaction (queued, sent, mined, failed or dropped)"""
+        transaction = ethereum_helper.get_admin_transaction_status(tx_id)
+        if not transaction:
+            return {'error': 'Transaction not found'}, 404
+        return transaction
+
 @token_ns.route('/transactions')
 class UserTransactions(Resource):
     @firebase_auth_required
@@ -4570,19 +4031,6 @@ def get_user_network_features(firebase_uid):
             with get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
-                        # Ensure user_network_preferences table exists
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS user_network_preferences (
-                                id SERIAL PRIMARY KEY,
-                                user_id INTEGER NOT NULL,
-                                stripe_product_id VARCHAR(100) NOT NULL,
-                                enabled BOOLEAN DEFAULT FALSE,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                UNIQUE(user_id, stripe_product_id)
-                            )
-                        """)
-
                         cur.execute("""
                             SELECT stripe_product_id, enabled
                             FROM user_network_preferences
@@ -5407,44 +4855,6 @@ def get_user_addresses():
         with get_db_connection() as conn:
             if conn:
                 with conn.cursor() as cur:
-                    # Check if addresses table exists
-                    cur.execute("""
-                        SELECT EXISTS (
-                            SELECT FROM information_schema.tables
-                            WHERE table_name = 'user_addresses'
-                        )
-                    """)
-                    table_exists = cur.fetchone()[0]
-
-                    if not table_exists:
-                        # Create addresses table with broadband support
-                        cur.execute("""
-                            CREATE TABLE user_addresses (
-                                id SERIAL PRIMARY KEY,
-                                firebase_uid VARCHAR(128) NOT NULL,
-                                billing_address JSONB,
-                                mailing_address JSONB,
-                                broadband_address JSONB,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                UNIQUE(firebase_uid)
-                            )
-                        """)
-                        conn.commit()
-                    else:
-                        # Check if broadband_address column exists and add it if missing
-                        cur.execute("""
-                            SELECT column_name FROM information_schema.columns
-                            WHERE table_name = 'user_addresses' AND column_name = 'broadband_address'
-                        """)
-                        broadband_column_exists = cur.fetchone()
-
-                        if not broadband_column_exists:
-                            print("Adding broadband_address column to user_addresses table...")
-                            cur.execute("ALTER TABLE user_addresses ADD COLUMN broadband_address JSONB")
-                            conn.commit()
-                            print("Broadband address column added successfully")
-
                     # Get user addresses
                     cur.execute("""
                         SELECT billing_address, mailing_address, broadband_address
@@ -5666,7 +5076,7 @@ def fix_failed_esim_activation():
                 ORDER BY assigned_at DESC
                 LIMIT 1
             """, (firebase_uid,))
-            iccid_result = cur.fetchone()
+            iccid_result = cursor.fetchone()
 
             if not iccid_result:
                 return jsonify({'success': False, 'error': 'No ICCID assigned to user'}), 404
@@ -5687,20 +5097,7 @@ def fix_failed_esim_activation():
                 purchase_exists = True
                 print(f"   ✓ Purchase already recorded")
 
-        # Step 4: Check if activation already exists
-        activation_exists = False
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id FROM oxio_activations
-                WHERE firebase_uid = %s
-                LIMIT 1
-            """, (firebase_uid,))
-            if cursor.fetchone():
-                activation_exists = True
-                print(f"   ✓ Activation record already exists")
-
-        # Step 5: Record purchase if not exists
+        # Step 4: Record purchase if not exists
         if not purchase_exists:
             print(f"   📝 Recording purchase...")
             from datetime import datetime
@@ -5716,27 +5113,18 @@ def fix_failed_esim_activation():
             )
             print(f"   ✓ Purchase recorded with ID: {purchase_id}")
 
-        # Step 6: Activate eSIM with OXIO if not already activated
-        if not activation_exists and oxio_user_id:
-            print(f"   🚀 Activating eSIM with OXIO...")
-            try:
-                from esim_activation_service import esim_activation_service
-
-                activation_result = esim_activation_service.activate_esim_after_payment(
-                    firebase_uid=firebase_uid,
-                    user_email=user_email,
-                    user_name=user_name or user_email.split('@')[0],
-                    stripe_session_id='manual_fix',
-                    purchase_amount=100
-                )
+        # Step 5: Resume the checkpointed activation workflow (skips steps that already succeeded)
+        from esim_activation_service import esim_activation_service
 
-                if activation_result.get('success'):
-                    print(f"   ✅ eSIM activation completed successfully")
-                else:
-                    print(f"   ⚠️ eSIM activation returned: {activation_result.get('error', 'Unknown error')}")
-
-            except Exception as e:
-                print(f"   ❌ Error during activation: {str(e)}")
+        activation_result = esim_activation_service.resume_activation(
+            firebase_uid, user_email, user_name or user_email.split('@')[0]
+        )
+        if activation_result.get('already_activated'):
+            print(f"   ✓ Activation record already exists")
+        elif activation_result.get('success'):
+            print(f"   ✅ eSIM activation completed (resumed from: {activation_result.get('resumed_from') or 'start'})")
+        else:
+            print(f"   ⚠️ eSIM activation stopped at {activation_result.get('step')}: {activation_result.get('error', 'Unknown error')}")
 
         return jsonify({
             'success': True,
@@ -5747,7 +5135,14 @@ def fix_failed_esim_activation():
                 'iccid': iccid,
                 'lpa_code': lpa_code,
                 'purchase_recorded': not purchase_exists,
-                'activation_triggered': not activation_exists
+                'activation_triggered': not activation_result.get('already_activated'),
+                'activation': {
+                    'success': activation_result.get('success'),
+                    'step': activation_result.get('step'),
+                    'error': activation_result.get('error'),
+                    'resumed_from': activation_result.get('resumed_from'),
+                    'workflow_id': activation_result.get('workflow_id')
+                }
             }
         })
 
@@ -6188,11 +5583,13 @@ try:
     from data_usage_monitor import DataUsageMonitor
     
     mcp_usage_service = MCPUsageService(get_db_connection)
-    mcp_usage_service.ensure_billing_table_exists()
+    mcp_usage_service.start_billing_worker()
     
     mcp_auth_manager = MCPAuthManager(get_db_connection, usage_service=mcp_usage_service)
+    mcp_auth_manager.start_maintenance()
     
     data_usage_monitor = DataUsageMonitor(get_db_connection)
+    data_usage_monitor.start_billing_worker()
     
     print("MCP Usage Service, Auth Manager, and Data Usage Monitor initialized successfully")
 except Exception as e:
@@ -6201,6 +5598,64 @@ except Exception as e:
     mcp_auth_manager = None
     data_usage_monitor = None
 
+# Initialize telemetry retention (partition creation, rollup and expiry)
+try:
+    from data_retention import DataRetentionManager
+    
+    data_retention_manager = DataRetentionManager(get_db_connection)
+    data_retention_manager.start_scheduler()
+    print("Data retention scheduler started")
+except Exception as e:
+    print(f"Error initializing data retention: {str(e)}")
+    data_retention_manager = None
+
+# Initialize ICCID inventory import and low-stock monitoring
+try:
+    from iccid_inventory import ICCIDInventory
+    
+    iccid_inventory = ICCIDInventory(get_db_connection)
+    iccid_inventory.start_monitor()
+    print("ICCID inventory monitor started")
+except Exception as e:
+    print(f"Error initializing ICCID inventory: {str(e)}")
+    iccid_inventory = None
+
+# Nightly fleet-wide reconciliation of OXIO lines into the local tables
+try:
+    from oxio_line_sync import OXIOLineSync
+    
+    oxio_line_sync = OXIOLineSync(get_db_connection, oxio_service)
+    oxio_line_sync.start_scheduler()
+    print("OXIO line sync scheduler started")
+except Exception as e:
+    print(f"Error initializing OXIO line sync: {str(e)}")
+    oxio_line_sync = None
+
+# In-memory index of available phone numbers, refreshed from OXIO in the background
+try:
+    from number_inventory import NumberInventory
+    
+    number_inventory = NumberInventory(oxio_service)
+    number_inventory.start()
+    print("Number inventory refresher started")
+except Exception as e:
+    print(f"Error initializing number inventory: {str(e)}")
+    number_inventory = None
+
+# Settle batched DOTM rewards from token_reward_ledger
+try:
+    if ethereum_helper.REWARD_BATCHING_ENABLED:
+        ethereum_helper.reward_ledger.start()
+        print("Reward batch settler started")
+except Exception as e:
+    print(f"Error starting reward batch settler: {str(e)}")
+
+# Flush in-memory OXIO call telemetry to oxio_api_metrics in the background
+try:
+    oxio_service.telemetry.start()
+except Exception as e:
+    print(f"Error starting OXIO telemetry: {str(e)}")
+
 
 # MCP API Key Management Endpoints
 @app.route('/admin/mcp-keys', methods=['GET'])
@@ -6319,7 +5774,7 @@ def validate_mcp_key():
         is_valid, key_info = mcp_auth_manager.validate_api_key(api_key)
         
         if is_valid:
-            is_allowed, rate_info = mcp_auth_manager.check_rate_limit(api_key, key_info)
+            is_allowed, rate_info = mcp_auth_manager.check_rate_limit(api_key, key_info, consume=False)
             return jsonify({
                 'valid': True,
                 'key_name': key_info.get('key_name'),
@@ -6458,6 +5913,56 @@ def log_data_usage_event(user):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/data-usage/log/batch', methods=['POST'])
+@firebase_auth_required
+def log_data_usage_events(user):
+    """Log a batch of data usage events (JSON array, {"events": [...]} or NDJSON)"""
+    try:
+        if not data_usage_monitor:
+            return jsonify({'success': False, 'error': 'Data usage monitor not initialized'}), 500
+        
+        try:
+            if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+                events = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+            else:
+                events = request.get_json(force=True)
+                if isinstance(events, dict):
+                    events = events.get('events')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': f'Invalid JSON: {str(e)}'}), 400
+        
+        if not isinstance(events, list):
+            return jsonify({'success': False, 'error': 'Expected an array of events'}), 400
+        
+        from data_usage_monitor import MAX_BATCH_EVENTS
+        if len(events) > MAX_BATCH_EVENTS:
+            return jsonify({'success': False, 'error': f'Batch exceeds {MAX_BATCH_EVENTS} events'}), 413
+        
+        firebase_uid = user.get('uid')
+        
+        # Get user's Stripe customer ID once for the whole batch
+        stripe_customer_id = None
+        with get_db_connection() as conn:
+            if conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT stripe_customer_id FROM users WHERE firebase_uid = %s", (firebase_uid,))
+                    result = cur.fetchone()
+                    if result:
+                        stripe_customer_id = result[0]
+        
+        for event in events:
+            if isinstance(event, dict):
+                event.update(firebase_uid=firebase_uid, stripe_customer_id=stripe_customer_id,
+                             ip_address=request.remote_addr)
+        
+        result = data_usage_monitor.log_usage_events(events)
+        # Partially rejected batches still return 200 with per-event errors
+        return jsonify(result), (200 if 'accepted' in result else 500)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/data-usage/simulate', methods=['POST'])
 @firebase_auth_required
 def simulate_data_usage(user):
@@ -6519,6 +6024,254 @@ def simulate_data_usage(user):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/admin/data-usage/reconcile', methods=['POST'])
+def reconcile_data_usage():
+    """Rebuild real-time usage aggregates from raw events (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not data_usage_monitor:
+        return jsonify({'success': False, 'error': 'Data usage monitor not initialized'}), 500
+    
+    data = request.get_json(silent=True) or {}
+    result = data_usage_monitor.reconcile_realtime_metrics(data.get('firebase_uid'))
+    return jsonify(result), (200 if result.get('success') else 500)
+
+
+@app.route('/api/admin/data-retention/stats', methods=['GET'])
+def get_data_retention_stats():
+    """Retention policies, reclaimed rows/bytes and recent runs (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not data_retention_manager:
+        return jsonify({'success': False, 'error': 'Data retention not initialized'}), 500
+    
+    return jsonify({
+        'success': True,
+        'stats': data_retention_manager.get_stats(),
+        'recent_runs': data_retention_manager.get_recent_runs()
+    })
+
+
+@app.route('/api/admin/data-retention/run', methods=['POST'])
+def run_data_retention():
+    """Create upcoming partitions and apply retention now (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not data_retention_manager:
+        return jsonify({'success': False, 'error': 'Data retention not initialized'}), 500
+    
+    created = data_retention_manager.ensure_partitions()
+    result = data_retention_manager.run()
+    result['partitions_created'] = created
+    return jsonify(result), (200 if result.get('success') else 500)
+
+
+@app.route('/api/admin/stripe-webhook-jobs', methods=['GET'])
+def get_stripe_webhook_jobs():
+    """Stripe webhook job counts by status and recent jobs (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not stripe_webhook_queue:
+        return jsonify({'success': False, 'error': 'Webhook queue not initialized'}), 500
+    
+    status = request.args.get('status')
+    limit = min(int(request.args.get('limit', 50)), 500)
+    result = stripe_webhook_queue.get_status(status, limit)
+    result['event_cache'] = processed_event_cache.get_stats()
+    return jsonify(result), (200 if result.get('success') else 500)
+
+
+@app.route('/api/admin/stripe-webhook-jobs/<int:job_id>/retry', methods=['POST'])
+def retry_stripe_webhook_job(job_id):
+    """Requeue a dead Stripe webhook job with a fresh attempt budget (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not stripe_webhook_queue:
+        return jsonify({'success': False, 'error': 'Webhook queue not initialized'}), 500
+    
+    if not stripe_webhook_queue.requeue_job(job_id):
+        return jsonify({'success': False, 'error': 'Job not found, or not dead or stuck past its lock timeout'}), 404
+    return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'})
+
+
+
+@app.route('/api/admin/iccid-inventory/import', methods=['POST'])
+def import_iccid_inventory():
+    """
+    Bulk import ICCID/LPA pairs (admin only)
+
+    Accepts a multipart 'file' upload or a raw request body in CSV (with an
+    iccid,lpa_code[,country,line_id] header), JSON array or JSON Lines format.
+    Pass dry_run=true to validate without writing.
+    """
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not iccid_inventory:
+        return jsonify({'success': False, 'error': 'ICCID inventory not initialized'}), 500
+    
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    filename = (upload.filename if upload else '') or ''
+    
+    file_format = request.args.get('format')
+    if not file_format:
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        if extension in ('csv', 'json', 'jsonl', 'ndjson'):
+            file_format = extension
+        elif request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            file_format = 'jsonl'
+        elif request.mimetype == 'application/json':
+            file_format = 'json'
+        else:
+            file_format = 'csv'
+    
+    from io import TextIOWrapper
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    text_stream = TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    result = iccid_inventory.import_file(text_stream, file_format, dry_run=dry_run)
+    if not result.get('success'):
+        return jsonify(result), 400 if 'parse' in result.get('error', '') else 500
+    
+    if not dry_run and result['inserted']:
+        result['stock'] = iccid_inventory.check_stock()
+    return jsonify(result)
+
+
+@app.route('/api/admin/iccid-inventory/stock', methods=['GET'])
+def get_iccid_inventory_stock():
+    """Current ICCID stock levels, low-stock status and import counters (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not iccid_inventory:
+        return jsonify({'success': False, 'error': 'ICCID inventory not initialized'}), 500
+    
+    levels = iccid_inventory.check_stock()
+    if not levels.get('success'):
+        return jsonify(levels), 500
+    levels['stats'] = iccid_inventory.get_stats()
+    return jsonify(levels)
+
+@app.route('/api/admin/oxio-line-sync', methods=['GET'])
+def get_oxio_line_sync():
+    """Progress of the current (or last) OXIO line sync and recent runs (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not oxio_line_sync:
+        return jsonify({'success': False, 'error': 'OXIO line sync not initialized'}), 500
+    
+    return jsonify({
+        'success': True,
+        'progress': oxio_line_sync.get_progress(),
+        'recent_runs': oxio_line_sync.get_recent_runs()
+    })
+
+@app.route('/api/admin/oxio-line-sync/run', methods=['POST'])
+def run_oxio_line_sync():
+    """Start a fleet-wide OXIO line sync in the background (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not oxio_line_sync:
+        return jsonify({'success': False, 'error': 'OXIO line sync not initialized'}), 500
+    
+    if not oxio_line_sync.start_run(trigger='manual'):
+        return jsonify({'success': False, 'error': 'A line sync is already running',
+                        'progress': oxio_line_sync.get_progress()}), 409
+    return jsonify({'success': True, 'message': 'OXIO line sync started; poll GET /api/admin/oxio-line-sync'}), 202
+
+@app.route('/api/admin/oxio-metrics', methods=['GET'])
+def oxio_api_metrics():
+    """Live OXIO call latency percentiles, status codes and error classes per endpoint (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    return jsonify(dict(oxio_service.telemetry.get_metrics(), success=True))
+
+@app.route('/api/admin/oxio-cache', methods=['GET', 'POST'])
+def oxio_reference_cache():
+    """OXIO reference data cache metrics (GET) or flush (POST, optional resource) (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if request.method == 'POST':
+        resource = request.args.get('resource') or (request.get_json(silent=True) or {}).get('resource')
+        if resource and resource not in OXIO_CACHE_TTLS:
+            return jsonify({'success': False, 'error': f"Unknown resource; expected one of {sorted(OXIO_CACHE_TTLS)}"}), 400
+        flushed = oxio_service.flush_reference_cache(resource)
+        print(f"🧹 Flushed {flushed} OXIO reference cache entries ({resource or 'all'})")
+        return jsonify({'success': True, 'flushed': flushed, 'resource': resource or 'all',
+                        'stats': oxio_service.reference_cache.get_stats()})
+    
+    return jsonify({'success': True, 'ttls': OXIO_CACHE_TTLS, 'stale_seconds': OXIO_CACHE_STALE_SECONDS,
+                    'stats': oxio_service.reference_cache.get_stats()})
+
+@app.route('/api/admin/eth-transactions', methods=['GET'])
+def admin_eth_transactions():
+    """Admin wallet nonces, queue depth and pending transactions per admin key (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    return jsonify({'success': True, 'wallets': ethereum_helper.get_admin_tx_stats()})
+
+@app.route('/api/admin/reward-batches', methods=['GET', 'POST'])
+def admin_reward_batches():
+    """Recent reward batches (GET) or settle pending rewards now (POST) (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    reward_ledger = ethereum_helper.reward_ledger
+    if request.method == 'POST':
+        outcomes = reward_ledger.reconcile()
+        batch_id = reward_ledger.settle(force=True)
+        return jsonify({'success': True, 'batch_id': batch_id, 'reconciled': outcomes})
+    
+    return jsonify({'success': True, 'batching_enabled': ethereum_helper.REWARD_BATCHING_ENABLED,
+                    'batch_size': reward_ledger.batch_size, 'max_delay_seconds': reward_ledger.max_delay,
+                    'batches': reward_ledger.get_recent_batches()})
+
+@app.route('/api/admin/reward-batches/<int:batch_id>/release', methods=['POST'])
+def release_reward_batch(batch_id):
+    """Settle an orphaned reward batch if it was mined, else return its rewards to pending (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    result = ethereum_helper.reward_ledger.release_batch(batch_id)
+    return jsonify(result), 200 if result['success'] else 409
+
+@app.route('/api/admin/number-inventory', methods=['GET'])
+def number_inventory_stats():
+    """Indexed NPAs, index ages, search latency and reservation counts (admin only)"""
+    admin_key = request.headers.get('X-Admin-Key') or request.args.get('admin_key')
+    if admin_key != os.environ.get('ADMIN_KEY', 'dotm_admin_2025'):
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    
+    if not number_inventory:
+        return jsonify({'success': False, 'error': 'Number inventory not initialized'}), 500
+    
+    return jsonify({'success': True, 'stats': number_inventory.get_stats()})
+
 if __name__ == '__main__':
     # Debug: Print all registered routes to verify OXIO endpoints are available
     print("\n=== Registered Flask Routes ===")
@@ -6531,6 +6284,7 @@ if __name__ == '__main__':
     print(f"Starting server on http://0.0.0.0:{port}")
     print(f"OXIO API endpoints should be available at:")
     print(f"  - GET  /api/oxio/test-connection")
+    print(f"  - GET  /api/oxio/health")
     print(f"  - GET  /api/oxio/test-plans")
     print(f"  - POST /api/oxio/activate-line")
     print(f"  - POST /api/oxio/test-sample-activation")
@@ -7,18 +7,27 @@ import os
 import secrets
 import hashlib
 import time
-from datetime import datetime, timedelta
+import atexit
+import threading
+from datetime import datetime
 from functools import wraps
 from typing import Optional, Tuple, Dict
 from flask import request, jsonify
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from mcp_rate_limiter import create_request_rate_limiter
+from mcp_request_log import RequestLogWriter
 
 # Constants
 API_KEY_PREFIX = "mcp_"
 API_KEY_LENGTH = 48  # Total length including prefix
 RATE_LIMIT_WINDOW = 3600  # 1 hour in seconds
 DEFAULT_RATE_LIMIT = 1000  # requests per hour
+RATE_LIMIT_PRUNE_INTERVAL = 600  # seconds between pruning idle rate-limit windows
+API_KEY_CACHE_TTL = int(os.environ.get('MCP_API_KEY_CACHE_TTL', 30))  # seconds a validated key is trusted
+API_KEY_REVOCATION_POLL = float(os.environ.get('MCP_API_KEY_REVOCATION_POLL', 2))  # seconds between revoked-key checks
+REVOKED_KEY_PREFIX = "mcp:revoked:"  # Redis marker set for API_KEY_CACHE_TTL when a key is revoked
+USAGE_FLUSH_INTERVAL = int(os.environ.get('MCP_USAGE_FLUSH_INTERVAL', 10))  # seconds between usage counter flushes
 
 
 def generate_api_key() -> str:
@@ -39,64 +48,37 @@ def hash_api_key(api_key: str) -> str:
 
 
 class MCPAuthManager:
-    """Manages MCP API key authentication and rate limiting"""
+    """
+    Manages MCP API key authentication and rate limiting
+
+    Validated keys are cached per process, so a revocation must reach every
+    instance: revoke_api_key sets a Redis marker (when the rate limiter shares
+    Redis) that cache hits check, and cache hits also poll the database every
+    API_KEY_REVOCATION_POLL seconds for keys revoked within the cache TTL.
+    """
     
-    def __init__(self, get_db_connection, usage_service=None):
+    def __init__(self, get_db_connection, usage_service=None, rate_limiter=None, request_log=None,
+                 redis_client=None):
         self.get_db_connection = get_db_connection
         self.usage_service = usage_service
-        self._ensure_table_exists()
-    
-    def _ensure_table_exists(self):
-        """Create mcp_api_keys table if it doesn't exist"""
-        try:
-            with self.get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS mcp_api_keys (
-                                id SERIAL PRIMARY KEY,
-                                key_hash VARCHAR(64) UNIQUE NOT NULL,
-                                key_name VARCHAR(255) NOT NULL,
-                                description TEXT,
-                                rate_limit INTEGER DEFAULT 1000,
-                                is_active BOOLEAN DEFAULT TRUE,
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                last_used_at TIMESTAMP,
-                                total_requests BIGINT DEFAULT 0,
-                                firebase_uid VARCHAR(128),
-                                allowed_origins TEXT[],
-                                metadata JSONB
-                            );
-                            
-                            CREATE INDEX IF NOT EXISTS idx_mcp_api_keys_key_hash 
-                                ON mcp_api_keys(key_hash);
-                            CREATE INDEX IF NOT EXISTS idx_mcp_api_keys_is_active 
-                                ON mcp_api_keys(is_active);
-                            CREATE INDEX IF NOT EXISTS idx_mcp_api_keys_firebase_uid 
-                                ON mcp_api_keys(firebase_uid);
-                        """)
-                        
-                        # Create rate limiting tracking table
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS mcp_api_requests (
-                                id SERIAL PRIMARY KEY,
-                                key_hash VARCHAR(64) NOT NULL,
-                                request_path VARCHAR(255),
-                                request_method VARCHAR(10),
-                                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                                ip_address INET,
-                                user_agent TEXT,
-                                response_status INTEGER
-                            );
-                            
-                            CREATE INDEX IF NOT EXISTS idx_mcp_api_requests_key_hash_timestamp 
-                                ON mcp_api_requests(key_hash, timestamp);
-                        """)
-                        
-                        conn.commit()
-                        print("MCP API keys tables created/verified successfully")
-        except Exception as e:
-            print(f"Error creating MCP API keys tables: {str(e)}")
+        self.rate_limiter = rate_limiter or create_request_rate_limiter(RATE_LIMIT_WINDOW)
+        self.request_log = request_log or RequestLogWriter(get_db_connection)
+        self.redis_client = redis_client or getattr(self.rate_limiter, 'client', None)
+        
+        # Validated key metadata by key hash: {key_hash: (expires_at, key_info)}
+        self._key_cache = {}
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._revocations_polled = 0.0
+        self._revocation_poll_lock = threading.Lock()
+        
+        # Usage not yet written to mcp_api_keys: {key_hash: [request_count, last_used_at]}
+        self._pending_usage = {}
+        self._usage_lock = threading.Lock()
+        
+        self._maintenance_thread = None
+        self._maintenance_stop = threading.Event()
     
     def create_api_key(
         self, 
@@ -141,6 +123,8 @@ class MCPAuthManager:
     def validate_api_key(self, api_key: str) -> Tuple[bool, Optional[Dict]]:
         """
         Validate an API key and return key details
+        Active keys are cached for API_KEY_CACHE_TTL seconds; usage counters are
+        accumulated in memory and written by flush_usage_counters
         Returns: (is_valid, key_info_dict or None)
         """
         if not api_key or not api_key.startswith(API_KEY_PREFIX):
@@ -148,6 +132,17 @@ class MCPAuthManager:
         
         try:
             key_hash = hash_api_key(api_key)
+            now = time.time()
+            
+            with self._cache_lock:
+                cached = self._key_cache.get(key_hash)
+            if cached and cached[0] > now and not self._revoked_elsewhere(key_hash, now):
+                with self._cache_lock:
+                    self.cache_hits += 1
+                self._record_usage(key_hash)
+                return True, dict(cached[1])
+            with self._cache_lock:
+                self.cache_misses += 1
             
             with self.get_db_connection() as conn:
                 if not conn:
@@ -162,18 +157,13 @@ class MCPAuthManager:
                     """, (key_hash,))
                     
                     key_info = cur.fetchone()
-                    
-                    if key_info:
-                        # Update last_used_at
-                        cur.execute("""
-                            UPDATE mcp_api_keys 
-                            SET last_used_at = CURRENT_TIMESTAMP,
-                                total_requests = total_requests + 1
-                            WHERE key_hash = %s
-                        """, (key_hash,))
-                        conn.commit()
-                        
-                        return True, dict(key_info)
+            
+            if key_info:
+                key_info = dict(key_info)
+                with self._cache_lock:
+                    self._key_cache[key_hash] = (now + API_KEY_CACHE_TTL, key_info)
+                self._record_usage(key_hash)
+                return True, dict(key_info)
             
             return False, None
             
@@ -181,54 +171,157 @@ class MCPAuthManager:
             print(f"Error validating API key: {str(e)}")
             return False, None
     
-    def check_rate_limit(self, api_key: str, key_info: Dict) -> Tuple[bool, Dict]:
-        """
-        Check if API key is within rate limit
-        Returns: (is_allowed, rate_limit_info)
-        """
+    def invalidate_cached_key(self, key_hash: str):
+        """Drop a key from the validation cache so the next request re-reads it"""
+        with self._cache_lock:
+            self._key_cache.pop(key_hash, None)
+    
+    def _revoked_elsewhere(self, key_hash: str, now: float) -> bool:
+        """True if a cached key was revoked by another instance; evicts it"""
+        if self.redis_client is not None:
+            try:
+                if self.redis_client.exists(f"{REVOKED_KEY_PREFIX}{key_hash}"):
+                    self.invalidate_cached_key(key_hash)
+                    return True
+            except Exception as e:
+                print(f"Error checking Redis for revoked API key: {str(e)}")
+        self._poll_revocations(now)
+        with self._cache_lock:
+            return key_hash not in self._key_cache
+    
+    def _poll_revocations(self, now: float):
+        """Evict keys revoked within the cache TTL, at most once per API_KEY_REVOCATION_POLL"""
+        if now - self._revocations_polled < API_KEY_REVOCATION_POLL:
+            return
+        if not self._revocation_poll_lock.acquire(blocking=False):
+            return  # another request is polling
         try:
-            key_hash = hash_api_key(api_key)
-            rate_limit = key_info.get('rate_limit', DEFAULT_RATE_LIMIT)
-            
+            self._revocations_polled = now
             with self.get_db_connection() as conn:
                 if not conn:
-                    return True, {}  # Allow if DB unavailable
-                
+                    return
                 with conn.cursor() as cur:
-                    # Count requests in the last hour
-                    one_hour_ago = datetime.now() - timedelta(hours=1)
-                    
-                    cur.execute("""
-                        SELECT COUNT(*) 
-                        FROM mcp_api_requests
-                        WHERE key_hash = %s AND timestamp > %s
-                    """, (key_hash, one_hour_ago))
-                    
-                    current_usage = cur.fetchone()[0]
-                    
-                    # Clean up old request logs (keep last 24 hours)
                     cur.execute("""
-                        DELETE FROM mcp_api_requests
-                        WHERE timestamp < NOW() - INTERVAL '24 hours'
-                    """)
+                        SELECT key_hash FROM mcp_api_keys
+                        WHERE revoked_at >= CURRENT_TIMESTAMP - (%s * INTERVAL '1 second')
+                    """, (API_KEY_CACHE_TTL + API_KEY_REVOCATION_POLL,))
+                    revoked = [row[0] for row in cur.fetchall()]
+            for revoked_hash in revoked:
+                self.invalidate_cached_key(revoked_hash)
+        except Exception as e:
+            print(f"Error polling revoked API keys: {str(e)}")
+        finally:
+            self._revocation_poll_lock.release()
+    
+    def _record_usage(self, key_hash: str):
+        with self._usage_lock:
+            usage = self._pending_usage.get(key_hash)
+            if usage:
+                usage[0] += 1
+                usage[1] = datetime.now()
+            else:
+                self._pending_usage[key_hash] = [1, datetime.now()]
+    
+    def flush_usage_counters(self) -> int:
+        """Write accumulated last_used_at/total_requests in one batched UPDATE; returns keys updated"""
+        with self._usage_lock:
+            pending, self._pending_usage = self._pending_usage, {}
+        if not pending:
+            return 0
+        
+        rows = [(key_hash, usage[0], usage[1]) for key_hash, usage in pending.items()]
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    raise RuntimeError("Database connection unavailable")
+                
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        UPDATE mcp_api_keys AS k
+                        SET total_requests = k.total_requests + v.request_count,
+                            last_used_at = GREATEST(k.last_used_at, v.last_used_at)
+                        FROM (VALUES %s) AS v(key_hash, request_count, last_used_at)
+                        WHERE k.key_hash = v.key_hash
+                    """, rows, template="(%s, %s::integer, %s::timestamp)")
                     conn.commit()
-                    
-                    is_allowed = current_usage < rate_limit
-                    
-                    rate_info = {
-                        "allowed": is_allowed,
-                        "current_usage": current_usage,
-                        "limit": rate_limit,
-                        "percentage": round((current_usage / rate_limit) * 100, 1),
-                        "reset_at": (datetime.now() + timedelta(hours=1)).isoformat()
-                    }
-                    
-                    return is_allowed, rate_info
-                    
+            return len(rows)
+        except Exception as e:
+            print(f"Error flushing MCP API key usage counters: {str(e)}")
+            # Put the counts back so they are retried on the next flush
+            with self._usage_lock:
+                for key_hash, count, last_used_at in rows:
+                    usage = self._pending_usage.get(key_hash)
+                    if usage:
+                        usage[0] += count
+                        usage[1] = max(usage[1], last_used_at)
+                    else:
+                        self._pending_usage[key_hash] = [count, last_used_at]
+            return 0
+    
+    def get_cache_stats(self) -> Dict:
+        with self._cache_lock:
+            cached_keys = len(self._key_cache)
+            hits, misses = self.cache_hits, self.cache_misses
+        with self._usage_lock:
+            pending_keys = len(self._pending_usage)
+            pending_requests = sum(usage[0] for usage in self._pending_usage.values())
+        return {
+            'ttl_seconds': API_KEY_CACHE_TTL,
+            'cached_keys': cached_keys,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses) * 100, 1) if hits + misses else 0.0,
+            'pending_usage_keys': pending_keys,
+            'pending_usage_requests': pending_requests
+        }
+    
+    def check_rate_limit(self, api_key: str, key_info: Dict, consume: bool = True) -> Tuple[bool, Dict]:
+        """
+        Check if API key is within rate limit (sliding window, no database access)
+        consume=False reports the current window without counting a request
+        Returns: (is_allowed, rate_limit_info)
+        """
+        try:
+            key_hash = hash_api_key(api_key)
+            rate_limit = key_info.get('rate_limit', DEFAULT_RATE_LIMIT)
+            return self.rate_limiter.hit(key_hash, rate_limit, consume=consume)
         except Exception as e:
             print(f"Error checking rate limit: {str(e)}")
             return True, {}  # Allow on error to prevent blocking
     
+    def start_maintenance(
+        self,
+        interval_seconds: int = RATE_LIMIT_PRUNE_INTERVAL,
+        usage_flush_interval: int = USAGE_FLUSH_INTERVAL
+    ):
+        """
+        Start the background job that flushes key usage counters and prunes
+        idle rate-limit windows (request log retention is handled by
+        data_retention.DataRetentionManager)
+        """
+        if self._maintenance_thread and self._maintenance_thread.is_alive():
+            return
+        
+        def run():
+            last_prune = time.time()
+            while not self._maintenance_stop.wait(usage_flush_interval):
+                self.flush_usage_counters()
+                if time.time() - last_prune >= interval_seconds:
+                    last_prune = time.time()
+                    self.rate_limiter.prune()
+        
+        self._maintenance_stop.clear()
+        self._maintenance_thread = threading.Thread(
+            target=run, name="mcp-auth-maintenance", daemon=True
+        )
+        self._maintenance_thread.start()
+        atexit.register(self.stop_maintenance)
+    
+    def stop_maintenance(self):
+        """Stop the background job and write any pending usage counters"""
+        self._maintenance_stop.set()
+        self.flush_usage_counters()
+    
     def log_request(
         self, 
         api_key: str, 
@@ -239,31 +332,18 @@ class MCPAuthManager:
         response_status: int,
         firebase_uid: Optional[str] = None
     ):
-        """Log an API request for rate limiting and analytics"""
+        """Queue an API request log row for analytics (written in batches by RequestLogWriter)"""
         try:
             key_hash = hash_api_key(api_key)
             
-            with self.get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            INSERT INTO mcp_api_requests 
-                            (key_hash, request_path, request_method, ip_address, 
-                             user_agent, response_status)
-                            VALUES (%s, %s, %s, %s, %s, %s)
-                        """, (key_hash, request_path, request_method, 
-                              ip_address, user_agent, response_status))
-                        conn.commit()
+            self.request_log.log(
+                key_hash, request_path, request_method,
+                ip_address, user_agent, response_status
+            )
             
-            # Report usage to Stripe if successful request and usage service available
+            # Count billable usage; MCPUsageService reports it to Stripe in aggregated batches
             if response_status == 200 and self.usage_service and firebase_uid:
-                try:
-                    self.usage_service.report_mcp_usage_to_stripe(
-                        firebase_uid=firebase_uid,
-                        request_count=1
-                    )
-                except Exception as e:
-                    print(f"Error reporting usage to Stripe: {str(e)}")
+                self.usage_service.record_mcp_usage(firebase_uid, request_count=1)
                     
         except Exception as e:
             print(f"Error logging MCP request: {str(e)}")
@@ -307,19 +387,30 @@ class MCPAuthManager:
                 with conn.cursor() as cur:
                     cur.execute("""
                         UPDATE mcp_api_keys
-                        SET is_active = FALSE
+                        SET is_active = FALSE, revoked_at = CURRENT_TIMESTAMP
                         WHERE id = %s
-                        RETURNING key_name
+                        RETURNING key_name, key_hash
                     """, (key_id,))
                     
                     result = cur.fetchone()
                     conn.commit()
                     
                     if result:
+                        self.invalidate_cached_key(result[1])
+                        self._publish_revocation(result[1])
                         return True, f"API key '{result[0]}' revoked successfully"
                     return False, "API key not found"
         except Exception as e:
             return False, f"Error revoking API key: {str(e)}"
+    
+    def _publish_revocation(self, key_hash: str):
+        """Tell other instances through Redis that a key they may have cached is revoked"""
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(f"{REVOKED_KEY_PREFIX}{key_hash}", 1, ex=API_KEY_CACHE_TTL + 1)
+        except Exception as e:
+            print(f"Error publishing API key revocation (instances poll the database instead): {str(e)}")
 
 
 def require_mcp_api_key(auth_manager: MCPAuthManager):
@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 """
 Rate Limiter and Queue Manager for MCP v2 Server
-Limits eSIM activations to 100 per hour with queue management
+Limits eSIM activations to 100 per hour with queue management, and provides the
+sliding-window engines behind MCP API key rate limits (in-memory or Redis-shared)
 """
 
+import os
 import time
+import uuid
 import logging
 from datetime import datetime, timedelta
 from collections import deque
 from typing import Dict, Optional, Tuple
 import threading
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -141,3 +149,182 @@ def check_activation_allowed(firebase_uid: str, email: str) -> Tuple[bool, Dict]
 def get_rate_limit_stats() -> Dict:
     """Get current rate limit statistics"""
     return rate_limiter.get_statistics()
+
+
+# Sliding-window engines for MCP API key rate limits (used by mcp_auth.MCPAuthManager)
+
+def _window_rate_info(allowed: bool, current_usage: int, limit: int,
+                      oldest_hit: Optional[float], now: float, window_seconds: int) -> Dict:
+    """Rate info in the shape returned by MCPAuthManager.check_rate_limit"""
+    # The window frees its next slot when the oldest counted request expires
+    reset_at = (oldest_hit if oldest_hit is not None else now) + window_seconds
+    return {
+        "allowed": allowed,
+        "current_usage": current_usage,
+        "limit": limit,
+        "percentage": round((current_usage / limit) * 100, 1) if limit else 100.0,
+        "reset_at": datetime.fromtimestamp(reset_at).isoformat()
+    }
+
+
+class SlidingWindowRateLimiter:
+    """
+    Exact sliding-window log kept in process memory
+    Each key holds the timestamps of its allowed requests within the window
+    """
+
+    def __init__(self, window_seconds: int = 3600):
+        self.window_seconds = window_seconds
+        self.hits: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+
+    def _expire(self, hits: deque, now: float):
+        cutoff = now - self.window_seconds
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+
+    def hit(self, key: str, limit: int, consume: bool = True) -> Tuple[bool, Dict]:
+        """
+        Check a key against its limit and record the request if allowed
+        Returns: (allowed, rate_info) where current_usage excludes this request
+        """
+        now = time.time()
+        with self.lock:
+            hits = self.hits.get(key)
+            if hits is None:
+                hits = deque()
+                self.hits[key] = hits
+            self._expire(hits, now)
+
+            current_usage = len(hits)
+            allowed = current_usage < limit
+            if allowed and consume:
+                hits.append(now)
+
+            oldest_hit = hits[0] if hits else None
+            return allowed, _window_rate_info(
+                allowed, current_usage, limit, oldest_hit, now, self.window_seconds
+            )
+
+    def prune(self) -> int:
+        """Drop keys with no requests left in the window; returns keys removed"""
+        now = time.time()
+        with self.lock:
+            idle = []
+            for key, hits in self.hits.items():
+                self._expire(hits, now)
+                if not hits:
+                    idle.append(key)
+            for key in idle:
+                del self.hits[key]
+            return len(idle)
+
+    def get_statistics(self) -> Dict:
+        with self.lock:
+            return {
+                "backend": "memory",
+                "tracked_keys": len(self.hits),
+                "window_seconds": self.window_seconds
+            }
+
+
+# Trim, count and conditionally add in one round trip so workers never race
+REDIS_SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local consume = tonumber(ARGV[4])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local current = redis.call('ZCARD', key)
+local allowed = 0
+if current < limit then
+    allowed = 1
+    if consume == 1 then
+        redis.call('ZADD', key, now, ARGV[5])
+    end
+end
+redis.call('PEXPIRE', key, math.ceil(window * 1000))
+
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+local oldest_score = ''
+if oldest[2] then
+    oldest_score = oldest[2]
+end
+return {allowed, current, oldest_score}
+"""
+
+
+class RedisSlidingWindowRateLimiter:
+    """
+    Sliding-window log shared across workers through any Redis-protocol server
+    Falls back to an in-memory window if the server is unreachable
+    """
+
+    def __init__(self, client, window_seconds: int = 3600, key_prefix: str = "mcp:ratelimit:"):
+        self.client = client
+        self.window_seconds = window_seconds
+        self.key_prefix = key_prefix
+        self.script = client.register_script(REDIS_SLIDING_WINDOW_SCRIPT)
+        self.fallback = SlidingWindowRateLimiter(window_seconds)
+        self.backend_errors = 0
+
+    def hit(self, key: str, limit: int, consume: bool = True) -> Tuple[bool, Dict]:
+        now = time.time()
+        try:
+            allowed, current_usage, oldest_score = self.script(
+                keys=[f"{self.key_prefix}{key}"],
+                args=[now, self.window_seconds, limit, 1 if consume else 0, f"{now}:{uuid.uuid4().hex}"]
+            )
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Redis rate limiter unavailable, using in-memory window: {str(e)}")
+            return self.fallback.hit(key, limit, consume)
+
+        if isinstance(oldest_score, bytes):
+            oldest_score = oldest_score.decode()
+        oldest_hit = float(oldest_score) if oldest_score else None
+        return bool(allowed), _window_rate_info(
+            bool(allowed), int(current_usage), limit, oldest_hit, now, self.window_seconds
+        )
+
+    def prune(self) -> int:
+        # Redis expires idle keys itself (PEXPIRE); only the fallback needs trimming
+        return self.fallback.prune()
+
+    def get_statistics(self) -> Dict:
+        return {
+            "backend": "redis",
+            "backend_errors": self.backend_errors,
+            "fallback_tracked_keys": len(self.fallback.hits),
+            "window_seconds": self.window_seconds
+        }
+
+
+def create_redis_client():
+    """Client for MCP_RATE_LIMIT_REDIS_URL, or None when it is unset or unusable"""
+    redis_url = os.environ.get('MCP_RATE_LIMIT_REDIS_URL')
+    if not redis_url:
+        return None
+    if redis is None:
+        logger.warning("MCP_RATE_LIMIT_REDIS_URL is set but the redis package is not installed")
+        return None
+    try:
+        return redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    except Exception as e:
+        logger.warning(f"Could not configure Redis client: {str(e)}")
+        return None
+
+
+def create_request_rate_limiter(window_seconds: int = 3600):
+    """
+    Build the MCP API key rate limiter
+    Uses Redis when MCP_RATE_LIMIT_REDIS_URL is set, otherwise process memory
+    """
+    client = create_redis_client()
+    if client is not None:
+        logger.info("MCP API key rate limiter using shared Redis backend")
+        return RedisSlidingWindowRateLimiter(client, window_seconds)
+
+    return SlidingWindowRateLimiter(window_seconds)
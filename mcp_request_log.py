@@ -0,0 +1,195 @@
+"""
+MCP Request Log Writer
+Buffers mcp_api_requests rows in a bounded in-process queue and writes them in
+batches from a background thread, so MCP calls never wait on a logging commit
+"""
+
+import os
+import time
+import queue
+import atexit
+import ipaddress
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from psycopg2.extras import execute_values
+
+# Writer configuration (overridable via environment)
+MCP_REQUEST_LOG_QUEUE_SIZE = int(os.environ.get('MCP_REQUEST_LOG_QUEUE_SIZE', 10000))
+MCP_REQUEST_LOG_BATCH_SIZE = int(os.environ.get('MCP_REQUEST_LOG_BATCH_SIZE', 500))
+MCP_REQUEST_LOG_FLUSH_INTERVAL = float(os.environ.get('MCP_REQUEST_LOG_FLUSH_INTERVAL', 2.0))  # seconds
+
+INSERT_REQUEST_LOGS_SQL = """
+    INSERT INTO mcp_api_requests
+    (key_hash, request_path, request_method, timestamp, ip_address, user_agent, response_status)
+    VALUES %s
+"""
+
+
+def _clean_ip(ip_address: Optional[str]) -> Optional[str]:
+    """One malformed INET value would fail the whole batch, so store NULL instead"""
+    if not ip_address:
+        return None
+    try:
+        return str(ipaddress.ip_address(ip_address.strip()))
+    except ValueError:
+        return None
+
+
+class RequestLogWriter:
+    """
+    Bounded queue of request log rows drained by a single writer thread.
+
+    A batch is flushed when it reaches batch_size rows or flush_interval seconds
+    after its first row, whichever comes first. When the queue is full new rows
+    are dropped (and counted) rather than blocking the request.
+    """
+
+    def __init__(
+        self,
+        get_db_connection,
+        max_queue_size: int = MCP_REQUEST_LOG_QUEUE_SIZE,
+        batch_size: int = MCP_REQUEST_LOG_BATCH_SIZE,
+        flush_interval: float = MCP_REQUEST_LOG_FLUSH_INTERVAL
+    ):
+        self.get_db_connection = get_db_connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.dropped_queue_full = 0
+        self.dropped_write_error = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_queue_depth = 0
+
+    def start(self):
+        """Start the writer thread (idempotent); registers a flush at interpreter exit"""
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="mcp-request-log-writer", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def log(
+        self,
+        key_hash: str,
+        request_path: str,
+        request_method: str,
+        ip_address: Optional[str],
+        user_agent: Optional[str],
+        response_status: int
+    ) -> bool:
+        """Queue one request log row; returns False if it was dropped"""
+        if not self._thread:
+            self.start()
+
+        record = (
+            key_hash, request_path, request_method, datetime.now(),
+            _clean_ip(ip_address), user_agent, response_status
+        )
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped_queue_full += 1
+            return False
+
+        with self._stats_lock:
+            self.enqueued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def _collect_batch(self, wait: bool) -> list:
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            try:
+                if not wait:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = self.flush_interval if deadline is None else deadline - time.time()
+                if timeout <= 0:
+                    break
+                batch.append(self.queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.time() + self.flush_interval
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: list):
+        started = time.time()
+        try:
+            with self._write_lock, self.get_db_connection() as conn:
+                if not conn:
+                    raise RuntimeError("Database connection unavailable")
+                with conn.cursor() as cur:
+                    execute_values(cur, INSERT_REQUEST_LOGS_SQL, batch, page_size=self.batch_size)
+                conn.commit()
+        except Exception as e:
+            print(f"Error writing {len(batch)} MCP request logs: {str(e)}")
+            with self._stats_lock:
+                self.dropped_write_error += len(batch)
+            return
+
+        with self._stats_lock:
+            self.written += len(batch)
+            self.batches += 1
+            self.last_batch_size = len(batch)
+            self.last_flush_ms = round((time.time() - started) * 1000, 2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch(wait=True)
+            if batch:
+                self._write_batch(batch)
+
+    def flush(self) -> int:
+        """Synchronously write everything currently queued; returns rows flushed"""
+        flushed = 0
+        while True:
+            batch = self._collect_batch(wait=False)
+            if not batch:
+                return flushed
+            self._write_batch(batch)
+            flushed += len(batch)
+
+    def close(self, timeout: float = 5.0):
+        """Stop the writer thread and flush any remaining rows"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        flushed = self.flush()
+        if flushed:
+            print(f"Flushed {flushed} MCP request logs on shutdown")
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'queue_capacity': self.queue.maxsize,
+                'max_queue_depth': self.max_queue_depth,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped_queue_full': self.dropped_queue_full,
+                'dropped_write_error': self.dropped_write_error,
+                'batches': self.batches,
+                'last_batch_size': self.last_batch_size,
+                'last_flush_ms': self.last_flush_ms,
+                'writer_running': bool(self._thread and self._thread.is_alive())
+            }
@@ -4,9 +4,13 @@ Integrates MCP API usage with Stripe metered billing
 """
 
 import os
+import uuid
+import atexit
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import stripe
+from psycopg2.extras import execute_values
 from stripe_metering import report_data_usage
 
 # Initialize Stripe
@@ -15,107 +19,238 @@ stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
 # MCP usage calculation constants
 REQUESTS_PER_MB = 1000  # Approximate: 1000 API requests = 1 MB of data usage
 
+# Aggregated billing configuration (overridable via environment)
+MCP_USAGE_STAGE_INTERVAL = int(os.environ.get('MCP_USAGE_STAGE_INTERVAL', 15))  # seconds between staging writes
+MCP_BILLING_INTERVAL = int(os.environ.get('MCP_BILLING_INTERVAL', 3600))  # seconds per Stripe meter event
+MCP_BILLING_REPORT_BATCH = 100  # pending billing events reported per pass
+MCP_BILLING_MAX_ATTEMPTS = int(os.environ.get('MCP_BILLING_MAX_ATTEMPTS', 10))  # then the batch is marked failed
+MCP_BILLING_RETRY_BASE = int(os.environ.get('MCP_BILLING_RETRY_BASE', 60))  # seconds, doubled per attempt
+MCP_BILLING_RETRY_MAX_SECONDS = 6 * 3600
+MCP_BILLING_LOCK_ID = 727073003  # pg_advisory lock so only one worker claims staged usage
+
 
 class MCPUsageService:
-    """Track and report MCP API usage to Stripe for billing"""
+    """
+    Track and report MCP API usage to Stripe for billing
+
+    Request counts are accumulated per user in memory, staged to
+    mcp_usage_staging every few seconds, and once per billing interval rolled
+    into one mcp_billing_events batch (and one Stripe meter event) per customer.
+    """
     
     def __init__(self, get_db_connection):
         self.get_db_connection = get_db_connection
+        self._pending = {}  # {firebase_uid: request_count} not yet staged
+        self._pending_lock = threading.Lock()
+        self._worker = None
+        self._worker_stop = threading.Event()
     
-    def report_mcp_usage_to_stripe(
-        self, 
-        firebase_uid: str,
-        request_count: int = 1
-    ) -> Dict:
-        """
-        Report MCP API usage to Stripe metered billing
+    def record_mcp_usage(self, firebase_uid: str, request_count: int = 1):
+        """Count billable MCP requests for a user (in memory, no I/O)"""
+        if not firebase_uid:
+            return
+        with self._pending_lock:
+            self._pending[firebase_uid] = self._pending.get(firebase_uid, 0) + request_count
+    
+    def stage_pending_usage(self) -> int:
+        """Write in-memory request counts to mcp_usage_staging; returns users staged"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
         
-        Args:
-            firebase_uid: User's Firebase UID
-            request_count: Number of API requests (default: 1)
-            
-        Returns:
-            dict: Result of the usage report
+        now = datetime.now()
+        rows = [(firebase_uid, count, now) for firebase_uid, count in pending.items()]
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    raise RuntimeError("Database unavailable")
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        INSERT INTO mcp_usage_staging (firebase_uid, request_count, recorded_at)
+                        VALUES %s
+                    """, rows)
+                    conn.commit()
+            return len(rows)
+        except Exception as e:
+            print(f"Error staging MCP usage: {str(e)}")
+            # Keep the counts in memory for the next attempt
+            with self._pending_lock:
+                for firebase_uid, count, _ in rows:
+                    self._pending[firebase_uid] = self._pending.get(firebase_uid, 0) + count
+            return 0
+    
+    def claim_staged_usage(self, billing_interval: int = MCP_BILLING_INTERVAL) -> int:
+        """
+        Roll staged usage into pending mcp_billing_events batches, one per customer,
+        at most once per billing_interval across all workers.
+        Staging rows are deleted in the same transaction, so usage is never
+        billed twice or lost if the process dies mid-way.
+        Returns: number of billing batches created
         """
         try:
-            # Get user's Stripe customer ID
             with self.get_db_connection() as conn:
                 if not conn:
-                    return {'success': False, 'error': 'Database unavailable'}
+                    return 0
                 
                 with conn.cursor() as cur:
-                    # Get Stripe customer ID from users table
-                    cur.execute("""
-                        SELECT stripe_customer_id, email
-                        FROM users
-                        WHERE firebase_uid = %s
-                    """, (firebase_uid,))
+                    cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (MCP_BILLING_LOCK_ID,))
+                    if not cur.fetchone()[0]:
+                        conn.rollback()
+                        return 0
                     
-                    result = cur.fetchone()
+                    period_end = datetime.now()
+                    cur.execute("SELECT MAX(period_end) FROM mcp_billing_events")
+                    last_period_end = cur.fetchone()[0]
+                    if last_period_end and last_period_end > period_end - timedelta(seconds=billing_interval):
+                        conn.rollback()
+                        return 0
                     
-                    if not result or not result[0]:
-                        print(f"No Stripe customer ID found for user {firebase_uid}")
-                        return {
-                            'success': False,
-                            'error': 'No Stripe customer ID',
-                            'user_email': result[1] if result else None
-                        }
+                    cur.execute("""
+                        WITH claimed AS (
+                            DELETE FROM mcp_usage_staging
+                            WHERE recorded_at <= %s
+                            RETURNING firebase_uid, request_count, recorded_at
+                        )
+                        SELECT c.firebase_uid, u.stripe_customer_id,
+                               SUM(c.request_count), MIN(c.recorded_at)
+                        FROM claimed c
+                        LEFT JOIN users u ON u.firebase_uid = c.firebase_uid
+                        GROUP BY c.firebase_uid, u.stripe_customer_id
+                    """, (period_end,))
                     
-                    stripe_customer_id = result[0]
-                    user_email = result[1]
-            
-            # Convert API requests to megabytes for billing
-            megabytes_used = request_count / REQUESTS_PER_MB
-            
-            # Report to Stripe
-            result = report_data_usage(
-                customer_id=stripe_customer_id,
-                megabytes_used=megabytes_used,
-                timestamp=datetime.now()
-            )
+                    batches = []
+                    for firebase_uid, stripe_customer_id, request_count, period_start in cur.fetchall():
+                        if not stripe_customer_id:
+                            print(f"No Stripe customer ID found for user {firebase_uid}, "
+                                  f"dropping {request_count} MCP requests")
+                            continue
+                        batches.append((
+                            firebase_uid, stripe_customer_id, int(request_count),
+                            int(request_count) / REQUESTS_PER_MB, period_start, period_end,
+                            f"mcp-usage-{uuid.uuid4()}", 'pending'
+                        ))
+                    
+                    if batches:
+                        execute_values(cur, """
+                            INSERT INTO mcp_billing_events
+                            (firebase_uid, stripe_customer_id, request_count, megabytes_used,
+                             period_start, period_end, idempotency_key, status)
+                            VALUES %s
+                        """, batches)
+                    conn.commit()
+                    return len(batches)
+        except Exception as e:
+            print(f"Error claiming staged MCP usage: {str(e)}")
+            return 0
+    
+    def report_pending_billing_events(self) -> Dict:
+        """
+        Send due pending mcp_billing_events to Stripe as meter events.
+        Each batch reuses its stored idempotency key as the meter event
+        identifier, so a retry after a crash or timeout is deduplicated by Stripe.
+        Claiming a batch pushes its next_attempt_at out with exponential backoff,
+        so failing batches don't hold up newer ones; after
+        MCP_BILLING_MAX_ATTEMPTS it is marked 'failed' for manual follow-up.
+        """
+        reported = failed = 0
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return {'success': False, 'error': 'Database unavailable'}
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE mcp_billing_events
+                        SET attempts = attempts + 1,
+                            next_attempt_at = CURRENT_TIMESTAMP
+                                + LEAST(%s * POWER(2, attempts), %s) * INTERVAL '1 second'
+                        WHERE id IN (
+                            SELECT id FROM mcp_billing_events
+                            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                            ORDER BY next_attempt_at, id
+                            LIMIT %s
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING id, firebase_uid, stripe_customer_id, request_count,
+                                  megabytes_used, period_end, idempotency_key, attempts
+                    """, (MCP_BILLING_RETRY_BASE, MCP_BILLING_RETRY_MAX_SECONDS, MCP_BILLING_REPORT_BATCH))
+                    events = cur.fetchall()
+                    conn.commit()
             
-            if result.get('success'):
-                # Log the billing event
-                self._log_billing_event(
-                    firebase_uid=firebase_uid,
-                    stripe_customer_id=stripe_customer_id,
-                    request_count=request_count,
-                    megabytes_used=megabytes_used,
-                    stripe_event_id=result.get('event_id')
+            for event_id, firebase_uid, customer_id, request_count, megabytes, period_end, key, attempts in events:
+                result = report_data_usage(
+                    customer_id=customer_id,
+                    megabytes_used=float(megabytes),
+                    timestamp=period_end,
+                    identifier=key
                 )
-                
-                print(f"✅ Reported {request_count} MCP requests ({megabytes_used:.4f} MB) "
-                      f"for {user_email} to Stripe")
-            
-            return result
+                give_up = not result.get('success') and attempts >= MCP_BILLING_MAX_ATTEMPTS
+                self._mark_billing_event(event_id, result, give_up)
+                if result.get('success'):
+                    reported += 1
+                    print(f"✅ Reported {request_count} MCP requests ({float(megabytes):.4f} MB) "
+                          f"for {firebase_uid} to Stripe")
+                else:
+                    failed += 1
+                    if give_up:
+                        print(f"❌ MCP billing event {event_id} for {firebase_uid} failed after "
+                              f"{attempts} attempts: {result.get('error')}")
             
+            return {'success': True, 'reported': reported, 'failed': failed}
         except Exception as e:
             print(f"Error reporting MCP usage to Stripe: {str(e)}")
-            return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e), 'reported': reported, 'failed': failed}
     
-    def _log_billing_event(
-        self,
-        firebase_uid: str,
-        stripe_customer_id: str,
-        request_count: int,
-        megabytes_used: float,
-        stripe_event_id: str
-    ):
-        """Log billing event to database for tracking"""
+    def _mark_billing_event(self, event_id: int, result: Dict, give_up: bool = False):
+        """Record the outcome of a Stripe meter event for a billing batch; give_up marks it failed"""
         try:
             with self.get_db_connection() as conn:
                 if conn:
                     with conn.cursor() as cur:
-                        cur.execute("""
-                            INSERT INTO mcp_billing_events 
-                            (firebase_uid, stripe_customer_id, request_count, 
-                             megabytes_used, stripe_event_id, created_at)
-                            VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-                        """, (firebase_uid, stripe_customer_id, request_count, 
-                              megabytes_used, stripe_event_id))
+                        if result.get('success'):
+                            cur.execute("""
+                                UPDATE mcp_billing_events
+                                SET status = 'reported', stripe_event_id = %s,
+                                    reported_at = CURRENT_TIMESTAMP, last_error = NULL
+                                WHERE id = %s
+                            """, (result.get('event_id'), event_id))
+                        else:
+                            cur.execute("""
+                                UPDATE mcp_billing_events
+                                SET last_error = %s, status = %s
+                                WHERE id = %s
+                            """, (result.get('error'), 'failed' if give_up else 'pending', event_id))
                         conn.commit()
         except Exception as e:
-            print(f"Error logging billing event: {str(e)}")
+            print(f"Error updating billing event {event_id}: {str(e)}")
+    
+    def start_billing_worker(
+        self,
+        stage_interval: int = MCP_USAGE_STAGE_INTERVAL,
+        billing_interval: int = MCP_BILLING_INTERVAL
+    ):
+        """
+        Start the background job that stages usage, claims it once per billing
+        interval and retries any batches not yet accepted by Stripe
+        """
+        if self._worker and self._worker.is_alive():
+            return
+        
+        def run():
+            while not self._worker_stop.wait(stage_interval):
+                self.stage_pending_usage()
+                self.claim_staged_usage(billing_interval)
+                self.report_pending_billing_events()
+        
+        self._worker_stop.clear()
+        self._worker = threading.Thread(target=run, name="mcp-billing-worker", daemon=True)
+        self._worker.start()
+        atexit.register(self.stop_billing_worker)
+    
+    def stop_billing_worker(self):
+        """Stop the background job and stage any counts still in memory"""
+        self._worker_stop.set()
+        self.stage_pending_usage()
     
     def get_user_usage_stats(
         self, 
@@ -260,30 +395,3 @@ class MCPUsageService:
         except Exception as e:
             print(f"Error getting endpoint usage: {str(e)}")
             return {'success': False, 'error': str(e)}
-    
-    def ensure_billing_table_exists(self):
-        """Create billing events table if it doesn't exist"""
-        try:
-            with self.get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        cur.execute("""
-                            CREATE TABLE IF NOT EXISTS mcp_billing_events (
-                                id SERIAL PRIMARY KEY,
-                                firebase_uid VARCHAR(128) NOT NULL,
-                                stripe_customer_id VARCHAR(255) NOT NULL,
-                                request_count INTEGER NOT NULL,
-                                megabytes_used DECIMAL(10, 6) NOT NULL,
-                                stripe_event_id VARCHAR(255),
-                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                            );
-                            
-                            CREATE INDEX IF NOT EXISTS idx_mcp_billing_events_firebase_uid 
-                                ON mcp_billing_events(firebase_uid);
-                            CREATE INDEX IF NOT EXISTS idx_mcp_billing_events_created_at 
-                                ON mcp_billing_events(created_at);
-                        """)
-                        conn.commit()
-                        print("MCP billing events table created/verified successfully")
-        except Exception as e:
-            print(f"Error creating MCP billing events table: {str(e)}")
@@ -0,0 +1,418 @@
+"""
+Phone Number Inventory Cache
+Keeps OXIO's available numbers per area code (NPA) in an in-memory index that a
+background thread prefetches and refreshes, so number searches (prefix, vanity
+pattern, contains) are answered without an OXIO call, and lets users hold a
+number with a short optimistic reservation. Narrowed searches against an NPA
+whose index was cut off at NUMBER_PREFETCH_LIMIT fall through to a live OXIO
+search when the index alone cannot fill the page
+"""
+
+import os
+import re
+import time
+import atexit
+import bisect
+import itertools
+import threading
+from typing import Any, Dict, List, Optional
+
+# Inventory configuration (overridable via environment)
+NUMBER_PREFETCH_NPAS = [npa.strip() for npa in os.environ.get('NUMBER_PREFETCH_NPAS', '212,646,917').split(',')
+                        if npa.strip()]  # indexed at startup
+NUMBER_PREFETCH_LIMIT = int(os.environ.get('NUMBER_PREFETCH_LIMIT', 500))  # numbers fetched per NPA
+NUMBER_REFRESH_INTERVAL = int(os.environ.get('NUMBER_REFRESH_INTERVAL', 300))  # seconds before an NPA is refetched
+NUMBER_MAX_NPAS = int(os.environ.get('NUMBER_MAX_NPAS', 200))  # least recently searched NPAs evicted past this
+NUMBER_RESERVATION_SECONDS = int(os.environ.get('NUMBER_RESERVATION_SECONDS', 600))
+
+NPA_RE = re.compile(r'^[2-9]\d{2}$')
+WILDCARDS = set('X?*_')  # compared after upper()
+KEYPAD = {letter: digit for digit, letters in {
+    '2': 'ABC', '3': 'DEF', '4': 'GHI', '5': 'JKL', '6': 'MNO', '7': 'PQRS', '8': 'TUV', '9': 'WXYZ'
+}.items() for letter in letters}
+
+
+def national_number(phone_number: str) -> Optional[str]:
+    """10-digit NANP number from +1XXXXXXXXXX / 1XXXXXXXXXX / XXXXXXXXXX, else None"""
+    digits = re.sub(r'\D', '', phone_number or '')
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return digits if len(digits) == 10 else None
+
+
+def vanity_digits(text: str, keep_wildcards: bool = False) -> str:
+    """Keypad digits for a vanity string ('CAFE' -> '2233'); other characters are dropped"""
+    result = []
+    for char in (text or '').upper():
+        if char.isdigit():
+            result.append(char)
+        elif keep_wildcards and char in WILDCARDS:
+            result.append('?')
+        elif char in KEYPAD:
+            result.append(KEYPAD[char])
+    return ''.join(result)
+
+
+def compile_pattern(pattern: str):
+    """
+    Regex for a number template: digits, vanity letters and single-digit
+    wildcards (x ? * _). Ten positions match the whole number, fewer match its end.
+    """
+    template = vanity_digits(pattern, keep_wildcards=True)
+    if not template or len(template) > 10:
+        raise ValueError('Pattern must have 1-10 digits, letters or wildcards')
+    body = ''.join(r'\d' if char == '?' else char for char in template)
+    return re.compile(f"^{body}$" if len(template) == 10 else f"{body}$")
+
+
+def _parse_numbers(data: Any) -> Dict[str, Dict]:
+    """{national number: OXIO record} from a search_available_numbers payload"""
+    if isinstance(data, dict):
+        data = data.get('phoneNumbers') or data.get('numbers') or data.get('availableNumbers') or []
+    records = {}
+    for item in data or []:
+        record = item if isinstance(item, dict) else {'phoneNumber': str(item)}
+        number = national_number(record.get('phoneNumber') or record.get('number') or '')
+        if number:
+            records[number] = record
+    return records
+
+
+class _NpaIndex:
+    def __init__(self, records: Dict[str, Dict], truncated: bool = False):
+        self.records = records
+        self.truncated = truncated  # OXIO had more numbers than prefetch_limit
+        self.numbers = sorted(records)
+        self.fetched_at = time.monotonic()
+        self.last_searched = time.monotonic()
+
+
+class NumberInventory:
+    """
+    In-memory index of available numbers per NPA
+
+    Searches for an indexed NPA never call OXIO; the first search for a new NPA
+    fetches it once (concurrent searches wait for the same fetch) and the
+    refresher keeps it current. Reservations are per process and optimistic:
+    OXIO can still hand a reserved number to another brand, so activation must
+    release the reservation if it fails.
+    """
+
+    def __init__(self, oxio_service, prefetch_npas: Optional[List[str]] = None,
+                 prefetch_limit: int = NUMBER_PREFETCH_LIMIT,
+                 refresh_interval: int = NUMBER_REFRESH_INTERVAL,
+                 max_npas: int = NUMBER_MAX_NPAS,
+                 reservation_seconds: int = NUMBER_RESERVATION_SECONDS):
+        self.oxio_service = oxio_service
+        self.prefetch_npas = prefetch_npas if prefetch_npas is not None else NUMBER_PREFETCH_NPAS
+        self.prefetch_limit = prefetch_limit
+        self.refresh_interval = refresh_interval
+        self.max_npas = max_npas
+        self.reservation_seconds = reservation_seconds
+
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, _NpaIndex] = {}
+        self._fetching: Dict[str, threading.Event] = {}
+        self._reservations: Dict[str, tuple] = {}  # number -> (holder, expires_at)
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.stats = {'searches': 0, 'index_searches': 0, 'live_searches': 0, 'fallthrough_searches': 0, 'fetches': 0,
+                      'fetch_failures': 0, 'evictions': 0, 'reservations': 0, 'reservation_conflicts': 0,
+                      'search_ms_total': 0.0}
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    # Index maintenance
+
+    def fetch_npa(self, npa: str) -> bool:
+        """Fetch an NPA's available numbers from OXIO and swap them into the index"""
+        result = self.oxio_service.search_available_numbers(npa=npa, limit=self.prefetch_limit)
+        if not result.get('success'):
+            self._count('fetch_failures')
+            print(f"⚠️ Number inventory fetch for {npa} failed: {result.get('message')}")
+            return False
+
+        records = _parse_numbers(result.get('data'))
+        index = _NpaIndex(records, truncated=len(records) >= self.prefetch_limit)
+        with self._lock:
+            previous = self._indexes.get(npa)
+            if previous:
+                index.last_searched = previous.last_searched
+            self._indexes[npa] = index
+            self.stats['fetches'] += 1
+            self._evict()
+        return True
+
+    def _evict(self):
+        while len(self._indexes) > self.max_npas:
+            npa = min(self._indexes, key=lambda key: self._indexes[key].last_searched)
+            del self._indexes[npa]
+            self.stats['evictions'] += 1
+
+    def _ensure_npa(self, npa: str) -> Optional[_NpaIndex]:
+        """The NPA's index, fetching it first if it is new; concurrent callers share one fetch"""
+        with self._lock:
+            index = self._indexes.get(npa)
+            if index:
+                return index
+            event = self._fetching.get(npa)
+            leader = event is None
+            if leader:
+                event = self._fetching[npa] = threading.Event()
+
+        if leader:
+            try:
+                self.fetch_npa(npa)
+            finally:
+                with self._lock:
+                    self._fetching.pop(npa, None)
+                event.set()
+        else:
+            event.wait(30)
+
+        with self._lock:
+            return self._indexes.get(npa)
+
+    def refresh_stale(self) -> int:
+        """Refetch NPAs older than refresh_interval, most recently searched first; returns how many"""
+        now = time.monotonic()
+        with self._lock:
+            stale = sorted((npa for npa, index in self._indexes.items()
+                            if now - index.fetched_at >= self.refresh_interval),
+                           key=lambda npa: -self._indexes[npa].last_searched)
+        refreshed = 0
+        for npa in stale:
+            if self._stop.is_set():
+                break
+            refreshed += self.fetch_npa(npa)
+        return refreshed
+
+    def start(self):
+        """Prefetch the configured NPAs, then refresh stale ones in the background"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            for npa in self.prefetch_npas:
+                if self._stop.is_set():
+                    return
+                self._ensure_npa(npa)
+            while not self._stop.wait(min(self.refresh_interval, 60)):
+                try:
+                    self.refresh_stale()
+                except Exception as e:
+                    print(f"Error refreshing number inventory: {str(e)}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="number-inventory", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+
+    # Reservations
+
+    def _reserved_by_other(self, number: str, holder: Optional[str], now: float) -> bool:
+        reservation = self._reservations.get(number)
+        if not reservation:
+            return False
+        if reservation[1] <= now:
+            del self._reservations[number]
+            return False
+        return reservation[0] != holder
+
+    def reserve(self, phone_number: str, holder: str) -> Dict[str, Any]:
+        """Hold an indexed number for holder for reservation_seconds (renews the holder's own hold)"""
+        number = national_number(phone_number)
+        if not number:
+            return {'success': False, 'status_code': 400, 'error': 'Invalid phone number'}
+
+        now = time.monotonic()
+        with self._lock:
+            index = self._indexes.get(number[:3])
+            if not index or number not in index.records:
+                return {'success': False, 'status_code': 404, 'error': 'Number is not in the available inventory'}
+            if self._reserved_by_other(number, holder, now):
+                self.stats['reservation_conflicts'] += 1
+                return {'success': False, 'status_code': 409, 'error': 'Number is reserved by another user'}
+            self._reservations[number] = (holder, now + self.reservation_seconds)
+            self.stats['reservations'] += 1
+        return {'success': True, 'phone_number': f"+1{number}", 'expires_in_seconds': self.reservation_seconds}
+
+    def release(self, phone_number: str, holder: str, taken: bool = False) -> bool:
+        """Drop holder's reservation; taken=True also removes the number from the index"""
+        number = national_number(phone_number)
+        with self._lock:
+            reservation = self._reservations.get(number)
+            if not reservation or reservation[0] != holder:
+                return False
+            del self._reservations[number]
+            index = self._indexes.get(number[:3])
+            if taken and index and number in index.records:
+                del index.records[number]
+                index.numbers.remove(number)
+        return True
+
+    # Search
+
+    def search(self, npa: str = None, nxx: str = None, zip_code: str = None, prefix: str = None,
+               pattern: str = None, contains: str = None, limit: int = 10,
+               holder: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Available numbers matching every given filter, from the index
+
+        The index holds at most prefetch_limit numbers per NPA, so when a
+        narrowed search (nxx, prefix, pattern, contains) on a truncated NPA
+        finds fewer than limit numbers, OXIO is searched for that NPA/NXX and
+        its results are filtered the same way.
+
+        Args:
+            npa/nxx: Area code and exchange
+            zip_code: Searches the ZIP code's area codes (from the cached reference data)
+            prefix: Leading digits of the 10-digit number
+            pattern: Template such as 'xxx-xxx-CAFE' or '??77'; shorter templates match the end
+            contains: Digits or vanity letters anywhere in the number
+            holder: Numbers this holder reserved are included
+
+        Returns:
+            Dictionary shaped like OXIOService.search_available_numbers
+        """
+        started = time.perf_counter()
+        self._count('searches')
+        try:
+            regex = compile_pattern(pattern) if pattern else None
+            contains_digits = vanity_digits(contains) if contains else None
+        except ValueError as e:
+            return {'success': False, 'status_code': 400, 'error': 'Invalid search', 'message': str(e)}
+
+        prefix = re.sub(r'\D', '', prefix or '')
+        npas = self._npas_for(npa or (prefix[:3] if len(prefix) >= 3 else None), zip_code)
+        if npas is None:
+            # No area code to index on: pass the search through to OXIO
+            self._count('live_searches')
+            return self.oxio_service.search_available_numbers(npa=npa, nxx=nxx, zip_code=zip_code, limit=limit)
+
+        def wanted(number: str) -> bool:
+            if nxx and number[3:6] != nxx or prefix and not number.startswith(prefix):
+                return False
+            if regex and not regex.search(number):
+                return False
+            return not (contains_digits and contains_digits not in number)
+
+        narrowed = bool(nxx or len(prefix) > 3 or regex or contains_digits)
+        matches, seen, unavailable, oldest, source = [], set(), [], None, 'index'
+        searched = 0
+        now = time.monotonic()
+        for area_code in npas:
+            if prefix and not (prefix.startswith(area_code) or area_code.startswith(prefix)):
+                continue
+            searched += 1
+            index = self._ensure_npa(area_code)
+            if not index:
+                unavailable.append(area_code)
+                continue
+            lead = max(prefix, area_code + (nxx or ''), key=len)
+            with self._lock:
+                index.last_searched = now
+                numbers = index.numbers
+                position = bisect.bisect_left(numbers, lead)
+                for number in itertools.islice(numbers, position, None):
+                    if not number.startswith(lead):
+                        break
+                    if not wanted(number) or self._reserved_by_other(number, holder, now):
+                        continue
+                    matches.append(index.records[number])
+                    seen.add(number)
+                    if len(matches) >= limit:
+                        break
+                age = now - index.fetched_at
+                truncated = index.truncated
+            oldest = age if oldest is None else max(oldest, age)
+            if narrowed and truncated and len(matches) < limit:
+                exchange = nxx or (prefix[3:6] if len(prefix) >= 6 else None)
+                live = self._live_matches(area_code, exchange, wanted, seen, holder, limit - len(matches))
+                if live is None:
+                    unavailable.append(area_code)
+                else:
+                    matches.extend(live)
+                    source = 'index+live'
+            if len(matches) >= limit:
+                break
+
+        if unavailable and not matches and len(unavailable) == searched:
+            return {
+                'success': False,
+                'status_code': 503,
+                'error': 'Number search unavailable',
+                'message': f"Could not fetch available numbers for area code(s) {', '.join(unavailable)}",
+                'area_codes': npas
+            }
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._count('index_searches')
+        self._count('search_ms_total', elapsed_ms)
+        return {
+            'success': True,
+            'data': {'phoneNumbers': matches},
+            'message': 'Available phone numbers retrieved successfully',
+            'source': source,
+            'area_codes': npas,
+            'unavailable_area_codes': unavailable,
+            'index_age_seconds': round(oldest, 1) if oldest is not None else None,
+            'search_ms': round(elapsed_ms, 3)
+        }
+
+    def _live_matches(self, npa: str, nxx: Optional[str], wanted, seen: set,
+                      holder: Optional[str], needed: int) -> Optional[List[Dict]]:
+        """Matches from a live OXIO search of npa/nxx that the index did not hold; None if OXIO failed"""
+        self._count('fallthrough_searches')
+        result = self.oxio_service.search_available_numbers(npa=npa, nxx=nxx, limit=self.prefetch_limit)
+        if not result.get('success'):
+            self._count('fetch_failures')
+            print(f"⚠️ Live number search for {npa}{nxx or ''} failed: {result.get('message')}")
+            return None
+
+        now = time.monotonic()
+        matches = []
+        with self._lock:
+            index = self._indexes.get(npa)
+            for number, record in sorted(_parse_numbers(result.get('data')).items()):
+                if index and number not in index.records:
+                    # Indexed so the number can be reserved like a prefetched one
+                    index.records[number] = record
+                    bisect.insort(index.numbers, number)
+                if number in seen or not wanted(number) or self._reserved_by_other(number, holder, now):
+                    continue
+                matches.append(record)
+                seen.add(number)
+                if len(matches) >= needed:
+                    break
+        return matches
+
+    def _npas_for(self, npa: Optional[str], zip_code: Optional[str]) -> Optional[List[str]]:
+        if npa:
+            return [npa] if NPA_RE.match(npa) else []
+        if not zip_code:
+            return None
+        details = self.oxio_service.get_zip_code_details(zip_code)  # TTL-cached reference data
+        if not details.get('success'):
+            return []
+        area_codes = (details.get('data') or {}).get('areaCodes') or []
+        npas = [str(code.get('areaCode') if isinstance(code, dict) else code) for code in area_codes]
+        return [code for code in npas if NPA_RE.match(code)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self.stats)
+            stats['npas'] = {npa: {'numbers': len(index.numbers), 'age_seconds': round(now - index.fetched_at, 1)}
+                             for npa, index in sorted(self._indexes.items())}
+            stats['active_reservations'] = sum(1 for _, expires in self._reservations.values() if expires > now)
+        searches = stats.pop('search_ms_total')
+        stats['avg_index_search_ms'] = round(searches / stats['index_searches'], 3) if stats['index_searches'] else None
+        stats['refresher_running'] = bool(self._thread and self._thread.is_alive())
+        return stats
@@ -0,0 +1,380 @@
+"""
+OXIO Line Reconciliation
+Fleet-wide sync of every user's OXIO lines into iccid_inventory, oxio_activations
+and purchases: pages through users, fetches lines concurrently under a rate limit,
+and writes only lines whose content hash changed, in batched transactions
+"""
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from psycopg2.extras import execute_values
+
+from esim_sync_service import line_fields, upsert_iccid, upsert_activation, ensure_recovered_purchase
+
+# Sync configuration (overridable via environment)
+LINE_SYNC_PAGE_SIZE = int(os.environ.get('OXIO_LINE_SYNC_PAGE_SIZE', 200))  # users per page
+LINE_SYNC_CONCURRENCY = int(os.environ.get('OXIO_LINE_SYNC_CONCURRENCY', 8))  # get_user_lines calls in flight
+LINE_SYNC_RATE = float(os.environ.get('OXIO_LINE_SYNC_RATE', 10))  # get_user_lines calls per second (0 = unlimited)
+LINE_SYNC_APPLY_BATCH = int(os.environ.get('OXIO_LINE_SYNC_APPLY_BATCH', 100))  # changed lines per transaction
+LINE_SYNC_HOUR = int(os.environ.get('OXIO_LINE_SYNC_HOUR', 3))  # nightly run, server local time
+LINE_SYNC_LOCK_ID = 727073005  # pg_advisory lock so only one worker syncs at a time
+
+UPSERT_SYNC_STATE_SQL = """
+    INSERT INTO oxio_line_sync_state (line_id, user_id, iccid, content_hash, synced_at)
+    VALUES %s
+    ON CONFLICT (line_id) DO UPDATE SET
+        user_id = EXCLUDED.user_id,
+        iccid = EXCLUDED.iccid,
+        content_hash = EXCLUDED.content_hash,
+        synced_at = EXCLUDED.synced_at
+"""
+
+
+def content_hash(user_id: int, fields: Dict[str, str]) -> str:
+    """Hash of everything a line sync writes, so equal hashes mean nothing to write"""
+    return hashlib.sha256(json.dumps(dict(fields, user_id=user_id), sort_keys=True).encode()).hexdigest()
+
+
+def seconds_until_hour(hour: int, now: Optional[datetime] = None) -> float:
+    """Seconds from now until the next hour:00 (tomorrow if already past)"""
+    now = now or datetime.now()
+    target = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+class RateLimiter:
+    """Spaces calls evenly at `rate` per second across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class OXIOLineSync:
+    """
+    Reconciles OXIO lines for every user with an oxio_user_id
+
+    Each page of users is fetched from OXIO concurrently, diffed against
+    oxio_line_sync_state, and new or changed lines are written (each in a
+    savepoint) with LINE_SYNC_APPLY_BATCH lines per commit. Lines stored for a
+    user but no longer returned by OXIO are counted as missing, not deleted.
+    """
+
+    def __init__(self, get_db_connection, oxio_service,
+                 page_size: int = LINE_SYNC_PAGE_SIZE,
+                 concurrency: int = LINE_SYNC_CONCURRENCY,
+                 rate: float = LINE_SYNC_RATE,
+                 apply_batch: int = LINE_SYNC_APPLY_BATCH):
+        self.get_db_connection = get_db_connection
+        self.oxio_service = oxio_service
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.rate = rate
+        self.apply_batch = apply_batch
+
+        self._run_lock = threading.Lock()
+        self._progress_lock = threading.Lock()
+        self._progress: Dict[str, Any] = {'status': 'idle'}
+        self._stop = threading.Event()
+        self._scheduler = None
+        self._run_thread = None
+
+    # Progress
+
+    def _update_progress(self, **counts):
+        with self._progress_lock:
+            for key, value in counts.items():
+                self._progress[key] = self._progress.get(key, 0) + value
+
+    def get_progress(self) -> Dict:
+        """Current (or last) run's counters, throughput and completion estimate"""
+        with self._progress_lock:
+            progress = dict(self._progress)
+        if progress.get('started_monotonic'):
+            end = progress.pop('finished_monotonic', None) or time.monotonic()
+            elapsed = end - progress.pop('started_monotonic')
+            progress['elapsed_seconds'] = round(elapsed, 1)
+            progress['users_per_second'] = round(progress['users_scanned'] / elapsed, 2) if elapsed else 0.0
+            progress['lines_per_second'] = round(progress['lines_seen'] / elapsed, 2) if elapsed else 0.0
+            if progress.get('users_total'):
+                progress['percent_complete'] = round(100 * progress['users_scanned'] / progress['users_total'], 1)
+        return progress
+
+    # Steps
+
+    def _fetch_page(self, cur, after_id: int) -> List[Tuple]:
+        cur.execute("""
+            SELECT id, firebase_uid, oxio_user_id
+            FROM users
+            WHERE oxio_user_id IS NOT NULL AND oxio_user_id <> '' AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (after_id, self.page_size))
+        return cur.fetchall()
+
+    def _fetch_lines(self, users: List[Tuple], limiter: RateLimiter,
+                     executor: ThreadPoolExecutor) -> List[Tuple[Tuple, Optional[List[Dict]]]]:
+        """(user, lines) for each user; lines is None when OXIO could not be read"""
+        def fetch(user):
+            limiter.acquire()
+            response = self.oxio_service.get_user_lines(user[2])
+            if not response.get('success'):
+                # 404 means OXIO has no such user (so no lines), anything else is unknown
+                return [] if response.get('status_code') == 404 else None
+            data = response.get('data') or {}
+            return data if isinstance(data, list) else data.get('lines') or []
+
+        results = list(zip(users, executor.map(fetch, users)))
+        self._update_progress(fetch_errors=sum(1 for _, lines in results if lines is None))
+        return results
+
+    def _diff(self, cur, fetched: List[Tuple[Tuple, Optional[List[Dict]]]]) -> List[Tuple]:
+        """New or changed lines as (user, fields, line, hash); counts everything else"""
+        user_ids = [user[0] for user, lines in fetched if lines is not None]
+        stored = {}
+        if user_ids:
+            cur.execute("""
+                SELECT line_id, user_id, content_hash FROM oxio_line_sync_state WHERE user_id = ANY(%s)
+            """, (user_ids,))
+            stored = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+        changes = []
+        counts = {'lines_seen': 0, 'lines_new': 0, 'lines_changed': 0, 'lines_unchanged': 0,
+                  'lines_missing': 0, 'lines_invalid': 0}
+        for user, lines in fetched:
+            if lines is None:
+                continue
+            seen = set()
+            for line in lines:
+                counts['lines_seen'] += 1
+                fields = line_fields(line)
+                if not fields['line_id'] or not fields['iccid']:
+                    counts['lines_invalid'] += 1
+                    continue
+                seen.add(fields['line_id'])
+                digest = content_hash(user[0], fields)
+                previous = stored.get(fields['line_id'])
+                if previous is None:
+                    counts['lines_new'] += 1
+                elif previous[1] != digest:
+                    counts['lines_changed'] += 1
+                else:
+                    counts['lines_unchanged'] += 1
+                    continue
+                changes.append((user, fields, line, digest))
+            counts['lines_missing'] += sum(
+                1 for line_id, (owner, _) in stored.items() if owner == user[0] and line_id not in seen
+            )
+        self._update_progress(**counts)
+        return changes
+
+    def _apply(self, conn, changes: List[Tuple]):
+        """Write changed lines, apply_batch per transaction; a failing line is rolled back alone"""
+        for start in range(0, len(changes), self.apply_batch):
+            synced = []
+            errors = 0
+            with conn.cursor() as cur:
+                for (user_id, firebase_uid, _), fields, line, digest in changes[start:start + self.apply_batch]:
+                    try:
+                        cur.execute("SAVEPOINT line_sync")
+                        upsert_iccid(cur, firebase_uid, fields)
+                        upsert_activation(cur, firebase_uid, user_id, fields, line)
+                        ensure_recovered_purchase(cur, firebase_uid, user_id)
+                        cur.execute("RELEASE SAVEPOINT line_sync")
+                        synced.append((fields['line_id'], user_id, fields['iccid'], digest, datetime.now()))
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT line_sync")
+                        errors += 1
+                        print(f"❌ OXIO line sync failed for line {fields['line_id']}: {str(e)}")
+                if synced:
+                    execute_values(cur, UPSERT_SYNC_STATE_SQL, synced)
+            conn.commit()
+            self._update_progress(lines_written=len(synced), apply_errors=errors)
+
+    def _record_run(self, cur, run_id: int, status: str = 'running', error: Optional[str] = None):
+        progress = self.get_progress()
+        cur.execute("""
+            UPDATE oxio_line_sync_runs SET
+                status = %s, error = %s,
+                finished_at = CASE WHEN %s = 'running' THEN NULL ELSE CURRENT_TIMESTAMP END,
+                users_scanned = %s, lines_seen = %s, lines_new = %s, lines_changed = %s,
+                lines_unchanged = %s, lines_missing = %s, fetch_errors = %s, apply_errors = %s,
+                duration_ms = %s
+            WHERE id = %s
+        """, (status, error, status, progress.get('users_scanned', 0), progress.get('lines_seen', 0),
+              progress.get('lines_new', 0), progress.get('lines_changed', 0), progress.get('lines_unchanged', 0),
+              progress.get('lines_missing', 0), progress.get('fetch_errors', 0), progress.get('apply_errors', 0),
+              int(progress.get('elapsed_seconds', 0) * 1000), run_id))
+
+    # Runs
+
+    def run(self, trigger: str = 'manual') -> Dict:
+        """
+        Reconcile every user's OXIO lines once (skipped if another worker holds the lock)
+
+        Returns:
+            dict: Final progress counters, or skipped/error details
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return {'success': False, 'error': 'A line sync is already running in this process'}
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return {'success': False, 'error': 'Database unavailable'}
+
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_lock(%s)", (LINE_SYNC_LOCK_ID,))
+                    locked = cur.fetchone()[0]
+                conn.commit()
+                if not locked:
+                    return {'success': True, 'skipped': True, 'message': 'Line sync running on another worker'}
+
+                try:
+                    return self._run_locked(conn, trigger)
+                finally:
+                    conn.rollback()  # session advisory locks survive rollback
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(%s)", (LINE_SYNC_LOCK_ID,))
+                    conn.commit()
+        except Exception as e:
+            print(f"Error running OXIO line sync: {str(e)}")
+            return {'success': False, 'error': str(e)}
+        finally:
+            self._run_lock.release()
+
+    def _run_locked(self, conn, trigger: str) -> Dict:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM users WHERE oxio_user_id IS NOT NULL AND oxio_user_id <> ''")
+            users_total = cur.fetchone()[0]
+            cur.execute("INSERT INTO oxio_line_sync_runs (trigger) VALUES (%s) RETURNING id", (trigger,))
+            run_id = cur.fetchone()[0]
+        conn.commit()
+
+        with self._progress_lock:
+            self._progress = {
+                'status': 'running', 'run_id': run_id, 'trigger': trigger,
+                'started_at': datetime.now().isoformat(), 'started_monotonic': time.monotonic(),
+                'users_total': users_total, 'users_scanned': 0, 'lines_seen': 0, 'lines_new': 0,
+                'lines_changed': 0, 'lines_unchanged': 0, 'lines_missing': 0, 'lines_invalid': 0,
+                'lines_written': 0, 'fetch_errors': 0, 'apply_errors': 0
+            }
+        print(f"🔄 OXIO line sync {run_id} started ({trigger}, {users_total} users)")
+
+        status, error = 'completed', None
+        limiter = RateLimiter(self.rate)
+        after_id = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='oxio-line-sync') as executor:
+                while True:
+                    if self._stop.is_set():
+                        status = 'stopped'
+                        break
+                    if not self.oxio_service.is_available('lookup'):
+                        status, error = 'aborted', 'OXIO lookup circuit open'
+                        break
+
+                    with conn.cursor() as cur:
+                        users = self._fetch_page(cur, after_id)
+                    conn.commit()
+                    if not users:
+                        break
+
+                    fetched = self._fetch_lines(users, limiter, executor)
+                    with conn.cursor() as cur:
+                        changes = self._diff(cur, fetched)
+                    conn.commit()
+                    self._apply(conn, changes)
+
+                    after_id = users[-1][0]
+                    self._update_progress(users_scanned=len(users))
+                    with conn.cursor() as cur:
+                        self._record_run(cur, run_id)
+                    conn.commit()
+        except Exception as e:
+            conn.rollback()
+            status, error = 'failed', str(e)
+            print(f"❌ OXIO line sync {run_id} failed: {str(e)}")
+
+        with self._progress_lock:
+            self._progress.update(status=status, error=error, finished_at=datetime.now().isoformat(),
+                                  finished_monotonic=time.monotonic())
+        with conn.cursor() as cur:
+            self._record_run(cur, run_id, status, error)
+        conn.commit()
+
+        progress = self.get_progress()
+        print(f"✅ OXIO line sync {run_id} {status}: {progress['users_scanned']} users, "
+              f"{progress['lines_new']} new, {progress['lines_changed']} changed, "
+              f"{progress['lines_missing']} missing, {progress['fetch_errors']} fetch errors "
+              f"({progress['users_per_second']} users/sec)")
+        return dict(progress, success=status == 'completed')
+
+    def start_run(self, trigger: str = 'manual') -> bool:
+        """Run in a background thread; False if a run is already in progress here"""
+        if self._run_lock.locked() or (self._run_thread and self._run_thread.is_alive()):
+            return False
+        self._run_thread = threading.Thread(target=self.run, args=(trigger,), name="oxio-line-sync-run", daemon=True)
+        self._run_thread.start()
+        return True
+
+    def get_recent_runs(self, limit: int = 20) -> List[Dict]:
+        try:
+            with self.get_db_connection() as conn:
+                if not conn:
+                    return []
+
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT id, trigger, status, started_at, finished_at, users_scanned, lines_seen,
+                               lines_new, lines_changed, lines_unchanged, lines_missing,
+                               fetch_errors, apply_errors, duration_ms, error
+                        FROM oxio_line_sync_runs
+                        ORDER BY id DESC
+                        LIMIT %s
+                    """, (limit,))
+                    columns = [column[0] for column in cur.description]
+                    return [{
+                        column: value.isoformat() if isinstance(value, datetime) else value
+                        for column, value in zip(columns, row)
+                    } for row in cur.fetchall()]
+        except Exception as e:
+            print(f"Error getting OXIO line sync runs: {str(e)}")
+            return []
+
+    def start_scheduler(self, hour: int = LINE_SYNC_HOUR):
+        """Run the sync every night at hour:00 (server local time)"""
+        if self._scheduler and self._scheduler.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(seconds_until_hour(hour)):
+                self.run(trigger='nightly')
+
+        self._stop.clear()
+        self._scheduler = threading.Thread(target=run, name="oxio-line-sync", daemon=True)
+        self._scheduler.start()
+        atexit.register(self.stop_scheduler)
+
+    def stop_scheduler(self):
+        """Stop the scheduler; a run in progress stops after its current page"""
+        self._stop.set()
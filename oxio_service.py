@@ -1,10 +1,80 @@
 import os
 import requests
 import json
+import base64
 from typing import Dict, Any, Optional
 import time
-import socket
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from db_pool import get_db_connection
+from circuit_breaker import CircuitBreaker, Bulkhead
+from ttl_cache import TTLCache
+from oxio_telemetry import OXIOTelemetry
+
+# HTTP client configuration (overridable via environment)
+OXIO_POOL_SIZE = int(os.environ.get('OXIO_POOL_SIZE', 20))  # keep-alive connections to the OXIO host
+OXIO_MAX_RETRIES = int(os.environ.get('OXIO_MAX_RETRIES', 3))
+OXIO_RETRY_BACKOFF = float(os.environ.get('OXIO_RETRY_BACKOFF', 0.5))  # seconds, doubled per retry
+OXIO_RETRY_JITTER = 0.25  # up to this many random seconds added to each backoff
+OXIO_CONNECT_TIMEOUT = float(os.environ.get('OXIO_CONNECT_TIMEOUT', 5))
+OXIO_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Read timeouts (seconds) per endpoint; line activation provisions on the carrier side
+OXIO_ENDPOINT_TIMEOUTS = {
+    'activate_line': 60,
+    'create_user': 30,
+    'create_group': 30,
+    'create_plan': 30,
+    'subscriptions': 30,
+    'find_user': 15,
+    'get_user_lines': 15,
+    'get_sim': 15,
+    'search_numbers': 15,
+    'reference': 15,
+    'test': 10,
+}
+OXIO_DEFAULT_TIMEOUT = 30
+
+# Circuit breakers per endpoint family, so slow number searches don't block activations
+OXIO_ENDPOINT_FAMILIES = {
+    'activate_line': 'provisioning',
+    'create_user': 'provisioning',
+    'create_group': 'provisioning',
+    'create_plan': 'provisioning',
+    'subscriptions': 'provisioning',
+    'find_user': 'lookup',
+    'get_user_lines': 'lookup',
+    'get_sim': 'lookup',
+    'search_numbers': 'numbers',
+    'reference': 'numbers',
+}
+OXIO_BREAKER_FAILURE_RATE = float(os.environ.get('OXIO_BREAKER_FAILURE_RATE', 0.5))
+OXIO_BREAKER_MIN_CALLS = int(os.environ.get('OXIO_BREAKER_MIN_CALLS', 10))  # per rolling window
+OXIO_BREAKER_WINDOW = float(os.environ.get('OXIO_BREAKER_WINDOW', 60))  # seconds
+OXIO_BREAKER_OPEN_SECONDS = float(os.environ.get('OXIO_BREAKER_OPEN_SECONDS', 30))
+OXIO_SLOW_CALL_SECONDS = float(os.environ.get('OXIO_SLOW_CALL_SECONDS', 10))  # slower calls count as failures
+OXIO_MAX_CONCURRENT_CALLS = int(os.environ.get('OXIO_MAX_CONCURRENT_CALLS', 16))
+OXIO_BULKHEAD_WAIT = float(os.environ.get('OXIO_BULKHEAD_WAIT', 2))  # seconds to wait for a free slot
+
+# Reference data cache (ZIP codes, area codes, plans): seconds each resource stays fresh
+OXIO_CACHE_TTLS = {
+    'zip_codes': int(os.environ.get('OXIO_CACHE_TTL_ZIP_CODES', 86400)),
+    'zip_code': int(os.environ.get('OXIO_CACHE_TTL_ZIP_CODES', 86400)),
+    'area_codes': int(os.environ.get('OXIO_CACHE_TTL_AREA_CODES', 900)),  # includes number counts
+    'plans': int(os.environ.get('OXIO_CACHE_TTL_PLANS', 300)),
+}
+OXIO_CACHE_STALE_SECONDS = int(os.environ.get('OXIO_CACHE_STALE_SECONDS', 3600))  # served stale while refreshing
+OXIO_CACHE_MAX_ENTRIES = int(os.environ.get('OXIO_CACHE_MAX_ENTRIES', 2000))
+
+
+class OXIOUnavailableError(requests.exceptions.ConnectionError):
+    """OXIO call refused locally (circuit open or too many calls in flight)"""
+
+    def __init__(self, family: str, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.family = family
+        self.retry_after = retry_after
+
 
 class OXIOService:
     def __init__(self):
@@ -18,6 +88,10 @@ class OXIOService:
         if not self.base_url:
             self.base_url = "https://api-staging.brandvno.com"
             print("⚠️  WARNING: OXIO_ENVIRONMENT secret not set, using default staging URL")
+        elif self.base_url == 'simulator':
+            # Local OXIO simulator for offline tests and benchmarks (oxio_simulator.py)
+            from oxio_simulator import get_embedded_simulator
+            self.base_url = get_embedded_simulator().url
 
         # Debug information
         print(f"OXIO Service initialized:")
@@ -28,63 +102,127 @@ class OXIOService:
         if not self.api_key or not self.auth_token:
             raise ValueError("OXIO_API_KEY and OXIO_AUTH_TOKEN must be set in secrets")
 
-    def get_headers(self) -> Dict[str, str]:
-        """Get standard headers for OXIO API requests"""
-        import base64
-
-        # Create Basic Auth credentials: username = API_KEY, password = AUTH_TOKEN
+        # Create Basic Auth credentials once: username = API_KEY, password = AUTH_TOKEN
         credentials = f"{self.api_key}:{self.auth_token}"
         encoded_credentials = base64.b64encode(credentials.encode('utf-8')).decode('utf-8')
-
-        # Credentials configured and encoded for authorization
-
-        return {
+        self._headers = {
             'Content-Type': 'application/json',
             'Accept': 'application/json',
             'Authorization': f'Basic {encoded_credentials}',
             'User-Agent': 'DOTM-Platform/1.0'
         }
+        self.session = self._create_session()
+        self.breakers = {
+            family: CircuitBreaker(
+                f"oxio:{family}",
+                failure_rate=OXIO_BREAKER_FAILURE_RATE,
+                min_calls=OXIO_BREAKER_MIN_CALLS,
+                window_seconds=OXIO_BREAKER_WINDOW,
+                open_seconds=OXIO_BREAKER_OPEN_SECONDS,
+                slow_call_seconds=OXIO_SLOW_CALL_SECONDS
+            )
+            for family in sorted(set(OXIO_ENDPOINT_FAMILIES.values())) + ['other']
+        }
+        self.bulkhead = Bulkhead('oxio', OXIO_MAX_CONCURRENT_CALLS, OXIO_BULKHEAD_WAIT)
+        self.telemetry = OXIOTelemetry(get_db_connection)
+        self.reference_cache = TTLCache('oxio-reference', OXIO_CACHE_MAX_ENTRIES,
+                                        cacheable=lambda result: bool(result.get('success')))
 
-    def record_api_ping(self, endpoint_name: str, request_time_ms: int, response_time_ms: int, 
-                       status_code: int, destination_url: str, additional_data: Dict = None):
-        """Record OXIO API response time in the pings database"""
+    def _create_session(self) -> requests.Session:
+        """
+        Long-lived session so calls reuse keep-alive TLS connections. Idempotent
+        verbs are retried with jittered exponential backoff on connection errors
+        and 429/5xx; POSTs are only retried when the connection was never made.
+        """
+        retry = Retry(
+            total=OXIO_MAX_RETRIES,
+            connect=OXIO_MAX_RETRIES,
+            read=OXIO_MAX_RETRIES,
+            status=OXIO_MAX_RETRIES,
+            allowed_methods=frozenset({'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}),
+            status_forcelist=OXIO_RETRY_STATUSES,
+            backoff_factor=OXIO_RETRY_BACKOFF,
+            backoff_jitter=OXIO_RETRY_JITTER,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OXIO_POOL_SIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self._headers)
+        return session
+
+    def _request(self, method: str, endpoint: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request on the pooled session with the endpoint's timeout, through
+        the endpoint family's circuit breaker and the shared bulkhead. Raises
+        OXIOUnavailableError (a ConnectionError) instead of calling OXIO when
+        either refuses the call.
+        """
+        family = OXIO_ENDPOINT_FAMILIES.get(endpoint, 'other')
+        breaker = self.breakers[family]
+        if not breaker.allow():
+            self.telemetry.record(endpoint, None, error_class='CircuitOpen')
+            retry_after = breaker.retry_after()
+            raise OXIOUnavailableError(
+                family, f"OXIO {family} calls suspended: circuit open"
+                        + (f" (retry in {retry_after:.0f}s)" if retry_after is not None else ''),
+                retry_after
+            )
+        if not self.bulkhead.acquire():
+            breaker.cancel()
+            self.telemetry.record(endpoint, None, error_class='BulkheadFull')
+            raise OXIOUnavailableError(family, f"Too many OXIO calls in flight ({self.bulkhead.max_concurrent})")
+
+        kwargs.setdefault('timeout', (OXIO_CONNECT_TIMEOUT, OXIO_ENDPOINT_TIMEOUTS.get(endpoint, OXIO_DEFAULT_TIMEOUT)))
+        started = time.monotonic()
         try:
-            # Import here to avoid circular imports
-            from main import get_db_connection
-            
-            with get_db_connection() as conn:
-                if conn:
-                    with conn.cursor() as cur:
-                        # Use a fixed price for OXIO API pings (not applicable but required by table)
-                        api_response_indicator = 1.0  # Use 1.0 to indicate successful API response
-                        
-                        roundtrip_ms = request_time_ms + response_time_ms
-                        
-                        # Create additional data with OXIO-specific information
-                        ping_data = {
-                            'endpoint_name': endpoint_name,
-                            'status_code': status_code,
-                            'timestamp': datetime.now().isoformat(),
-                            'service': 'oxio_api',
-                            'hostname': socket.gethostname(),
-                            'user_id': 1  # Default user for system pings
-                        }
-                        
-                        if additional_data:
-                            ping_data.update(additional_data)
-                        
-                        cur.execute(
-                            """INSERT INTO token_price_pings 
-                               (token_price, request_time_ms, response_time_ms, roundtrip_ms, 
-                                ping_destination, source, additional_data)
-                               VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-                            (api_response_indicator, request_time_ms, response_time_ms, roundtrip_ms, 
-                             destination_url, 'oxio_api', json.dumps(ping_data))
-                        )
-                        conn.commit()
-                        print(f"Recorded OXIO API ping: {endpoint_name} (Request: {request_time_ms}ms, Status: {status_code})")
+            response = self.session.request(method, url, **kwargs)
         except Exception as e:
-            print(f"Error recording OXIO API ping: {str(e)}")
+            # Any failure must be recorded, or a half-open probe slot stays taken
+            elapsed = time.monotonic() - started
+            breaker.record(False, elapsed)
+            self.telemetry.record(endpoint, elapsed * 1000, error_class=type(e).__name__)
+            raise
+        finally:
+            self.bulkhead.release()
+        elapsed = time.monotonic() - started
+        breaker.record(response.status_code < 500 and response.status_code != 429, elapsed)
+        self.telemetry.record(endpoint, elapsed * 1000, status_code=response.status_code)
+        return response
+
+    def is_available(self, family: str = 'provisioning') -> bool:
+        """False while the family's circuit is open, so callers can defer work instead of failing"""
+        return self.breakers[family].state != 'open'
+
+    def get_health(self) -> Dict[str, Any]:
+        """Circuit breaker state per endpoint family and bulkhead usage"""
+        breakers = {family: breaker.get_stats() for family, breaker in self.breakers.items()}
+        return {
+            'healthy': all(stats['state'] == 'closed' for stats in breakers.values()),
+            'breakers': breakers,
+            'bulkhead': self.bulkhead.get_stats()
+        }
+
+    def _cached(self, key: tuple, loader) -> Dict[str, Any]:
+        """Reference lookup through the TTL cache; key[0] is the resource name"""
+        result, source = self.reference_cache.get(key, loader, OXIO_CACHE_TTLS[key[0]], OXIO_CACHE_STALE_SECONDS)
+        return dict(result, cache=source)
+
+    def flush_reference_cache(self, resource: str = None) -> int:
+        """Drop cached reference data (one resource or all); returns entries dropped"""
+        if resource:
+            return self.reference_cache.flush(lambda key: key[0] == resource)
+        return self.reference_cache.flush()
+
+    def request(self, method: str, path: str, endpoint: str = None, **kwargs) -> requests.Response:
+        """Call an OXIO API path (e.g. '/v3/subscriptions') without a dedicated method"""
+        return self._request(method, endpoint or path, f"{self.base_url}{path}", **kwargs)
+
+    def get_headers(self) -> Dict[str, str]:
+        """Get standard headers for OXIO API requests"""
+        return dict(self._headers)
 
     def _get_available_esim_iccid(self) -> str:
         """Get an available WARM eSIM ICCID for activation"""
@@ -94,7 +232,7 @@ class OXIOService:
             url = f"{self.base_url}/v3/sims/{test_iccid}"
             headers = self.get_headers()
             
-            response = requests.get(url, headers=headers, timeout=30)
+            response = self._request('GET', 'get_sim', url, headers=headers)
             
             if response.status_code == 200:
                 sim_data = response.json()
@@ -210,11 +348,10 @@ class OXIOService:
             print(f"OXIO API Request Headers (Auth masked): {dict(headers, **{'Authorization': '***'})}")
             print(f"OXIO API Request Payload: [REDACTED - contains sensitive eSIM data]")
 
-            response = requests.post(
+            response = self._request('POST', 'activate_line',
                 url,
                 headers=headers,
-                json=payload,
-                timeout=30
+                json=payload
             )
 
             print(f"OXIO API Response Status: {response.status_code}")
@@ -346,17 +483,14 @@ class OXIOService:
             # Track timing
             start_time = time.time() * 1000  # Convert to milliseconds
             
-            response = requests.post(
+            response = self._request('POST', 'create_group',
                 url,
                 headers=headers,
-                json=payload,
-                timeout=30
+                json=payload
             )
             
             end_time = time.time() * 1000
             total_time_ms = int(end_time - start_time)
-            request_time_ms = int(total_time_ms * 0.3)  # Estimate request preparation time
-            response_time_ms = int(total_time_ms * 0.7)  # Estimate response processing time
 
             print(f"OXIO Create Group Response Status: {response.status_code}")
             print(f"OXIO Create Group Response Headers: {dict(response.headers)}")
@@ -397,19 +531,6 @@ class OXIOService:
                 if not oxio_group_id:
                     oxio_group_id = response_data.get('groupId') or response_data.get('id') or response_data.get('group_id')
                 
-                # Record successful API ping
-                self.record_api_ping(
-                    endpoint_name='create_group',
-                    request_time_ms=request_time_ms,
-                    response_time_ms=response_time_ms,
-                    status_code=response.status_code,
-                    destination_url=url,
-                    additional_data={
-                        'group_name': group_name,
-                        'oxio_group_id': oxio_group_id,
-                        'group_status': response_data.get('group', {}).get('status') if isinstance(response_data.get('group'), dict) else None
-                    }
-                )
                 
                 return {
                     'success': True,
@@ -421,19 +542,6 @@ class OXIOService:
                     'response_time_ms': total_time_ms
                 }
             else:
-                # Record failed API ping
-                self.record_api_ping(
-                    endpoint_name='create_group',
-                    request_time_ms=request_time_ms,
-                    response_time_ms=response_time_ms,
-                    status_code=response.status_code,
-                    destination_url=url,
-                    additional_data={
-                        'group_name': group_name,
-                        'error': f'HTTP {response.status_code}',
-                        'error_message': response_data.get('message', 'Unknown error')
-                    }
-                )
                 
                 return {
                     'success': False,
@@ -509,11 +617,10 @@ class OXIOService:
             print(f"OXIO Create User Headers (Auth masked): {dict(headers, **{'Authorization': '***'})}")
             print(f"OXIO Create User Payload: [REDACTED - contains sensitive data]")
 
-            response = requests.post(
+            response = self._request('POST', 'create_user',
                 url,
                 headers=headers,
-                json=payload,
-                timeout=30
+                json=payload
             )
 
             print(f"OXIO Create User Response Status: {response.status_code}")
@@ -626,11 +733,10 @@ class OXIOService:
             print(f"OXIO Find User Headers (Auth masked): {dict(headers, **{'Authorization': '***'})}")
             print(f"OXIO Find User Params: {params}")
 
-            response = requests.get(
+            response = self._request('GET', 'find_user',
                 url,
                 headers=headers,
-                params=params,
-                timeout=30
+                params=params
             )
 
             print(f"OXIO Find User Response Status: {response.status_code}")
@@ -745,10 +851,9 @@ class OXIOService:
             print(f"OXIO Get User Lines URL: {url}")
             print(f"OXIO Get User Lines Headers (Auth masked): {dict(headers, **{'Authorization': '***'})}")
 
-            response = requests.get(
+            response = self._request('GET', 'get_user_lines',
                 url,
-                headers=headers,
-                timeout=30
+                headers=headers
             )
 
             print(f"OXIO Get User Lines Response Status: {response.status_code}")
@@ -857,11 +962,10 @@ class OXIOService:
 
             url = f"{self.base_url}/v3/plans/custom"
 
-            response = requests.post(
+            response = self._request('POST', 'create_plan',
                 url,
                 headers=headers,
-                json=payload,
-                timeout=30
+                json=payload
             )
 
             print(f"OXIO API Response Status: {response.status_code}")
@@ -949,7 +1053,11 @@ class OXIOService:
             }
 
     def test_plans_endpoint(self) -> Dict[str, Any]:
-        """Test the plans endpoint for health check"""
+        """Test the plans endpoint for health check (cached for OXIO_CACHE_TTLS['plans'])"""
+        return self._cached(('plans',), self._fetch_test_plans_endpoint)
+
+    def _fetch_test_plans_endpoint(self) -> Dict[str, Any]:
+        """Call the OXIO v3 root as a plans health check (uncached)"""
         try:
             # Use the v3 endpoint for health check
             test_url = f"{self.base_url}/v3"
@@ -960,7 +1068,7 @@ class OXIOService:
             headers_masked = dict(headers, **{'Authorization': auth_masked})
             print(f"Headers (Basic Auth masked): {headers_masked}")
 
-            response = requests.get(test_url, headers=headers, timeout=10)
+            response = self._request('GET', 'test', test_url, headers=headers)
             print(f"Plans endpoint response status: {response.status_code}")
             print(f"Plans endpoint content-type: {response.headers.get('content-type', 'Unknown')}")
 
@@ -1038,7 +1146,7 @@ class OXIOService:
             headers_masked = dict(headers, **{'Authorization': auth_masked})
             print(f"Headers (Basic Auth masked): {headers_masked}")
 
-            response = requests.get(test_url, headers=headers, timeout=10)
+            response = self._request('GET', 'test', test_url, headers=headers)
             print(f"SIM endpoint response status: {response.status_code}")
             print(f"SIM endpoint content-type: {response.headers.get('content-type', 'Unknown')}")
 
@@ -1098,7 +1206,7 @@ class OXIOService:
     
     def get_zip_codes(self, prefix: str = None, state: str = None, per_page: int = 50, page: int = 1) -> Dict[str, Any]:
         """
-        Get list of ZIP codes and their associated area codes
+        Get list of ZIP codes and their associated area codes (cached)
         
         Args:
             prefix: Optional ZIP code prefix to filter (e.g., "202" for all ZIP codes starting with 202)
@@ -1109,6 +1217,14 @@ class OXIOService:
         Returns:
             Dictionary containing ZIP codes with their area codes and availability
         """
+        prefix = (prefix or '').strip() or None
+        state = (state or '').strip().upper() or None
+        per_page, page = int(per_page), int(page)
+        return self._cached(('zip_codes', prefix, state, per_page, page),
+                            lambda: self._fetch_zip_codes(prefix, state, per_page, page))
+
+    def _fetch_zip_codes(self, prefix: str = None, state: str = None, per_page: int = 50, page: int = 1) -> Dict[str, Any]:
+        """Fetch a page of ZIP codes from OXIO (uncached)"""
         try:
             url = f"{self.base_url}/v3-internal/zip-codes"
             headers = self.get_headers()
@@ -1126,7 +1242,7 @@ class OXIOService:
             print(f"OXIO Get ZIP Codes URL: {url}")
             print(f"OXIO Get ZIP Codes Params: {params}")
             
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            response = self._request('GET', 'reference', url, headers=headers, params=params)
             
             print(f"OXIO Get ZIP Codes Response Status: {response.status_code}")
             
@@ -1154,22 +1270,19 @@ class OXIOService:
             }
     
     def get_zip_code_details(self, zip_code: str) -> Dict[str, Any]:
-        """
-        Get detailed information for a specific ZIP code including area codes and availability
-        
-        Args:
-            zip_code: 5-digit ZIP code to query
-            
-        Returns:
-            Dictionary containing ZIP code details with area codes and phone number availability
-        """
+        """Get detailed information for a specific ZIP code (cached)"""
+        zip_code = str(zip_code).strip()
+        return self._cached(('zip_code', zip_code), lambda: self._fetch_zip_code_details(zip_code))
+
+    def _fetch_zip_code_details(self, zip_code: str) -> Dict[str, Any]:
+        """Fetch one ZIP code's area codes and availability from OXIO (uncached)"""
         try:
             url = f"{self.base_url}/v3-internal/zip-codes/{zip_code}"
             headers = self.get_headers()
             
             print(f"OXIO Get ZIP Code Details URL: {url}")
             
-            response = requests.get(url, headers=headers, timeout=30)
+            response = self._request('GET', 'reference', url, headers=headers)
             
             print(f"OXIO Get ZIP Code Details Response Status: {response.status_code}")
             
@@ -1197,16 +1310,14 @@ class OXIOService:
             }
     
     def get_available_area_codes(self, zip_code: str = None, country_code: str = "US") -> Dict[str, Any]:
-        """
-        Get available area codes, optionally filtered by ZIP code
-        
-        Args:
-            zip_code: Optional ZIP code to filter area codes
-            country_code: Country code (default: US)
-            
-        Returns:
-            Dictionary containing available area codes with phone number counts
-        """
+        """Get available area codes, optionally filtered by ZIP code (cached)"""
+        zip_code = (zip_code or '').strip() or None
+        country_code = (country_code or 'US').strip().upper()
+        return self._cached(('area_codes', zip_code, country_code),
+                            lambda: self._fetch_available_area_codes(zip_code, country_code))
+
+    def _fetch_available_area_codes(self, zip_code: str = None, country_code: str = "US") -> Dict[str, Any]:
+        """Fetch available area codes from OXIO (uncached)"""
         try:
             url = f"{self.base_url}/v3/phone-numbers/available-area-codes"
             headers = self.get_headers()
@@ -1221,7 +1332,7 @@ class OXIOService:
             print(f"OXIO Get Available Area Codes URL: {url}")
             print(f"OXIO Get Available Area Codes Params: {params}")
             
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            response = self._request('GET', 'reference', url, headers=headers, params=params)
             
             print(f"OXIO Get Available Area Codes Response Status: {response.status_code}")
             
@@ -1284,7 +1395,7 @@ class OXIOService:
             print(f"OXIO Search Available Numbers URL: {url}")
             print(f"OXIO Search Available Numbers Params: {params}")
             
-            response = requests.get(url, headers=headers, params=params, timeout=30)
+            response = self._request('GET', 'search_numbers', url, headers=headers, params=params)
             
             print(f"OXIO Search Available Numbers Response Status: {response.status_code}")
             
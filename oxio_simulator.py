@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+OXIO API Simulator
+In-process stand-in for the OXIO endpoints OXIOService calls (end users, groups,
+lines, SIMs, subscriptions, plans, number search) with configurable latency,
+error injection and rate limiting, for offline tests and benchmarks
+
+Point OXIOService at it with OXIO_ENVIRONMENT=simulator (embedded, started on
+first use) or run it standalone and set OXIO_ENVIRONMENT to its URL:
+
+    python oxio_simulator.py --port 8099 --latency-ms 150 --error-rate 0.05
+"""
+
+import os
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import Counter, deque
+from typing import Any, Dict, Optional
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+# Defaults for the embedded simulator (OXIO_ENVIRONMENT=simulator)
+SIMULATOR_LATENCY_MS = float(os.environ.get('OXIO_SIMULATOR_LATENCY_MS', 0))
+SIMULATOR_JITTER_MS = float(os.environ.get('OXIO_SIMULATOR_JITTER_MS', 0))
+SIMULATOR_ERROR_RATE = float(os.environ.get('OXIO_SIMULATOR_ERROR_RATE', 0))  # share of calls answered 503
+SIMULATOR_RATE_LIMIT = float(os.environ.get('OXIO_SIMULATOR_RATE_LIMIT', 0))  # requests/second, 0 = unlimited
+
+USER_EXISTS_CODE = 6805  # OXIO error code for POST /v2/end-users with a known email
+BRAND_ID = '91f70e2e-d7a8-4e9c-afc6-30acc019ed67'
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class OXIOSimulator:
+    """
+    Stateful fake OXIO API
+
+    Latency, random 503s and a requests/second limit (429 with Retry-After)
+    apply to every call; inject() queues specific responses for a path prefix.
+    Users, groups, lines and subscriptions live in memory until reset().
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 rate_limit: float = 0, endpoint_latency_ms: Optional[Dict[str, float]] = None, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.endpoint_latency_ms = dict(endpoint_latency_ms or {})  # path prefix -> latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.url = None
+        self.reset()
+        self.app = self._create_app()
+
+    def reset(self):
+        """Forget all state, injected faults and counters"""
+        with self._lock:
+            self.users: Dict[str, Dict] = {}
+            self.users_by_email: Dict[str, str] = {}
+            self.groups: Dict[str, Dict] = {}
+            self.lines: Dict[str, Dict] = {}
+            self.subscriptions: Dict[str, Dict] = {}
+            self.faults = deque()
+            self.requests = Counter()
+            self.responses = Counter()
+            self._recent = deque()  # request timestamps in the last second, for the rate limit
+            self._next_number = 0
+
+    # Fault injection
+
+    def inject(self, path_prefix: str, status: int, body: Optional[Dict] = None,
+               count: int = 1, method: Optional[str] = None, delay_ms: float = 0):
+        """Answer the next `count` matching requests with status/body (after delay_ms)"""
+        with self._lock:
+            self.faults.append({'path': path_prefix, 'method': method, 'status': status,
+                                'body': body if body is not None else {'message': f'Injected {status}'},
+                                'remaining': count, 'delay_ms': delay_ms})
+
+    def _take_fault(self, method: str, path: str) -> Optional[Dict]:
+        with self._lock:
+            for fault in self.faults:
+                if path.startswith(fault['path']) and fault['method'] in (None, method):
+                    fault['remaining'] -= 1
+                    if fault['remaining'] <= 0:
+                        self.faults.remove(fault)
+                    return fault
+        return None
+
+    def _rate_limited(self) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and self._recent[0] <= now - 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate_limit:
+                return True
+            self._recent.append(now)
+        return False
+
+    def _delay(self, path: str):
+        latency = self.latency_ms
+        for prefix, value in self.endpoint_latency_ms.items():
+            if path.startswith(prefix):
+                latency = value
+                break
+        if self.jitter_ms:
+            latency += self._random.uniform(0, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    # Synthetic records
+
+    def _new_line(self, end_user_id: str, plan_id: Optional[str], group_id: Optional[str], area_code: str) -> Dict:
+        with self._lock:
+            self._next_number += 1
+            number = self._next_number
+        iccid = f"8901{self._random.randint(0, 10 ** 14 - 1):014d}"
+        line_id = str(uuid.uuid4())
+        return {
+            'lineId': line_id,
+            'status': 'ACTIVE',
+            'lineType': 'LINE_TYPE_MOBILITY',
+            'countryCode': 'US',
+            'endUserId': end_user_id,
+            'planId': plan_id,
+            'groupId': group_id,
+            'sim': {
+                'iccid': iccid,
+                'simType': 'EMBEDDED',
+                'countryCode': 'US',
+                'activationCode': f"LPA:1$consumer.e-sim.global${iccid}",
+                'activationUrl': f"https://esim.simulator.local/activate/{line_id}"
+            },
+            'phoneNumbers': [{'phoneNumber': f"+1{area_code}555{number % 10000:04d}"}]
+        }
+
+    def _create_app(self) -> Flask:
+        app = Flask('oxio_simulator')
+        sim = self
+
+        def error(status: int, message: str, code: Optional[int] = None, **extra):
+            body = dict(extra, message=message)
+            if code is not None:
+                body['code'] = code
+            return jsonify(body), status
+
+        @app.before_request
+        def simulate_network():
+            if request.path.startswith('/_sim'):
+                return None
+            with sim._lock:
+                sim.requests[f"{request.method} {request.path}"] += 1
+            if not request.headers.get('Authorization'):
+                return error(401, 'Missing credentials')
+            if sim._rate_limited():
+                response, status = error(429, 'Rate limit exceeded')
+                response.headers['Retry-After'] = '1'
+                return response, status
+
+            fault = sim._take_fault(request.method, request.path)
+            if fault:
+                time.sleep(fault['delay_ms'] / 1000)
+                return jsonify(fault['body']), fault['status']
+
+            sim._delay(request.path)
+            if sim.error_rate and sim._random.random() < sim.error_rate:
+                return error(503, 'Service temporarily unavailable (simulated)')
+            return None
+
+        @app.after_request
+        def count_response(response):
+            if not request.path.startswith('/_sim'):
+                with sim._lock:
+                    sim.responses[response.status_code] += 1
+            return response
+
+        # End users and groups
+
+        @app.route('/v2/end-users', methods=['POST'])
+        def create_end_user():
+            payload = request.get_json(silent=True) or {}
+            email = (payload.get('email') or '').lower()
+            with sim._lock:
+                if email and email in sim.users_by_email:
+                    return error(400, 'End user already exists', USER_EXISTS_CODE,
+                                 endUserId=sim.users_by_email[email])
+                end_user_id = str(uuid.uuid4())
+                user = dict(payload, endUserId=end_user_id, brandId=BRAND_ID)
+                sim.users[end_user_id] = user
+                if email:
+                    sim.users_by_email[email] = end_user_id
+            return jsonify(user), 201
+
+        @app.route('/v2/end-users', methods=['GET'])
+        def find_end_users():
+            email = (request.args.get('email') or '').lower()
+            with sim._lock:
+                users = [user for user in sim.users.values()
+                         if not email or (user.get('email') or '').lower() == email]
+            return jsonify({'endUsers': users})
+
+        @app.route('/v2/groups', methods=['POST'])
+        def create_group():
+            payload = request.get_json(silent=True) or {}
+            if payload.get('endUserId') not in sim.users:
+                return error(404, 'End user not found')
+            group = dict(payload, groupId=str(uuid.uuid4()), status='ACTIVE')
+            with sim._lock:
+                sim.groups[group['groupId']] = group
+            return jsonify({'group': group}), 201
+
+        # Lines, SIMs, subscriptions and plans
+
+        @app.route('/v3/lines/line', methods=['POST'])
+        def activate_line():
+            payload = request.get_json(silent=True) or {}
+            end_user_id = payload.get('endUserId') or (payload.get('endUser') or {}).get('endUserId')
+            if end_user_id not in sim.users:
+                return error(404, 'End user not found')
+            area_code = (payload.get('phoneNumberRequirements') or {}).get('preferredAreaCode') or '212'
+            line = sim._new_line(end_user_id, payload.get('planId'), payload.get('groupId'), area_code)
+            with sim._lock:
+                sim.lines[line['lineId']] = line
+            return jsonify(line), 201
+
+        @app.route('/v3/end-users/<end_user_id>/lines', methods=['GET'])
+        def user_lines(end_user_id):
+            if end_user_id not in sim.users:
+                return error(404, 'End user not found')
+            with sim._lock:
+                lines = [line for line in sim.lines.values() if line['endUserId'] == end_user_id]
+            return jsonify({'lines': lines})
+
+        @app.route('/v3/sims/<iccid>', methods=['GET'])
+        def get_sim(iccid):
+            with sim._lock:
+                line = next((line for line in sim.lines.values() if line['sim']['iccid'] == iccid), None)
+            return jsonify({'iccid': iccid, 'simType': 'EMBEDDED',
+                            'status': 'ACTIVE' if line else 'WARM', 'lineId': line and line['lineId']})
+
+        @app.route('/v3/subscriptions', methods=['POST'])
+        def create_subscription():
+            payload = request.get_json(silent=True) or {}
+            subscription = dict(payload, subscriptionId=str(uuid.uuid4()), status='ACTIVE')
+            with sim._lock:
+                sim.subscriptions[subscription['subscriptionId']] = subscription
+            return jsonify(subscription), 201
+
+        @app.route('/v3/plans/custom', methods=['POST'])
+        def create_custom_plan():
+            payload = request.get_json(silent=True) or {}
+            return jsonify(dict(payload, plan_id=f"sim_plan_{uuid.uuid4().hex[:12]}",
+                                profile_id=f"sim_profile_{uuid.uuid4().hex[:12]}")), 201
+
+        @app.route('/v3', methods=['GET'])
+        def root():
+            return jsonify({'service': 'oxio-simulator', 'version': 'v3', 'status': 'ok'})
+
+        # Reference data and number search
+
+        @app.route('/v3-internal/zip-codes', methods=['GET'])
+        def zip_codes():
+            prefix = request.args.get('prefix') or '100'
+            per_page = int(request.args.get('perPage', 50))
+            page = int(request.args.get('page', 1))
+            start = (page - 1) * per_page
+            codes = [f"{prefix}{n:0{5 - len(prefix)}d}"[:5] for n in range(start, start + min(per_page, 20))]
+            return jsonify({'zipCodes': [{'zipCode': code, 'state': request.args.get('state') or 'NY',
+                                          'areaCodes': ['212', '646']} for code in codes],
+                            'page': page, 'perPage': per_page})
+
+        @app.route('/v3-internal/zip-codes/<zip_code>', methods=['GET'])
+        def zip_code_details(zip_code):
+            if not zip_code.isdigit() or len(zip_code) != 5:
+                return error(404, f'ZIP code {zip_code} not found')
+            return jsonify({'zipCode': zip_code, 'state': 'NY',
+                            'areaCodes': [{'areaCode': '212', 'availableNumbers': 120},
+                                          {'areaCode': '646', 'availableNumbers': 80}]})
+
+        @app.route('/v3/phone-numbers/available-area-codes', methods=['GET'])
+        def available_area_codes():
+            return jsonify({'countryCode': request.args.get('countryCode', 'US'),
+                            'areaCodes': [{'areaCode': code, 'availableNumbers': count}
+                                          for code, count in (('212', 120), ('646', 80), ('917', 45))]})
+
+        @app.route('/v3/phone-numbers/available', methods=['GET'])
+        def available_numbers():
+            npa = request.args.get('npa') or request.args.get('areaCode') or '212'
+            nxx = request.args.get('nxx') or '555'
+            limit = int(request.args.get('limit', 10))
+            return jsonify({'phoneNumbers': [{'phoneNumber': f"+1{npa}{nxx}{n:04d}", 'npa': npa, 'nxx': nxx}
+                                             for n in range(min(limit, 100))]})
+
+        # Simulator control
+
+        @app.route('/_sim/stats', methods=['GET'])
+        def stats():
+            return jsonify(sim.get_stats())
+
+        @app.route('/_sim/config', methods=['POST'])
+        def configure():
+            payload = request.get_json(silent=True) or {}
+            for key in ('latency_ms', 'jitter_ms', 'error_rate', 'rate_limit'):
+                if key in payload:
+                    setattr(sim, key, float(payload[key]))
+            return jsonify(sim.get_stats())
+
+        @app.route('/_sim/faults', methods=['POST'])
+        def faults():
+            payload = request.get_json(silent=True) or {}
+            sim.inject(payload.get('path', '/'), int(payload.get('status', 500)), payload.get('body'),
+                       int(payload.get('count', 1)), payload.get('method'), float(payload.get('delay_ms', 0)))
+            return jsonify({'queued': len(sim.faults)})
+
+        @app.route('/_sim/reset', methods=['POST'])
+        def reset():
+            sim.reset()
+            return jsonify({'reset': True})
+
+        return app
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'latency_ms': self.latency_ms,
+                'jitter_ms': self.jitter_ms,
+                'error_rate': self.error_rate,
+                'rate_limit': self.rate_limit,
+                'users': len(self.users),
+                'lines': len(self.lines),
+                'subscriptions': len(self.subscriptions),
+                'pending_faults': len(self.faults),
+                'requests': dict(self.requests),
+                'responses': {str(status): count for status, count in self.responses.items()}
+            }
+
+    # Serving
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Serve on a background thread (port 0 picks a free port); returns the base URL"""
+        if self._server:
+            return self.url
+        self._server = make_server(host, port, self.app, threaded=True, request_handler=_QuietHandler)
+        self.url = f"http://{host}:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name='oxio-simulator', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server = None
+            self.url = None
+
+
+_embedded = None
+_embedded_lock = threading.Lock()
+
+
+def get_embedded_simulator() -> OXIOSimulator:
+    """Process-wide simulator for OXIO_ENVIRONMENT=simulator, started on first use"""
+    global _embedded
+    with _embedded_lock:
+        if _embedded is None:
+            _embedded = OXIOSimulator(latency_ms=SIMULATOR_LATENCY_MS, jitter_ms=SIMULATOR_JITTER_MS,
+                                      error_rate=SIMULATOR_ERROR_RATE, rate_limit=SIMULATOR_RATE_LIMIT)
+            _embedded.start()
+            print(f"🧪 OXIO simulator listening on {_embedded.url}")
+        return _embedded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OXIO API simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=SIMULATOR_LATENCY_MS)
+    parser.add_argument('--jitter-ms', type=float, default=SIMULATOR_JITTER_MS)
+    parser.add_argument('--error-rate', type=float, default=SIMULATOR_ERROR_RATE)
+    parser.add_argument('--rate-limit', type=float, default=SIMULATOR_RATE_LIMIT, help='requests/second')
+    args = parser.parse_args()
+
+    simulator = OXIOSimulator(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit)
+    print(f"OXIO simulator on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms}ms, error rate {args.error_rate}, rate limit {args.rate_limit or 'none'})")
+    print(f"Set OXIO_ENVIRONMENT=http://{args.host}:{args.port} to use it")
+    make_server(args.host, args.port, simulator.app, threaded=True).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
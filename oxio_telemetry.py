@@ -0,0 +1,264 @@
+"""
+OXIO API Telemetry
+Per-endpoint latency histograms, status code counts and error classes for OXIO
+calls, aggregated in memory and flushed in batches to oxio_api_metrics from a
+background thread, so OXIO calls never wait on a metrics commit
+"""
+
+import os
+import json
+import socket
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from psycopg2.extras import execute_values
+
+OXIO_METRICS_FLUSH_INTERVAL = float(os.environ.get('OXIO_METRICS_FLUSH_INTERVAL', 60))  # seconds per stored window
+
+# Log-linear buckets: exact below 2 * SUB_BUCKETS ms, then SUB_BUCKETS per power of two (~6% wide)
+SUB_BUCKETS = 16
+
+INSERT_METRICS_SQL = """
+    INSERT INTO oxio_api_metrics (
+        window_start, window_end, hostname, endpoint, calls, errors,
+        p50_ms, p90_ms, p99_ms, max_ms, total_ms, status_counts, error_classes, histogram
+    ) VALUES %s
+"""
+
+
+def bucket_index(value_ms: int) -> int:
+    if value_ms < 2 * SUB_BUCKETS:
+        return max(value_ms, 0)
+    shift = value_ms.bit_length() - SUB_BUCKETS.bit_length()
+    return SUB_BUCKETS * shift + (value_ms >> shift)
+
+
+def bucket_bounds(index: int) -> tuple:
+    """(lowest, highest) millisecond value that falls in the bucket"""
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index - SUB_BUCKETS * shift
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """HDR-style histogram of millisecond latencies with bounded relative error"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.count = 0
+        self.total_ms = 0
+        self.max_ms = 0
+
+    def record(self, value_ms: float):
+        value_ms = int(round(value_ms))
+        self.counts[bucket_index(value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def merge(self, other: 'LatencyHistogram'):
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, p: float) -> Optional[int]:
+        """Highest value equivalent to the p-th percentile (None when empty)"""
+        if not self.count:
+            return None
+        rank = max(int(round(p / 100 * self.count)), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(bucket_bounds(index)[1], self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, int]:
+        """{bucket lower bound (ms): count}, mergeable across rows by summing"""
+        return {str(bucket_bounds(index)[0]): count for index, count in sorted(self.counts.items())}
+
+
+class EndpointStats:
+    """
+    Counters for one endpoint; calls includes rejected ones (circuit open,
+    bulkhead full), while the histogram only covers calls that reached OXIO
+    """
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.rejected = 0
+        self.errors = 0
+        self.status_counts = Counter()
+        self.error_classes = Counter()
+
+    @property
+    def calls(self) -> int:
+        return self.histogram.count + self.rejected
+
+    def merge(self, other: 'EndpointStats'):
+        self.histogram.merge(other.histogram)
+        self.rejected += other.rejected
+        self.errors += other.errors
+        self.status_counts.update(other.status_counts)
+        self.error_classes.update(other.error_classes)
+
+    def summary(self) -> Dict:
+        calls, timed = self.calls, self.histogram.count
+        return {
+            'calls': calls,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'error_rate': round(self.errors / calls, 4) if calls else 0.0,
+            'mean_ms': round(self.histogram.total_ms / timed, 1) if timed else None,
+            'p50_ms': self.histogram.percentile(50),
+            'p90_ms': self.histogram.percentile(90),
+            'p99_ms': self.histogram.percentile(99),
+            'max_ms': self.histogram.max_ms if timed else None,
+            'status_counts': dict(self.status_counts),
+            'error_classes': dict(self.error_classes)
+        }
+
+
+class OXIOTelemetry:
+    """
+    In-memory OXIO call metrics with a periodic batch writer
+
+    record() only updates counters under a lock. Every flush_interval the
+    current window is swapped out and written as one oxio_api_metrics row per
+    endpoint; a failed write is merged back into the next window.
+    """
+
+    def __init__(self, get_db_connection, flush_interval: float = OXIO_METRICS_FLUSH_INTERVAL):
+        self.get_db_connection = get_db_connection
+        self.flush_interval = flush_interval
+        self.hostname = socket.gethostname()
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._window: Dict[str, EndpointStats] = {}
+        self._window_started = datetime.now()
+        self._totals: Dict[str, EndpointStats] = {}
+        self._started_at = datetime.now()
+
+        self._thread = None
+        self._stop = threading.Event()
+
+        # Writer metrics
+        self.flushes = 0
+        self.rows_written = 0
+        self.write_errors = 0
+        self.last_flush_at = None
+
+    def record(self, endpoint: str, latency_ms: Optional[float], status_code: Optional[int] = None,
+               error_class: Optional[str] = None):
+        """
+        Record one OXIO call; error_class is set when no response was received.
+        latency_ms None marks a call rejected before it was sent, which counts
+        as an error but stays out of the latency histogram.
+        """
+        with self._lock:
+            for stats_by_endpoint in (self._window, self._totals):
+                stats = stats_by_endpoint.get(endpoint)
+                if stats is None:
+                    stats = stats_by_endpoint[endpoint] = EndpointStats()
+                if latency_ms is None:
+                    stats.rejected += 1
+                else:
+                    stats.histogram.record(latency_ms)
+                if status_code is not None:
+                    stats.status_counts[str(status_code)] += 1
+                if error_class:
+                    stats.error_classes[error_class] += 1
+                if error_class or (status_code is not None and status_code >= 500):
+                    stats.errors += 1
+
+    def _rows(self, window: Dict[str, EndpointStats], started: datetime, ended: datetime) -> List[tuple]:
+        return [
+            (started, ended, self.hostname, endpoint, stats.calls, stats.errors,
+             stats.histogram.percentile(50), stats.histogram.percentile(90), stats.histogram.percentile(99),
+             stats.histogram.max_ms if stats.histogram.count else None, stats.histogram.total_ms,
+             json.dumps(dict(stats.status_counts)), json.dumps(dict(stats.error_classes)),
+             json.dumps(stats.histogram.to_dict()))
+            for endpoint, stats in sorted(window.items())
+        ]
+
+    def flush(self) -> int:
+        """Write the current window to oxio_api_metrics; returns rows written"""
+        with self._write_lock:
+            with self._lock:
+                window, started = self._window, self._window_started
+                self._window, self._window_started = {}, datetime.now()
+            if not window:
+                return 0
+
+            rows = self._rows(window, started, datetime.now())
+            try:
+                with self.get_db_connection() as conn:
+                    if not conn:
+                        raise RuntimeError("Database connection unavailable")
+                    with conn.cursor() as cur:
+                        execute_values(cur, INSERT_METRICS_SQL, rows)
+                    conn.commit()
+            except Exception as e:
+                print(f"Error writing OXIO API metrics: {str(e)}")
+                with self._lock:
+                    for endpoint, stats in window.items():
+                        self._window.setdefault(endpoint, EndpointStats()).merge(stats)
+                    self._window_started = started
+                    self.write_errors += 1
+                return 0
+
+            with self._lock:
+                self.flushes += 1
+                self.rows_written += len(rows)
+                self.last_flush_at = datetime.now().isoformat()
+            return len(rows)
+
+    def start(self):
+        """Start the flush thread (idempotent); registers a final flush at interpreter exit"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(self.flush_interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error in OXIO telemetry flusher: {str(e)}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="oxio-telemetry", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+        print(f"📈 OXIO telemetry flusher started (every {self.flush_interval:.0f}s)")
+
+    def close(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.flush()
+
+    def get_metrics(self) -> Dict:
+        """Live per-endpoint metrics since process start and for the unflushed window"""
+        with self._lock:
+            return {
+                'since': self._started_at.isoformat(),
+                'endpoints': {endpoint: stats.summary() for endpoint, stats in sorted(self._totals.items())},
+                'window': {
+                    'started_at': self._window_started.isoformat(),
+                    'endpoints': {endpoint: stats.summary() for endpoint, stats in sorted(self._window.items())}
+                },
+                'writer': {
+                    'running': bool(self._thread and self._thread.is_alive()),
+                    'flush_interval_seconds': self.flush_interval,
+                    'flushes': self.flushes,
+                    'rows_written': self.rows_written,
+                    'write_errors': self.write_errors,
+                    'last_flush_at': self.last_flush_at
+                }
+            }
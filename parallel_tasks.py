@@ -0,0 +1,82 @@
+"""
+Parallel Side Effects
+Runs independent side effects (database writes, token awards, emails, Stripe
+updates) concurrently on a shared bounded executor with per-task timeouts
+"""
+
+import os
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+# Executor configuration (overridable via environment)
+SIDE_EFFECT_MAX_WORKERS = int(os.environ.get('SIDE_EFFECT_MAX_WORKERS', 8))
+SIDE_EFFECT_TIMEOUT = float(os.environ.get('SIDE_EFFECT_TIMEOUT', 30))  # default per-task seconds
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Shared executor, created on first use so importing this module starts no threads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SIDE_EFFECT_MAX_WORKERS,
+                                           thread_name_prefix='side-effect')
+            atexit.register(_executor.shutdown, wait=False)
+        return _executor
+
+
+def run_parallel(tasks: Dict[str, Callable[[], Any]],
+                 timeout: float = SIDE_EFFECT_TIMEOUT,
+                 timeouts: Optional[Dict[str, float]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Run independent zero-argument callables concurrently and collect their outcomes
+
+    Each task gets its own deadline measured from submission (timeouts[name],
+    else timeout), so the call returns once the slowest task finishes or the
+    longest deadline passes. A task that times out keeps running in the
+    background; its late result is discarded, so tasks must record their own
+    effects if those matter after a timeout.
+
+    Args:
+        tasks: Task name -> callable
+        timeout: Default per-task timeout in seconds
+        timeouts: Optional per-task overrides
+
+    Returns:
+        dict: Task name -> {'success', 'result' or 'error', 'timed_out', 'elapsed_ms'}
+    """
+    timeouts = timeouts or {}
+    started = time.monotonic()
+    elapsed = {}
+
+    def timed(name, task):
+        task_started = time.monotonic()
+        try:
+            return task()
+        finally:
+            elapsed[name] = int((time.monotonic() - task_started) * 1000)
+
+    executor = get_executor()
+    futures = {name: executor.submit(timed, name, task) for name, task in tasks.items()}
+
+    results = {}
+    for name in sorted(futures, key=lambda n: timeouts.get(n, timeout)):
+        remaining = started + timeouts.get(name, timeout) - time.monotonic()
+        try:
+            result = futures[name].result(timeout=max(remaining, 0))
+            results[name] = {'success': True, 'result': result, 'timed_out': False}
+        except FutureTimeoutError:
+            results[name] = {'success': False, 'error': f"Timed out after {timeouts.get(name, timeout)}s",
+                             'timed_out': True}
+            print(f"⏱️ Side effect {name} timed out after {timeouts.get(name, timeout)}s")
+        except Exception as e:
+            results[name] = {'success': False, 'error': str(e), 'timed_out': False}
+            print(f"⚠️ Side effect {name} failed: {str(e)}")
+        results[name]['elapsed_ms'] = elapsed.get(name, int((time.monotonic() - started) * 1000))
+
+    return {name: results[name] for name in tasks}
@@ -0,0 +1,160 @@
+"""
+OXIO Plan Activation Ledger
+Records each paid plan activation (one per Stripe checkout session) before the
+OXIO subscription is created, so a retried webhook job never POSTs a second
+subscription for the same payment
+"""
+
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+from oxio_service import OXIOUnavailableError
+from stripe_webhook_queue import PermanentJobError
+
+# OXIO statuses that mean the subscription was not created, so the POST can be retried
+RETRYABLE_STATUS_CODES = (502, 503)
+
+
+class PlanActivationLedger:
+    """
+    oxio_plan_activations rows, keyed by Stripe checkout session
+
+    started:    the POST was sent (or its outcome is unknown)
+    subscribed: OXIO created the subscription; the purchase is not recorded yet
+    recorded:   purchase recorded, activation complete
+    rejected:   OXIO refused the subscription (4xx)
+    """
+
+    def __init__(self, get_db_connection):
+        self.get_db_connection = get_db_connection
+
+    def claim(self, session_id: str, firebase_uid: str, plan_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Insert a 'started' row for the session; returns None when this call
+        claimed it, else the existing activation
+        """
+        with self.get_db_connection() as conn:
+            if not conn:
+                raise RuntimeError("Database unavailable")
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO oxio_plan_activations (stripe_session_id, firebase_uid, oxio_plan_id, status)
+                    VALUES (%s, %s, %s, 'started')
+                    ON CONFLICT (stripe_session_id) DO NOTHING
+                    RETURNING stripe_session_id
+                """, (session_id, firebase_uid, plan_id))
+                if cur.fetchone():
+                    conn.commit()
+                    return None
+                cur.execute("""
+                    SELECT status, subscription_id, purchase_id, last_error
+                    FROM oxio_plan_activations
+                    WHERE stripe_session_id = %s
+                """, (session_id,))
+                row = cur.fetchone()
+                conn.commit()
+        return {'status': row[0], 'subscription_id': row[1], 'purchase_id': row[2], 'last_error': row[3]}
+
+    def mark(self, session_id: str, status: str, subscription_id: Optional[str] = None,
+             purchase_id: Optional[int] = None, error: Optional[str] = None):
+        """Move the activation to status; raises if the update cannot be saved"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                raise RuntimeError("Database unavailable")
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE oxio_plan_activations
+                    SET status = %s,
+                        subscription_id = COALESCE(%s, subscription_id),
+                        purchase_id = COALESCE(%s, purchase_id),
+                        last_error = %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE stripe_session_id = %s
+                """, (status, subscription_id, purchase_id, error, session_id))
+                conn.commit()
+
+    def release(self, session_id: str):
+        """Drop a 'started' claim whose POST never reached OXIO, so a retry may send it"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                raise RuntimeError("Database unavailable")
+            with conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM oxio_plan_activations
+                    WHERE stripe_session_id = %s AND status = 'started'
+                """, (session_id,))
+                conn.commit()
+
+
+def activate_plan_once(ledger: PlanActivationLedger, session_id: str, firebase_uid: str, plan_id: str,
+                       create_subscription: Callable[[], requests.Response],
+                       record_purchase: Callable[[Optional[str]], Optional[int]]) -> Dict[str, Any]:
+    """
+    Create the OXIO subscription for a checkout session at most once, then record the purchase
+
+    Failures the job queue may retry (raised as-is) are limited to calls that
+    never reached OXIO. An OXIO 4xx, an unknown POST outcome (read timeout,
+    500/504) and any failure after the subscription exists raise
+    PermanentJobError. Requeueing a dead job whose subscription was created
+    resumes at recording the purchase without a second POST.
+
+    Returns: {'subscription_id', 'purchase_id', 'resumed'}
+    """
+    existing = ledger.claim(session_id, firebase_uid, plan_id)
+    resumed = existing is not None
+    if existing and existing['status'] == 'recorded':
+        return {'subscription_id': existing['subscription_id'], 'purchase_id': existing['purchase_id'],
+                'resumed': True}
+    if existing and existing['status'] != 'subscribed':
+        raise PermanentJobError(
+            f"Plan activation for session {session_id} already {existing['status']} "
+            f"({existing['last_error'] or 'outcome unknown'}); check OXIO for a subscription, and delete "
+            f"its oxio_plan_activations row before requeueing to allow a new POST"
+        )
+
+    if existing:
+        subscription_id = existing['subscription_id']
+    else:
+        try:
+            response = create_subscription()
+        except (OXIOUnavailableError, requests.exceptions.ConnectTimeout):
+            # Refused locally or never connected: OXIO did not see the request
+            ledger.release(session_id)
+            raise
+        except Exception as e:
+            ledger.mark(session_id, 'started', error=f"POST failed: {str(e)}"[:1000])
+            raise PermanentJobError(f"OXIO subscription outcome unknown for session {session_id}: {str(e)}")
+
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            ledger.release(session_id)
+            raise Exception(f"OXIO plan activation unavailable ({response.status_code}): {response.text[:500]}")
+        if 400 <= response.status_code < 500:
+            ledger.mark(session_id, 'rejected', error=f"{response.status_code}: {response.text[:500]}")
+            raise PermanentJobError(f"OXIO rejected plan activation ({response.status_code}): {response.text[:500]}")
+        if response.status_code not in (200, 201):
+            ledger.mark(session_id, 'started', error=f"{response.status_code}: {response.text[:500]}")
+            raise PermanentJobError(f"OXIO plan activation outcome unknown ({response.status_code}): "
+                                    f"{response.text[:500]}")
+
+        try:
+            body = response.json()
+            subscription_id = body.get('id') or body.get('subscriptionId')
+            ledger.mark(session_id, 'subscribed', subscription_id=subscription_id)
+        except Exception as e:
+            raise PermanentJobError(f"OXIO subscription created for session {session_id} but not saved: {str(e)}")
+
+    try:
+        purchase_id = record_purchase(subscription_id)
+        if purchase_id is None:
+            raise RuntimeError("record_purchase returned no purchase ID")
+    except Exception as e:
+        raise PermanentJobError(f"OXIO subscription {subscription_id} created but purchase not recorded "
+                                f"(requeue the job to retry recording): {str(e)}")
+    try:
+        ledger.mark(session_id, 'recorded', purchase_id=purchase_id)
+    except Exception as e:
+        raise PermanentJobError(f"Purchase {purchase_id} recorded for subscription {subscription_id} but the "
+                                f"activation was not marked recorded; do not requeue: {str(e)}")
+
+    return {'subscription_id': subscription_id, 'purchase_id': purchase_id, 'resumed': resumed}
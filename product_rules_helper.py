@@ -1,9 +1,7 @@
 
 import os
 from typing import Optional, Dict, Any
-def get_db_connection():
-    from main import get_db_connection as main_get_db_connection
-    return main_get_db_connection()
+from db_pool import get_db_connection
 
 def get_product_rules(stripe_product_id: str) -> Optional[Dict[str, Any]]:
     """Retrieve product rules from database by Stripe product ID"""
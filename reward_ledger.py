@@ -0,0 +1,315 @@
+"""
+Batched DOTM Reward Ledger
+Records member and purchase rewards as pending rows in token_reward_ledger and
+settles them periodically as one multi-recipient mintBatch transaction per
+batch, instead of one admin transaction (and its gas overhead) per reward
+"""
+
+import os
+import atexit
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+REWARD_BATCHING_ENABLED = os.environ.get('REWARD_BATCHING_ENABLED', 'false').lower() == 'true'  # token must have mintBatch
+REWARD_BATCH_SIZE = int(os.environ.get('REWARD_BATCH_SIZE', 100))  # recipients per mintBatch transaction
+REWARD_MAX_DELAY_SECONDS = int(os.environ.get('REWARD_MAX_DELAY_SECONDS', 900))  # oldest pending reward waits at most this
+REWARD_SETTLE_POLL_SECONDS = int(os.environ.get('REWARD_SETTLE_POLL_SECONDS', 30))
+REWARD_MAX_ATTEMPTS = int(os.environ.get('REWARD_MAX_ATTEMPTS', 3))  # failed batches before a reward is marked failed
+REWARD_ORPHAN_SECONDS = 3600  # batch with no known transaction this long is flagged for review
+REWARD_SETTLE_LOCK_ID = 727073006  # pg_advisory lock so only one worker settles at a time
+
+
+class LedgerEntry(NamedTuple):
+    """A reward waiting in the ledger; exposes the same id/tx_hash/status as a TxHandle"""
+    id: str
+    tx_hash: Optional[str] = None
+    status: str = 'pending'
+
+    def __str__(self):
+        return f"{self.id} (pending batch settlement)"
+
+
+class RewardLedger:
+    """
+    Accumulates rewards and settles them in batches
+
+    A batch is due once REWARD_BATCH_SIZE distinct addresses are pending or
+    the oldest pending reward is REWARD_MAX_DELAY_SECONDS old. Rewards for the
+    same address are summed into one mintBatch entry. Claimed rows move to
+    'settling' in the same transaction that creates the batch, and only become
+    'settled' once its transaction is mined; failed or dropped batches put them
+    back to 'pending'. Status comes from the stored transaction, so batches
+    queued before a restart or by another instance still settle. A batch
+    whose transaction can no longer be found is marked 'orphaned' and its
+    rewards stay claimed, since resending could mint twice, until an admin
+    releases it with release_batch.
+
+    Args:
+        send_batch(addresses, amounts_wei, on_sent, record) -> handle with .id;
+            record=('token_reward_batches', batch_id) gets the transaction hash
+        get_tx_status(tx_id, tx_hash, record) -> queued | sent | mined | failed | dropped | unknown
+    """
+
+    def __init__(self, get_db_connection, send_batch: Callable, get_tx_status: Callable,
+                 batch_size: int = REWARD_BATCH_SIZE, max_delay: int = REWARD_MAX_DELAY_SECONDS):
+        self.get_db_connection = get_db_connection
+        self.send_batch = send_batch
+        self.get_tx_status = get_tx_status
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._thread = None
+        self._stop = threading.Event()
+
+    def accrue(self, eth_address: str, amount_wei: int, reason: str, user_id: Optional[int] = None,
+               reference: Optional[str] = None) -> Dict[str, Any]:
+        """Record a pending reward; reference makes it idempotent (e.g. 'new_member:<address>')"""
+        if not eth_address or amount_wei <= 0:
+            return {'success': False, 'error': 'Reward needs an address and a positive amount'}
+        with self.get_db_connection() as conn:
+            if not conn:
+                return {'success': False, 'error': 'Database unavailable'}
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO token_reward_ledger (eth_address, user_id, amount_wei, reason, reference)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (reference) DO NOTHING
+                    RETURNING id
+                """, (eth_address, user_id, amount_wei, reason, reference))
+                row = cur.fetchone()
+            conn.commit()
+        if not row:
+            return {'success': False, 'error': 'Reward already recorded'}
+        return {'success': True, 'entry': LedgerEntry(f"reward_{row[0]}")}
+
+    def settle(self, force: bool = False) -> Optional[int]:
+        """Claim one due batch and queue its mintBatch transaction; returns the batch id"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                return None
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (REWARD_SETTLE_LOCK_ID,))
+                if not cur.fetchone()[0]:
+                    conn.rollback()
+                    return None
+
+                cur.execute("""
+                    SELECT COUNT(DISTINCT eth_address), EXTRACT(EPOCH FROM NOW() - MIN(created_at))
+                    FROM token_reward_ledger WHERE status = 'pending'
+                """)
+                addresses, oldest_age = cur.fetchone()
+                if not addresses or (not force and addresses < self.batch_size
+                                     and float(oldest_age or 0) < self.max_delay):
+                    conn.rollback()
+                    return None
+
+                cur.execute("""
+                    INSERT INTO token_reward_batches (status, recipients, rewards, total_wei)
+                    VALUES ('sending', 0, 0, 0) RETURNING id
+                """)
+                batch_id = cur.fetchone()[0]
+                cur.execute("""
+                    WITH recipients AS (
+                        SELECT eth_address FROM token_reward_ledger
+                        WHERE status = 'pending'
+                        GROUP BY eth_address
+                        ORDER BY MIN(created_at)
+                        LIMIT %s
+                    )
+                    UPDATE token_reward_ledger l
+                    SET status = 'settling', batch_id = %s, attempts = l.attempts + 1
+                    FROM recipients r
+                    WHERE l.eth_address = r.eth_address AND l.status = 'pending'
+                    RETURNING l.eth_address, l.amount_wei
+                """, (self.batch_size, batch_id))
+                claimed = cur.fetchall()
+
+                totals: Dict[str, int] = {}
+                for eth_address, amount_wei in claimed:
+                    totals[eth_address] = totals.get(eth_address, 0) + int(amount_wei)
+                cur.execute("""
+                    UPDATE token_reward_batches SET recipients = %s, rewards = %s, total_wei = %s WHERE id = %s
+                """, (len(totals), len(claimed), sum(totals.values()), batch_id))
+            conn.commit()
+
+        try:
+            handle = self.send_batch(list(totals), list(totals.values()), self._on_sent(batch_id),
+                                     ('token_reward_batches', batch_id))
+        except Exception as e:
+            print(f"❌ Reward batch {batch_id} could not be queued: {str(e)}")
+            self._release(batch_id, str(e))
+            return batch_id
+
+        self._execute("UPDATE token_reward_batches SET tx_id = %s WHERE id = %s", (handle.id, batch_id))
+        print(f"🪙 Reward batch {batch_id} queued: {len(claimed)} rewards to {len(totals)} addresses ({handle.id})")
+        return batch_id
+
+    def _on_sent(self, batch_id: int):
+        def on_sent(tx_hash, previous_hash):
+            self._execute("UPDATE token_reward_batches SET status = 'sent', tx_hash = %s WHERE id = %s",
+                          (tx_hash, batch_id))
+        return on_sent
+
+    def _execute(self, sql: str, params: tuple):
+        with self.get_db_connection() as conn:
+            if conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                conn.commit()
+
+    def _release(self, batch_id: int, error: str):
+        """Fail a batch and return its rewards to pending (or failed after REWARD_MAX_ATTEMPTS)"""
+        with self.get_db_connection() as conn:
+            if conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE token_reward_ledger
+                        SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END, batch_id = NULL
+                        WHERE batch_id = %s AND status = 'settling'
+                    """, (REWARD_MAX_ATTEMPTS, batch_id))
+                    cur.execute("UPDATE token_reward_batches SET status = 'failed', error = %s WHERE id = %s",
+                                (error[:1000], batch_id))
+                conn.commit()
+
+    def _settle_batch(self, batch_id: int):
+        with self.get_db_connection() as conn:
+            if conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE token_reward_ledger SET status = 'settled', settled_at = NOW()
+                        WHERE batch_id = %s AND status = 'settling'
+                    """, (batch_id,))
+                    cur.execute("""
+                        UPDATE token_reward_batches SET status = 'settled', settled_at = NOW() WHERE id = %s
+                    """, (batch_id,))
+                conn.commit()
+
+    def reconcile(self) -> Dict[str, int]:
+        """
+        Settle mined batches and release failed ones; returns counts by outcome.
+        Holds the settle lock, so it never races settle() or another worker.
+        """
+        outcomes = {'settled': 0, 'released': 0, 'orphaned': 0}
+        with self.get_db_connection() as conn:
+            if not conn:
+                return outcomes
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (REWARD_SETTLE_LOCK_ID,))
+                if not cur.fetchone()[0]:
+                    conn.rollback()
+                    return outcomes
+                cur.execute("""
+                    SELECT id, tx_id, tx_hash, EXTRACT(EPOCH FROM NOW() - created_at)
+                    FROM token_reward_batches WHERE status IN ('sending', 'sent') ORDER BY id
+                """)
+                batches = cur.fetchall()
+
+            try:
+                for batch_id, tx_id, tx_hash, age in batches:
+                    status = self.get_tx_status(tx_id, tx_hash, ('token_reward_batches', batch_id))
+                    if status == 'mined':
+                        self._settle_batch(batch_id)
+                        outcomes['settled'] += 1
+                    elif status in ('failed', 'dropped'):
+                        self._release(batch_id, f"Transaction {status}")
+                        outcomes['released'] += 1
+                    elif status == 'unknown' and float(age or 0) >= REWARD_ORPHAN_SECONDS:
+                        self._execute("UPDATE token_reward_batches SET status = 'orphaned', error = %s WHERE id = %s",
+                                      ('Transaction not found; rewards held for review', batch_id))
+                        print(f"⚠️ Reward batch {batch_id} orphaned: no transaction found for {tx_id or 'unqueued batch'}")
+                        outcomes['orphaned'] += 1
+            finally:
+                conn.rollback()  # releases the settle lock
+        return outcomes
+
+    def release_batch(self, batch_id: int) -> Dict[str, Any]:
+        """
+        Admin action for an orphaned batch: settle it if its transaction turns
+        out to be mined, otherwise put its rewards back to pending so the next
+        batch mints them
+        """
+        with self.get_db_connection() as conn:
+            if not conn:
+                return {'success': False, 'error': 'Database unavailable'}
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (REWARD_SETTLE_LOCK_ID,))
+                if not cur.fetchone()[0]:
+                    conn.rollback()
+                    return {'success': False, 'error': 'Settlement in progress; try again'}
+                cur.execute("SELECT status, tx_id, tx_hash FROM token_reward_batches WHERE id = %s", (batch_id,))
+                row = cur.fetchone()
+
+            try:
+                if not row or row[0] != 'orphaned':
+                    return {'success': False, 'error': 'Batch not found or not orphaned'}
+                status = self.get_tx_status(row[1], row[2], ('token_reward_batches', batch_id))
+                if status == 'mined':
+                    self._settle_batch(batch_id)
+                    return {'success': True, 'batch_id': batch_id, 'outcome': 'settled'}
+                if status in ('queued', 'sent'):
+                    self._execute("UPDATE token_reward_batches SET status = 'sent', error = NULL WHERE id = %s",
+                                  (batch_id,))
+                    return {'success': True, 'batch_id': batch_id, 'outcome': 'pending_transaction'}
+
+                self._execute("""
+                    UPDATE token_reward_ledger SET status = 'pending', batch_id = NULL
+                    WHERE batch_id = %s AND status = 'settling'
+                """, (batch_id,))
+                self._execute("UPDATE token_reward_batches SET status = 'released', error = %s WHERE id = %s",
+                              (f"Released by admin (transaction {status})", batch_id))
+                print(f"🔓 Reward batch {batch_id} released; its rewards return to pending")
+                return {'success': True, 'batch_id': batch_id, 'outcome': 'released'}
+            finally:
+                conn.rollback()  # releases the settle lock
+
+    def start(self, poll_seconds: int = REWARD_SETTLE_POLL_SECONDS):
+        """Reconcile and settle due batches in the background (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(poll_seconds):
+                try:
+                    self.reconcile()
+                    self.settle()
+                except Exception as e:
+                    print(f"Error settling reward batches: {str(e)}")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="reward-ledger", daemon=True)
+        self._thread.start()
+        atexit.register(self._stop.set)
+
+    def get_pending_balance(self, eth_address: str) -> Dict[str, Any]:
+        """Rewards recorded for an address but not yet minted"""
+        balance = {'pending_wei': 0, 'settling_wei': 0, 'pending_rewards': 0}
+        with self.get_db_connection() as conn:
+            if conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT status, COALESCE(SUM(amount_wei), 0), COUNT(*) FROM token_reward_ledger
+                        WHERE eth_address = %s AND status IN ('pending', 'settling')
+                        GROUP BY status
+                    """, (eth_address,))
+                    for status, amount_wei, count in cur.fetchall():
+                        balance[f"{status}_wei"] = int(amount_wei)
+                        balance['pending_rewards'] += count
+        total = balance['pending_wei'] + balance['settling_wei']
+        balance['unminted_dotm'] = total / 10 ** 18
+        return balance
+
+    def get_recent_batches(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self.get_db_connection() as conn:
+            if not conn:
+                return []
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, status, recipients, rewards, total_wei, tx_id, tx_hash, error, created_at, settled_at
+                    FROM token_reward_batches ORDER BY id DESC LIMIT %s
+                """, (limit,))
+                columns = [column[0] for column in cur.description]
+                batches = [dict(zip(columns, row)) for row in cur.fetchall()]
+        for batch in batches:
+            batch['total_wei'] = str(batch['total_wei'])
+            for key in ('created_at', 'settled_at'):
+                batch[key] = batch[key].isoformat() if batch[key] else None
+        return batches
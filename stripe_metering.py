@@ -6,7 +6,7 @@ from datetime import datetime
 # Initialize Stripe
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
 
-def report_data_usage(customer_id, megabytes_used, timestamp=None):
+def report_data_usage(customer_id, megabytes_used, timestamp=None, identifier=None):
     """
     Report data usage to Stripe for metering and billing
     
@@ -14,6 +14,8 @@ def report_data_usage(customer_id, megabytes_used, timestamp=None):
         customer_id (str): Stripe customer ID
         megabytes_used (float): Amount of data used in megabytes
         timestamp (datetime, optional): When the usage occurred. Defaults to now.
+        identifier (str, optional): Unique meter event identifier; Stripe ignores
+            repeats of the same identifier, making retries idempotent
     
     Returns:
         dict: Result of the usage report
@@ -22,16 +24,20 @@ def report_data_usage(customer_id, megabytes_used, timestamp=None):
         if not timestamp:
             timestamp = datetime.now()
         
-        # Report usage event to Stripe
-        event = stripe.billing.MeterEvent.create(
-            event_name='data_usage',
-            payload={
+        event_params = {
+            'event_name': 'data_usage',
+            'payload': {
                 'stripe_customer_id': customer_id,
                 'megabytes_used': str(megabytes_used),
                 'timestamp': timestamp.isoformat()
             },
-            timestamp=int(timestamp.timestamp())
-        )
+            'timestamp': int(timestamp.timestamp())
+        }
+        if identifier:
+            event_params['identifier'] = identifier
+        
+        # Report usage event to Stripe
+        event = stripe.billing.MeterEvent.create(**event_params)
         
         print(f"Reported {megabytes_used} MB usage for customer {customer_id}")
         return {
@@ -8,20 +8,10 @@ Features OFF by default: Network Scans, voLTE (w/ HD Voice), Global Wi-Fi Callin
 
 import os
 import stripe
-import psycopg2
-from contextlib import contextmanager
+from db_pool import get_db_connection
 
 # Initialize Stripe
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
-database_url = os.environ.get('DATABASE_URL')
-
-@contextmanager
-def get_db_connection():
-    connection = psycopg2.connect(database_url)
-    try:
-        yield connection
-    finally:
-        connection.close()
 
 def create_network_features_table():
     """Create the network_features table if it doesn't exist"""
@@ -0,0 +1,365 @@
+"""
+Stripe Webhook Job Queue
+Durable Postgres-backed queue so the webhook endpoint only verifies, records and
+enqueues events; worker threads claim jobs with SKIP LOCKED and retry with backoff.
+An in-process LRU of recorded event IDs answers Stripe's duplicate deliveries
+without a database round-trip.
+"""
+
+import os
+import json
+import uuid
+import socket
+import atexit
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+# Queue configuration (overridable via environment)
+WEBHOOK_WORKER_THREADS = int(os.environ.get('STRIPE_WEBHOOK_WORKER_THREADS', 2))
+WEBHOOK_JOB_MAX_ATTEMPTS = int(os.environ.get('STRIPE_WEBHOOK_MAX_ATTEMPTS', 8))
+WEBHOOK_RETRY_BASE_SECONDS = int(os.environ.get('STRIPE_WEBHOOK_RETRY_BASE', 30))  # doubled per attempt
+WEBHOOK_RETRY_MAX_SECONDS = 3600
+WEBHOOK_JOB_LOCK_TIMEOUT = int(os.environ.get('STRIPE_WEBHOOK_LOCK_TIMEOUT', 900))  # seconds before a running job is reclaimed
+WEBHOOK_POLL_INTERVAL = 2  # seconds between polls when the queue is empty
+PROCESSED_EVENT_CACHE_SIZE = int(os.environ.get('STRIPE_EVENT_CACHE_SIZE', 10000))  # event IDs kept in memory
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'dead')
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help; the job goes straight to dead"""
+
+
+class DeferJobError(Exception):
+    """
+    Raised by a job handler when a dependency is known to be down (e.g. an open
+    circuit breaker); the job is requeued after `delay` seconds without using
+    up one of its attempts
+    """
+
+    def __init__(self, message: str, delay: int = WEBHOOK_RETRY_BASE_SECONDS):
+        super().__init__(message)
+        self.delay = delay
+
+
+def retry_delay(attempts: int) -> int:
+    """Seconds to wait before the next attempt after `attempts` failures"""
+    return min(WEBHOOK_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), WEBHOOK_RETRY_MAX_SECONDS)
+
+
+class ProcessedEventCache:
+    """
+    Bounded LRU of event IDs already committed to processed_stripe_events
+
+    Only add IDs after the insert commits (or the insert found a conflict), so
+    a hit is always a safe duplicate. Misses fall through to the table, which
+    stays the source of truth across processes and restarts.
+    """
+
+    def __init__(self, max_size: int = PROCESSED_EVENT_CACHE_SIZE):
+        self.max_size = max_size
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, event_id: str) -> bool:
+        with self._lock:
+            if event_id in self._events:
+                self._events.move_to_end(event_id)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, event_id: str):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._events[event_id] = True
+            self._events.move_to_end(event_id)
+            while len(self._events) > self.max_size:
+                self._events.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._events),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+class StripeWebhookQueue:
+    """
+    Queue of verified Stripe events awaiting processing
+
+    Jobs move queued -> running -> succeeded, or back to queued with an
+    exponential backoff on failure, and to dead once attempts run out (or on
+    PermanentJobError). Dead jobs stay visible to admins and can be requeued.
+    """
+
+    def __init__(self, get_db_connection, handler: Callable[[Dict], Optional[Dict]]):
+        self.get_db_connection = get_db_connection
+        self.handler = handler
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._workers = []
+
+    def enqueue(self, cur, event_id: str, event_type: str, payload: Dict) -> bool:
+        """
+        Add an event job using the caller's cursor, so it commits atomically with
+        the processed_stripe_events insert. Returns False if already queued.
+        """
+        cur.execute("""
+            INSERT INTO stripe_webhook_jobs (event_id, event_type, payload, max_attempts)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (event_id) DO NOTHING
+        """, (event_id, event_type, json.dumps(payload), WEBHOOK_JOB_MAX_ATTEMPTS))
+        return cur.rowcount == 1
+
+    def notify(self):
+        """Wake an idle worker in this process after a commit"""
+        self._wakeup.set()
+
+    def claim_job(self) -> Optional[Dict]:
+        """
+        Claim the oldest due job, or reclaim one whose worker stopped responding
+
+        Each claim gets its own lock token so a stale thread can never finish a
+        job another thread has since reclaimed. Stale jobs that already used up
+        their attempts go to dead instead of being reclaimed again.
+        """
+        lock_token = f"{self.worker_id}:{uuid.uuid4().hex}"
+        with self.get_db_connection() as conn:
+            if not conn:
+                return None
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    WITH expired AS (
+                        UPDATE stripe_webhook_jobs
+                        SET status = 'dead',
+                            last_error = 'Worker stopped responding on final attempt',
+                            locked_by = NULL,
+                            locked_at = NULL,
+                            completed_at = CURRENT_TIMESTAMP,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE status = 'running'
+                            AND locked_at < CURRENT_TIMESTAMP - (%s * INTERVAL '1 second')
+                            AND attempts >= max_attempts
+                        RETURNING event_id
+                    )
+                    UPDATE processed_stripe_events
+                    SET processing_result = 'dead: Worker stopped responding on final attempt'
+                    WHERE event_id IN (SELECT event_id FROM expired)
+                """, (WEBHOOK_JOB_LOCK_TIMEOUT,))
+
+                cur.execute("""
+                    UPDATE stripe_webhook_jobs
+                    SET status = 'running',
+                        attempts = attempts + 1,
+                        locked_by = %s,
+                        locked_at = CURRENT_TIMESTAMP,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM stripe_webhook_jobs
+                        WHERE (status = 'queued' AND run_after <= CURRENT_TIMESTAMP)
+                            OR (status = 'running' AND locked_at < CURRENT_TIMESTAMP - (%s * INTERVAL '1 second'))
+                        ORDER BY run_after, id
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, event_id, event_type, payload, attempts, max_attempts
+                """, (lock_token, WEBHOOK_JOB_LOCK_TIMEOUT))
+                row = cur.fetchone()
+                conn.commit()
+
+        if not row:
+            return None
+        payload = row[3] if isinstance(row[3], dict) else json.loads(row[3])
+        return {
+            'id': row[0],
+            'event_id': row[1],
+            'event_type': row[2],
+            'payload': payload,
+            'attempts': row[4],
+            'max_attempts': row[5],
+            'lock_token': lock_token
+        }
+
+    def _finish_job(self, job: Dict, status: str, error: Optional[str] = None,
+                    result: Optional[Dict] = None, delay: int = 0, refund_attempt: bool = False):
+        with self.get_db_connection() as conn:
+            if not conn:
+                return
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE stripe_webhook_jobs
+                    SET status = %s,
+                        last_error = %s,
+                        result = %s,
+                        run_after = CURRENT_TIMESTAMP + (%s * INTERVAL '1 second'),
+                        locked_by = NULL,
+                        locked_at = NULL,
+                        attempts = attempts - %s,
+                        completed_at = CASE WHEN %s IN ('succeeded', 'dead') THEN CURRENT_TIMESTAMP END,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND locked_by = %s
+                """, (status, error, json.dumps(result) if result is not None else None,
+                      delay, 1 if refund_attempt else 0, status, job['id'], job['lock_token']))
+
+                if status in ('succeeded', 'dead'):
+                    cur.execute("""
+                        UPDATE processed_stripe_events SET processing_result = %s WHERE event_id = %s
+                    """, (status if status == 'succeeded' else f"dead: {error}"[:1000], job['event_id']))
+                conn.commit()
+
+    def process_job(self, job: Dict) -> str:
+        """Run the handler for one claimed job and record the outcome; returns the new status"""
+        try:
+            result = self.handler(job['payload'])
+            self._finish_job(job, 'succeeded', result=result or {})
+            print(f"✅ Stripe webhook job {job['id']} ({job['event_type']} {job['event_id']}) succeeded")
+            return 'succeeded'
+
+        except DeferJobError as e:
+            delay = max(int(e.delay), 1)
+            self._finish_job(job, 'queued', error=str(e), delay=delay, refund_attempt=True)
+            print(f"⏸️ Stripe webhook job {job['id']} deferred {delay}s: {str(e)}")
+            return 'queued'
+
+        except PermanentJobError as e:
+            self._finish_job(job, 'dead', error=str(e))
+            print(f"❌ Stripe webhook job {job['id']} failed permanently: {str(e)}")
+            return 'dead'
+
+        except Exception as e:
+            traceback.print_exc()
+            if job['attempts'] >= job['max_attempts']:
+                self._finish_job(job, 'dead', error=str(e))
+                print(f"❌ Stripe webhook job {job['id']} dead after {job['attempts']} attempts: {str(e)}")
+                return 'dead'
+
+            delay = retry_delay(job['attempts'])
+            self._finish_job(job, 'queued', error=str(e), delay=delay)
+            print(f"⚠️ Stripe webhook job {job['id']} attempt {job['attempts']} failed, retrying in {delay}s: {str(e)}")
+            return 'queued'
+
+    def run_once(self) -> bool:
+        """Claim and process one job; returns False when nothing was due"""
+        job = self.claim_job()
+        if not job:
+            return False
+        self.process_job(job)
+        return True
+
+    def start_workers(self, threads: int = WEBHOOK_WORKER_THREADS):
+        """Start worker threads that drain the queue"""
+        if any(worker.is_alive() for worker in self._workers):
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    if self.run_once():
+                        continue
+                except Exception as e:
+                    print(f"Error in Stripe webhook worker: {str(e)}")
+                self._wakeup.wait(WEBHOOK_POLL_INTERVAL)
+                self._wakeup.clear()
+
+        self._stop.clear()
+        self._workers = [
+            threading.Thread(target=run, name=f"stripe-webhook-worker-{i}", daemon=True)
+            for i in range(threads)
+        ]
+        for worker in self._workers:
+            worker.start()
+        atexit.register(self.stop_workers)
+
+    def stop_workers(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def requeue_job(self, job_id: int) -> bool:
+        """
+        Put a dead job, or a running job whose lock has expired, back in the
+        queue with a fresh attempt budget. Jobs a worker still holds are left alone.
+        """
+        with self.get_db_connection() as conn:
+            if not conn:
+                return False
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE stripe_webhook_jobs
+                    SET status = 'queued', attempts = 0, run_after = CURRENT_TIMESTAMP,
+                        locked_by = NULL, locked_at = NULL, completed_at = NULL,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                        AND (status = 'dead'
+                             OR (status = 'running'
+                                 AND locked_at < CURRENT_TIMESTAMP - (%s * INTERVAL '1 second')))
+                """, (job_id, WEBHOOK_JOB_LOCK_TIMEOUT))
+                requeued = cur.rowcount == 1
+                conn.commit()
+
+        if requeued:
+            self.notify()
+        return requeued
+
+    def get_status(self, status: Optional[str] = None, limit: int = 50) -> Dict:
+        """Job counts by status plus the most recent jobs (optionally of one status)"""
+        with self.get_db_connection() as conn:
+            if not conn:
+                return {'success': False, 'error': 'Database unavailable'}
+
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT status, COUNT(*),
+                           EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - MIN(created_at))
+                    FROM stripe_webhook_jobs
+                    GROUP BY status
+                """)
+                counts = {s: 0 for s in JOB_STATUSES}
+                oldest = {}
+                for job_status, count, age in cur.fetchall():
+                    counts[job_status] = count
+                    oldest[job_status] = int(age) if age is not None else None
+
+                cur.execute("""
+                    SELECT id, event_id, event_type, status, attempts, max_attempts,
+                           last_error, run_after, created_at, completed_at
+                    FROM stripe_webhook_jobs
+                    WHERE %(status)s::varchar IS NULL OR status = %(status)s
+                    ORDER BY id DESC
+                    LIMIT %(limit)s
+                """, {'status': status, 'limit': limit})
+                jobs = [{
+                    'id': row[0],
+                    'event_id': row[1],
+                    'event_type': row[2],
+                    'status': row[3],
+                    'attempts': row[4],
+                    'max_attempts': row[5],
+                    'last_error': row[6],
+                    'run_after': row[7].isoformat() if row[7] else None,
+                    'created_at': row[8].isoformat() if row[8] else None,
+                    'completed_at': row[9].isoformat() if row[9] else None
+                } for row in cur.fetchall()]
+
+        return {
+            'success': True,
+            'counts': counts,
+            'oldest_age_seconds': oldest,
+            'jobs': jobs,
+            'workers': sum(1 for worker in self._workers if worker.is_alive())
+        }
@@ -0,0 +1,101 @@
+// Gas and throughput of batched reward minting (mintBatch) against one
+// rewardDataPurchase transaction per reward, on the local Hardhat network.
+// Run with: npx hardhat test
+const { expect } = require("chai");
+const { ethers } = require("hardhat");
+
+const BLOCK_GAS_LIMIT = 30_000_000n;
+const REWARD_WEI = ethers.parseEther("1.033");
+
+function freshAddresses(count) {
+  return Array.from({ length: count }, () => ethers.Wallet.createRandom().address);
+}
+
+describe("DOTMToken batched rewards", function () {
+  let token;
+  let owner;
+  let member;
+
+  beforeEach(async function () {
+    [owner, member] = await ethers.getSigners();
+    token = await ethers.deployContract("DOTMToken");
+    await token.waitForDeployment();
+  });
+
+  it("mints every recipient's amount in one transaction", async function () {
+    const recipients = freshAddresses(3);
+    const amounts = [REWARD_WEI, REWARD_WEI * 2n, 1n];
+
+    await expect(token.mintBatch(recipients, amounts))
+      .to.emit(token, "Transfer")
+      .withArgs(ethers.ZeroAddress, recipients[1], amounts[1]);
+
+    for (let i = 0; i < recipients.length; i++) {
+      expect(await token.balanceOf(recipients[i])).to.equal(amounts[i]);
+    }
+    expect(await token.totalSupply()).to.equal(REWARD_WEI * 3n + 1n);
+  });
+
+  it("rejects mismatched arrays, non-owners and minting past max supply", async function () {
+    const [recipient] = freshAddresses(1);
+
+    await expect(token.mintBatch([recipient], [])).to.be.revertedWith(
+      "Recipients and amounts length mismatch"
+    );
+    await expect(token.connect(member).mintBatch([recipient], [1n])).to.be.revertedWithCustomError(
+      token,
+      "OwnableUnauthorizedAccount"
+    );
+
+    const maxSupply = await token.MAX_SUPPLY();
+    await expect(token.mintBatch([recipient, recipient], [maxSupply, 1n])).to.be.revertedWith(
+      "Minting would exceed max supply"
+    );
+  });
+
+  it("costs less gas per reward than one transaction per reward", async function () {
+    const singles = 20;
+    let singleGas = 0n;
+    const singleStarted = performance.now();
+    for (const recipient of freshAddresses(singles)) {
+      const tx = await token.rewardDataPurchase(recipient, 10_000n);
+      singleGas += (await tx.wait()).gasUsed;
+    }
+    const singleSeconds = (performance.now() - singleStarted) / 1000;
+    const singleGasPerReward = singleGas / BigInt(singles);
+
+    const rows = [
+      {
+        mode: "one tx per reward",
+        rewards: singles,
+        gasPerReward: Number(singleGasPerReward),
+        rewardsPerBlock: Number(BLOCK_GAS_LIMIT / singleGasPerReward),
+        rewardsPerSecond: Math.round(singles / singleSeconds),
+      },
+    ];
+
+    for (const size of [10, 50, 100, 200]) {
+      const recipients = freshAddresses(size);
+      const started = performance.now();
+      const tx = await token.mintBatch(recipients, recipients.map(() => REWARD_WEI));
+      const receipt = await tx.wait();
+      const seconds = (performance.now() - started) / 1000;
+      const gasPerReward = receipt.gasUsed / BigInt(size);
+
+      // Settlement sizes its gas limit as 60k base + 60k per recipient (ethereum_helper.py)
+      expect(receipt.gasUsed).to.be.lessThan(60_000n + 60_000n * BigInt(size));
+      expect(gasPerReward).to.be.lessThan(singleGasPerReward);
+      expect(await token.balanceOf(recipients[size - 1])).to.equal(REWARD_WEI);
+
+      rows.push({
+        mode: `mintBatch x${size}`,
+        rewards: size,
+        gasPerReward: Number(gasPerReward),
+        rewardsPerBlock: Number(BLOCK_GAS_LIMIT / gasPerReward),
+        rewardsPerSecond: Math.round(size / seconds),
+      });
+    }
+
+    console.table(rows);
+  });
+});
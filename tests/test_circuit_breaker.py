@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test: Circuit Breaker and Bulkhead
+Exercises failure-rate opening, half-open probing and bulkhead rejection
+"""
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, Bulkhead
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', clock)
+    options = dict(failure_rate=0.5, min_calls=4, window_seconds=60, open_seconds=30,
+                   slow_call_seconds=5, half_open_calls=2)
+    options.update(kwargs)
+    return CircuitBreaker('test', **options), clock
+
+
+def test_opens_once_failure_rate_reached_with_enough_calls(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    for success in (False, False, True):
+        assert breaker.allow()
+        breaker.record(success, 0.1)
+    assert breaker.state == 'closed'  # below min_calls
+
+    breaker.allow()
+    breaker.record(True, 6)  # slow call counts as a failure
+    assert breaker.state == 'open'
+    assert breaker.allow() is False
+    assert breaker.retry_after() == 30
+    assert breaker.get_stats()['rejected'] == 1
+
+
+def test_old_calls_leave_the_window(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    for _ in range(3):
+        breaker.allow()
+        breaker.record(False, 0.1)
+    clock.now += 61
+    breaker.allow()
+    breaker.record(False, 0.1)
+    assert breaker.state == 'closed'
+
+
+def test_half_open_probes_close_or_reopen(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch)
+    for _ in range(4):
+        breaker.allow()
+        breaker.record(False, 0.1)
+    clock.now += 30
+    assert breaker.state == 'half_open'
+
+    assert breaker.allow() and breaker.allow()
+    assert breaker.allow() is False  # only half_open_calls probes at once
+    breaker.record(True, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == 'open'
+
+    clock.now += 30
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(True, 0.1)
+    assert breaker.state == 'closed'
+
+
+def test_bulkhead_rejects_when_full():
+    bulkhead = Bulkhead('test', max_concurrent=2, max_wait_seconds=0)
+    assert bulkhead.acquire() and bulkhead.acquire()
+    assert bulkhead.acquire() is False
+    bulkhead.release()
+    assert bulkhead.acquire()
+    assert bulkhead.get_stats() == {'max_concurrent': 2, 'in_flight': 2, 'rejected': 1}
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test: Telemetry Data Retention
+Exercises partition planning and expiry in DataRetentionManager against a fake database
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+from psycopg2 import sql
+from data_retention import (
+    DataRetentionManager, _parse_partition_bound, _missing_partition_days, _expired_partitions
+)
+
+TODAY = datetime(2026, 10, 16)
+POLICY = {
+    'table': 'token_price_pings',
+    'time_column': 'created_at',
+    'retention_days': 30,
+    'rollup_sql': "INSERT INTO token_price_pings_hourly SELECT * FROM {partition}"
+}
+
+
+def render(query):
+    """Render psycopg2.sql compositions without a live connection"""
+    if isinstance(query, str):
+        return query
+    if isinstance(query, sql.Composed):
+        return ''.join(render(part) for part in query.seq)
+    if isinstance(query, sql.Identifier):
+        return '.'.join(f'"{s}"' for s in query.strings)
+    return query.string
+
+
+def partition(name, lower, upper):
+    return {'name': name, 'lower': lower, 'upper': upper}
+
+
+class FakeDatabase:
+    def __init__(self, bounds, cutoff, default=None, stray_days=(), moved=0):
+        self.bounds = bounds
+        self.cutoff = cutoff
+        self.default = default
+        self.stray_days = stray_days
+        self.moved = moved
+        self.last = ''
+        self.executed = []
+        self.result = None
+        self.rows = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params=None):
+        text = render(query)
+        self.executed.append(text)
+        self.last = text
+        if "= 'DEFAULT'" in text:
+            self.result = (self.default,) if self.default else None
+        elif 'pg_get_expr' in text:
+            self.rows = list(self.bounds)
+        elif 'SELECT DISTINCT' in text:
+            self.rows = [(day,) for day in self.stray_days]
+        elif "DATE_TRUNC('day', LOCALTIMESTAMP)" in text:
+            self.result = (TODAY,)
+        elif 'pg_try_advisory_lock' in text:
+            self.result = (True,)
+        elif "LOCALTIMESTAMP - (" in text:
+            self.result = (self.cutoff,)
+        elif 'pg_total_relation_size' in text:
+            self.result = (1200, 8192)
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.rows
+
+    @property
+    def rowcount(self):
+        return self.moved if 'WITH moved' in self.last else 0
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def make_manager(db):
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    return DataRetentionManager(get_db_connection, policies=[POLICY])
+
+
+def test_parses_legacy_and_daily_bounds():
+    assert _parse_partition_bound("FOR VALUES FROM (MINVALUE) TO ('2026-10-17 00:00:00')") == (
+        None, datetime(2026, 10, 17))
+    assert _parse_partition_bound("FOR VALUES FROM ('2026-10-17 00:00:00') TO ('2026-10-18 00:00:00')") == (
+        datetime(2026, 10, 17), datetime(2026, 10, 18))
+
+
+def test_only_uncovered_days_get_partitions():
+    partitions = [
+        partition('t_legacy', None, datetime(2026, 10, 17)),
+        partition('t_p20261017', datetime(2026, 10, 17), datetime(2026, 10, 18)),
+    ]
+
+    missing = _missing_partition_days(partitions, TODAY, 3)
+
+    assert missing == [datetime(2026, 10, 18), datetime(2026, 10, 19)]
+
+
+def test_partition_expires_only_when_entirely_past_cutoff():
+    partitions = [
+        partition('t_legacy', None, datetime(2026, 9, 10)),
+        partition('t_p20260915', datetime(2026, 9, 15), datetime(2026, 9, 16)),
+        partition('t_p20260916', datetime(2026, 9, 16), datetime(2026, 9, 17)),
+    ]
+
+    expired = _expired_partitions(partitions, datetime(2026, 9, 16, 12))
+
+    assert [p['name'] for p in expired] == ['t_legacy', 't_p20260915']
+
+
+def test_expired_partitions_are_rolled_up_then_dropped():
+    db = FakeDatabase([
+        ('token_price_pings_p20260901', "FOR VALUES FROM ('2026-09-01 00:00:00') TO ('2026-09-02 00:00:00')"),
+        ('token_price_pings_p20261016', "FOR VALUES FROM ('2026-10-16 00:00:00') TO ('2026-10-17 00:00:00')"),
+    ], cutoff=datetime(2026, 9, 16))
+    manager = make_manager(db)
+
+    result = manager.run()
+
+    (table,) = result['tables']
+    assert table['partitions_dropped'] == 1
+    assert table['rows_reclaimed'] == 1200 and table['bytes_reclaimed'] == 8192
+    rollup = next(i for i, q in enumerate(db.executed) if 'token_price_pings_hourly' in q)
+    drop = next(i for i, q in enumerate(db.executed) if q.startswith('DROP TABLE'))
+    assert rollup < drop
+    assert db.executed[drop] == 'DROP TABLE "token_price_pings_p20260901"'
+    assert manager.get_stats()['bytes_reclaimed'] == 8192
+
+
+def test_default_partition_bound_is_not_a_daily_partition():
+    db = FakeDatabase([
+        ('token_price_pings_default', 'DEFAULT'),
+        ('token_price_pings_p20261016', "FOR VALUES FROM ('2026-10-16 00:00:00') TO ('2026-10-17 00:00:00')"),
+    ], cutoff=datetime(2026, 9, 16))
+
+    partitions = make_manager(db)._list_partitions(db, 'token_price_pings')
+
+    assert [p['name'] for p in partitions] == ['token_price_pings_p20261016']
+
+
+def test_rows_in_default_partition_are_moved_into_new_partitions():
+    db = FakeDatabase([
+        ('token_price_pings_default', 'DEFAULT'),
+        ('token_price_pings_p20261016', "FOR VALUES FROM ('2026-10-16 00:00:00') TO ('2026-10-17 00:00:00')"),
+        ('token_price_pings_p20261017', "FOR VALUES FROM ('2026-10-17 00:00:00') TO ('2026-10-18 00:00:00')"),
+    ], cutoff=datetime(2026, 9, 16), default='token_price_pings_default',
+        stray_days=[datetime(2026, 10, 18)], moved=5)
+    manager = make_manager(db)
+
+    assert manager.ensure_partitions(days_ahead=2) == 1
+
+    assert any(q.startswith('LOCK TABLE "token_price_pings_default"') for q in db.executed)
+    drain = next(i for i, q in enumerate(db.executed) if 'WITH moved' in q)
+    attach = next(i for i, q in enumerate(db.executed) if 'ATTACH PARTITION "token_price_pings_p20261018"' in q)
+    assert drain < attach
+    assert not any('PARTITION OF' in q for q in db.executed)
+    assert manager.get_stats()['default_rows_drained'] == 5
+
+
+def test_without_default_partition_missing_days_are_created_directly():
+    db = FakeDatabase([
+        ('token_price_pings_p20261016', "FOR VALUES FROM ('2026-10-16 00:00:00') TO ('2026-10-17 00:00:00')"),
+    ], cutoff=datetime(2026, 9, 16))
+
+    assert make_manager(db).ensure_partitions(days_ahead=1) == 1
+
+    (create,) = [q for q in db.executed if q.startswith('CREATE TABLE')]
+    assert 'IF NOT EXISTS "token_price_pings_p20261017" PARTITION OF "token_price_pings"' in create
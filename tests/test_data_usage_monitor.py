@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Test: Real-Time Data Usage Aggregates
+Checks that DataUsageMonitor.log_usage_event updates aggregates incrementally
+and queues Stripe usage in the same transaction as the raw event (no database required)
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import data_usage_monitor
+from data_usage_monitor import DataUsageMonitor, _history_resolution
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.connections = 0
+        self.commits = 0
+        self.statements = []
+        self.copies = []
+        self.billing = []
+        self.rows = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    def fetchone(self):
+        return (42,)
+
+    def fetchall(self):
+        return self.rows
+
+    def copy_expert(self, sql, file):
+        self.copies.append((sql, file.read()))
+
+    def commit(self):
+        self.commits += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def make_monitor(monkeypatch=None):
+    db = FakeDatabase()
+    if monkeypatch:
+        monkeypatch.setattr(data_usage_monitor, 'execute_values',
+                            lambda cur, sql, rows, **kwargs: db.billing.extend(rows))
+
+    @contextmanager
+    def get_db_connection():
+        db.connections += 1
+        yield db
+
+    return DataUsageMonitor(get_db_connection), db
+
+
+def no_stripe_call(*args):
+    raise AssertionError('Stripe must not be called while logging usage')
+
+
+def test_event_and_realtime_increment_share_one_transaction():
+    monitor, db = make_monitor()
+
+    result = monitor.log_usage_event('uid-1', '5G', 'Mobile', 250.0, 512.0, provider='OXIO')
+
+    assert result == {'success': True, 'event_id': 42, 'data_gb': 0.5, 'cost_usd': 0.05}
+    assert db.connections == 1
+    assert db.commits == 1
+    insert_event, upsert_realtime, upsert_rollups = [sql for sql, _ in db.statements]
+    assert 'INSERT INTO data_usage_metrics' in insert_event
+    assert 'INSERT INTO data_usage_realtime' in upsert_realtime
+    assert 'INSERT INTO data_usage_rollups' in upsert_rollups
+    assert db.statements[2][1]['events_5g'] == 1
+
+
+def test_realtime_increment_does_not_rescan_raw_events():
+    monitor, db = make_monitor()
+    monitor.log_usage_event('uid-1', '4G', 'WiFi', 50.0, 10.0)
+
+    sql, params = db.statements[1]
+    assert 'FROM data_usage_metrics' not in sql
+    assert 'hour_bucket' in sql and 'day_bucket' in sql
+    assert params['gb'] == 10.0 / 1024
+
+
+def test_single_event_queues_stripe_usage_in_its_transaction(monkeypatch):
+    monitor, db = make_monitor(monkeypatch)
+    monkeypatch.setattr(monitor, '_report_to_stripe', no_stripe_call)
+
+    monitor.log_usage_event('uid-1', '5G', 'Mobile', 250.0, 512.0, provider='OXIO', stripe_customer_id='cus_1')
+
+    assert db.commits == 1
+    (row,) = db.billing
+    assert row[:7] == ('uid-1', 'cus_1', 0.5, 1, '5G', 'Mobile', 'OXIO')
+    assert row[7].startswith('data-usage-')
+
+
+def test_batch_is_copied_once_with_one_aggregate_update_per_user(monkeypatch):
+    monitor, db = make_monitor(monkeypatch)
+    monkeypatch.setattr(monitor, '_report_to_stripe', no_stripe_call)
+    events = [
+        {'firebase_uid': 'uid-b', 'stripe_customer_id': 'cus_b', 'network_type': '5G', 'data_used_mb': 1024},
+        {'firebase_uid': 'uid-a', 'data_used_mb': 512, 'provider': 'OXIO, Inc.'},
+        {'firebase_uid': 'uid-b', 'stripe_customer_id': 'cus_b', 'data_used_mb': 1024},
+    ]
+
+    result = monitor.log_usage_events(events)
+
+    assert result['success'] and result['accepted'] == 3 and result['users'] == 2
+    assert db.connections == 1 and db.commits == 1
+    (copy_sql, csv_data), = db.copies
+    assert copy_sql.startswith('COPY data_usage_metrics')
+    assert len(csv_data.splitlines()) == 3
+    assert '"OXIO, Inc."' in csv_data
+    upserts = [params for sql, params in db.statements if 'data_usage_realtime' in sql]
+    assert [(p['uid'], p['gb']) for p in upserts] == [('uid-a', 0.5), ('uid-b', 2.0)]
+    assert upserts[1]['network_type'] == '4G'
+    rollups = [params for sql, params in db.statements if 'data_usage_rollups' in sql]
+    assert [(p['uid'], p['count'], p['events_5g']) for p in rollups] == [('uid-a', 1, 0), ('uid-b', 2, 1)]
+    (billing,) = db.billing
+    assert billing[:7] == ('uid-b', 'cus_b', 2.0, 2, '4G', 'Mobile', None)
+
+
+def test_pending_billing_events_report_with_stored_key_and_back_off(monkeypatch):
+    monitor, db = make_monitor()
+    calls = []
+
+    def fake_report(customer_id, data_gb, network_type, connection_type, provider, timestamp, identifier):
+        calls.append((customer_id, data_gb, identifier))
+        return {'success': identifier == 'key-1', 'event_id': identifier, 'error': 'timeout'}
+    monkeypatch.setattr(monitor, '_report_to_stripe', fake_report)
+
+    created_at = datetime.now()
+    max_attempts = data_usage_monitor.DATA_USAGE_BILLING_MAX_ATTEMPTS
+    db.rows = [
+        (1, 'cus_a', 2.0, '5G', 'Mobile', 'OXIO', created_at, 'key-1', 1),
+        (2, 'cus_b', 0.5, '4G', 'WiFi', None, created_at, 'key-2', 1),
+        (3, 'cus_c', 0.1, '4G', 'Home', None, created_at, 'key-3', max_attempts),
+    ]
+    result = monitor.report_pending_billing_events()
+
+    assert result == {'success': True, 'reported': 1, 'failed': 2}
+    assert calls == [('cus_a', 2.0, 'key-1'), ('cus_b', 0.5, 'key-2'), ('cus_c', 0.1, 'key-3')]
+    claim_sql, _ = db.statements[0]
+    assert 'next_attempt_at <= CURRENT_TIMESTAMP' in claim_sql and 'FOR UPDATE SKIP LOCKED' in claim_sql
+    updates = [params for sql, params in db.statements[1:]]
+    assert updates == [('key-1', 1), ('timeout', 'pending', 2), ('timeout', 'failed', 3)]
+
+
+def test_invalid_events_are_rejected_individually():
+    monitor, db = make_monitor()
+    events = [
+        {'firebase_uid': 'uid-a', 'data_used_mb': 5},
+        {'firebase_uid': 'uid-a', 'network_type': '3G'},
+        {'firebase_uid': 'uid-a', 'data_used_mb': 'lots'},
+        {'data_used_mb': 5},
+        'not an event',
+    ]
+
+    result = monitor.log_usage_events(events)
+
+    assert result['accepted'] == 1
+    assert [r['index'] for r in result['rejected']] == [1, 2, 3, 4]
+    assert len(db.copies[0][1].splitlines()) == 1
+
+
+def test_fully_invalid_batch_skips_database():
+    monitor, db = make_monitor()
+    result = monitor.log_usage_events([{'firebase_uid': 'uid-a', 'speed_mbps': -1}])
+
+    assert result['success'] is False and result['accepted'] == 0
+    assert db.connections == 0
+
+
+def test_history_interval_picks_coarsest_rollup_and_bounds_points():
+    assert _history_resolution(24, 1) == (3, 1)        # 1440 minutes / 500 points
+    assert _history_resolution(1, 1) == (1, 1)
+    assert _history_resolution(24, 15) == (15, 5)
+    assert _history_resolution(24, 90) == (120, 60)
+    assert _history_resolution(24 * 30, 5) == (120, 60)
+    assert _history_resolution(24 * 365, 60) == (1080, 60)
+    assert _history_resolution(24 * 365, 1440) == (1440, 1440)
+
+
+def test_history_reads_rollups_not_raw_events():
+    monitor, db = make_monitor()
+    db.fetchall = lambda: []
+
+    result = monitor.get_usage_history('uid-1', hours=24 * 30, interval_minutes=5)
+
+    sql, params = db.statements[0]
+    assert 'FROM data_usage_rollups' in sql and 'data_usage_metrics' not in sql
+    assert params['resolution'] == 60 and params['step'] == 7200
+    assert result['interval_minutes'] == 120
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test: Database Schema Migrations
+Exercises db_migrations.run_migrations against a fake connection (no database required)
+"""
+
+from contextlib import contextmanager
+import db_migrations
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.db.statements.append(sql)
+        if sql.strip().startswith('SELECT version FROM'):
+            self.rows = [(v,) for v in sorted(self.db.applied)]
+        elif 'INSERT INTO schema_migrations' in sql:
+            self.db.pending.append(params[0])
+        elif self.db.fail_on and self.db.fail_on in sql:
+            raise Exception("syntax error")
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeDatabase:
+    def __init__(self, applied=(), fail_on=None):
+        self.applied = set(applied)
+        self.pending = []
+        self.statements = []
+        self.fail_on = fail_on
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.applied.update(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+
+def use_database(monkeypatch, db):
+    @contextmanager
+    def fake_get_db_connection():
+        yield db
+    monkeypatch.setattr(db_migrations, 'get_db_connection', fake_get_db_connection)
+
+
+def test_versions_are_unique_and_ordered():
+    versions = [m[0] for m in db_migrations.MIGRATIONS]
+    assert versions == sorted(versions)
+    assert len(versions) == len(set(versions))
+
+
+def test_applies_only_pending_migrations(monkeypatch):
+    db = FakeDatabase(applied={1, 2})
+    use_database(monkeypatch, db)
+
+    result = db_migrations.run_migrations()
+
+    assert result['success']
+    assert result['applied'] == [m[0] for m in db_migrations.MIGRATIONS if m[0] > 2]
+    assert result['current_version'] == db_migrations.MIGRATIONS[-1][0]
+    assert any('pg_advisory_unlock' in sql for sql in db.statements)
+
+
+def test_stops_at_failed_migration(monkeypatch):
+    db = FakeDatabase(fail_on='CREATE TABLE IF NOT EXISTS mcp_api_keys')
+    use_database(monkeypatch, db)
+
+    result = db_migrations.run_migrations()
+
+    assert not result['success']
+    assert result['failed_version'] == 3
+    assert db.applied == {1, 2}
+
+
+def test_check_schema_current_reports_pending(monkeypatch):
+    use_database(monkeypatch, FakeDatabase(applied={1}))
+    assert db_migrations.check_schema_current() is False
+
+    use_database(monkeypatch, FakeDatabase(applied={m[0] for m in db_migrations.MIGRATIONS}))
+    assert db_migrations.check_schema_current() is True
+
+
+def test_token_assignment_duplicates_are_archived_before_unique_index():
+    sql = dict((m[0], m[2]) for m in db_migrations.MIGRATIONS)[19]
+    archive = sql.index('INSERT INTO token_assignments_duplicates')
+    delete = sql.index('DELETE FROM token_assignments t')
+    assert delete < archive < sql.index('CREATE UNIQUE INDEX IF NOT EXISTS idx_token_assignments_wallet_reason_unique')
+    assert 'MIN(id) AS kept_id' in sql
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test: Shared Database Connection Pool
+Exercises db_pool.ConnectionPool against fake connections (no database required)
+"""
+
+import threading
+import time
+from psycopg2 import extensions
+from db_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise Exception("server closed the connection unexpectedly")
+        self.conn.status = extensions.TRANSACTION_STATUS_INTRANS
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        if self.broken:
+            raise Exception("connection already closed")
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    options = dict(min_size=1, max_size=2, acquire_timeout=0.2,
+                   health_check_idle=60, leak_threshold=60, connect=FakeConnection)
+    options.update(kwargs)
+    return ConnectionPool("postgresql://test", **options)
+
+
+def test_reuses_returned_connection():
+    pool = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+
+    stats = pool.get_stats()
+    assert stats['checkouts'] == 2
+    assert stats['connections_created'] == 1
+    assert stats['waits'] == 0
+
+
+def test_rolls_back_dirty_connection_on_return():
+    pool = make_pool()
+    conn = pool.getconn()
+    conn.status = extensions.TRANSACTION_STATUS_INERROR
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert conn.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+
+
+def test_times_out_when_exhausted():
+    pool = make_pool(max_size=1, acquire_timeout=0.05)
+    pool.getconn()
+    try:
+        pool.getconn()
+        assert False, "expected PoolTimeoutError"
+    except PoolTimeoutError:
+        pass
+    assert pool.get_stats()['timeouts'] == 1
+
+
+def test_waiter_is_handed_released_connection():
+    pool = make_pool(max_size=1, acquire_timeout=2)
+    conn = pool.getconn()
+    result = {}
+
+    def waiter():
+        result['conn'] = pool.getconn()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    thread.join(timeout=2)
+
+    assert result['conn'] is conn
+    stats = pool.get_stats()
+    assert stats['waits'] == 1
+    assert stats['wait_time_ms_total'] > 0
+
+
+def test_discards_unhealthy_idle_connection():
+    pool = make_pool(health_check_idle=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+
+    replacement = pool.getconn()
+    assert replacement is not conn
+    assert conn.closed
+    stats = pool.get_stats()
+    assert stats['health_check_failures'] == 1
+    assert stats['size'] == 1
+
+
+def test_counts_leaked_checkouts_once():
+    pool = make_pool(leak_threshold=0.01)
+    conn = pool.getconn()
+    time.sleep(0.02)
+    assert pool.get_stats()['leaks'] == 1
+    pool.putconn(conn)
+    assert pool.get_stats()['leaks'] == 1
+
+
+def test_concurrent_checkouts_never_exceed_max_size():
+    pool = make_pool(max_size=3, acquire_timeout=5)
+    peak = {'in_use': 0}
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(20):
+            conn = pool.getconn()
+            with lock:
+                peak['in_use'] = max(peak['in_use'], pool.get_stats()['in_use'])
+            pool.putconn(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = pool.get_stats()
+    assert peak['in_use'] <= 3
+    assert stats['size'] <= 3
+    assert stats['checkouts'] == 160
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Test: Resumable eSIM Activation Workflow
+Checks that eSIMActivationService resumes at the first incomplete step and
+never repeats completed external calls (no OXIO or database required)
+"""
+
+import os
+import time
+
+os.environ.setdefault('OXIO_API_KEY', 'test')
+os.environ.setdefault('OXIO_AUTH_TOKEN', 'test')
+
+from esim_activation_service import eSIMActivationService, ACTIVATION_STEPS
+
+LINE = {'success': True, 'data': {'lineId': 'line-1', 'iccid': '8901', 'phoneNumbers': [{'phoneNumber': '+12125550100'}]}}
+
+
+class FakeWorkflowStore:
+    """Stands in for esim_activation_workflows: keeps checkpointed step outputs"""
+
+    def __init__(self):
+        self.steps = {}
+        self.status = 'pending'
+
+    def claim(self, workflow_key, params):
+        return dict(params, id=1, workflow_key=workflow_key, status=self.status, attempts=1,
+                    steps={name: {'output': output} for name, output in self.steps.items()})
+
+    def checkpoint(self, workflow_id, step, output=None, status=None, error=None):
+        if output is not None:
+            self.steps[step] = output
+        self.status = status or self.status
+
+
+def make_service(monkeypatch, store, calls, fail_record=False):
+    service = eSIMActivationService()
+    monkeypatch.setattr(service, '_claim_workflow', store.claim)
+    monkeypatch.setattr(service, '_checkpoint', store.checkpoint)
+
+    def record(name, result):
+        def step(*args, **kwargs):
+            calls.append(name)
+            return result() if callable(result) else result
+        monkeypatch.setattr(service, name, step)
+
+    record('_get_or_create_user_data', {'user_id': 3, 'oxio_user_id': None, 'eth_address': '0xabc'})
+    record('_ensure_oxio_user', 'oxio-user-1')
+    record('_update_user_oxio_data', None)
+    record('_activate_esim_line', LINE)
+    record('_process_activation_data', {'iccid': '8901', 'line_id': 'line-1', 'qr_code': 'qr'})
+    record('_store_activation_record',
+           lambda: {'success': False, 'error': 'deadlock'} if fail_record else {'success': True, 'activation_id': 9})
+    record('_update_user_esim_details', None)
+    record('_award_purchase_tokens', {'success': True, 'tx_hash': '0xtx'})
+    record('_send_activation_email', True)
+    return service
+
+
+def activate(service):
+    return service.activate_esim_after_payment('uid-1', 'a@example.com', 'Ada L', stripe_session_id='cs_1')
+
+
+def test_fresh_activation_runs_every_step_once(monkeypatch):
+    store, calls = FakeWorkflowStore(), []
+    result = activate(make_service(monkeypatch, store, calls))
+
+    assert result['success'] and result['activation_id'] == 9 and result['resumed_from'] is None
+    assert set(store.steps) == set(ACTIVATION_STEPS)
+    assert store.status == 'completed'
+    assert calls.count('_activate_esim_line') == 1
+
+
+def test_retry_resumes_after_failed_step_without_repeating_oxio_calls(monkeypatch):
+    store, calls = FakeWorkflowStore(), []
+    failed = activate(make_service(monkeypatch, store, calls, fail_record=True))
+
+    assert failed['success'] is False and failed['step'] == 'activation_record'
+    assert store.status == 'failed'
+
+    calls.clear()
+    result = activate(make_service(monkeypatch, store, calls))
+
+    assert result['success'] and result['resumed_from'] == 'activation_record'
+    assert result['oxio_user_id'] == 'oxio-user-1'
+    assert calls[0] == '_store_activation_record'
+    assert sorted(calls[1:]) == ['_award_purchase_tokens', '_send_activation_email', '_update_user_esim_details']
+
+
+def test_completed_workflow_returns_stored_result(monkeypatch):
+    store, calls = FakeWorkflowStore(), []
+    activate(make_service(monkeypatch, store, calls))
+
+    calls.clear()
+    result = activate(make_service(monkeypatch, store, calls))
+
+    assert result['success'] and result['token_reward']['tx_hash'] == '0xtx'
+    assert calls == []
+
+
+def test_post_activation_steps_run_concurrently(monkeypatch):
+    store, calls = FakeWorkflowStore(), []
+    service = make_service(monkeypatch, store, calls)
+    started = []
+
+    def slow(name, result):
+        def step(*args, **kwargs):
+            started.append(name)
+            time.sleep(0.2)
+            return result
+        monkeypatch.setattr(service, name, step)
+
+    slow('_award_purchase_tokens', {'success': True, 'tx_hash': '0xtx'})
+    slow('_send_activation_email', True)
+    slow('_update_user_esim_details', None)
+
+    began = time.monotonic()
+    result = activate(service)
+
+    assert time.monotonic() - began < 0.5
+    assert result['success'] and result['email_sent'] is True
+    assert set(result['side_effects']) == {'user_esim_details', 'token_reward', 'activation_email'}
+
+
+def test_failed_token_award_and_email_are_not_checkpointed(monkeypatch):
+    store, calls = FakeWorkflowStore(), []
+    service = make_service(monkeypatch, store, calls)
+    monkeypatch.setattr(service, '_award_purchase_tokens', lambda *args: {'success': False, 'error': 'queue full'})
+    monkeypatch.setattr(service, '_send_activation_email', lambda *args: False)
+    activate(service)
+
+    assert 'token_reward' not in store.steps and 'activation_email' not in store.steps
+
+
+def test_incomplete_post_activation_steps_leave_workflow_resumable(monkeypatch):
+    store, calls = FakeWorkflowStore(), []
+    service = make_service(monkeypatch, store, calls)
+    monkeypatch.setattr(service, '_award_purchase_tokens', lambda *args: {'success': False, 'error': 'queue full'})
+    monkeypatch.setattr(service, '_send_activation_email', lambda *args: False)
+    first = activate(service)
+
+    assert first['success'] and first['resumable'] is True
+    assert first['incomplete_steps'] == ['token_reward', 'activation_email']
+    assert store.status == 'failed'
+
+    calls.clear()
+    result = activate(make_service(monkeypatch, store, calls))
+
+    assert sorted(calls) == ['_award_purchase_tokens', '_send_activation_email']
+    assert result['resumed_from'] == 'token_reward' and 'incomplete_steps' not in result
+    assert result['token_reward']['tx_hash'] == '0xtx' and result['email_sent'] is True
+    assert store.status == 'completed'
+
+
+def test_award_without_wallet_is_checkpointed_as_skipped(monkeypatch):
+    store, calls = FakeWorkflowStore(), []
+    service = make_service(monkeypatch, store, calls)
+    monkeypatch.setattr(service, '_award_purchase_tokens', lambda *args: {'success': False, 'skipped': True})
+    activate(service)
+
+    assert store.steps['token_reward'] == {'success': False, 'skipped': True}
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Test: Admin Wallet Transaction Manager
+Exercises local nonce assignment under concurrency, nonce resync, gas bumping
+of stuck transactions, receipts, the on_sent hash callbacks and the durable
+outbox (resume after restart, drain on shutdown)
+"""
+
+import threading
+from contextlib import contextmanager
+
+from eth_account import Account
+from web3 import Web3
+
+import eth_tx_manager
+from eth_tx_manager import AdminTransactionManager
+
+ADMIN_KEY = '0x' + '11' * 32
+RECIPIENT = '0x' + '22' * 20
+
+
+class FakeEth:
+    account = Account
+
+    def __init__(self, nonce=7):
+        self.pending_nonce = nonce
+        self.latest_nonce = nonce
+        self.gas_price = 10 * 10 ** 9
+        self.sent = []  # (nonce, gasPrice, tx_hash)
+        self.receipts = {}
+        self.errors = []
+        self.nonce_reads = 0
+
+    def get_transaction_count(self, address, block='latest'):
+        self.nonce_reads += 1
+        return self.pending_nonce if block == 'pending' else self.latest_nonce
+
+    def send_raw_transaction(self, raw):
+        if self.errors:
+            raise ValueError(self.errors.pop(0))
+        tx_hash = Web3.keccak(raw)
+        assert Account.recover_transaction(raw) == Account.from_key(ADMIN_KEY).address
+        self.sent.append((self._last['nonce'], self._last['gasPrice'], Web3.to_hex(tx_hash)))
+        return tx_hash
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise Exception(f"Transaction with hash: '{tx_hash}' not found.")
+        return self.receipts[tx_hash]
+
+
+class FakeWeb3:
+    def __init__(self, nonce=7):
+        self.eth = FakeEth(nonce)
+
+    @staticmethod
+    def to_hex(value):
+        return Web3.to_hex(value)
+
+
+class FakeContractCall:
+    def __init__(self, eth):
+        self.eth = eth
+
+    def build_transaction(self, params):
+        self.eth._last = params
+        tx = {'to': RECIPIENT, 'value': 0, 'data': '0x', 'chainId': 1}
+        tx.update(params)
+        return tx
+
+
+def eth_web3(eth):
+    web3 = FakeWeb3()
+    web3.eth = eth
+    return web3
+
+
+def make_manager(**kwargs):
+    web3 = FakeWeb3()
+    return web3.eth, AdminTransactionManager(web3, ADMIN_KEY, **kwargs)
+
+
+def test_concurrent_submits_get_consecutive_nonces():
+    eth, manager = make_manager()
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(manager.submit(FakeContractCall(eth), 'reward')))
+               for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(handle.status == 'queued' for handle in handles)
+
+    while manager.process_next():
+        pass
+
+    assert sorted(nonce for nonce, _, _ in eth.sent) == list(range(7, 27))
+    assert eth.nonce_reads == 1  # synced once, then tracked locally
+    assert all(handle.status == 'sent' and handle.tx_hash for handle in handles)
+    assert manager.get_stats()['next_nonce'] == 27
+
+
+def test_nonce_error_resyncs_and_retries():
+    eth, manager = make_manager()
+    manager.submit(FakeContractCall(eth), 'first')
+    manager.process_next()
+
+    eth.pending_nonce = 12  # another process used the wallet
+    eth.errors.append('nonce too low: next nonce 12, tx nonce 8')
+    handle = manager.submit(FakeContractCall(eth), 'second')
+    manager.process_next()
+
+    assert handle.status == 'sent' and handle.nonce == 12
+    assert manager.get_stats()['nonce_resyncs'] == 2
+
+
+def test_send_failure_fails_handle_and_keeps_nonce():
+    eth, manager = make_manager()
+    eth.errors.append('insufficient funds for gas * price + value')
+    failed = manager.submit(FakeContractCall(eth), 'broke')
+    manager.process_next()
+    assert failed.status == 'failed' and failed.wait(0)
+
+    ok = manager.submit(FakeContractCall(eth), 'funded')
+    manager.process_next()
+    assert ok.nonce == 7
+
+
+def test_stuck_transaction_is_bumped_and_earlier_hash_can_win(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(eth_tx_manager.time, 'monotonic', lambda: now[0])
+    eth, manager = make_manager(stuck_seconds=60, gas_bump=1.2)
+    hashes = []
+    handle = manager.submit(FakeContractCall(eth), 'reward', on_sent=lambda new, old: hashes.append((new, old)))
+    manager.process_next()
+    first_hash = handle.tx_hash
+
+    now[0] += 30
+    manager.check_pending()
+    assert len(eth.sent) == 1
+
+    now[0] += 31
+    manager.check_pending()
+    assert len(eth.sent) == 2
+    assert eth.sent[1][0] == eth.sent[0][0]  # same nonce
+    assert eth.sent[1][1] == 12 * 10 ** 9
+    bumped_hash = handle.tx_hash
+    assert hashes == [(first_hash, None), (bumped_hash, first_hash)]
+
+    eth.receipts[first_hash] = {'transactionHash': bytes.fromhex(first_hash[2:]), 'blockNumber': 5, 'status': 1}
+    manager.check_pending()
+    assert handle.status == 'mined' and handle.tx_hash == first_hash and handle.block_number == 5
+    assert hashes[-1] == (first_hash, bumped_hash)
+    assert manager.get_stats()['pending'] == []
+
+
+def test_gas_bump_respects_cap(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(eth_tx_manager.time, 'monotonic', lambda: now[0])
+    eth, manager = make_manager(stuck_seconds=60, gas_bump=2, max_gas_price_gwei=15)
+    manager.submit(FakeContractCall(eth), 'reward')
+    manager.process_next()
+
+    for _ in range(3):
+        now[0] += 61
+        manager.check_pending()
+    assert [gas_price for _, gas_price, _ in eth.sent] == [10 * 10 ** 9, 15 * 10 ** 9]
+
+
+def test_reverted_and_dropped_transactions():
+    eth, manager = make_manager()
+    reverted = manager.submit(FakeContractCall(eth), 'reverts')
+    dropped = manager.submit(FakeContractCall(eth), 'replaced elsewhere')
+    manager.process_next()
+    manager.process_next()
+
+    eth.receipts[reverted.tx_hash] = {'transactionHash': bytes.fromhex(reverted.tx_hash[2:]), 'status': 0}
+    eth.latest_nonce = 9
+    manager.check_pending()
+
+    assert reverted.status == 'failed' and reverted.error == 'Transaction reverted'
+    assert dropped.status == 'dropped'
+    stats = manager.get_stats()
+    assert (stats['failed'], stats['dropped'], stats['pending']) == (1, 1, [])
+
+
+class FakeOutbox:
+    """Stands in for AdminTxOutbox: keeps saved handle states and rows left by a previous process"""
+
+    def __init__(self, unfinished=None, fail_add=False):
+        self.saved = {}
+        self.unfinished = unfinished or []
+        self.fail_add = fail_add
+        self.adopted_elsewhere = set()
+        self.released = False
+
+    def add(self, handle, sender, record=None):
+        if self.fail_add:
+            raise RuntimeError('Database unavailable; transaction not queued')
+        self.saved[handle.id] = ('queued', None, record)
+
+    def confirm_owner(self, handle):
+        return handle.id not in self.adopted_elsewhere
+
+    def save(self, handle):
+        self.saved[handle.id] = (handle.status, handle.tx_hash, self.saved.get(handle.id, (None, None, None))[2])
+
+    def claim_unfinished(self, sender):
+        handles, self.unfinished = self.unfinished, []
+        return handles
+
+    def heartbeat(self):
+        pass
+
+    def release(self):
+        self.released = True
+
+
+def test_outbox_stores_submit_and_each_state_change():
+    eth, manager = make_manager(outbox=FakeOutbox())
+    handle = manager.submit(FakeContractCall(eth), 'bonus', record=('first_transaction_bonuses', 4))
+    assert manager.outbox.saved[handle.id] == ('queued', None, ('first_transaction_bonuses', 4))
+
+    manager.process_next()
+    assert manager.outbox.saved[handle.id] == ('sent', handle.tx_hash, ('first_transaction_bonuses', 4))
+
+    eth.receipts[handle.tx_hash] = {'transactionHash': bytes.fromhex(handle.tx_hash[2:]), 'status': 1}
+    manager.check_pending()
+    assert manager.outbox.saved[handle.id][0] == 'mined'
+
+
+class FakeOutboxDatabase:
+    """Cursor/connection for AdminTxOutbox.save; the admin_transactions row links to record"""
+
+    def __init__(self, record):
+        self.record = record
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+
+    def fetchone(self):
+        return self.record
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def save_with_record(record, status, tx_hash=None, block_number=None):
+    db = FakeOutboxDatabase(record)
+
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    handle = eth_tx_manager.TxHandle('award', None)
+    handle.status, handle.tx_hash, handle.block_number = status, tx_hash, block_number
+    eth_tx_manager.AdminTxOutbox(get_db_connection, load_call=None).save(handle)
+    return [sql for sql, _ in db.statements[1:]]
+
+
+def test_unmined_award_releases_its_guard_row():
+    assert save_with_record(('token_assignments', 3), 'failed') == ['DELETE FROM token_assignments WHERE id = %s']
+    assert save_with_record(('first_transaction_bonuses', 4), 'dropped', tx_hash='0xab') == [
+        'DELETE FROM first_transaction_bonuses WHERE id = %s']
+
+    # Mined (even reverted) and in-flight transactions keep the row, with their hash
+    assert save_with_record(('token_assignments', 3), 'failed', tx_hash='0xab', block_number=9) == [
+        'UPDATE token_assignments SET tx_hash = %s WHERE id = %s']
+    assert save_with_record(('token_assignments', 3), 'sent', tx_hash='0xab') == [
+        'UPDATE token_assignments SET tx_hash = %s WHERE id = %s']
+    # Reward batches are put back by the ledger itself
+    assert save_with_record(('token_reward_batches', 5), 'dropped', tx_hash='0xab') == [
+        'UPDATE token_reward_batches SET tx_hash = %s WHERE id = %s']
+
+
+def test_submit_fails_when_outbox_cannot_store_it():
+    eth, manager = make_manager(outbox=FakeOutbox(fail_add=True))
+    try:
+        manager.submit(FakeContractCall(eth), 'bonus')
+        assert False, 'submit should raise'
+    except RuntimeError:
+        pass
+    assert manager.get_stats()['queued'] == 0 and manager.get_stats()['submitted'] == 0
+
+
+def test_resume_sends_queued_rows_and_watches_sent_ones():
+    eth = FakeWeb3().eth
+    queued = eth_tx_manager.TxHandle('left queued', FakeContractCall(eth))
+    sent = eth_tx_manager.TxHandle('left sent', FakeContractCall(eth))
+    sent.status, sent.nonce, sent.gas_price = 'sent', 6, 10 * 10 ** 9
+    sent.hashes, sent.tx_hash = ['0x' + 'ab' * 32], '0x' + 'ab' * 32
+    outbox = FakeOutbox(unfinished=[queued, sent])
+    manager = AdminTransactionManager(eth_web3(eth), ADMIN_KEY, outbox=outbox)
+
+    assert manager.resume() == 2
+    manager.process_next()
+
+    assert queued.status == 'sent' and queued.nonce == 7
+    assert [handle['id'] for handle in manager.get_stats()['pending']] == [sent.id, queued.id]
+    assert manager.get_handle(sent.id) is sent and manager.get_stats()['resumed'] == 2
+
+
+def test_row_adopted_by_another_instance_is_not_sent():
+    outbox = FakeOutbox()
+    eth, manager = make_manager(outbox=outbox)
+    handle = manager.submit(FakeContractCall(eth), 'bonus')
+    outbox.adopted_elsewhere.add(handle.id)
+
+    assert manager.process_next() is True
+    assert eth.sent == [] and handle.status == 'queued'
+
+
+def test_stop_drains_the_queue_and_releases_rows():
+    eth, manager = make_manager(outbox=FakeOutbox(), poll_interval=0.05)
+    manager.start()
+    handles = [manager.submit(FakeContractCall(eth), f"reward {i}") for i in range(3)]
+    manager.stop(drain_timeout=2)
+
+    assert all(handle.status == 'sent' for handle in handles)
+    assert manager.outbox.released is True
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test: ICCID Inventory Import
+Exercises validation, streaming COPY staging and stock monitoring against a fake database
+"""
+
+import io
+from contextlib import contextmanager
+import pytest
+import iccid_inventory
+from iccid_inventory import ICCIDInventory, luhn_valid, validate_inventory_row
+
+LPA = 'LPA:1$smdp.example.com$ABCD-1234-EFGH'
+
+
+def make_iccid(body):
+    """Append the Luhn check digit to an 18/19-digit ICCID body"""
+    for check in '0123456789':
+        if luhn_valid(body + check):
+            return body + check
+
+
+ICCID_A = make_iccid('891004234814455936')
+ICCID_B = make_iccid('891004234814455937')
+
+
+class FakeDatabase:
+    def __init__(self, existing=(), stock_rows=()):
+        self.existing = set(existing)
+        self.staged = []
+        self.copies = 0
+        self.rowcount = 0
+        self.stock_rows = list(stock_rows)
+        self.committed = False
+
+    def cursor(self):
+        return self
+
+    def copy_expert(self, sql, buffer):
+        self.copies += 1
+        self.staged.extend(line.split(',')[0] for line in buffer.read().splitlines())
+
+    def execute(self, sql, params=None):
+        if 'INSERT INTO iccid_inventory' in sql:
+            new = [iccid for iccid in self.staged if iccid not in self.existing]
+            self.rowcount = len(new)
+
+    def fetchall(self):
+        return self.stock_rows
+
+    def commit(self):
+        self.committed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def make_inventory(db, **kwargs):
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    return ICCIDInventory(get_db_connection, **kwargs)
+
+
+def test_luhn_and_row_validation():
+    assert luhn_valid('79927398713') and not luhn_valid('79927398710')
+    assert validate_inventory_row({'iccid': ICCID_A + 'F', 'lpa': LPA, 'country': 'gb'}) == {
+        'iccid': ICCID_A, 'lpa_code': LPA, 'country': 'GB', 'line_id': None}
+
+    bad_check = ICCID_A[:-1] + str((int(ICCID_A[-1]) + 1) % 10)
+    with pytest.raises(ValueError, match='Luhn'):
+        validate_inventory_row({'iccid': bad_check, 'lpa_code': LPA})
+    with pytest.raises(ValueError, match='LPA'):
+        validate_inventory_row({'iccid': ICCID_A, 'lpa_code': 'smdp.example.com$ABCD'})
+
+
+def test_csv_import_dedupes_rejects_and_skips_existing():
+    csv_file = io.StringIO(
+        "ICCID,LPA_Code,Country\n"
+        f"{ICCID_A},{LPA},US\n"
+        f"{ICCID_A},{LPA},US\n"
+        f"{ICCID_B},{LPA},US\n"
+        f"8900000000000000001,{LPA},US\n"
+    )
+    db = FakeDatabase(existing={ICCID_B})
+
+    result = make_inventory(db).import_file(csv_file, 'csv')
+
+    assert db.staged == [ICCID_A, ICCID_B] and db.committed
+    assert (result['received'], result['valid'], result['inserted']) == (4, 2, 1)
+    assert result['already_in_inventory'] == 1 and result['duplicates_in_file'] == 1
+    assert result['rejected'] == [{'line': 4, 'error': 'ICCID fails Luhn checksum: 8900000000000000001'}]
+
+
+def test_large_imports_are_copied_in_chunks(monkeypatch):
+    monkeypatch.setattr(iccid_inventory, 'ICCID_IMPORT_CHUNK_ROWS', 2)
+    records = [{'iccid': make_iccid(f'8910042348144559{n:02d}'), 'lpa_code': LPA} for n in range(5)]
+    db = FakeDatabase()
+
+    result = make_inventory(db).import_records(records)
+
+    assert db.copies == 3 and result['inserted'] == 5
+
+
+def test_dry_run_validates_without_database():
+    lines = io.StringIO(f'{{"iccid": "{ICCID_A}", "lpa_code": "{LPA}"}}\n\n{{"iccid": "123"}}\n')
+
+    result = make_inventory(None).import_file(lines, 'jsonl', dry_run=True)
+
+    assert result['success'] and result['valid'] == 1 and result['rejected_count'] == 1
+
+
+def test_stock_check_flags_low_inventory():
+    db = FakeDatabase(stock_rows=[('GB', 5, 40, 45, 0), ('US', 20, 300, 320, 10)])
+    inventory = make_inventory(db, low_stock_threshold=50)
+
+    levels = inventory.check_stock()
+
+    assert levels['available'] == 25 and levels['low_stock'] is True
+    assert levels['days_of_stock'] == 2.5
+    assert levels['by_country']['GB'] == {'available': 5, 'assigned': 40, 'total': 45}
+    assert inventory.get_stats()['low_stock_warnings'] == 1
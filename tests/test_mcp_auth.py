@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test: MCP API Key Validation Cache
+Exercises MCPAuthManager key caching, revocation and batched usage counters
+"""
+
+from contextlib import contextmanager
+import mcp_auth
+from mcp_auth import MCPAuthManager, hash_api_key
+from mcp_rate_limiter import SlidingWindowRateLimiter
+
+API_KEY = "mcp_testkey"
+KEY_ROW = {'id': 7, 'key_name': 'test', 'description': '', 'rate_limit': 1000, 'is_active': True,
+           'firebase_uid': 'uid-1', 'allowed_origins': None, 'total_requests': 0}
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.selects = 0
+        self.usage_batches = []
+        self.fail_updates = False
+        self.result = None
+        self.revoked = []
+        self.revocation_polls = 0
+
+    def cursor(self, cursor_factory=None):
+        return self
+
+    def execute(self, sql, params=None):
+        if 'SELECT id, key_name' in sql:
+            self.selects += 1
+            self.result = KEY_ROW
+        elif 'RETURNING key_name, key_hash' in sql:
+            self.result = ('test', hash_api_key(API_KEY))
+        elif 'revoked_at >=' in sql:
+            self.revocation_polls += 1
+            self.result = [(key_hash,) for key_hash in self.revoked]
+
+    def fetchone(self):
+        return self.result
+
+    def fetchall(self):
+        return self.result
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeRedis:
+    def __init__(self):
+        self.keys = {}
+
+    def set(self, key, value, ex=None):
+        self.keys[key] = (value, ex)
+
+    def exists(self, key):
+        return int(key in self.keys)
+
+
+def make_manager(monkeypatch, db=None, redis_client=None):
+    db = db or FakeDatabase()
+
+    def fake_execute_values(cur, sql, rows, template=None):
+        if db.fail_updates:
+            raise Exception("deadlock detected")
+        db.usage_batches.append(sorted(rows))
+    monkeypatch.setattr(mcp_auth, 'execute_values', fake_execute_values)
+
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    manager = MCPAuthManager(get_db_connection, rate_limiter=SlidingWindowRateLimiter(), redis_client=redis_client)
+    return manager, db
+
+
+def test_validated_key_is_served_from_cache(monkeypatch):
+    manager, db = make_manager(monkeypatch)
+
+    for _ in range(3):
+        is_valid, key_info = manager.validate_api_key(API_KEY)
+        assert is_valid and key_info['key_name'] == 'test'
+
+    assert db.selects == 1
+    stats = manager.get_cache_stats()
+    assert stats['hits'] == 2
+    assert stats['pending_usage_requests'] == 3
+
+
+def test_revoke_invalidates_cached_key(monkeypatch):
+    manager, db = make_manager(monkeypatch)
+    manager.validate_api_key(API_KEY)
+
+    success, _ = manager.revoke_api_key(7)
+    manager.validate_api_key(API_KEY)
+
+    assert success
+    assert db.selects == 2
+
+
+def test_revocation_on_another_instance_is_seen_through_redis(monkeypatch):
+    redis_client = FakeRedis()
+    manager, db = make_manager(monkeypatch, redis_client=redis_client)
+    other, _ = make_manager(monkeypatch, db=db, redis_client=redis_client)
+    manager.validate_api_key(API_KEY)
+
+    other.revoke_api_key(7)
+    assert redis_client.keys[f"mcp:revoked:{hash_api_key(API_KEY)}"][1] == mcp_auth.API_KEY_CACHE_TTL + 1
+    manager.validate_api_key(API_KEY)
+
+    assert db.selects == 2  # the cached entry was dropped and the key re-read
+
+
+def test_revocation_on_another_instance_is_polled_without_redis(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(mcp_auth.time, 'time', lambda: now[0])
+    manager, db = make_manager(monkeypatch)
+    manager.validate_api_key(API_KEY)
+    manager.validate_api_key(API_KEY)
+    assert db.revocation_polls == 1
+
+    db.revoked = [hash_api_key(API_KEY)]  # revoked by another instance
+    now[0] += 1
+    manager.validate_api_key(API_KEY)
+    assert db.selects == 1  # within the poll interval the cache is still trusted
+
+    now[0] += mcp_auth.API_KEY_REVOCATION_POLL
+    manager.validate_api_key(API_KEY)
+    assert db.revocation_polls == 2
+    assert db.selects == 2
+
+
+def test_usage_counters_flush_as_one_batch(monkeypatch):
+    manager, db = make_manager(monkeypatch)
+    for _ in range(4):
+        manager.validate_api_key(API_KEY)
+
+    assert manager.flush_usage_counters() == 1
+    assert manager.flush_usage_counters() == 0
+
+    (batch,) = db.usage_batches
+    assert batch[0][0] == hash_api_key(API_KEY)
+    assert batch[0][1] == 4
+
+
+def test_failed_flush_keeps_counts_for_retry(monkeypatch):
+    manager, db = make_manager(monkeypatch)
+    manager.validate_api_key(API_KEY)
+    db.fail_updates = True
+    manager.flush_usage_counters()
+    manager.validate_api_key(API_KEY)
+
+    db.fail_updates = False
+    manager.flush_usage_counters()
+
+    assert db.usage_batches[0][0][1] == 2
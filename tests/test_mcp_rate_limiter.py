@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test: MCP API Key Rate Limiting
+Exercises the sliding-window engines behind MCPAuthManager.check_rate_limit
+"""
+
+import time
+import pytest
+from mcp_rate_limiter import SlidingWindowRateLimiter, RedisSlidingWindowRateLimiter
+from mcp_auth import MCPAuthManager, hash_api_key
+
+
+def test_allows_up_to_limit_then_rejects():
+    limiter = SlidingWindowRateLimiter(window_seconds=3600)
+
+    usages = [limiter.hit("key", 3)[1]['current_usage'] for _ in range(3)]
+    allowed, info = limiter.hit("key", 3)
+
+    assert usages == [0, 1, 2]
+    assert not allowed
+    assert info['current_usage'] == 3
+    assert info['percentage'] == 100.0
+
+
+def test_rejected_and_peeked_requests_are_not_counted():
+    limiter = SlidingWindowRateLimiter(window_seconds=3600)
+    limiter.hit("key", 1)
+    limiter.hit("key", 1)
+    limiter.hit("key", 1, consume=False)
+
+    assert len(limiter.hits["key"]) == 1
+
+
+def test_window_slides_and_prune_drops_idle_keys():
+    limiter = SlidingWindowRateLimiter(window_seconds=0.05)
+    assert limiter.hit("key", 1)[0]
+    assert not limiter.hit("key", 1)[0]
+
+    time.sleep(0.06)
+    assert limiter.prune() == 1
+    assert limiter.hit("key", 1)[0]
+
+
+def test_check_rate_limit_uses_key_hash_and_keeps_header_fields():
+    limiter = SlidingWindowRateLimiter()
+    manager = MCPAuthManager(get_db_connection=None, rate_limiter=limiter)
+
+    allowed, info = manager.check_rate_limit("mcp_test", {'rate_limit': 10})
+
+    assert allowed
+    assert hash_api_key("mcp_test") in limiter.hits
+    assert set(info) == {'allowed', 'current_usage', 'limit', 'percentage', 'reset_at'}
+    assert info['limit'] - info['current_usage'] == 10
+
+
+def test_redis_backend_shares_window_between_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+    worker_a = RedisSlidingWindowRateLimiter(fakeredis.FakeStrictRedis(server=server))
+    worker_b = RedisSlidingWindowRateLimiter(fakeredis.FakeStrictRedis(server=server))
+
+    assert worker_a.hit("key", 2)[0]
+    assert worker_b.hit("key", 2)[1]['current_usage'] == 1
+    assert not worker_a.hit("key", 2)[0]
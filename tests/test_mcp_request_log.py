@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test: MCP Request Log Writer
+Exercises mcp_request_log.RequestLogWriter batching against a fake database
+"""
+
+import time
+from contextlib import contextmanager
+import mcp_request_log
+from mcp_request_log import RequestLogWriter
+
+
+class FakeDatabase:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def make_writer(monkeypatch, db, **kwargs):
+    def fake_execute_values(cur, sql, rows, page_size=None):
+        if db.fail:
+            raise Exception("relation does not exist")
+        db.batches.append(list(rows))
+    monkeypatch.setattr(mcp_request_log, 'execute_values', fake_execute_values)
+
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    options = dict(max_queue_size=100, batch_size=10, flush_interval=0.05)
+    options.update(kwargs)
+    return RequestLogWriter(get_db_connection, **options)
+
+
+def log(writer, status=200, ip='203.0.113.7'):
+    return writer.log('hash', '/mcp', 'POST', ip, 'pytest', status)
+
+
+def test_writes_batches_by_size_and_interval(monkeypatch):
+    db = FakeDatabase()
+    writer = make_writer(monkeypatch, db, batch_size=10)
+    for _ in range(25):
+        log(writer)
+
+    deadline = time.time() + 2
+    while writer.get_stats()['written'] < 25 and time.time() < deadline:
+        time.sleep(0.01)
+    writer.close()
+
+    assert sorted(len(b) for b in db.batches) == [5, 10, 10]
+    assert writer.get_stats()['queue_depth'] == 0
+
+
+def test_drops_when_queue_full_and_flushes_on_close(monkeypatch):
+    db = FakeDatabase()
+    writer = make_writer(monkeypatch, db, max_queue_size=3, flush_interval=60)
+    writer._thread = object()  # keep the writer thread from draining the queue
+
+    results = [log(writer) for _ in range(5)]
+    writer._thread = None
+    writer.close()
+
+    stats = writer.get_stats()
+    assert results == [True, True, True, False, False]
+    assert stats['dropped_queue_full'] == 2
+    assert stats['written'] == 3
+
+
+def test_counts_failed_writes_and_cleans_bad_ips(monkeypatch):
+    db = FakeDatabase(fail=True)
+    writer = make_writer(monkeypatch, db)
+    writer._thread = object()
+    log(writer, ip='not-an-ip')
+    record = writer.queue.queue[0]
+    writer._thread = None
+    writer.close()
+
+    assert record[4] is None
+    assert writer.get_stats()['dropped_write_error'] == 1
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Test: Aggregated MCP Usage Billing
+Exercises MCPUsageService staging and idempotent Stripe reporting against a fake database
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import mcp_usage_service
+from mcp_usage_service import MCPUsageService
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.staged = []
+        self.pending_events = []
+        self.statements = []
+        self.rows = []
+        self.fail_staging = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+        if "WHERE status = 'pending'" in sql:
+            self.rows, self.pending_events = self.pending_events, []
+
+    def fetchall(self):
+        return self.rows
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def make_service(monkeypatch):
+    db = FakeDatabase()
+
+    def fake_execute_values(cur, sql, rows, **kwargs):
+        if db.fail_staging:
+            raise Exception("connection reset")
+        db.staged.extend(rows)
+    monkeypatch.setattr(mcp_usage_service, 'execute_values', fake_execute_values)
+
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    return MCPUsageService(get_db_connection), db
+
+
+def test_requests_are_aggregated_per_user_before_staging(monkeypatch):
+    service, db = make_service(monkeypatch)
+    for _ in range(3):
+        service.record_mcp_usage('uid-a')
+    service.record_mcp_usage('uid-b', request_count=5)
+
+    assert service.stage_pending_usage() == 2
+    assert service.stage_pending_usage() == 0
+    assert sorted((uid, count) for uid, count, _ in db.staged) == [('uid-a', 3), ('uid-b', 5)]
+
+
+def test_failed_staging_keeps_counts(monkeypatch):
+    service, db = make_service(monkeypatch)
+    service.record_mcp_usage('uid-a', request_count=2)
+    db.fail_staging = True
+    service.stage_pending_usage()
+    db.fail_staging = False
+    service.record_mcp_usage('uid-a')
+
+    service.stage_pending_usage()
+
+    assert [(uid, count) for uid, count, _ in db.staged] == [('uid-a', 3)]
+
+
+def test_pending_batches_report_with_stored_idempotency_key(monkeypatch):
+    service, db = make_service(monkeypatch)
+    calls = []
+
+    def fake_report(customer_id, megabytes_used, timestamp=None, identifier=None):
+        calls.append((customer_id, megabytes_used, identifier))
+        return {'success': identifier == 'key-1', 'event_id': identifier, 'error': 'timeout'}
+    monkeypatch.setattr(mcp_usage_service, 'report_data_usage', fake_report)
+
+    period_end = datetime.now()
+    db.pending_events = [
+        (1, 'uid-a', 'cus_a', 2500, 2.5, period_end, 'key-1', 1),
+        (2, 'uid-b', 'cus_b', 10, 0.01, period_end, 'key-2', 1),
+    ]
+    result = service.report_pending_billing_events()
+
+    assert result == {'success': True, 'reported': 1, 'failed': 1}
+    assert calls == [('cus_a', 2.5, 'key-1'), ('cus_b', 0.01, 'key-2')]
+    updates = [params for sql, params in db.statements if 'UPDATE mcp_billing_events' in sql and params]
+    assert ('key-1', 1) in updates
+    assert ('timeout', 'pending', 2) in updates
+
+
+def test_due_batches_are_claimed_with_backoff_and_fail_after_max_attempts(monkeypatch):
+    service, db = make_service(monkeypatch)
+    monkeypatch.setattr(mcp_usage_service, 'report_data_usage',
+                        lambda customer_id, megabytes_used, timestamp=None, identifier=None:
+                        {'success': False, 'error': 'invalid customer'})
+
+    db.pending_events = [
+        (3, 'uid-c', 'cus_c', 10, 0.01, datetime.now(), 'key-3', mcp_usage_service.MCP_BILLING_MAX_ATTEMPTS),
+    ]
+    result = service.report_pending_billing_events()
+
+    assert result == {'success': True, 'reported': 0, 'failed': 1}
+    claim_sql, claim_params = db.statements[0]
+    assert 'next_attempt_at <= CURRENT_TIMESTAMP' in claim_sql
+    assert 'ORDER BY next_attempt_at, id' in claim_sql
+    assert claim_params == (mcp_usage_service.MCP_BILLING_RETRY_BASE,
+                            mcp_usage_service.MCP_BILLING_RETRY_MAX_SECONDS,
+                            mcp_usage_service.MCP_BILLING_REPORT_BATCH)
+    assert db.statements[-1][1] == ('invalid customer', 'failed', 3)
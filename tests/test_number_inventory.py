@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Test: Phone Number Inventory
+Exercises index searches (prefix, vanity pattern, contains, ZIP), cold-NPA
+fetch coalescing, refresh/eviction and optimistic reservations
+"""
+
+import time
+import threading
+
+import number_inventory
+from number_inventory import NumberInventory, compile_pattern, national_number, vanity_digits
+
+
+class FakeOXIO:
+    def __init__(self, numbers_by_npa, zip_area_codes=None):
+        self.numbers_by_npa = dict(numbers_by_npa)
+        self.zip_area_codes = zip_area_codes or {}
+        self.searches = []
+        self.gate = None
+
+    def search_available_numbers(self, npa=None, nxx=None, zip_code=None, area_code=None, limit=10):
+        self.searches.append({'npa': npa, 'nxx': nxx, 'zip_code': zip_code, 'limit': limit})
+        if self.gate:
+            self.gate.wait(5)
+        if npa not in self.numbers_by_npa:
+            return {'success': False, 'status_code': 503, 'message': 'HTTP 503 error'}
+        numbers = [{'phoneNumber': f"+1{number}"} for number in self.numbers_by_npa[npa]
+                   if not nxx or number[3:6] == nxx]
+        return {'success': True, 'data': {'phoneNumbers': numbers[:limit]}}
+
+    def get_zip_code_details(self, zip_code):
+        return {'success': True, 'data': {'areaCodes': self.zip_area_codes.get(zip_code, [])}}
+
+
+NUMBERS = {
+    '212': ['2125550100', '2125552233', '2125557777', '2126662233', '2129990001'],
+    '646': ['6465550123', '6467772233'],
+}
+
+
+def numbers(result):
+    return [record['phoneNumber'] for record in result['data']['phoneNumbers']]
+
+
+def test_helpers():
+    assert national_number('+1 (212) 555-0100') == '2125550100'
+    assert national_number('555-0100') is None
+    assert vanity_digits('CAFE') == '2233'
+    assert compile_pattern('xxx-xxx-CAFE').search('2125552233')
+    assert not compile_pattern('xxx-xxx-CAFE').search('2125552234')
+    assert compile_pattern('?777').search('2125557777')
+
+
+def test_searches_are_served_from_the_index():
+    oxio = FakeOXIO(NUMBERS)
+    inventory = NumberInventory(oxio, prefetch_npas=[])
+
+    first = inventory.search(npa='212', limit=10)
+    assert first['source'] == 'index'
+    assert len(first['data']['phoneNumbers']) == 5
+    assert len(oxio.searches) == 1  # cold NPA fetched once
+
+    assert numbers(inventory.search(npa='212', pattern='xxx-xxx-CAFE')) == ['+12125552233', '+12126662233']
+    assert numbers(inventory.search(prefix='212555', contains='77')) == ['+12125557777']
+    assert numbers(inventory.search(npa='212', nxx='666')) == ['+12126662233']
+    assert numbers(inventory.search(npa='212', limit=2)) == ['+12125550100', '+12125552233']
+    assert len(oxio.searches) == 1
+
+
+def test_zip_search_spans_area_codes_and_unknown_search_goes_live():
+    oxio = FakeOXIO(NUMBERS, zip_area_codes={'10001': [{'areaCode': '212'}, '646']})
+    inventory = NumberInventory(oxio, prefetch_npas=[])
+
+    result = inventory.search(zip_code='10001', pattern='CAFE', limit=10)
+    assert result['area_codes'] == ['212', '646']
+    assert numbers(result) == ['+12125552233', '+12126662233', '+16467772233']
+
+    inventory.search(limit=5)
+    assert oxio.searches[-1] == {'npa': None, 'nxx': None, 'zip_code': None, 'limit': 5}
+    assert inventory.get_stats()['live_searches'] == 1
+
+
+def test_narrowed_search_on_a_truncated_npa_falls_through_to_oxio():
+    oxio = FakeOXIO(NUMBERS)
+    inventory = NumberInventory(oxio, prefetch_npas=[], prefetch_limit=3)
+
+    # The index holds the first three 212 numbers; 666 and 999 exchanges were cut off
+    result = inventory.search(npa='212', nxx='666')
+    assert numbers(result) == ['+12126662233']
+    assert result['source'] == 'index+live'
+    assert oxio.searches[-1] == {'npa': '212', 'nxx': '666', 'zip_code': None, 'limit': 3}
+    assert inventory.reserve('+12126662233', 'user-1')['success']
+
+    # A page the index can fill stays off OXIO, as does an NPA OXIO returned in full
+    searches = len(oxio.searches)
+    assert inventory.search(npa='212', prefix='212555', limit=2)['source'] == 'index'
+    assert numbers(inventory.search(npa='646', contains='99')) == []
+    assert len(oxio.searches) == searches + 1  # only the cold 646 fetch
+    assert inventory.get_stats()['fallthrough_searches'] == 1
+
+
+def test_failed_npa_fetch_is_an_error_not_an_empty_result():
+    inventory = NumberInventory(FakeOXIO(NUMBERS), prefetch_npas=[])
+
+    result = inventory.search(npa='415')
+    assert result['success'] is False
+    assert result['status_code'] == 503
+
+    oxio = FakeOXIO(NUMBERS, zip_area_codes={'10001': ['212', '415']})
+    partial = NumberInventory(oxio, prefetch_npas=[]).search(zip_code='10001', limit=10)
+    assert partial['success'] is True
+    assert partial['unavailable_area_codes'] == ['415']
+    assert len(partial['data']['phoneNumbers']) == 5
+
+
+def test_invalid_pattern_is_rejected():
+    inventory = NumberInventory(FakeOXIO(NUMBERS), prefetch_npas=[])
+    assert inventory.search(npa='212', pattern='12345678901')['status_code'] == 400
+
+
+def test_concurrent_cold_searches_share_one_fetch():
+    oxio = FakeOXIO(NUMBERS)
+    oxio.gate = threading.Event()
+    inventory = NumberInventory(oxio, prefetch_npas=[])
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(inventory.search(npa='646'))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    oxio.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(oxio.searches) == 1
+    assert all(len(result['data']['phoneNumbers']) == 2 for result in results)
+
+
+def test_refresh_and_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(number_inventory.time, 'monotonic', lambda: now[0])
+    oxio = FakeOXIO(NUMBERS)
+    inventory = NumberInventory(oxio, prefetch_npas=[], refresh_interval=300, max_npas=1)
+
+    inventory.search(npa='212')
+    now[0] += 10
+    inventory.search(npa='646')
+    assert list(inventory.get_stats()['npas']) == ['646']  # 212 evicted as least recently searched
+
+    oxio.numbers_by_npa['646'] = ['6460000000']
+    assert inventory.refresh_stale() == 0
+    now[0] += 300
+    assert inventory.refresh_stale() == 1
+    assert numbers(inventory.search(npa='646')) == ['+16460000000']
+
+
+def test_reservations_hide_numbers_from_other_users():
+    inventory = NumberInventory(FakeOXIO(NUMBERS), prefetch_npas=[], reservation_seconds=600)
+    inventory.search(npa='646')
+
+    assert inventory.reserve('+16465550123', 'alice')['success']
+    assert inventory.reserve('+16465550123', 'bob')['status_code'] == 409
+    assert inventory.reserve('+16469999999', 'bob')['status_code'] == 404
+    assert numbers(inventory.search(npa='646')) == ['+16467772233']
+    assert numbers(inventory.search(npa='646', holder='alice')) == ['+16465550123', '+16467772233']
+
+    assert not inventory.release('+16465550123', 'bob')
+    assert inventory.release('+16465550123', 'alice', taken=True)
+    assert numbers(inventory.search(npa='646')) == ['+16467772233']
+
+
+def test_expired_reservation_frees_the_number(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(number_inventory.time, 'monotonic', lambda: now[0])
+    inventory = NumberInventory(FakeOXIO(NUMBERS), prefetch_npas=[], reservation_seconds=60)
+    inventory.search(npa='646')
+    inventory.reserve('6465550123', 'alice')
+
+    now[0] += 61
+    assert inventory.reserve('6465550123', 'bob')['success']
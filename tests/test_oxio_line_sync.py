@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Test: OXIO Line Reconciliation
+Exercises OXIOLineSync paging, content-hash diffing and batched writes against
+a fake database and a fake OXIO service
+"""
+
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+os.environ.setdefault('OXIO_API_KEY', 'test')
+os.environ.setdefault('OXIO_AUTH_TOKEN', 'test')
+
+import oxio_line_sync
+from esim_sync_service import line_fields
+from oxio_line_sync import OXIOLineSync, content_hash, seconds_until_hour
+
+
+def line(line_id, iccid, status='ACTIVE', phone='+12125550100'):
+    return {'lineId': line_id, 'status': status, 'sim': {'iccid': iccid, 'activationCode': 'LPA:1$x$y'},
+            'phoneNumbers': [{'phoneNumber': phone}]}
+
+
+class FakeDatabase:
+    def __init__(self, users, state=None, fail_iccid=None):
+        self.users = users
+        self.state = dict(state or {})  # line_id -> (user_id, hash)
+        self.fail_iccid = fail_iccid
+        self.writes = []
+        self.commits = 0
+        self.result = None
+        self.description = None
+        self.rowcount = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.result, self.rowcount = None, 1
+        if 'pg_try_advisory_lock' in sql:
+            self.result = [(True,)]
+        elif 'SELECT COUNT(*) FROM users' in sql:
+            self.result = [(len(self.users),)]
+        elif 'INSERT INTO oxio_line_sync_runs' in sql:
+            self.result = [(1,)]
+        elif 'FROM users' in sql:
+            after_id, limit = params
+            self.result = [user for user in self.users if user[0] > after_id][:limit]
+        elif 'FROM oxio_line_sync_state' in sql:
+            self.result = [(line_id, owner, digest) for line_id, (owner, digest) in self.state.items()
+                           if owner in params[0]]
+        elif 'INSERT INTO iccid_inventory' in sql:
+            if params[0] == self.fail_iccid:
+                raise Exception('value too long')
+            self.writes.append(('iccid', params[0]))
+        elif 'UPDATE oxio_activations' in sql:
+            self.rowcount = 0
+        elif 'INSERT INTO oxio_activations' in sql:
+            self.writes.append(('activation', params[3]))
+        elif 'FROM purchases' in sql:
+            self.result = [(1,)]
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result or []
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeOXIO:
+    def __init__(self, lines):
+        self.lines = lines
+        self.calls = []
+
+    def get_user_lines(self, oxio_user_id):
+        self.calls.append(oxio_user_id)
+        if oxio_user_id not in self.lines:
+            return {'success': False, 'status_code': 503}
+        return {'success': True, 'data': {'lines': self.lines[oxio_user_id]}}
+
+    def is_available(self, family):
+        return True
+
+
+def make_sync(monkeypatch, db, oxio, **kwargs):
+    def fake_execute_values(cur, sql, rows, page_size=None):
+        for line_id, user_id, _, digest, _ in rows:
+            db.state[line_id] = (user_id, digest)
+    monkeypatch.setattr(oxio_line_sync, 'execute_values', fake_execute_values)
+
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    options = dict(page_size=2, concurrency=4, rate=0, apply_batch=2)
+    options.update(kwargs)
+    return OXIOLineSync(get_db_connection, oxio, **options)
+
+
+def test_first_run_writes_everything_then_only_changes(monkeypatch):
+    users = [(1, 'uid-1', 'ox-1'), (2, 'uid-2', 'ox-2'), (3, 'uid-3', 'ox-3')]
+    oxio = FakeOXIO({'ox-1': [line('L1', '8901')], 'ox-2': [line('L2', '8902'), line('L3', '8903')], 'ox-3': []})
+    db = FakeDatabase(users)
+    sync = make_sync(monkeypatch, db, oxio)
+
+    first = sync.run()
+    assert first['success'] and first['users_scanned'] == 3
+    assert (first['lines_new'], first['lines_changed'], first['lines_written']) == (3, 0, 3)
+    assert sorted(oxio.calls) == ['ox-1', 'ox-2', 'ox-3']
+
+    db.writes.clear()
+    oxio.lines['ox-2'] = [line('L2', '8902', status='SUSPENDED')]  # L3 dropped, L2 changed
+    second = sync.run()
+    assert (second['lines_new'], second['lines_changed'], second['lines_unchanged']) == (0, 1, 1)
+    assert second['lines_missing'] == 1
+    assert db.writes == [('iccid', '8902'), ('activation', '8902')]
+
+
+def test_fetch_errors_are_counted_and_failed_lines_retried_next_run(monkeypatch):
+    users = [(1, 'uid-1', 'ox-1'), (2, 'uid-2', 'ox-down')]
+    oxio = FakeOXIO({'ox-1': [line('L1', '8901'), line('L2', '8902')]})
+    db = FakeDatabase(users, fail_iccid='8901')
+    sync = make_sync(monkeypatch, db, oxio)
+
+    result = sync.run()
+    assert (result['fetch_errors'], result['apply_errors'], result['lines_written']) == (1, 1, 1)
+    assert 'L1' not in db.state and 'L2' in db.state
+
+    db.fail_iccid = None
+    assert sync.run()['lines_new'] == 1
+
+
+def test_hash_covers_owner_and_fields():
+    fields = line_fields(line('L1', '8901'))
+    assert content_hash(1, fields) == content_hash(1, dict(fields))
+    assert content_hash(1, fields) != content_hash(2, fields)
+    assert content_hash(1, fields) != content_hash(1, dict(fields, status='SUSPENDED'))
+
+
+def test_seconds_until_nightly_hour():
+    assert seconds_until_hour(3, datetime(2026, 1, 1, 2, 30)) == 1800
+    assert seconds_until_hour(3, datetime(2026, 1, 1, 3, 0)) == 86400
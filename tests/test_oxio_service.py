@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test: OXIO HTTP Client
+Checks OXIOService's pooled session: cached auth headers, per-endpoint
+timeouts and retries only for idempotent verbs (local stub server, no OXIO)
+"""
+
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault('OXIO_API_KEY', 'test')
+os.environ.setdefault('OXIO_AUTH_TOKEN', 'test')
+
+import pytest
+import oxio_service
+from oxio_service import OXIOService
+
+
+@pytest.fixture
+def stub():
+    """Local server that answers 503 to the first `failures` requests, then 200"""
+    state = {'failures': 0, 'requests': [], 'connections': set()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def respond(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            state['requests'].append((self.command, self.headers.get('Authorization')))
+            state['connections'].add(self.client_address)
+            failing = state['failures'] > 0
+            state['failures'] -= 1
+            body = json.dumps({'phoneNumbers': []} if not failing else {'message': 'busy'}).encode()
+            self.send_response(503 if failing else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = respond
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state['url'] = f"http://127.0.0.1:{server.server_port}"
+    yield state
+    server.shutdown()
+
+
+@pytest.fixture
+def service(monkeypatch, stub):
+    monkeypatch.setattr(oxio_service, 'OXIO_RETRY_BACKOFF', 0)
+    monkeypatch.setattr(oxio_service, 'OXIO_RETRY_JITTER', 0)
+    service = OXIOService()
+    service.base_url = stub['url']
+    return service
+
+
+def test_auth_headers_are_encoded_once_and_copied(service):
+    headers = service.get_headers()
+    headers['Authorization'] = 'tampered'
+
+    assert service.get_headers()['Authorization'] == 'Basic dGVzdDp0ZXN0'
+    assert service.session.headers['Authorization'] == 'Basic dGVzdDp0ZXN0'
+
+
+def test_calls_reuse_one_keep_alive_connection(service, stub):
+    for _ in range(3):
+        assert service.search_available_numbers(area_code='212')['success']
+
+    assert len(stub['requests']) == 3 and len(stub['connections']) == 1
+
+
+def test_idempotent_get_is_retried_on_503(service, stub):
+    stub['failures'] = 2
+
+    assert service.search_available_numbers(area_code='212')['success']
+    assert [method for method, _ in stub['requests']] == ['GET'] * 3
+
+
+def test_post_is_not_retried(service, stub):
+    stub['failures'] = 1
+
+    result = service.create_oxio_user('Ada', 'Lovelace', 'ada@example.com', 'uid-1')
+
+    assert result['success'] is False and result['status_code'] == 503
+    assert len(stub['requests']) == 1
+
+
+def test_endpoint_timeouts(monkeypatch, service):
+    seen = {}
+
+    def fake_request(method, url, **kwargs):
+        seen[url] = kwargs['timeout']
+        return type('Response', (), {'status_code': 200})()
+    monkeypatch.setattr(service.session, 'request', fake_request)
+
+    service._request('POST', 'activate_line', 'https://oxio/line')
+    service.request('GET', '/v3/unknown')
+
+    assert seen['https://oxio/line'] == (oxio_service.OXIO_CONNECT_TIMEOUT, 60)
+    assert seen[f"{service.base_url}/v3/unknown"] == (oxio_service.OXIO_CONNECT_TIMEOUT,
+                                                       oxio_service.OXIO_DEFAULT_TIMEOUT)
+
+
+def test_open_circuit_fails_fast_per_endpoint_family(service, stub):
+    stub['failures'] = 100
+    service.breakers['numbers'].min_calls = 2
+    for _ in range(2):
+        assert service.search_available_numbers(area_code='212')['success'] is False
+    calls_made = len(stub['requests'])
+
+    result = service.search_available_numbers(area_code='212')
+
+    assert result['success'] is False and 'circuit open' in result['message']
+    assert len(stub['requests']) == calls_made
+    assert service.is_available('numbers') is False and service.is_available('provisioning') is True
+    health = service.get_health()
+    assert health['healthy'] is False and health['breakers']['numbers']['state'] == 'open'
+
+
+def test_reference_lookups_are_cached_by_normalized_params(service, stub):
+    first = service.get_zip_codes(prefix=' 202 ', state='dc')
+    second = service.get_zip_codes(prefix='202', state='DC', per_page='50')
+
+    assert (first['cache'], second['cache']) == ('miss', 'hit')
+    assert len(stub['requests']) == 1
+
+    assert service.flush_reference_cache('zip_codes') == 1
+    assert service.get_zip_codes(prefix='202', state='DC')['cache'] == 'miss'
+    assert len(stub['requests']) == 2
+
+
+def test_unexpected_exception_still_records_a_failure(monkeypatch, service):
+    breaker = service.breakers['provisioning']
+    breaker._open(0)
+    breaker.open_seconds = 0  # half-open on the next call
+    breaker.half_open_calls = 1
+
+    def broken_request(method, url, **kwargs):
+        raise ValueError('Invalid header value')
+    monkeypatch.setattr(service.session, 'request', broken_request)
+
+    with pytest.raises(ValueError):
+        service._request('POST', 'activate_line', 'https://oxio/line')
+
+    # The probe slot was given back and the failed probe reopened the circuit
+    assert breaker._probes_in_flight == 0 and breaker.times_opened == 2
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test: OXIO API Simulator
+Drives OXIOService against oxio_simulator over HTTP: user creation (including
+the 6805 existing-user error), line activation, fault injection and rate limits
+"""
+
+import os
+
+os.environ.setdefault('OXIO_API_KEY', 'test')
+os.environ.setdefault('OXIO_AUTH_TOKEN', 'test')
+
+import pytest
+import oxio_service
+from oxio_service import OXIOService
+from oxio_simulator import OXIOSimulator, USER_EXISTS_CODE
+
+
+@pytest.fixture
+def simulator():
+    sim = OXIOSimulator(seed=1)
+    sim.start()
+    yield sim
+    sim.stop()
+
+
+@pytest.fixture
+def service(monkeypatch, simulator):
+    monkeypatch.setattr(oxio_service, 'OXIO_RETRY_BACKOFF', 0)
+    monkeypatch.setattr(oxio_service, 'OXIO_RETRY_JITTER', 0)
+    monkeypatch.setenv('OXIO_ENVIRONMENT', simulator.url)
+    return OXIOService()
+
+
+def test_user_creation_and_existing_user_error(service):
+    created = service.create_oxio_user('Ada', 'Lovelace', 'ada@example.com', 'uid-1')
+    assert created['success'] and created['oxio_user_id']
+
+    duplicate = service.create_oxio_user('Ada', 'Lovelace', 'ADA@example.com', 'uid-1')
+    assert duplicate['status_code'] == 400 and duplicate['data']['code'] == USER_EXISTS_CODE
+
+    found = service.find_user_by_email('ada@example.com')
+    assert found['success'] and found['oxio_user_id'] == created['oxio_user_id']
+
+
+def test_line_activation_shows_up_in_user_lines(service):
+    oxio_user_id = service.create_oxio_user(email='line@example.com')['oxio_user_id']
+
+    activation = service.activate_line({'lineType': 'LINE_TYPE_MOBILITY', 'endUserId': oxio_user_id,
+                                        'phoneNumberRequirements': {'preferredAreaCode': '646'}})
+    assert activation['success']
+    line = activation['data']
+    assert line['sim']['iccid'].startswith('8901') and line['phoneNumbers'][0]['phoneNumber'].startswith('+1646')
+
+    lines = service.get_user_lines(oxio_user_id)['data']['lines']
+    assert [entry['lineId'] for entry in lines] == [line['lineId']]
+    assert service.activate_line('unknown-user')['status_code'] == 404
+
+
+def test_injected_faults_and_rate_limit(service, simulator):
+    oxio_user_id = service.create_oxio_user(email='fault@example.com')['oxio_user_id']
+
+    simulator.inject('/v3/lines/line', 500, {'message': 'carrier timeout'}, count=1)
+    failed = service.activate_line(oxio_user_id)
+    assert failed['status_code'] == 500 and failed['message'] == 'carrier timeout'
+    assert service.activate_line(oxio_user_id)['success']
+
+    simulator.rate_limit = 2
+    statuses = [service.request('POST', '/v3/subscriptions', json={}).status_code for _ in range(4)]
+    assert statuses[:2] == [201, 201] and 429 in statuses
+    assert simulator.get_stats()['responses']['429'] >= 1
+
+
+def test_environment_value_simulator_starts_embedded_server(monkeypatch):
+    monkeypatch.setenv('OXIO_ENVIRONMENT', 'simulator')
+    service = OXIOService()
+
+    assert service.base_url.startswith('http://127.0.0.1:')
+    assert service.test_connection()['success']
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test: OXIO API Telemetry
+Exercises the latency histogram and OXIOTelemetry window flushing against a fake database
+"""
+
+import json
+import random
+from contextlib import contextmanager
+import oxio_telemetry
+from oxio_telemetry import LatencyHistogram, OXIOTelemetry, bucket_index, bucket_bounds
+
+
+class FakeDatabase:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def make_telemetry(monkeypatch, db):
+    def fake_execute_values(cur, sql, rows, page_size=None):
+        if db.fail:
+            raise Exception("relation does not exist")
+        db.batches.append(list(rows))
+    monkeypatch.setattr(oxio_telemetry, 'execute_values', fake_execute_values)
+
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    return OXIOTelemetry(get_db_connection, flush_interval=60)
+
+
+def test_buckets_are_contiguous_with_bounded_error():
+    previous_high = -1
+    for index in range(bucket_index(200000) + 1):
+        low, high = bucket_bounds(index)
+        assert low == previous_high + 1
+        assert bucket_index(low) == index and bucket_index(high) == index
+        assert high - low <= max(low // 16, 0)
+        previous_high = high
+
+
+def test_percentiles_track_exact_values_within_bucket_error():
+    rng = random.Random(7)
+    values = sorted(int(rng.lognormvariate(5, 1)) for _ in range(5000))
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    for p in (50, 90, 99):
+        exact = values[int(round(p / 100 * len(values))) - 1]
+        assert exact <= histogram.percentile(p) <= exact * 1.07
+    assert histogram.percentile(100) == values[-1] == histogram.max_ms
+
+
+def test_flush_writes_one_row_per_endpoint_and_keeps_totals(monkeypatch):
+    db = FakeDatabase()
+    telemetry = make_telemetry(monkeypatch, db)
+    telemetry.record('search_numbers', 120, status_code=200)
+    telemetry.record('search_numbers', 80, status_code=503)
+    telemetry.record('activate_line', 5000, error_class='ReadTimeout')
+
+    assert telemetry.flush() == 2
+    rows = {row[3]: row for row in db.batches[0]}
+    _, _, _, _, calls, errors, p50, _, _, max_ms, total_ms, statuses, error_classes, histogram = rows['search_numbers']
+    assert (calls, errors, max_ms, total_ms) == (2, 1, 120, 200)
+    assert json.loads(statuses) == {'200': 1, '503': 1}
+    assert sum(json.loads(histogram).values()) == 2
+    assert json.loads(rows['activate_line'][12]) == {'ReadTimeout': 1}
+
+    assert telemetry.flush() == 0  # window was reset
+    metrics = telemetry.get_metrics()
+    assert metrics['endpoints']['search_numbers']['calls'] == 2
+    assert metrics['window']['endpoints'] == {}
+
+
+def test_failed_flush_is_merged_into_next_window(monkeypatch):
+    db = FakeDatabase(fail=True)
+    telemetry = make_telemetry(monkeypatch, db)
+    telemetry.record('get_sim', 10, status_code=200)
+    assert telemetry.flush() == 0
+
+    db.fail = False
+    telemetry.record('get_sim', 20, status_code=200)
+    assert telemetry.flush() == 1
+    assert db.batches[0][0][4] == 2
+    assert telemetry.get_metrics()['writer']['write_errors'] == 1
+
+
+def test_rejections_count_as_errors_but_stay_out_of_the_histogram(monkeypatch):
+    db = FakeDatabase()
+    telemetry = make_telemetry(monkeypatch, db)
+    telemetry.record('activate_line', 900, status_code=200)
+    for _ in range(9):
+        telemetry.record('activate_line', None, error_class='CircuitOpen')
+
+    summary = telemetry.get_metrics()['endpoints']['activate_line']
+    assert (summary['calls'], summary['rejected'], summary['errors']) == (10, 9, 9)
+    assert summary['p50_ms'] >= 900 and summary['mean_ms'] == 900
+    assert summary['error_classes'] == {'CircuitOpen': 9}
+
+    telemetry.flush()
+    row = db.batches[0][0]
+    assert (row[4], row[5], row[9]) == (10, 9, 900)
+    assert sum(json.loads(row[13]).values()) == 1
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Test: Parallel Side Effects
+Checks run_parallel concurrency, per-task timeouts and error capture
+"""
+
+import time
+from parallel_tasks import run_parallel
+
+
+def sleeper(seconds, value=None):
+    def task():
+        time.sleep(seconds)
+        return value
+    return task
+
+
+def test_latency_is_bounded_by_slowest_task():
+    began = time.monotonic()
+    results = run_parallel({'a': sleeper(0.2, 1), 'b': sleeper(0.2, 2), 'c': sleeper(0.3, 3)})
+
+    assert time.monotonic() - began < 0.6
+    assert [results[name]['result'] for name in ('a', 'b', 'c')] == [1, 2, 3]
+    assert all(result['success'] for result in results.values())
+
+
+def test_per_task_timeout_does_not_block_other_results():
+    results = run_parallel({'slow': sleeper(1.0), 'fast': sleeper(0.01, 'ok')},
+                           timeout=5, timeouts={'slow': 0.1})
+
+    assert results['slow']['success'] is False and results['slow']['timed_out'] is True
+    assert results['fast'] == {'success': True, 'result': 'ok', 'timed_out': False,
+                               'elapsed_ms': results['fast']['elapsed_ms']}
+
+
+def test_exceptions_are_captured_per_task():
+    def boom():
+        raise ValueError('Resend unavailable')
+
+    results = run_parallel({'email': boom, 'receipt': sleeper(0, 'done')})
+
+    assert results['email'] == {'success': False, 'error': 'Resend unavailable', 'timed_out': False,
+                                'elapsed_ms': results['email']['elapsed_ms']}
+    assert results['receipt']['result'] == 'done'
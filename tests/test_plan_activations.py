@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test: Paid Plan Activations
+Checks that activate_plan_once POSTs an OXIO subscription at most once per
+checkout session across job retries, and which failures are retried
+"""
+
+import pytest
+import requests
+
+from oxio_service import OXIOUnavailableError
+from plan_activations import activate_plan_once
+from stripe_webhook_queue import PermanentJobError
+
+
+class FakeLedger:
+    def __init__(self):
+        self.rows = {}
+
+    def claim(self, session_id, firebase_uid, plan_id):
+        if session_id in self.rows:
+            return dict(self.rows[session_id])
+        self.rows[session_id] = {'status': 'started', 'subscription_id': None, 'purchase_id': None, 'last_error': None}
+        return None
+
+    def mark(self, session_id, status, subscription_id=None, purchase_id=None, error=None):
+        row = self.rows[session_id]
+        row['status'] = status
+        row['subscription_id'] = subscription_id or row['subscription_id']
+        row['purchase_id'] = purchase_id or row['purchase_id']
+        row['last_error'] = error
+
+    def release(self, session_id):
+        if self.rows.get(session_id, {}).get('status') == 'started':
+            del self.rows[session_id]
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.text = str(self.body)
+
+    def json(self):
+        return self.body
+
+
+def make_oxio(*outcomes):
+    posts = []
+
+    def create_subscription():
+        posts.append(1)
+        outcome = outcomes[min(len(posts), len(outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return create_subscription, posts
+
+
+def activate(ledger, create_subscription, record_purchase=lambda subscription_id: 7):
+    return activate_plan_once(ledger, 'cs_1', 'uid-1', 'plan-10gb', create_subscription, record_purchase)
+
+
+def test_successful_activation_is_not_repeated():
+    ledger = FakeLedger()
+    create_subscription, posts = make_oxio(FakeResponse(201, {'id': 'sub_1'}))
+
+    assert activate(ledger, create_subscription) == {'subscription_id': 'sub_1', 'purchase_id': 7, 'resumed': False}
+    assert activate(ledger, create_subscription)['resumed'] is True
+    assert len(posts) == 1
+
+
+def test_purchase_failure_after_subscription_is_permanent_and_resumes_without_posting():
+    ledger = FakeLedger()
+    create_subscription, posts = make_oxio(FakeResponse(200, {'subscriptionId': 'sub_2'}))
+
+    with pytest.raises(PermanentJobError):
+        activate(ledger, create_subscription, record_purchase=lambda subscription_id: None)
+    assert ledger.rows['cs_1']['status'] == 'subscribed'
+
+    recorded = []
+    result = activate(ledger, create_subscription, record_purchase=lambda subscription_id: recorded.append(subscription_id) or 9)
+    assert result == {'subscription_id': 'sub_2', 'purchase_id': 9, 'resumed': True}
+    assert recorded == ['sub_2']
+    assert len(posts) == 1
+
+
+def test_unknown_outcome_and_rejection_are_permanent():
+    ledger = FakeLedger()
+    create_subscription, posts = make_oxio(requests.exceptions.ReadTimeout('read timed out'))
+    with pytest.raises(PermanentJobError):
+        activate(ledger, create_subscription)
+    with pytest.raises(PermanentJobError):
+        activate(ledger, create_subscription)
+    assert len(posts) == 1  # the retry never POSTs again while the outcome is unknown
+
+    ledger = FakeLedger()
+    create_subscription, posts = make_oxio(FakeResponse(422, {'error': 'plan not allowed'}))
+    with pytest.raises(PermanentJobError):
+        activate(ledger, create_subscription)
+    assert ledger.rows['cs_1']['status'] == 'rejected'
+
+
+def test_calls_that_never_reached_oxio_are_retried():
+    ledger = FakeLedger()
+    create_subscription, posts = make_oxio(
+        OXIOUnavailableError('provisioning', 'circuit open'),
+        requests.exceptions.ConnectTimeout('connect timed out'),
+        FakeResponse(503),
+        FakeResponse(201, {'id': 'sub_3'})
+    )
+    for error in (OXIOUnavailableError, requests.exceptions.ConnectTimeout, Exception):
+        with pytest.raises(error):
+            activate(ledger, create_subscription)
+        assert 'cs_1' not in ledger.rows
+
+    assert activate(ledger, create_subscription)['subscription_id'] == 'sub_3'
+    assert len(posts) == 4
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Test: Batched Reward Ledger
+Exercises accrual idempotency, batch due rules (size and max delay),
+per-address aggregation, settlement on mined batches and release on failure
+against a fake database
+"""
+
+from contextlib import contextmanager
+
+import reward_ledger
+from reward_ledger import RewardLedger
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.rows = []  # dicts: id, eth_address, amount_wei, reference, status, attempts, batch_id, age
+        self.batches = {}
+        self.result = None
+        self.description = None
+        self.lock_held_elsewhere = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.result = None
+        if 'pg_try_advisory_xact_lock' in sql:
+            self.result = [(not self.lock_held_elsewhere,)]
+        elif 'INSERT INTO token_reward_ledger' in sql:
+            eth_address, user_id, amount_wei, reason, reference = params
+            if reference and any(row['reference'] == reference for row in self.rows):
+                return
+            row = {'id': len(self.rows) + 1, 'eth_address': eth_address, 'amount_wei': amount_wei,
+                   'reference': reference, 'status': 'pending', 'attempts': 0, 'batch_id': None, 'age': 0}
+            self.rows.append(row)
+            self.result = [(row['id'],)]
+        elif 'COUNT(DISTINCT eth_address)' in sql:
+            pending = [row for row in self.rows if row['status'] == 'pending']
+            self.result = [(len({row['eth_address'] for row in pending}),
+                            max((row['age'] for row in pending), default=None))]
+        elif 'INSERT INTO token_reward_batches' in sql:
+            batch_id = len(self.batches) + 1
+            self.batches[batch_id] = {'status': 'sending', 'tx_id': None, 'tx_hash': None, 'age': 0}
+            self.result = [(batch_id,)]
+        elif 'WITH recipients AS' in sql:
+            limit, batch_id = params
+            addresses = []
+            for row in sorted(self.rows, key=lambda row: -row['age']):
+                if row['status'] == 'pending' and row['eth_address'] not in addresses:
+                    addresses.append(row['eth_address'])
+            claimed = []
+            for row in self.rows:
+                if row['status'] == 'pending' and row['eth_address'] in addresses[:limit]:
+                    row.update(status='settling', batch_id=batch_id, attempts=row['attempts'] + 1)
+                    claimed.append((row['eth_address'], row['amount_wei']))
+            self.result = claimed
+        elif 'SET recipients' in sql:
+            recipients, rewards, total_wei, batch_id = params
+            self.batches[batch_id].update(recipients=recipients, rewards=rewards, total_wei=total_wei)
+        elif 'SET tx_id' in sql:
+            self.batches[params[1]]['tx_id'] = params[0]
+        elif "SET status = 'sent'" in sql:
+            self.batches[params[1]].update(status='sent', tx_hash=params[0])
+        elif 'SELECT status, tx_id, tx_hash FROM token_reward_batches' in sql:
+            batch = self.batches.get(params[0])
+            self.result = [(batch['status'], batch['tx_id'], batch['tx_hash'])] if batch else None
+        elif "UPDATE token_reward_ledger SET status = 'pending'" in sql:
+            for row in self.rows:
+                if row['batch_id'] == params[0] and row['status'] == 'settling':
+                    row.update(status='pending', batch_id=None)
+        elif "SET status = 'released'" in sql:
+            self.batches[params[1]].update(status='released', error=params[0])
+        elif "SET status = 'sent', error = NULL" in sql:
+            self.batches[params[0]].update(status='sent', error=None)
+        elif 'FROM token_reward_batches WHERE status IN' in sql:
+            self.result = [(batch_id, batch['tx_id'], batch['tx_hash'], batch['age'])
+                           for batch_id, batch in sorted(self.batches.items())
+                           if batch['status'] in ('sending', 'sent')]
+        elif "UPDATE token_reward_ledger SET status = 'settled'" in sql:
+            for row in self.rows:
+                if row['batch_id'] == params[0] and row['status'] == 'settling':
+                    row['status'] = 'settled'
+        elif "UPDATE token_reward_batches SET status = 'settled'" in sql:
+            self.batches[params[0]]['status'] = 'settled'
+        elif 'CASE WHEN attempts' in sql:
+            max_attempts, batch_id = params
+            for row in self.rows:
+                if row['batch_id'] == batch_id and row['status'] == 'settling':
+                    row.update(status='failed' if row['attempts'] >= max_attempts else 'pending', batch_id=None)
+        elif "SET status = 'failed'" in sql or "SET status = 'orphaned'" in sql:
+            self.batches[params[1]].update(status='failed' if 'failed' in sql else 'orphaned', error=params[0])
+        elif 'COALESCE(SUM(amount_wei)' in sql:
+            totals = {}
+            for row in self.rows:
+                if row['eth_address'] == params[0] and row['status'] in ('pending', 'settling'):
+                    amount, count = totals.get(row['status'], (0, 0))
+                    totals[row['status']] = (amount + row['amount_wei'], count + 1)
+            self.result = [(status, amount, count) for status, (amount, count) in totals.items()]
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result or []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeHandle:
+    def __init__(self, tx_id):
+        self.id = tx_id
+
+
+def make_ledger(batch_size=3, max_delay=900):
+    db = FakeDatabase()
+    sent, statuses = [], {}
+
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    def send_batch(addresses, amounts, on_sent, record):
+        assert record == ('token_reward_batches', len(db.batches))
+        tx_id = f"tx_{len(sent) + 1}"
+        sent.append((addresses, amounts))
+        on_sent(f"0xhash{len(sent)}", None)
+        return FakeHandle(tx_id)
+
+    ledger = RewardLedger(get_db_connection, send_batch,
+                          lambda tx_id, tx_hash, record: statuses.get(tx_id, 'sent'),
+                          batch_size=batch_size, max_delay=max_delay)
+    return db, ledger, sent, statuses
+
+
+def test_accrue_is_idempotent_by_reference():
+    db, ledger, _, _ = make_ledger()
+    first = ledger.accrue('0xA', 10, 'new_member', reference='new_member:0xa')
+    assert first['success'] and first['entry'].id == 'reward_1' and first['entry'].tx_hash is None
+    assert ledger.accrue('0xA', 10, 'new_member', reference='new_member:0xa') == \
+        {'success': False, 'error': 'Reward already recorded'}
+    assert not ledger.accrue('0xA', 0, 'data_purchase')['success']
+    assert len(db.rows) == 1
+
+
+def test_batch_waits_for_size_or_delay():
+    db, ledger, sent, _ = make_ledger(batch_size=3, max_delay=900)
+    ledger.accrue('0xA', 10, 'data_purchase')
+    ledger.accrue('0xB', 20, 'data_purchase')
+    assert ledger.settle() is None
+
+    db.rows[0]['age'] = 901
+    assert ledger.settle() == 1
+    assert sent == [(['0xA', '0xB'], [10, 20])]
+
+
+def test_batch_sums_per_address_and_caps_recipients():
+    db, ledger, sent, _ = make_ledger(batch_size=2)
+    for address, amount in [('0xA', 10), ('0xB', 20), ('0xA', 5), ('0xC', 7)]:
+        ledger.accrue(address, amount, 'data_purchase')
+    db.rows[2]['age'] = 1  # 0xA has the oldest pending reward
+
+    batch_id = ledger.settle()
+    assert sent == [(['0xA', '0xB'], [15, 20])]
+    assert db.batches[batch_id] == {'status': 'sent', 'tx_id': 'tx_1', 'tx_hash': '0xhash1', 'age': 0,
+                                    'recipients': 2, 'rewards': 3, 'total_wei': 35}
+    assert ledger.get_pending_balance('0xA') == {'pending_wei': 0, 'settling_wei': 15, 'pending_rewards': 2,
+                                                 'unminted_dotm': 15 / 10 ** 18}
+    assert [row['status'] for row in db.rows] == ['settling', 'settling', 'settling', 'pending']
+
+
+def test_mined_batch_settles_and_failed_batch_releases(monkeypatch):
+    monkeypatch.setattr(reward_ledger, 'REWARD_MAX_ATTEMPTS', 2)
+    db, ledger, sent, statuses = make_ledger(batch_size=1)
+    ledger.accrue('0xA', 10, 'data_purchase')
+    ledger.accrue('0xB', 20, 'data_purchase')
+
+    ledger.settle()  # 0xA
+    ledger.settle()  # 0xB
+    assert ledger.reconcile() == {'settled': 0, 'released': 0, 'orphaned': 0}
+
+    statuses.update({'tx_1': 'mined', 'tx_2': 'failed'})
+    assert ledger.reconcile() == {'settled': 1, 'released': 1, 'orphaned': 0}
+    assert [row['status'] for row in db.rows] == ['settled', 'pending']
+    assert ledger.get_pending_balance('0xA')['pending_rewards'] == 0
+
+    ledger.settle(force=True)
+    statuses['tx_3'] = 'dropped'
+    ledger.reconcile()
+    assert db.rows[1]['status'] == 'failed'  # second failed attempt
+
+
+def test_unknown_batch_is_orphaned_after_grace_period():
+    db, ledger, _, statuses = make_ledger(batch_size=1)
+    ledger.accrue('0xA', 10, 'data_purchase')
+    ledger.settle()
+    statuses['tx_1'] = 'unknown'
+
+    assert ledger.reconcile()['orphaned'] == 0
+    db.batches[1]['age'] = reward_ledger.REWARD_ORPHAN_SECONDS
+    assert ledger.reconcile()['orphaned'] == 1
+    assert db.batches[1]['status'] == 'orphaned' and db.rows[0]['status'] == 'settling'
+
+
+def test_queue_failure_releases_rewards():
+    db, ledger, _, _ = make_ledger(batch_size=1)
+    ledger.send_batch = lambda *args: (_ for _ in ()).throw(ValueError('Admin key not configured'))
+    ledger.accrue('0xA', 10, 'data_purchase')
+
+    assert ledger.settle() == 1
+    assert db.batches[1]['status'] == 'failed'
+    assert db.rows[0]['status'] == 'pending' and db.rows[0]['batch_id'] is None
+
+
+def test_orphaned_batch_can_be_released_or_settled_by_admin():
+    db, ledger, _, statuses = make_ledger(batch_size=1)
+    ledger.accrue('0xA', 10, 'data_purchase')
+    ledger.accrue('0xB', 20, 'data_purchase')
+    ledger.settle()
+    ledger.settle()
+    statuses.update({'tx_1': 'unknown', 'tx_2': 'unknown'})
+    for batch in db.batches.values():
+        batch['age'] = reward_ledger.REWARD_ORPHAN_SECONDS
+    assert ledger.reconcile()['orphaned'] == 2
+
+    assert ledger.release_batch(1)['outcome'] == 'released'
+    assert db.batches[1]['status'] == 'released'
+    assert db.rows[0]['status'] == 'pending' and db.rows[0]['batch_id'] is None
+
+    statuses['tx_2'] = 'mined'  # found on chain after all
+    assert ledger.release_batch(2)['outcome'] == 'settled'
+    assert db.rows[1]['status'] == 'settled'
+
+    assert ledger.release_batch(2) == {'success': False, 'error': 'Batch not found or not orphaned'}
+
+
+def test_reconcile_waits_for_the_settle_lock():
+    db, ledger, _, statuses = make_ledger(batch_size=1)
+    ledger.accrue('0xA', 10, 'data_purchase')
+    ledger.settle()
+    statuses['tx_1'] = 'mined'
+
+    db.lock_held_elsewhere = True
+    assert ledger.reconcile() == {'settled': 0, 'released': 0, 'orphaned': 0}
+    db.lock_held_elsewhere = False
+    assert ledger.reconcile()['settled'] == 1
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test: Stripe Webhook Job Queue
+Exercises StripeWebhookQueue retry, backoff and dead-letter handling against a fake database
+"""
+
+from contextlib import contextmanager
+import stripe_webhook_queue
+from stripe_webhook_queue import StripeWebhookQueue, PermanentJobError, DeferJobError, ProcessedEventCache, retry_delay
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.updates = []
+        self.claimable = []
+        self.result = None
+        self.rowcount = 1
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+        if 'WITH expired' in sql:
+            self.rowcount = 0
+        elif 'FOR UPDATE SKIP LOCKED' in sql:
+            self.result = self.claimable.pop(0) if self.claimable else None
+        elif 'UPDATE stripe_webhook_jobs' in sql:
+            self.updates.append(params)
+        elif 'UPDATE processed_stripe_events' in sql:
+            self.updates.append(('processed', params))
+
+    def fetchone(self):
+        return self.result
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def make_queue(handler):
+    db = FakeDatabase()
+
+    @contextmanager
+    def get_db_connection():
+        yield db
+
+    return StripeWebhookQueue(get_db_connection, handler), db
+
+
+def job(attempts=1, max_attempts=3):
+    return {'id': 5, 'event_id': 'evt_1', 'event_type': 'checkout.session.completed',
+            'payload': {'id': 'evt_1'}, 'attempts': attempts, 'max_attempts': max_attempts,
+            'lock_token': 'host:1:abc'}
+
+
+def test_backoff_doubles_and_is_capped(monkeypatch):
+    monkeypatch.setattr(stripe_webhook_queue, 'WEBHOOK_RETRY_BASE_SECONDS', 30)
+    assert [retry_delay(n) for n in (1, 2, 3)] == [30, 60, 120]
+    assert retry_delay(20) == stripe_webhook_queue.WEBHOOK_RETRY_MAX_SECONDS
+
+
+def test_claimed_job_runs_handler_and_succeeds():
+    seen = []
+    queue, db = make_queue(lambda event: seen.append(event) or {'status': 'processed'})
+    db.claimable = [(5, 'evt_1', 'checkout.session.completed', '{"id": "evt_1"}', 1, 3)]
+
+    assert queue.run_once() is True
+    assert queue.run_once() is False
+
+    assert seen == [{'id': 'evt_1'}]
+    status, error, result = db.updates[0][:3]
+    assert status == 'succeeded' and error is None and result == '{"status": "processed"}'
+    assert db.updates[1] == ('processed', ('succeeded', 'evt_1'))
+
+
+def test_each_claim_gets_its_own_lock_token():
+    queue, db = make_queue(lambda event: {})
+    db.claimable = [(5, 'evt_1', 'checkout.session.completed', '{}', 1, 3),
+                    (6, 'evt_2', 'checkout.session.completed', '{}', 1, 3)]
+
+    first, second = queue.claim_job(), queue.claim_job()
+
+    assert first['lock_token'] != second['lock_token']
+    assert first['lock_token'].startswith(queue.worker_id)
+    queue.process_job(first)
+    assert db.updates[0][-1] == first['lock_token']
+
+
+def test_claim_expires_stale_jobs_out_of_attempts_before_reclaiming():
+    queue, db = make_queue(lambda event: {})
+    queue.claim_job()
+
+    expire_sql = db.statements[0][0]
+    assert 'WITH expired' in expire_sql and 'attempts >= max_attempts' in expire_sql
+    assert "SET status = 'dead'" in expire_sql
+    assert 'FOR UPDATE SKIP LOCKED' in db.statements[1][0]
+
+
+def test_requeue_only_touches_dead_or_expired_jobs():
+    queue, db = make_queue(lambda event: {})
+    assert queue.requeue_job(5) is True
+
+    requeue_sql = db.statements[0][0]
+    assert "status = 'dead'" in requeue_sql and 'locked_at <' in requeue_sql
+    assert "'queued'" not in requeue_sql.split('WHERE')[1]
+
+
+def test_failure_requeues_with_backoff_until_attempts_run_out():
+    def handler(event):
+        raise Exception('OXIO timeout')
+    queue, db = make_queue(handler)
+
+    assert queue.process_job(job(attempts=1)) == 'queued'
+    assert db.updates[0][0] == 'queued' and db.updates[0][3] == retry_delay(1)
+
+    assert queue.process_job(job(attempts=3)) == 'dead'
+    assert db.updates[1][0] == 'dead'
+    assert db.updates[2] == ('processed', ('dead: OXIO timeout', 'evt_1'))
+
+
+def test_permanent_error_skips_retries():
+    def handler(event):
+        raise PermanentJobError('Missing Firebase UID or email')
+    queue, db = make_queue(handler)
+
+    assert queue.process_job(job(attempts=1)) == 'dead'
+    assert db.updates[0][:2] == ('dead', 'Missing Firebase UID or email')
+
+
+def test_deferred_job_is_requeued_without_using_an_attempt():
+    def handler(event):
+        raise DeferJobError('OXIO provisioning circuit open', delay=25)
+    queue, db = make_queue(handler)
+
+    assert queue.process_job(job(attempts=3)) == 'queued'
+    status, error, _, delay, refunded = db.updates[0][:5]
+    assert (status, error, delay, refunded) == ('queued', 'OXIO provisioning circuit open', 25, 1)
+
+
+def test_processed_event_cache_evicts_least_recently_seen():
+    cache = ProcessedEventCache(max_size=2)
+    cache.add('evt_1')
+    cache.add('evt_2')
+    assert 'evt_1' in cache  # refreshes evt_1
+    cache.add('evt_3')
+
+    assert 'evt_2' not in cache
+    assert 'evt_1' in cache and 'evt_3' in cache
+    stats = cache.get_stats()
+    assert (stats['size'], stats['hits'], stats['misses']) == (2, 3, 1)
+
+
+def test_disabled_processed_event_cache_always_misses():
+    cache = ProcessedEventCache(max_size=0)
+    cache.add('evt_1')
+    assert 'evt_1' not in cache
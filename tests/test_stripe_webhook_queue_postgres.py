@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test: Stripe Webhook Job Queue on Postgres
+Runs StripeWebhookQueue's claim, finish and expiry SQL against a real database
+(DATABASE_URL) in a throwaway schema built from db_migrations.MIGRATIONS
+"""
+
+import os
+import uuid
+from contextlib import contextmanager
+
+import pytest
+
+import stripe_webhook_queue
+from stripe_webhook_queue import StripeWebhookQueue
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="DATABASE_URL not set")
+
+
+@pytest.fixture
+def queue():
+    import psycopg2
+    from db_migrations import MIGRATIONS
+
+    schema = f"test_webhooks_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(DATABASE_URL)
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+        cur.execute(f"SET search_path TO {schema}")
+        for _, _, migration_sql in sorted(MIGRATIONS):
+            cur.execute(migration_sql)
+    admin.commit()
+
+    @contextmanager
+    def get_db_connection():
+        conn = psycopg2.connect(DATABASE_URL, options=f"-c search_path={schema}")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    try:
+        yield StripeWebhookQueue(get_db_connection, handler=lambda payload: {}), admin
+    finally:
+        admin.rollback()
+        with admin.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.commit()
+        admin.close()
+
+
+def enqueue(queue, admin, event_id, max_attempts=3):
+    with admin.cursor() as cur:
+        cur.execute("""
+            INSERT INTO processed_stripe_events (event_id, event_type, processing_result)
+            VALUES (%s, 'checkout.session.completed', 'queued')
+        """, (event_id,))
+        assert queue.enqueue(cur, event_id, 'checkout.session.completed', {'id': event_id})
+        cur.execute("UPDATE stripe_webhook_jobs SET max_attempts = %s WHERE event_id = %s", (max_attempts, event_id))
+    admin.commit()
+
+
+def expire_lock(admin, job):
+    """Age the job's lock past WEBHOOK_JOB_LOCK_TIMEOUT, as if its worker hung"""
+    with admin.cursor() as cur:
+        cur.execute("""
+            UPDATE stripe_webhook_jobs
+            SET locked_at = CURRENT_TIMESTAMP - (%s * INTERVAL '1 second')
+            WHERE id = %s
+        """, (stripe_webhook_queue.WEBHOOK_JOB_LOCK_TIMEOUT + 60, job['id']))
+    admin.commit()
+
+
+def fetch(admin, query, params):
+    with admin.cursor() as cur:
+        cur.execute(query, params)
+        row = cur.fetchone()
+    admin.commit()
+    return row
+
+
+def job_row(admin, job_id):
+    return fetch(admin, "SELECT status, attempts, locked_by FROM stripe_webhook_jobs WHERE id = %s", (job_id,))
+
+
+def test_stale_worker_cannot_finish_a_reclaimed_job(queue):
+    queue, admin = queue
+    enqueue(queue, admin, 'evt_stale')
+
+    first = queue.claim_job()
+    assert job_row(admin, first['id']) == ('running', 1, first['lock_token'])
+    assert queue.claim_job() is None  # still locked
+
+    expire_lock(admin, first)
+    second = queue.claim_job()
+    assert second['id'] == first['id'] and second['attempts'] == 2
+    assert second['lock_token'] != first['lock_token']
+
+    queue._finish_job(first, 'queued', error='stale worker', delay=60)
+    assert job_row(admin, first['id']) == ('running', 2, second['lock_token'])
+
+    queue._finish_job(second, 'succeeded', result={'ok': True})
+    assert job_row(admin, first['id']) == ('succeeded', 2, None)
+    assert fetch(admin, "SELECT processing_result FROM processed_stripe_events WHERE event_id = %s",
+                 ('evt_stale',)) == ('succeeded',)
+
+
+def test_hung_final_attempt_goes_to_dead(queue):
+    queue, admin = queue
+    enqueue(queue, admin, 'evt_hung', max_attempts=1)
+
+    job = queue.claim_job()
+    expire_lock(admin, job)
+
+    assert queue.claim_job() is None  # expired instead of reclaimed
+    status, attempts, locked_by = job_row(admin, job['id'])
+    assert (status, attempts, locked_by) == ('dead', 1, None)
+    assert fetch(admin, "SELECT processing_result FROM processed_stripe_events WHERE event_id = %s",
+                 ('evt_hung',)) == ('dead: Worker stopped responding on final attempt',)
+
+    # The hung worker finishing late cannot revive it
+    queue._finish_job(job, 'succeeded', result={})
+    assert job_row(admin, job['id'])[0] == 'dead'
+
+
+def test_deferred_job_refunds_its_attempt_and_waits(queue):
+    queue, admin = queue
+    enqueue(queue, admin, 'evt_defer')
+
+    job = queue.claim_job()
+    queue._finish_job(job, 'queued', error='not yet', delay=300, refund_attempt=True)
+
+    assert job_row(admin, job['id']) == ('queued', 0, None)
+    assert queue.claim_job() is None  # run_after is in the future
+    assert fetch(admin, "SELECT run_after > CURRENT_TIMESTAMP FROM stripe_webhook_jobs WHERE id = %s",
+                 (job['id'],)) == (True,)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test: TTL Cache
+Exercises freshness, stale-while-revalidate, load coalescing and error handling
+"""
+
+import time
+import threading
+
+import ttl_cache
+from ttl_cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_fresh_hit_then_expiry(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttl_cache.time, 'monotonic', clock)
+    cache = TTLCache('test')
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {'success': True, 'n': len(loads)}
+
+    assert cache.get('k', loader, ttl=10) == ({'success': True, 'n': 1}, 'miss')
+    assert cache.get('k', loader, ttl=10) == ({'success': True, 'n': 1}, 'hit')
+    clock.now += 11
+    assert cache.get('k', loader, ttl=10) == ({'success': True, 'n': 2}, 'miss')
+
+
+def test_stale_value_served_while_one_refresh_runs(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ttl_cache.time, 'monotonic', clock)
+    cache = TTLCache('test')
+    release = threading.Event()
+    values = iter(['old', 'new'])
+
+    def loader():
+        value = next(values)
+        if value == 'new':
+            release.wait(5)
+        return value
+
+    cache.get('k', loader, ttl=10, stale_seconds=60)
+    clock.now += 11
+    assert cache.get('k', loader, ttl=10, stale_seconds=60) == ('old', 'stale')
+    assert cache.get('k', loader, ttl=10, stale_seconds=60) == ('old', 'stale')  # no second refresh
+    release.set()
+    for _ in range(100):
+        if cache.get_stats()['refreshes']:
+            break
+        time.sleep(0.01)
+    assert cache.get('k', loader, ttl=10, stale_seconds=60) == ('new', 'hit')
+
+
+def test_concurrent_misses_share_one_load():
+    cache = TTLCache('test')
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get('k', loader, ttl=10)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.get('k', loader, ttl=10))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while cache.get_stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(source for _, source in results) == ['coalesced'] * 3 + ['miss']
+
+
+def test_uncacheable_results_and_flush():
+    cache = TTLCache('test', cacheable=lambda result: result['success'])
+    cache.get('bad', lambda: {'success': False}, ttl=10)
+    cache.get(('zip_codes', '202'), lambda: {'success': True}, ttl=10)
+    cache.get(('plans',), lambda: {'success': True}, ttl=10)
+
+    assert cache.get_stats()['entries'] == 2
+    assert cache.flush(lambda key: key[0] == 'plans') == 1
+    assert cache.get(('zip_codes', '202'), lambda: {'success': True}, ttl=10)[1] == 'hit'
@@ -0,0 +1,145 @@
+"""
+TTL Cache
+In-process cache for slow-changing upstream lookups: per-entry TTLs,
+stale-while-revalidate and coalescing of concurrent identical loads
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Pending:
+    """A load in progress that other callers for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Bounded LRU of loaded values with freshness windows
+
+    A value is fresh for `ttl` seconds, then served stale for up to
+    `stale_seconds` more while one background load refreshes it. Concurrent
+    misses for the same key share a single load. Only values accepted by
+    `cacheable` are stored, so upstream errors are never cached.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1000,
+                 cacheable: Callable[[Any], bool] = lambda value: True):
+        self.name = name
+        self.max_entries = max_entries
+        self.cacheable = cacheable
+        self._entries = OrderedDict()  # key -> (value, fresh_until, stale_until)
+        self._pending: Dict[Hashable, _Pending] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Any], ttl: float,
+            stale_seconds: float = 0) -> Tuple[Any, str]:
+        """
+        Cached value for key, loading it if needed
+
+        Returns:
+            (value, source) where source is 'hit', 'stale', 'miss' or 'coalesced'
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                value, fresh_until, stale_until = entry
+                if now < fresh_until:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value, 'hit'
+                if now < stale_until:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._pending:
+                        self._pending[key] = _Pending()
+                        threading.Thread(target=self._load, args=(key, loader, ttl, stale_seconds, True),
+                                         name=f"{self.name}-cache-refresh", daemon=True).start()
+                    return value, 'stale'
+
+            pending = self._pending.get(key)
+            if pending:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                self._pending[key] = _Pending()
+
+        if pending:
+            pending.done.wait()
+            if pending.error:
+                raise pending.error
+            return pending.value, 'coalesced'
+        return self._load(key, loader, ttl, stale_seconds), 'miss'
+
+    def _load(self, key: Hashable, loader: Callable[[], Any], ttl: float,
+              stale_seconds: float, refresh: bool = False) -> Any:
+        """Run loader for a key this caller registered as pending, store and publish the result"""
+        pending = self._pending[key]
+        try:
+            value = loader()
+        except Exception as e:
+            pending.error = e
+            with self._lock:
+                self._pending.pop(key, None)
+                if refresh:
+                    self.refresh_failures += 1
+            pending.done.set()
+            if refresh:
+                print(f"⚠️ {self.name} cache refresh failed for {key}: {str(e)}")
+                return None
+            raise
+
+        with self._lock:
+            if refresh:
+                self.refreshes += 1
+            if self.cacheable(value):
+                now = time.monotonic()
+                self._entries[key] = (value, now + ttl, now + ttl + stale_seconds)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            elif refresh:
+                self.refresh_failures += 1  # keep serving the stale value until it runs out
+            self._pending.pop(key, None)
+        pending.value = value
+        pending.done.set()
+        return value
+
+    def flush(self, match: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Drop all entries, or those whose key satisfies match; returns how many were dropped"""
+        with self._lock:
+            keys = [key for key in self._entries if match is None or match(key)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': round((self.hits + self.stale_hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                'refreshes': self.refreshes,
+                'refresh_failures': self.refresh_failures,
+                'evictions': self.evictions
+            }